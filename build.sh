@@ -3,6 +3,7 @@ set -o errexit
 
 pip install -r requirements.txt
 
+python manage.py rtms_definition_bundles
 python manage.py collectstatic --no-input
 python manage.py migrate
 
@@ -3,14 +3,42 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Supported ASGI deployment:
+
+    gunicorn config.asgi:application -k uvicorn.workers.UvicornWorker
+
+(uvicorn is not in requirements.txt; install it on hosts that serve ASGI.)
+Under ASGI the I/O-bound endpoints use the async views in rtms_app.views_async,
+and the live dashboard stream (rtms_app.views_live) stays open. Live deltas are
+fanned out in-process, so run a single worker process for them to reach every
+open dashboard. `manage.py rtms_loadtest --scenario downloads --server wsgi
+--server asgi` compares worker occupancy of the two modes.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
 
 import os
+from pathlib import Path
+
+# Load .env file at the very start
+try:
+    from dotenv import load_dotenv
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    load_dotenv(BASE_DIR / ".env")
+except ImportError:
+    pass
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+# Serve downloads/exports through the async views (see RTMS_ASYNC_VIEWS in settings).
+os.environ.setdefault("RTMS_ASYNC_VIEWS", "1")
 
 application = get_asgi_application()
+
+# Optional warm-up, same as config/wsgi.py.
+if os.environ.get("RTMS_WARMUP", "0") == "1":
+    from rtms_app.warmup import warm_up
+
+    warm_up()
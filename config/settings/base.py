@@ -46,6 +46,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "rtms_app.middleware.RequestMiddleware",
+    "rtms_app.middleware.ProfilerMiddleware",
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -66,6 +67,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "config.wsgi.application"
+ASGI_APPLICATION = "config.asgi.application"
 
 # --- DB ---
 DATABASE_URL = env("DATABASE_URL")
@@ -74,7 +76,8 @@ if DATABASE_URL:
         "default": dj_database_url.config(
             default=DATABASE_URL,
             conn_max_age=600,
-            ssl_require=True,
+            # sqlite:/// URL（負荷試験用の一時DBなど）では SSL オプションを付けない
+            ssl_require=env_bool("DATABASE_SSL_REQUIRE", "1") and not DATABASE_URL.startswith("sqlite"),
         )
     }
 else:
@@ -95,6 +98,9 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 STORAGES = {
     "staticfiles": {"BACKEND": "whitenoise.storage.CompressedStaticFilesStorage"},
 }
+# Definition bundles (manage.py rtms_definition_bundles) carry a content hash in their name,
+# so they can be cached forever.
+WHITENOISE_IMMUTABLE_FILE_TEST = r"^" + STATIC_URL + r"rtms_app/definitions/[a-z0-9_]+\.[0-9a-f]{12}\.json$"
 
 LOGIN_URL = "/admin/login/"
 LOGIN_REDIRECT_URL = "/app/dashboard/"
@@ -105,6 +111,36 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Patient survey guidance
 PATIENT_SURVEY_PRE_WINDOW_DAYS = int(env("PATIENT_SURVEY_PRE_WINDOW_DAYS", 7))
 
+# On-demand profiler (superuser + X-Profile: 1 or ?_profile=1) output directory
+RTMS_PROFILE_DIR = env("RTMS_PROFILE_DIR", str(BASE_DIR / "profiles"))
+
+# Slow-query log: statements at or over this many ms are logged and EXPLAINed once per shape
+# (negative disables). The slowest RTMS_SLOW_QUERY_TOP_N shapes are kept per process.
+RTMS_SLOW_QUERY_MS = float(env("RTMS_SLOW_QUERY_MS", 200))
+RTMS_SLOW_QUERY_TOP_N = int(env("RTMS_SLOW_QUERY_TOP_N", 50))
+
+# Keep pre-rendered static fragments (HAM-D rows, questionnaire options, default side-effect rows)
+# in process memory, keyed by a hash of their definition. Off in dev so template edits show up.
+RTMS_PRECOMPILED_FRAGMENTS = env_bool("RTMS_PRECOMPILED_FRAGMENTS", "0")
+
+# Route I/O-bound endpoints (file downloads, CSV exports, consent redirect, healthz) to the async
+# variants in rtms_app.views_async. config/asgi.py turns this on; keep it off under WSGI.
+RTMS_ASYNC_VIEWS = env_bool("RTMS_ASYNC_VIEWS", "0")
+
+# Capacity report (rtms_app.views_capacity): beds for rTMS inpatients and rTMS sessions per day.
+# Days over these are flagged; 0 means "not configured" (no over-capacity check).
+RTMS_BED_CAPACITY = int(env("RTMS_BED_CAPACITY", 0))
+RTMS_DAILY_SESSION_CAPACITY = int(env("RTMS_DAILY_SESSION_CAPACITY", 0))
+
+# Treatment slot scheduler (rtms_app.services.slot_scheduler): rooms, coils per type ("H1:2,H7:1"),
+# opening hours, setup time added to each sitting and the minimum gap between same-day sittings.
+RTMS_SCHEDULER_ROOMS = int(env("RTMS_SCHEDULER_ROOMS", 1))
+RTMS_SCHEDULER_COILS = env("RTMS_SCHEDULER_COILS", "H1:1")
+RTMS_SCHEDULER_OPEN = env("RTMS_SCHEDULER_OPEN", "09:00")
+RTMS_SCHEDULER_CLOSE = env("RTMS_SCHEDULER_CLOSE", "17:00")
+RTMS_SCHEDULER_SETUP_MINUTES = int(env("RTMS_SCHEDULER_SETUP_MINUTES", 10))
+RTMS_SCHEDULER_MIN_GAP_MINUTES = int(env("RTMS_SCHEDULER_MIN_GAP_MINUTES", 50))
+
 # Logging（500根治のため、django.request は ERROR以上を必ず出す）
 # NOTE:
 # - DJANGO_LOG_LEVEL controls application/framework loggers.
@@ -124,6 +160,7 @@ LOGGING = {
         # Keep terminal output readable in dev by default.
         # Enable explicitly by setting DJANGO_DB_LOG_LEVEL=DEBUG etc.
         "django.db.backends": {"handlers": ["console"], "level": DB_LOG_LEVEL, "propagate": False},
+        "rtms_app.slow_query": {"handlers": ["console"], "level": "WARNING", "propagate": False},
         "django.utils.autoreload": {"handlers": ["console"], "level": AUTORELOAD_LOG_LEVEL, "propagate": False},
         "watchfiles": {"handlers": ["console"], "level": AUTORELOAD_LOG_LEVEL, "propagate": False},
         "whitenoise": {"handlers": ["console"], "level": LOG_LEVEL, "propagate": False},
@@ -9,3 +9,7 @@ RENDER_EXTERNAL_HOSTNAME = os.environ.get("RENDER_EXTERNAL_HOSTNAME")
 if RENDER_EXTERNAL_HOSTNAME:
     if RENDER_EXTERNAL_HOSTNAME not in ALLOWED_HOSTS:
         ALLOWED_HOSTS.append(RENDER_EXTERNAL_HOSTNAME)
+
+# Compiled templates are already cached per process by Django's default loaders; here we also
+# keep the pre-rendered static fragments (services.fragments).
+RTMS_PRECOMPILED_FRAGMENTS = env_bool("RTMS_PRECOMPILED_FRAGMENTS", "1")
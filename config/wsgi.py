@@ -23,3 +23,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
 application = get_wsgi_application()
+
+# Optional warm-up (holiday tables, survey instruments, templates).
+# With `gunicorn --preload` this runs once in the master before the workers fork.
+if os.environ.get("RTMS_WARMUP", "0") == "1":
+    from rtms_app.warmup import warm_up
+
+    warm_up()
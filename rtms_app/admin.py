@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.urls import path
 from django.shortcuts import render
 from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404
 from django.db import models
 from django_jsonform.widgets import JSONFormWidget
 from django.contrib.auth.models import User, Group
@@ -211,6 +212,31 @@ class RTMSAdminSite(admin.AdminSite):
         }
         return render(request, 'admin/research_export.html', context)
 
+    def profiles_view(self, request):
+        """リクエストプロファイル一覧（superuser のみ）"""
+        if not request.user.is_superuser:
+            raise PermissionDenied
+        from .utils.profiling import list_profiles, get_profile_dir
+
+        context = {
+            'title': 'リクエストプロファイル',
+            'site_header': self.site_header,
+            'profiles': list_profiles(),
+            'profile_dir': get_profile_dir(),
+        }
+        return render(request, 'admin/profiles.html', context)
+
+    def profile_download_view(self, request, name, ext):
+        """プロファイル（.prof / .json）のダウンロード（superuser のみ）"""
+        if not request.user.is_superuser:
+            raise PermissionDenied
+        from .utils.profiling import profile_file_path
+
+        file_path = profile_file_path(name, ext)
+        if not file_path:
+            raise Http404
+        return FileResponse(open(file_path, 'rb'), as_attachment=True, filename=f"{name}.{ext}")
+
     def admin_backup_view(self, request):
         """バックアップ管理ページ（staff のみ）"""
         if not request.user.is_staff:
@@ -227,6 +253,7 @@ class RTMSAdminSite(admin.AdminSite):
         extra_context = extra_context or {}
         extra_context['research_export_url'] = '/admin/research-export/'
         extra_context['admin_backup_url'] = '/admin/backup/'
+        extra_context['profiles_url'] = '/admin/profiles/'
         extra_context['show_research_export'] = request.user.is_superuser
         extra_context['show_admin_backup'] = request.user.is_staff
         return super().index(request, extra_context)
@@ -235,6 +262,8 @@ class RTMSAdminSite(admin.AdminSite):
         urls = super().get_urls()
         custom_urls = [
             path('research-export/', self.admin_view(self.research_export_view), name='research-export'),
+            path('profiles/', self.admin_view(self.profiles_view), name='profiles'),
+            path('profiles/<str:name>.<str:ext>', self.admin_view(self.profile_download_view), name='profile-download'),
             path('backup/', self.admin_view(self.admin_backup_view), name='admin-backup'),
         ]
         return custom_urls + urls
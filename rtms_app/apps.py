@@ -6,4 +6,8 @@ class RtmsAppConfig(AppConfig):
     verbose_name = 'rTMS 管理メニュー'  # ★ここを変更
 
     def ready(self):
-        import rtms_app.signals  # シグナルをインポートして登録
\ No newline at end of file
+        import rtms_app.signals  # シグナルをインポートして登録
+
+        from django.db.backends.signals import connection_created
+        from .utils.slow_queries import install as install_slow_query_log
+        connection_created.connect(install_slow_query_log, dispatch_uid='rtms_slow_query_log')
\ No newline at end of file
@@ -0,0 +1 @@
+"""HTTP-level load testing (asyncio client + scripted morning workload)."""
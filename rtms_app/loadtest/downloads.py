@@ -0,0 +1,81 @@
+"""
+遅いクライアントの大きなダウンロード中に、軽いリクエストがどれだけ待たされるかを測るシナリオ。
+
+- ダウンロード役: スタッフでログインし、SQLite バックアップ（download_db）を
+  bytes_per_sec に絞って読み続ける（回線の遅い端末を模す）。
+- プローブ役: healthz を probe_interval ごとに叩き、レイテンシを記録する。
+
+WSGI の sync ワーカーではダウンロード1本がワーカーを1つ占有するため、ワーカー数以上の
+ダウンロードが始まるとプローブが待たされる。ASGI（config/asgi.py, RTMS_ASYNC_VIEWS）では
+チャンク送信の合間にイベントループが空くので、プローブはほぼ待たされない。
+blocked_ratio は blocked_ms を超えた（またはエラーになった）プローブの割合。
+"""
+import asyncio
+import random
+import time
+
+from django.urls import reverse
+
+from .http import AsyncHTTPClient
+from .workload import Recorder, VirtualUser
+
+
+async def _downloader(client, path, recorder, deadline, bytes_per_sec):
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        try:
+            status, received = await client.download(path, bytes_per_sec=bytes_per_sec)
+            ok = status == 200 and received > 0
+        except Exception:
+            ok = False
+        recorder.add('download_db', time.perf_counter() - t0, ok)
+        if not ok:
+            await asyncio.sleep(0.5)
+
+
+async def _prober(client, recorder, deadline, interval, probes):
+    path = reverse('rtms_app:healthz')
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        try:
+            resp = await client.get(path)
+            ok = resp.status == 200
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - t0
+        recorder.add('healthz', elapsed, ok)
+        probes.append((elapsed, ok))
+        await asyncio.sleep(max(0.0, interval - elapsed))
+
+
+async def run_downloads(host, port, manifest, downloaders=8, duration=30.0, bytes_per_sec=256 * 1024,
+                        probe_interval=0.2, blocked_ms=1000.0, seed=0, timeout=10.0):
+    """downloaders 本の遅いダウンロードと healthz プローブを duration 秒走らせる。"""
+    rng = random.Random(seed)
+    recorder = Recorder()
+    staff = manifest['staff']
+    clients = []
+    for i in range(downloaders):
+        client = AsyncHTTPClient(host, port, timeout=timeout)
+        vu = VirtualUser('nurse', client, manifest, recorder, random.Random(rng.random()), 0)
+        if await vu.login_staff(staff[i % len(staff)]):
+            clients.append(client)
+
+    deadline = time.perf_counter() + duration
+    probes = []
+    path = reverse('rtms_app:download_db')
+    tasks = [
+        asyncio.create_task(_downloader(client, path, recorder, deadline, bytes_per_sec))
+        for client in clients
+    ]
+    tasks.append(asyncio.create_task(_prober(
+        AsyncHTTPClient(host, port, timeout=timeout), recorder, deadline, probe_interval, probes,
+    )))
+    await asyncio.gather(*tasks)
+    recorder.finished = time.perf_counter()
+
+    report = recorder.report()
+    blocked = sum(1 for elapsed, ok in probes if not ok or elapsed * 1000 > blocked_ms)
+    report['downloaders'] = len(clients)
+    report['blocked_ratio'] = round(blocked / len(probes), 4) if probes else 0.0
+    return report
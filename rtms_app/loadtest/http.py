@@ -0,0 +1,154 @@
+"""
+負荷試験用の最小限の asyncio HTTP/1.1 クライアント（外部依存なし）。
+
+gunicorn の sync ワーカーは keep-alive を使わないため、1 リクエスト 1 接続
+（Connection: close）で送り、EOF まで読む。Cookie（sessionid / csrftoken）を保持し、
+POST には Django の CSRF トークンを自動で付ける。
+"""
+import asyncio
+import json
+from dataclasses import dataclass, field
+from urllib.parse import urlencode
+
+
+@dataclass
+class Response:
+    status: int
+    headers: dict = field(default_factory=dict)
+    body: bytes = b''
+
+    @property
+    def location(self):
+        return self.headers.get('location', '')
+
+    def json(self):
+        return json.loads(self.body.decode('utf-8'))
+
+
+def _decode_chunked(data: bytes) -> bytes:
+    out = bytearray()
+    pos = 0
+    while True:
+        end = data.index(b'\r\n', pos)
+        size = int(data[pos:end].split(b';', 1)[0], 16)
+        pos = end + 2
+        if size == 0:
+            return bytes(out)
+        out += data[pos:pos + size]
+        pos += size + 2
+
+
+class AsyncHTTPClient:
+    def __init__(self, host='127.0.0.1', port=8000, timeout=30.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.cookies = {}
+
+    @property
+    def csrftoken(self):
+        return self.cookies.get('csrftoken', '')
+
+    async def get(self, path, params=None, headers=None):
+        if params:
+            path = f"{path}?{urlencode(params)}"
+        return await self.request('GET', path, headers=headers)
+
+    async def post(self, path, data=None, json_body=None, headers=None):
+        headers = dict(headers or {})
+        headers.setdefault('X-CSRFToken', self.csrftoken)
+        if json_body is not None:
+            body = json.dumps(json_body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        else:
+            data = dict(data or {})
+            data.setdefault('csrfmiddlewaretoken', self.csrftoken)
+            body = urlencode(data, doseq=True).encode('utf-8')
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        return await self.request('POST', path, body=body, headers=headers)
+
+    async def download(self, path, bytes_per_sec=None, chunk_size=64 * 1024):
+        """GET path の本文を読み捨てながら受け取り、(status, 受信バイト数) を返す。
+
+        bytes_per_sec を指定すると遅い回線のクライアントのように少しずつ読む
+        （サーバー側は送信待ちでブロックされる）。
+        """
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            lines = [
+                f"GET {path} HTTP/1.1",
+                f"Host: {self.host}:{self.port}",
+                "Connection: close",
+                "User-Agent: rtms-loadtest",
+            ]
+            if self.cookies:
+                lines.append("Cookie: " + "; ".join(f"{k}={v}" for k, v in self.cookies.items()))
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+            await writer.drain()
+            head = await reader.readuntil(b'\r\n\r\n')
+            status = int(head.split(b' ', 2)[1])
+            received = 0
+            while True:
+                chunk = await reader.read(chunk_size)
+                if not chunk:
+                    break
+                received += len(chunk)
+                if bytes_per_sec:
+                    await asyncio.sleep(len(chunk) / bytes_per_sec)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+        return status, received
+
+    async def request(self, method, path, body=b'', headers=None):
+        return await asyncio.wait_for(self._request(method, path, body, headers or {}), self.timeout)
+
+    async def _request(self, method, path, body, headers):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            lines = [
+                f"{method} {path} HTTP/1.1",
+                f"Host: {self.host}:{self.port}",
+                "Connection: close",
+                "User-Agent: rtms-loadtest",
+                f"Content-Length: {len(body)}",
+            ]
+            if self.cookies:
+                lines.append("Cookie: " + "; ".join(f"{k}={v}" for k, v in self.cookies.items()))
+            lines.extend(f"{k}: {v}" for k, v in headers.items())
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body)
+            await writer.drain()
+            raw = await reader.read()
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+        return self._parse(raw)
+
+    def _parse(self, raw):
+        head, _, payload = raw.partition(b'\r\n\r\n')
+        header_lines = head.decode('latin-1').split('\r\n')
+        status = int(header_lines[0].split(' ', 2)[1])
+        headers = {}
+        for line in header_lines[1:]:
+            name, _, value = line.partition(':')
+            name = name.strip().lower()
+            value = value.strip()
+            if name == 'set-cookie':
+                cookie, _, _attrs = value.partition(';')
+                k, _, v = cookie.partition('=')
+                v = v.strip()
+                if v and v != '""':
+                    self.cookies[k.strip()] = v
+                else:
+                    self.cookies.pop(k.strip(), None)
+                continue
+            headers[name] = value
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            payload = _decode_chunked(payload)
+        return Response(status=status, headers=headers, body=payload)
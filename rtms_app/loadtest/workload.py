@@ -0,0 +1,263 @@
+"""
+朝の業務を模したシナリオ（看護師・医師・患者ポータル）を asyncio で再生し、
+URL 名ごとのスループット・レイテンシ分位点（p50/p95/p99）・エラー率を集計する。
+
+- 看護師: ダッシュボード → treatment_add GET → treatment_add POST（保存）
+- 医師:   ダッシュボード → HAM-D 入力（XHR POST）→ クリニカルパス PDF
+- 患者:   ポータル → 質問票の自動保存（JSON XHR POST）を繰り返す
+
+prepare_workload() でデータを投入し、戻り値のマニフェスト（ログイン情報・患者ID・治療日）を
+run_workload() に渡す。サーバーは別プロセス（gunicorn）でも LiveServer でもよい。
+"""
+import asyncio
+import datetime
+import math
+import random
+import time
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+from rtms_app.models import Patient, TreatmentSession
+from rtms_app.services.patient_accounts import provision_patient_users
+from rtms_app.services.synthetic_cohort import COHORT_START, seed_cohort
+
+from .http import AsyncHTTPClient
+
+STAFF_PASSWORD = 'loadtest-pass'
+PERSONAS = ('nurse', 'physician', 'patient')
+
+
+def prepare_workload(n_patients=50, n_staff=10, n_portal=10, seed=20260105):
+    """合成コホート＋負荷試験用ログインを作成し、マニフェスト dict を返す。"""
+    seed_cohort(n_patients, courses=1, seed=seed)
+    staff = []
+    for i in range(n_staff):
+        username = f"loadtest_staff{i:02d}"
+        user, _ = User.objects.get_or_create(username=username, defaults={'is_staff': True})
+        user.is_staff = True
+        user.set_password(STAFF_PASSWORD)
+        user.save()
+        staff.append({'username': username, 'password': STAFF_PASSWORD})
+
+    patients = []
+    qs = list(Patient.objects.lean().filter(card_id__gte='90000').order_by('card_id')[:n_patients])
+    provision_patient_users(qs[:n_portal], reset_password=True)
+    for i, p in enumerate(qs):
+        dates = list(
+            TreatmentSession.objects.filter(patient=p).order_by('session_date')
+            .values_list('session_date', flat=True)
+        )
+        patients.append({
+            'id': p.id,
+            'card_id': p.card_id,
+            'treatment_dates': [d.isoformat() for d in dates],
+            'portal': i < n_portal,
+        })
+
+    return {
+        'dashboard_date': (COHORT_START + datetime.timedelta(days=28)).isoformat(),
+        'staff': staff,
+        'patients': patients,
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def add(self, name, seconds, ok):
+        self.latencies[name].append(seconds)
+        if not ok:
+            self.errors[name] += 1
+
+    @staticmethod
+    def _pct(sorted_values, q):
+        # nearest-rank
+        if not sorted_values:
+            return 0.0
+        k = max(0, min(len(sorted_values) - 1, math.ceil(q / 100.0 * len(sorted_values)) - 1))
+        return sorted_values[k]
+
+    def report(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        by_name = {}
+        total = errors = 0
+        for name, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            n = len(values)
+            total += n
+            errors += self.errors[name]
+            by_name[name] = {
+                'count': n,
+                'errors': self.errors[name],
+                'error_rate': round(self.errors[name] / n, 4) if n else 0.0,
+                'rps': round(n / elapsed, 2) if elapsed else 0.0,
+                'p50_ms': round(self._pct(values, 50) * 1000, 1),
+                'p95_ms': round(self._pct(values, 95) * 1000, 1),
+                'p99_ms': round(self._pct(values, 99) * 1000, 1),
+            }
+        return {
+            'elapsed_s': round(elapsed, 2),
+            'requests': total,
+            'errors': errors,
+            'error_rate': round(errors / total, 4) if total else 0.0,
+            'throughput_rps': round(total / elapsed, 2) if elapsed else 0.0,
+            'by_url': by_name,
+        }
+
+
+class VirtualUser:
+    def __init__(self, persona, client, manifest, recorder, rng, think):
+        self.persona = persona
+        self.client = client
+        self.manifest = manifest
+        self.recorder = recorder
+        self.rng = rng
+        self.think = think
+
+    async def call(self, name, coro, ok=None):
+        t0 = time.perf_counter()
+        try:
+            resp = await coro
+        except Exception:
+            self.recorder.add(name, time.perf_counter() - t0, False)
+            return None
+        good = resp.status < 400 if ok is None else ok(resp)
+        self.recorder.add(name, time.perf_counter() - t0, good)
+        return resp
+
+    async def pause(self):
+        if self.think:
+            await asyncio.sleep(self.rng.uniform(0.5, 1.5) * self.think)
+
+    # --- login -----------------------------------------------------------
+    async def login_staff(self, account):
+        await self.call('admin_login GET', self.client.get('/admin/login/'))
+        return await self.call('login', self.client.post('/admin/login/', {
+            'username': account['username'],
+            'password': account['password'],
+            'next': reverse('rtms_app:dashboard'),
+        }), ok=lambda r: r.status == 302 and 'sessionid' in self.client.cookies)
+
+    async def login_patient(self, patient):
+        login_url = reverse('patient_portal:login')
+        await self.call('portal_login GET', self.client.get(login_url))
+        return await self.call('portal_login', self.client.post(login_url, {
+            'username': patient['card_id'],
+            'password': patient['card_id'],
+        }), ok=lambda r: r.status == 302 and 'sessionid' in self.client.cookies)
+
+    # --- personas --------------------------------------------------------
+    def _patient(self):
+        return self.rng.choice(self.manifest['patients'])
+
+    async def dashboard(self):
+        await self.call('dashboard', self.client.get(
+            reverse('rtms_app:dashboard'), {'date': self.manifest['dashboard_date']}
+        ))
+
+    async def nurse_round(self):
+        await self.dashboard()
+        await self.pause()
+        p = self._patient()
+        day = self.rng.choice(p['treatment_dates'])
+        url = reverse('rtms_app:treatment_add', args=[p['id']])
+        await self.call('treatment_add GET', self.client.get(url, {'date': day}))
+        await self.pause()
+        await self.call('treatment_add POST', self.client.post(url, {
+            'treatment_date': day,
+            'treatment_time': '09:00',
+            'mt_percent': '120',
+            'frequency_hz': '18.0',
+            'train_seconds': '2.0',
+            'intertrain_seconds': '20.0',
+            'train_count': '55',
+            'total_pulses': '1980',
+        }))
+
+    async def physician_round(self):
+        await self.dashboard()
+        await self.pause()
+        p = self._patient()
+        scores = {f"q{i}": str(self.rng.randrange(3)) for i in range(1, 22)}
+        await self.call('assessment POST', self.client.post(
+            reverse('rtms_app:assessment_scale', args=[p['id'], 'week3', 'hamd']),
+            scores,
+            headers={'X-Requested-With': 'XMLHttpRequest'},
+        ))
+        await self.pause()
+        await self.call('print_path_pdf', self.client.get(
+            reverse('rtms_app:print:print_clinical_path_pdf', args=[p['id']])
+        ))
+
+    async def patient_round(self, instrument_url):
+        answers = {}
+        for i in range(1, 22):
+            answers[f"q{i}"] = str(self.rng.randrange(4))
+            if i % 5 == 0:
+                await self.call('survey_autosave', self.client.post(
+                    instrument_url,
+                    json_body={'answers': dict(answers), 'nav': 'stay'},
+                    headers={'X-Requested-With': 'XMLHttpRequest'},
+                ))
+                await self.pause()
+
+    async def run(self, deadline, index):
+        if self.persona == 'patient':
+            portal = [p for p in self.manifest['patients'] if p['portal']]
+            if not portal:
+                return
+            patient = portal[index % len(portal)]
+            if not await self.login_patient(patient):
+                return
+            resp = await self.call('portal_start', self.client.post(
+                reverse('patient_portal:start'), {'phase': 'pre'}
+            ), ok=lambda r: r.status == 302)
+            if resp is None or resp.status != 302:
+                return
+            instrument_url = resp.location
+            # ログインが遅くても各ユーザー最低 1 周は回す
+            while True:
+                await self.call('portal', self.client.get(reverse('patient_portal:portal')))
+                await self.patient_round(instrument_url)
+                if time.perf_counter() >= deadline:
+                    return
+
+        staff = self.manifest['staff']
+        if not await self.login_staff(staff[index % len(staff)]):
+            return
+        round_fn = self.nurse_round if self.persona == 'nurse' else self.physician_round
+        while True:
+            await round_fn()
+            if time.perf_counter() >= deadline:
+                return
+            await self.pause()
+
+
+async def run_workload(host, port, manifest, users, duration=30.0, think=0.5, seed=0, timeout=30.0):
+    """users = {'nurse': 5, 'physician': 2, 'patient': 3} の人数で duration 秒再生する。"""
+    rng = random.Random(seed)
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration
+    tasks = []
+    index = 0
+    for persona in PERSONAS:
+        for _ in range(users.get(persona, 0)):
+            vu = VirtualUser(
+                persona,
+                AsyncHTTPClient(host, port, timeout=timeout),
+                manifest,
+                recorder,
+                random.Random(rng.random()),
+                think,
+            )
+            tasks.append(asyncio.create_task(vu.run(deadline, index)))
+            index += 1
+    await asyncio.gather(*tasks)
+    recorder.finished = time.perf_counter()
+    return recorder.report()
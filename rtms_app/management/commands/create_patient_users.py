@@ -1,9 +1,8 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
-import re
 
 from rtms_app.models import Patient
-from rtms_app.services.patient_accounts import ensure_patient_user, PATIENT_GROUP_NAME
+from rtms_app.services.patient_accounts import PATIENT_GROUP_NAME, is_valid_card_id, provision_patient_users
 
 
 class Command(BaseCommand):
@@ -27,6 +26,11 @@ class Command(BaseCommand):
             action="store_true",
             help="Show what would be done without making changes.",
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="Processes used to hash passwords (default: number of CPUs, 1 = no pool).",
+        )
         parser.add_argument(
             "--disable-pk-users",
             action="store_true",
@@ -45,46 +49,43 @@ class Command(BaseCommand):
         if options.get("patient_ids"):
             qs = qs.filter(id__in=options["patient_ids"])
 
-        created = 0
-        touched = 0
-        skipped = 0
         reset_pw = bool(options.get("reset_password"))
+        patients = list(qs.only("id", "card_id", "name", "user_id"))
 
-        for patient in qs.iterator():
-            # Skip patients without valid card_id
-            if not patient.card_id or not re.match(r'^\d{5}$', patient.card_id):
-                self.stdout.write(self.style.WARNING(
-                    f"Patient {patient.id} ({patient.name}): invalid card_id '{patient.card_id}' - skipped"
-                ))
-                skipped += 1
-                continue
-            
-            if dry_run:
+        if dry_run:
+            skipped = 0
+            for patient in patients:
+                if not is_valid_card_id(patient.card_id):
+                    self.stdout.write(self.style.WARNING(
+                        f"Patient {patient.id} ({patient.name}): invalid card_id '{patient.card_id}' - skipped"
+                    ))
+                    skipped += 1
+                    continue
                 status = "would create" if not patient.user_id else "would update"
                 self.stdout.write(f"Patient {patient.id} ({patient.card_id}): {status} user '{patient.card_id}'")
-                touched += 1
-                continue
-            
-            try:
-                user, was_created = ensure_patient_user(patient, reset_password=reset_pw)
-                if was_created:
-                    created += 1
-                else:
-                    touched += 1
+            self.stdout.write(self.style.SUCCESS(
+                f"Finished (dry run). touched={len(patients) - skipped}, skipped={skipped}"
+            ))
+            return
+
+        result = provision_patient_users(patients, reset_password=reset_pw, workers=options.get("workers"))
+
+        for patient, reason in result.skipped:
+            self.stdout.write(self.style.WARNING(
+                f"Patient {patient.id} ({patient.name}): {reason} - skipped"
+            ))
+        for label, group in (("created", result.created), ("linked", result.linked), ("ok", result.unchanged)):
+            for patient in group:
                 self.stdout.write(
-                    f"Patient {patient.id} ({patient.card_id}): linked to user {user.username} "
-                    f"({'created' if was_created else 'ok'})"
+                    f"Patient {patient.id} ({patient.card_id}): linked to user {patient.card_id} ({label})"
                 )
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(
-                    f"Patient {patient.id} ({patient.card_id}): failed - {e}"
-                ))
-                skipped += 1
 
         self.stdout.write(self.style.SUCCESS(
-            f"Finished. created={created}, touched={touched}, skipped={skipped}"
+            f"Finished. created={len(result.created)}, "
+            f"touched={len(result.linked) + len(result.unchanged)}, skipped={len(result.skipped)}, "
+            f"passwords_set={result.passwords_set}"
         ))
-    
+
     def _disable_old_pk_users(self, dry_run: bool):
         """Disable old PK-based patient users that don't match any card_id."""
         from django.contrib.auth.models import Group
@@ -0,0 +1,258 @@
+import contextlib
+import datetime
+import json
+import platform
+import statistics
+import time
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.template.backends.django import Template as DjangoBackendTemplate
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rtms_app.models import Patient, TreatmentSession
+from rtms_app.services.synthetic_cohort import COHORT_START, seed_cohort
+
+
+class _Rollback(Exception):
+    pass
+
+
+@contextlib.contextmanager
+def _template_render_timer():
+    """テンプレートのレンダリング時間(ms)を累積する。入れ子の render は外側だけ数える。"""
+    original = DjangoBackendTemplate.render
+    state = {"depth": 0, "ms": 0.0}
+
+    def timed_render(self, context=None, request=None):
+        state["depth"] += 1
+        t0 = time.perf_counter()
+        try:
+            return original(self, context, request)
+        finally:
+            state["depth"] -= 1
+            if state["depth"] == 0:
+                state["ms"] += (time.perf_counter() - t0) * 1000
+
+    DjangoBackendTemplate.render = timed_render
+    try:
+        yield state
+    finally:
+        DjangoBackendTemplate.render = original
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a deterministic synthetic cohort at one or more scale points and time the "
+        "dashboard, month calendar, clinical path, HAM-D form, exports and skip flow. "
+        "Writes query counts, wall time and template render time as JSON and can compare "
+        "against a saved baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--patients",
+            type=int,
+            action="append",
+            dest="scales",
+            help="Number of patients for a scale point (can be repeated). Default: 20 and 100.",
+        )
+        parser.add_argument("--courses", type=int, default=2, help="Spread patients over this many course numbers.")
+        parser.add_argument("--repeat", type=int, default=3, help="Timed runs per scenario (median is reported).")
+        parser.add_argument("--seed", type=int, default=20260105, help="Random seed for the synthetic cohort.")
+        parser.add_argument("--output", help="Write results as JSON to this path.")
+        parser.add_argument("--compare", help="Baseline JSON from an earlier run to compare against.")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=1.25,
+            help="Median time ratio above which a scenario counts as a regression (default 1.25).",
+        )
+        parser.add_argument(
+            "--fail-on-regression",
+            action="store_true",
+            help="Exit with an error if --compare finds a regression.",
+        )
+        parser.add_argument(
+            "--in-place",
+            action="store_true",
+            help="Use the configured database inside a rolled-back transaction instead of a throwaway test database.",
+        )
+
+    def handle(self, *args, **options):
+        scales = options.get("scales") or [20, 100]
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be >= 1")
+
+        old_config = None
+        if not options["in_place"]:
+            from django.test.utils import setup_databases
+            old_config = setup_databases(verbosity=0, interactive=False, aliases={"default"})
+        try:
+            with override_settings(ALLOWED_HOSTS=["testserver"]):
+                results = {
+                    "meta": {
+                        "created_at": timezone.now().isoformat(),
+                        "seed": options["seed"],
+                        "courses": options["courses"],
+                        "repeat": options["repeat"],
+                        "db_vendor": connection.vendor,
+                        "django": django.get_version(),
+                        "python": platform.python_version(),
+                    },
+                    "scales": {},
+                }
+                for n in scales:
+                    results["scales"][str(n)] = self._run_scale(n, options)
+        finally:
+            if old_config is not None:
+                from django.test.utils import teardown_databases
+                teardown_databases(old_config, verbosity=0)
+
+        if options.get("output"):
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+        if options.get("compare"):
+            with open(options["compare"], encoding="utf-8") as f:
+                baseline = json.load(f)
+            regressions = self._compare(baseline, results, options["threshold"])
+            if regressions and options["fail_on_regression"]:
+                raise CommandError(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+
+    # ------------------------------------------------------------------
+    # scale point
+    # ------------------------------------------------------------------
+    def _run_scale(self, n, options):
+        out = {}
+        try:
+            with transaction.atomic():
+                t0 = time.perf_counter()
+                stats = seed_cohort(n, courses=options["courses"], seed=options["seed"])
+                out["seed_seconds"] = round(time.perf_counter() - t0, 3)
+                out["rows"] = stats.as_dict()
+                out["scenarios"] = self._run_scenarios(options["repeat"])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{n} patients (seeded in {out['seed_seconds']}s)"))
+        for name, r in out["scenarios"].items():
+            self.stdout.write(
+                f"  {name:<16} median {r['median_ms']:>9.1f} ms  min {r['min_ms']:>9.1f} ms  "
+                f"render {r['render_ms']:>8.1f} ms  queries {r['queries']:>5}  status {r['status']}"
+            )
+        return out
+
+    def _run_scenarios(self, repeat):
+        user = User.objects.create_superuser("rtms_bench", password=None)
+        client = Client()
+        client.force_login(user)
+        factory = RequestFactory()
+
+        patients = list(Patient.objects.filter(card_id__gte="90000").order_by("card_id")[:repeat + 1])
+        sample = patients[0]
+        mid = COHORT_START + datetime.timedelta(days=28)
+
+        def research_export():
+            from rtms_app.views import export_research_csv
+            request = factory.post("/bench/export_research_csv/", {})
+            request.user = user
+            return export_research_csv(request)
+
+        skip_targets = []
+        for p in patients[1:]:
+            planned = (
+                TreatmentSession.objects.filter(patient=p, status="planned")
+                .order_by("session_date").first()
+            )
+            if planned:
+                skip_targets.append((p, planned.session_date))
+
+        def skip_flow():
+            # 毎回別患者の予定セッションを順延する（同じ行を二重にスキップしない）
+            p, d = skip_targets.pop(0) if skip_targets else (sample, mid)
+            return client.post(reverse("rtms_app:treatment_add", args=[p.id]), {
+                "treatment_date": d.isoformat(),
+                "treatment_time": "09:00",
+                "mt_percent": "120",
+                "frequency_hz": "18.0",
+                "train_seconds": "2.0",
+                "intertrain_seconds": "20.0",
+                "train_count": "55",
+                "total_pulses": "1980",
+                "action": "skip",
+            })
+
+        scenarios = {
+            "dashboard": lambda: client.get(reverse("rtms_app:dashboard"), {"date": mid.isoformat()}),
+            "calendar_month": lambda: client.get(
+                reverse("rtms_app:calendar_month"), {"year": mid.year, "month": mid.month}
+            ),
+            "clinical_path": lambda: client.get(reverse("rtms_app:patient_clinical_path", args=[sample.id])),
+            "hamd_form": lambda: client.get(
+                reverse("rtms_app:assessment_scale", args=[sample.id, "baseline", "hamd"])
+            ),
+            "research_export": research_export,
+            "survey_export": lambda: client.get(reverse("rtms_app:patient_survey_export", args=[sample.id])),
+            "slot_schedule": lambda: client.get(
+                reverse("rtms_app:slot_schedule"), {"year": mid.year, "month": mid.month}
+            ),
+            "skip": skip_flow,
+        }
+        return {name: self._time(fn, repeat) for name, fn in scenarios.items()}
+
+    def _time(self, fn, repeat):
+        timings = []
+        render_timings = []
+        queries = 0
+        status = None
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as ctx, _template_render_timer() as rendered:
+                t0 = time.perf_counter()
+                response = fn()
+                if getattr(response, "streaming", False):
+                    b"".join(response.streaming_content)
+                timings.append((time.perf_counter() - t0) * 1000)
+            render_timings.append(rendered["ms"])
+            queries = len(ctx.captured_queries)
+            status = getattr(response, "status_code", None)
+        return {
+            "median_ms": round(statistics.median(timings), 2),
+            "min_ms": round(min(timings), 2),
+            "render_ms": round(statistics.median(render_timings), 2),
+            "queries": queries,
+            "status": status,
+        }
+
+    # ------------------------------------------------------------------
+    # baseline comparison
+    # ------------------------------------------------------------------
+    def _compare(self, baseline, current, threshold):
+        regressions = []
+        self.stdout.write(self.style.MIGRATE_HEADING("Comparison with baseline"))
+        for scale, cur in current["scales"].items():
+            base = baseline.get("scales", {}).get(scale)
+            if not base:
+                self.stdout.write(f"  {scale} patients: no baseline")
+                continue
+            for name, r in cur["scenarios"].items():
+                b = base.get("scenarios", {}).get(name)
+                if not b:
+                    continue
+                ratio = r["median_ms"] / b["median_ms"] if b["median_ms"] else 0.0
+                dq = r["queries"] - b["queries"]
+                bad = ratio > threshold or dq > 0
+                line = f"  {scale:>5} {name:<16} time x{ratio:.2f}  queries {dq:+d}"
+                if bad:
+                    regressions.append(f"{scale}:{name}")
+                    self.stdout.write(self.style.WARNING(line + "  REGRESSION"))
+                else:
+                    self.stdout.write(line)
+        return regressions
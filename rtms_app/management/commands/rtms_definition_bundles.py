@@ -0,0 +1,22 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from rtms_app.services.definition_bundles import default_output_dir, write_bundles
+
+
+class Command(BaseCommand):
+    help = (
+        "Write content-hashed JSON bundles of the HAM-D anchors and patient instrument "
+        "definitions into the app's static files. Run before collectstatic (see build.sh)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output-dir",
+            help=f"Directory to write to (default: {os.path.relpath(default_output_dir())}).",
+        )
+
+    def handle(self, *args, **options):
+        for path in write_bundles(options.get("output_dir")):
+            self.stdout.write(f"{os.path.relpath(path)} ({os.path.getsize(path)} bytes)")
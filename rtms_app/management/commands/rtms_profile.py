@@ -0,0 +1,67 @@
+import json
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import NoReverseMatch, reverse
+
+from rtms_app.utils.profiling import get_profile_dir, profile_file_path, run_profiled
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Profile one view offline with cProfile and the SQL log, e.g. "
+        "`rtms_profile rtms_app:patient_clinical_path --patient 12 --date 2026-01-20`. "
+        "The profile is saved to RTMS_PROFILE_DIR like the on-demand profiler's."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("url_name", help="URL name, e.g. rtms_app:dashboard or rtms_app:treatment_add.")
+        parser.add_argument("--patient", type=int, help="Patient id passed as the URL's first argument.")
+        parser.add_argument("--date", help="Sent as ?date=YYYY-MM-DD.")
+        parser.add_argument("--arg", action="append", default=[], help="Extra URL argument (can be repeated).")
+        parser.add_argument("--sort", default="cumulative", help="pstats sort key (default: cumulative).")
+        parser.add_argument("--limit", type=int, default=30, help="Number of pstats rows to print.")
+
+    def handle(self, *args, **options):
+        url_args = ([options["patient"]] if options.get("patient") else []) + options["arg"]
+        try:
+            url = reverse(options["url_name"], args=url_args)
+        except NoReverseMatch as e:
+            raise CommandError(str(e))
+        params = {"date": options["date"]} if options.get("date") else {}
+
+        request_id = f"cli-{uuid.uuid4().hex[:8]}"
+        meta = {"method": "GET", "path": url, "user": "rtms_profile", "source": "command"}
+        # 計測用ユーザーや GET による副作用を残さない
+        try:
+            with transaction.atomic(), override_settings(ALLOWED_HOSTS=["testserver"]):
+                user = User.objects.create_superuser(f"rtms_profile_{request_id}", password=None)
+                client = Client()
+                client.force_login(user)
+                response, name = run_profiled(
+                    lambda: client.get(url, params),
+                    request_id,
+                    meta=meta,
+                    sort=options["sort"],
+                    limit=options["limit"],
+                )
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"GET {url} -> {response.status_code}"))
+        with open(profile_file_path(name, "json"), encoding="utf-8") as f:
+            data = json.load(f)
+        self.stdout.write(
+            f"{data['elapsed_ms']} ms, {data['sql_count']} queries ({data['sql_time_ms']} ms in SQL)"
+        )
+        self.stdout.write(data["top"])
+        self.stdout.write(self.style.SUCCESS(f"Saved {name}.prof / {name}.json in {get_profile_dir()}"))
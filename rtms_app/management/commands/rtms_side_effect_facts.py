@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from rtms_app.services.side_effect_facts import BACKFILL_BATCH_SIZE, backfill
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the SideEffectObservation table from SideEffectCheck.rows and the legacy "
+        "TreatmentSession.side_effects JSON, in batches of sessions. Safe to re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=BACKFILL_BATCH_SIZE,
+            help=f"Sessions per transaction (default: {BACKFILL_BATCH_SIZE}).",
+        )
+
+    def handle(self, *args, **options):
+        sessions = observations = 0
+        for n_sessions, n_observations in backfill(options["batch_size"]):
+            sessions += n_sessions
+            observations += n_observations
+            self.stdout.write(f"{sessions} sessions, {observations} observations")
+        self.stdout.write(self.style.SUCCESS(f"Done: {sessions} sessions, {observations} observations"))
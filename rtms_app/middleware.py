@@ -77,4 +77,36 @@ class PatientAccessMiddleware:
 
         if request.method == "GET":
             return redirect("/patient/")
-        return HttpResponseForbidden("患者用アカウントではアクセスできません。")
\ No newline at end of file
+        return HttpResponseForbidden("患者用アカウントではアクセスできません。")
+
+class ProfilerMiddleware:
+    """
+    スーパーユーザーが X-Profile: 1 ヘッダーまたは ?_profile=1 を付けたリクエストだけ
+    cProfile + SQLログ付きで実行し、PROFILE_DIR に request_id 付きで保存する。
+    RequestMiddleware より後ろ（request.request_id 設定済み）に置くこと。
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _wants_profile(self, request):
+        user = getattr(request, "user", None)
+        if not user or not user.is_superuser:
+            return False
+        return request.headers.get("X-Profile") == "1" or request.GET.get("_profile") == "1"
+
+    def __call__(self, request):
+        if not self._wants_profile(request):
+            return self.get_response(request)
+
+        from .utils.profiling import run_profiled
+
+        request_id = getattr(request, "request_id", None) or str(uuid.uuid4())[:8]
+        meta = {
+            "method": request.method,
+            "path": request.get_full_path(),
+            "user": request.user.username,
+        }
+        response, name = run_profiled(lambda: self.get_response(request), request_id, meta=meta)
+        response["X-Profile-Name"] = name
+        logger.info(f"[{request_id}] profiled {request.method} {request.path} -> {name}")
+        return response
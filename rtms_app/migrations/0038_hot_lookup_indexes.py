@@ -0,0 +1,35 @@
+# Generated by Django 5.0.14 on 2026-10-18 23:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rtms_app', '0037_alter_card_id_unique_5digits'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assessment',
+            index=models.Index(fields=['patient', 'timing', '-date'], name='assessment_pt_timing_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['patient', '-created_at'], name='auditlog_pt_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mappingsession',
+            index=models.Index(fields=['patient', 'course_number', 'week_number'], name='mapping_pt_course_week_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mappingsession',
+            index=models.Index(fields=['patient', 'date'], name='mapping_pt_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='treatmentsession',
+            index=models.Index(fields=['patient', 'session_date'], name='treatment_pt_sdate_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-19 00:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rtms_app', '0038_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='protocol_type',
+            field=models.CharField(choices=[('INSURANCE', '保険診療プロトコル'), ('PMS', '市販後調査プロトコル'), ('ACCELERATED', '加速プロトコル（1日2回）')], default='INSURANCE', max_length=16, verbose_name='プロトコル'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.14 on 2026-10-19 00:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rtms_app', '0039_patient_protocol_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SideEffectObservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('course_number', models.IntegerField(default=1, verbose_name='クール数')),
+                ('session_date', models.DateField(verbose_name='実施日')),
+                ('item_key', models.CharField(choices=[('scalp_pain', '頭皮痛・刺激痛'), ('facial_discomfort', '顔面の不快感'), ('neck_shoulder_pain', '頸部痛・肩こり'), ('headache_post', '頭痛（刺激後）'), ('seizure', 'けいれん（部位・時間）'), ('syncope', '失神'), ('hearing_issue', '聴覚障害'), ('dizziness_tinnitus', 'めまい・耳鳴り'), ('attention_issue', '注意集中困難'), ('acute_mood_change', '急性の気分変化（躁転など）'), ('other', 'その他')], max_length=32, verbose_name='項目')),
+                ('phase', models.CharField(choices=[('before', '刺激前'), ('during', '刺激中'), ('after', '刺激後'), ('unspecified', '時点なし')], max_length=16, verbose_name='時点')),
+                ('grade', models.PositiveSmallIntegerField(verbose_name='重症度')),
+                ('relatedness', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='関連性')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='rtms_app.patient')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='side_effect_observations', to='rtms_app.treatmentsession')),
+            ],
+            options={
+                'verbose_name': '副作用所見',
+                'verbose_name_plural': '副作用所見',
+                'indexes': [models.Index(fields=['item_key', 'session_date'], name='se_obs_item_date_idx'), models.Index(fields=['patient', 'course_number'], name='se_obs_pt_course_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='sideeffectobservation',
+            constraint=models.UniqueConstraint(fields=('session', 'item_key', 'phase'), name='unique_side_effect_observation'),
+        ),
+    ]
@@ -3,8 +3,36 @@ from django.utils import timezone
 from django.contrib.auth.models import User
 import os
 
+from .protocols import DEFAULT_PROTOCOL, PROTOCOL_CHOICES
+from .services.side_effect_schema import SIDE_EFFECT_ITEMS
 from .surveys import INSTRUMENT_ORDER, calculate_score, instrument_label
 
+
+class PatientQuerySet(models.QuerySet):
+    # 一覧・カレンダー・集計では使わない大きな自由記述/JSON 列
+    # (large free-text / JSON columns that list paths never render)
+    NARRATIVE_FIELDS = (
+        'life_history',
+        'past_history',
+        'present_illness',
+        'medication_history',
+        'summary_text',
+        'discharge_prescription',
+        'mapping_notes',
+        'questionnaire_data',
+        'psychiatric_history',
+        'psychiatric_history_other_text',
+    )
+
+    def lean(self, *keep):
+        """
+        一覧用の軽量プロジェクション。
+        叙述系フィールドを defer し、id・氏名・日付など一覧で使う列のみ読み込む。
+        keep に指定したフィールドは defer しない（例: 研究CSVの psychiatric_history）。
+        """
+        return self.defer(*[f for f in self.NARRATIVE_FIELDS if f not in keep])
+
+
 class Patient(models.Model):
     GENDER_CHOICES = [('M', '男性'), ('F', '女性'), ('O', 'その他')]
     ADMISSION_TYPES = [('voluntary', '任意入院'), ('medical_protection', '医療保護入院'), ('emergency', '緊急措置入院'), ('measure', '措置入院')]
@@ -13,7 +41,8 @@ class Patient(models.Model):
     card_id = models.CharField("患者ID", max_length=5, unique=True, db_index=True) 
     # ★追加: 何クール目か
     course_number = models.IntegerField("クール数", default=1)
-    # protocol_type was removed (no longer used). See migrations for removal.
+    # 治療プロトコル（回数・1日の回数・漸減）。定義は rtms_app/protocols.py
+    protocol_type = models.CharField("プロトコル", max_length=16, choices=PROTOCOL_CHOICES, default=DEFAULT_PROTOCOL)
 
     # --- 新規フィールド: 全例調査対象フラグ ---
     is_all_case_survey = models.BooleanField("全例調査対象", default=False)
@@ -89,6 +118,8 @@ class Patient(models.Model):
     ]
     status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="waiting", db_index=True)
 
+    objects = PatientQuerySet.as_manager()
+
     def __str__(self): return f"{self.name} ({self.card_id} - {self.course_number}クール)"
     @property
     def age(self):
@@ -155,6 +186,12 @@ class MappingSession(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['patient', 'course_number', 'date', 'stimulation_site'], name='unique_mapping_per_patient_course_date_site')
         ]
+        indexes = [
+            # treatment_add: 週番号で当該週の位置決めを引く
+            models.Index(fields=['patient', 'course_number', 'week_number'], name='mapping_pt_course_week_idx'),
+            # dashboard: 患者×実施日の存在確認
+            models.Index(fields=['patient', 'date'], name='mapping_pt_date_idx'),
+        ]
 
 class TreatmentSession(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
@@ -243,6 +280,10 @@ class TreatmentSession(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['patient', 'course_number', 'session_date', 'slot'], name='unique_treatment_per_patient_course_date_slot')
         ]
+        indexes = [
+            # dashboard / 週回数カウント: course を問わず患者×実施日で引く
+            models.Index(fields=['patient', 'session_date'], name='treatment_pt_sdate_idx'),
+        ]
 
 
 class TreatmentSkip(models.Model):
@@ -304,6 +345,48 @@ class SideEffectCheck(models.Model):
     def __str__(self):
         return f"SideEffectCheck(session={self.session_id})"
 
+
+class SideEffectObservation(models.Model):
+    """副作用の正規化テーブル（1行 = 1セッション・1項目・1時点の重症度 1 以上）
+
+    SideEffectCheck.rows と TreatmentSession.side_effects（旧形式）から
+    services.side_effect_facts が作る派生データ。副作用チェック保存時に同期し、
+    既存データは rtms_side_effect_facts コマンドで埋める。
+    患者・クール・実施日はセッションから複製して集計を JOIN なしで行う。
+    """
+    PHASE_CHOICES = [
+        ('before', '刺激前'),
+        ('during', '刺激中'),
+        ('after', '刺激後'),
+        ('unspecified', '時点なし'),  # 旧形式 side_effects
+    ]
+    ITEM_CHOICES = [(item['key'], item['label']) for item in SIDE_EFFECT_ITEMS]
+
+    session = models.ForeignKey("TreatmentSession", on_delete=models.CASCADE, related_name="side_effect_observations")
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="+")
+    course_number = models.IntegerField("クール数", default=1)
+    session_date = models.DateField("実施日")
+    item_key = models.CharField("項目", max_length=32, choices=ITEM_CHOICES)
+    phase = models.CharField("時点", max_length=16, choices=PHASE_CHOICES)
+    grade = models.PositiveSmallIntegerField("重症度")
+    relatedness = models.PositiveSmallIntegerField("関連性", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "副作用所見"
+        verbose_name_plural = "副作用所見"
+        constraints = [
+            models.UniqueConstraint(fields=["session", "item_key", "phase"], name="unique_side_effect_observation"),
+        ]
+        indexes = [
+            # 項目×期間の発現率（incidence report）
+            models.Index(fields=["item_key", "session_date"], name="se_obs_item_date_idx"),
+            # 患者・クール単位の集計
+            models.Index(fields=["patient", "course_number"], name="se_obs_pt_course_idx"),
+        ]
+
+    def __str__(self):
+        return f"SideEffectObservation(session={self.session_id}, {self.item_key}/{self.phase}={self.grade})"
+
 class Assessment(models.Model):
     TIMING_CHOICES = [
         ('baseline', '治療前評価'),
@@ -341,6 +424,10 @@ class Assessment(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['patient', 'course_number', 'timing', 'type'], name='unique_assessment_per_patient_course_timing_type')
         ]
+        indexes = [
+            # filter(patient, timing).order_by('-date') の最新評価取得
+            models.Index(fields=['patient', 'timing', '-date'], name='assessment_pt_timing_date_idx'),
+        ]
 
 
 class ScaleDefinition(models.Model):
@@ -565,6 +652,8 @@ class AuditLog(models.Model):
             models.Index(fields=['created_at']),
             models.Index(fields=['patient']),
             models.Index(fields=['action']),
+            # audit_logs_view: filter(patient).order_by('-created_at')
+            models.Index(fields=['patient', '-created_at'], name='auditlog_pt_created_idx'),
         ]
 
 
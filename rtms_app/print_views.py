@@ -4,12 +4,17 @@ from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from django.http import HttpResponseNotAllowed
 from urllib.parse import urlencode
+from functools import wraps
 
 from .models import Patient, Assessment, ConsentDocument, TreatmentSession, SideEffectCheck
 from .views import generate_calendar_weeks
 from .services.print_service import build_pdf_filename, CONTENT_LABELS
+from .services.session_ordinals import ordinal_of as session_ordinal_of
+from .services.side_effect_schema import default_side_effect_rows
 from django.template.loader import render_to_string
 from django.http import HttpResponse
+from django.conf import settings
+from asgiref.sync import sync_to_async
 
 
 # Helper to provide HAMD trend columns with graceful fallback
@@ -28,11 +33,30 @@ def _hamd_cols_for_patient(patient):
 		for code, label in labels
 	]
 
-try:
-	from weasyprint import HTML, CSS
-	HAVE_WEASY = True
-except Exception:
-	HAVE_WEASY = False
+_weasy_html = None
+
+
+def _weasyprint_html():
+	"""WeasyPrint の HTML クラス（初回の PDF 出力時に import。未導入なら False）"""
+	global _weasy_html
+	if _weasy_html is None:
+		try:
+			from weasyprint import HTML
+			_weasy_html = HTML
+		except Exception:
+			_weasy_html = False
+	return _weasy_html
+
+
+def _write_pdf(HTML, html, base_url):
+	return HTML(string=html, base_url=base_url).write_pdf(stylesheets=[])
+
+
+def _pdf_response(pdf, filename):
+	resp = HttpResponse(pdf, content_type='application/pdf')
+	# inline so browser opens PDF (user can save or print)
+	resp['Content-Disposition'] = f'inline; filename="{filename}"'
+	return resp
 
 
 def render_pdf_response(request, template, context, filename):
@@ -40,17 +64,39 @@ def render_pdf_response(request, template, context, filename):
 	context = dict(context)
 	context['include_mode'] = True
 	html = render_to_string(template, context, request=request)
-	if HAVE_WEASY:
+	HTML = _weasyprint_html()
+	if HTML:
 		base_url = request.build_absolute_uri('/')
-		pdf = HTML(string=html, base_url=base_url).write_pdf(stylesheets=[])
-		resp = HttpResponse(pdf, content_type='application/pdf')
-		# inline so browser opens PDF (user can save or print)
-		resp['Content-Disposition'] = f'inline; filename="{filename}"'
-		return resp
+		if settings.RTMS_ASYNC_VIEWS:
+			# ASGI: PDF 生成（CPU・フォント読み込み）は async_pdf_view が共有スレッドの外で行う。
+			# ラップされずに呼ばれたときは HTML のまま返る
+			resp = HttpResponse(html)
+			resp.pdf_job = (HTML, html, base_url, filename)
+			return resp
+		return _pdf_response(_write_pdf(HTML, html, base_url), filename)
 	else:
 		# Fallback: return HTML so users can still view/print; warn in console
 		return HttpResponse(html)
 
+
+def async_pdf_view(view):
+	"""RTMS_ASYNC_VIEWS 用の PDF ビュー: 本体は共有スレッドで実行し、PDF は別スレッドで作り終えてから応答する。
+
+	ヘッダーを送る前に PDF ができているので、生成に失敗すれば通常のエラー応答になる。
+	"""
+	sync_view = sync_to_async(view)
+
+	@wraps(view)
+	async def wrapper(request, *args, **kwargs):
+		resp = await sync_view(request, *args, **kwargs)
+		job = getattr(resp, 'pdf_job', None)
+		if job is None:
+			return resp
+		HTML, html, base_url, filename = job
+		pdf = await sync_to_async(_write_pdf, thread_sensitive=False)(HTML, html, base_url)
+		return _pdf_response(pdf, filename)
+	return wrapper
+
 # map doc keys to templates or pdf statics
 DOC_TEMPLATES = {
 	"admission": {"label": "入院時サマリ", "template": "rtms_app/print/admission_summary.html"},
@@ -385,41 +431,17 @@ def print_side_effect_check(request, patient_id, session_id):
 	patient = get_object_or_404(Patient, pk=patient_id)
 	session = get_object_or_404(TreatmentSession, pk=session_id, patient=patient)
 	
-	# Calculate session number (all treatment sessions for this patient up to and including this one)
-	if getattr(session, 'session_date', None):
-		session_number = TreatmentSession.objects.filter(
-			patient=patient,
-			session_date__lte=session.session_date,
-		).order_by('session_date', 'date').count()
-	else:
-		session_number = TreatmentSession.objects.filter(
-			patient=patient,
-			date__lte=session.date,
-		).order_by('date').count()
+	# Session number within the course (same numbering as treatment_add / calendars)
+	session_number = session_ordinal_of(session.id, patient, session.course_number)
 	
 	# Get side-effect check if exists
-	def default_rows():
-		return [
-			{"item": "頭皮痛・刺激痛", "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""},
-			{"item": "顔面の不快感", "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""},
-			{"item": "頸部痛・肩こり", "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""},
-			{"item": "頭痛 (刺激後)", "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""},
-			{"item": "けいれん (部位・時間)", "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""},
-			{"item": "失神", "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""},
-			{"item": "聴覚障害", "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""},
-			{"item": "めまい・耳鳴り", "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""},
-			{"item": "注意集中困難", "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""},
-			{"item": "急性気分変化 (躁転など)", "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""},
-			{"item": "その他", "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""},
-		]
-
 	try:
 		side_effect_check = SideEffectCheck.objects.get(session=session)
-		rows = side_effect_check.rows or default_rows()
+		rows = side_effect_check.rows or default_side_effect_rows()
 		memo = side_effect_check.memo or ""
 		signature = side_effect_check.physician_signature or ""
 	except SideEffectCheck.DoesNotExist:
-		rows = default_rows()
+		rows = default_side_effect_rows()
 		memo = ""
 		signature = ""
 	
@@ -465,39 +487,15 @@ def print_side_effect_check_pdf(request, patient_id, session_id):
 	patient = get_object_or_404(Patient, pk=patient_id)
 	session = get_object_or_404(TreatmentSession, pk=session_id, patient=patient)
 
-	if getattr(session, 'session_date', None):
-		session_number = TreatmentSession.objects.filter(
-			patient=patient,
-			session_date__lte=session.session_date,
-		).order_by('session_date', 'date').count()
-	else:
-		session_number = TreatmentSession.objects.filter(
-			patient=patient,
-			date__lte=session.date,
-		).order_by('date').count()
-
-	def default_rows():
-		return [
-			{"item": "頭皮痛・刺激痛", "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""},
-			{"item": "顔面の不快感", "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""},
-			{"item": "頸部痛・肩こり", "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""},
-			{"item": "頭痛 (刺激後)", "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""},
-			{"item": "けいれん (部位・時間)", "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""},
-			{"item": "失神", "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""},
-			{"item": "聴覚障害", "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""},
-			{"item": "めまい・耳鳴り", "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""},
-			{"item": "注意集中困難", "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""},
-			{"item": "急性気分変化 (躁転など)", "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""},
-			{"item": "その他", "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""},
-		]
+	session_number = session_ordinal_of(session.id, patient, session.course_number)
 
 	try:
 		side_effect_check = SideEffectCheck.objects.get(session=session)
-		rows = side_effect_check.rows or default_rows()
+		rows = side_effect_check.rows or default_side_effect_rows()
 		memo = side_effect_check.memo or ""
 		signature = side_effect_check.physician_signature or ""
 	except SideEffectCheck.DoesNotExist:
-		rows = default_rows()
+		rows = default_side_effect_rows()
 		memo = ""
 		signature = ""
 
@@ -1,14 +1,20 @@
 # rtms_app/protocols.py
 """Protocol abstraction layer for rTMS.
 
-This module centralizes protocol-specific logic (sessions, eval weeks, required fields).
-Note: `Patient.protocol_type` was removed; default INSURANCE protocol is used for now.
+This module centralizes protocol-specific logic (sessions, sessions per day, taper,
+eval weeks, required fields). The protocol of a patient is `Patient.protocol_type`;
+the dated plan (date, slot) is built by `services.rtms_schedule.build_treatment_plan`.
 """
 from __future__ import annotations
 from dataclasses import dataclass
 from typing import Literal, Optional
 
-ProtocolType = Literal["INSURANCE", "PMS"]
+ProtocolType = Literal["INSURANCE", "PMS", "ACCELERATED"]
+
+DEFAULT_PROTOCOL: ProtocolType = "INSURANCE"
+
+# 寛解時の漸減: 第4週は3回まで、第5週は2回まで、第6週は1回まで
+STANDARD_TAPER = ((4, 3), (5, 2), (6, 1))
 
 
 @dataclass
@@ -16,17 +22,29 @@ class ProtocolSpec:
     """Specification for a treatment protocol.
 
     Attributes:
-        code: INSURANCE | PMS
+        code: INSURANCE | PMS | ACCELERATED
         display_name: Japanese display name
         total_sessions: Total planned treatment sessions (e.g., 30)
         required_evaluation_weeks: Week numbers where HAM-D must be entered
         allow_early_taper: Whether remission triggers taper (week 4-6)
+        sessions_per_day: Sessions given on each open day
+        min_gap_minutes: Minimum interval between sessions on the same day
+        taper: (week_no, max sessions in that week) pairs applied on remission
     """
     code: ProtocolType
     display_name: str
     total_sessions: int
     required_evaluation_weeks: list[int]
     allow_early_taper: bool = True
+    sessions_per_day: int = 1
+    min_gap_minutes: int = 0
+    taper: tuple[tuple[int, int], ...] = STANDARD_TAPER
+
+    def weekly_limit(self, week_no: int) -> Optional[int]:
+        """Taper limit for week_no, or None if the week is not tapered."""
+        if not self.allow_early_taper:
+            return None
+        return dict(self.taper).get(week_no)
 
 
 # ========================================================================
@@ -50,12 +68,26 @@ PMS_PROTOCOL = ProtocolSpec(
     allow_early_taper=True,
 )
 
+ACCELERATED_PROTOCOL = ProtocolSpec(
+    code="ACCELERATED",
+    display_name="加速プロトコル（1日2回）",
+    total_sessions=30,
+    required_evaluation_weeks=[0, 3],
+    allow_early_taper=False,
+    sessions_per_day=2,
+    min_gap_minutes=50,
+    taper=(),
+)
+
 # Map protocol code -> spec
 _REGISTRY = {
     "INSURANCE": INSURANCE_PROTOCOL,
     "PMS": PMS_PROTOCOL,
+    "ACCELERATED": ACCELERATED_PROTOCOL,
 }
 
+PROTOCOL_CHOICES = [(spec.code, spec.display_name) for spec in _REGISTRY.values()]
+
 
 def get_protocol_by_code(code: str) -> Optional[ProtocolSpec]:
     """Retrieve protocol specification by code.
@@ -71,12 +103,11 @@ def get_protocol_by_code(code: str) -> Optional[ProtocolSpec]:
 
 def get_protocol(patient) -> ProtocolSpec:
     """Return the protocol spec for this patient's current course.
-    Currently returns the default INSURANCE specification.
+    Unknown or missing codes fall back to the INSURANCE specification.
     """
     from rtms_app.models import Patient  # delayed to avoid circular import
     if not isinstance(patient, Patient):
         # fallback: handle patient_id or None
         return INSURANCE_PROTOCOL
 
-    # protocol_type removed — always use INSURANCE for now
-    return INSURANCE_PROTOCOL
+    return _REGISTRY.get(patient.protocol_type or DEFAULT_PROTOCOL, INSURANCE_PROTOCOL)
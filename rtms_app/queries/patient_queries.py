@@ -19,7 +19,7 @@ def get_patients_for_dashboard(target_date: date) -> QuerySet[Patient]:
         Prefetch(
             'treatmentsession_set',
             queryset=TreatmentSession.objects.filter(
-                date__date=target_date
+                session_date=target_date
             )
         ),
         Prefetch(
@@ -60,5 +60,5 @@ def count_sessions_by_patient(patient_id: int, up_to_date: Optional[date] = None
     """
     query = TreatmentSession.objects.filter(patient_id=patient_id)
     if up_to_date:
-        query = query.filter(date__date__lte=up_to_date)
+        query = query.filter(session_date__lte=up_to_date)
     return query.count()
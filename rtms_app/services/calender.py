@@ -0,0 +1,84 @@
+"""
+カレンダー（月間カレンダー・クリニカルパス）の日セル/イベント型。
+
+1画面で数百セル・数千イベントを生成するため、dict ではなく __slots__ 付きの
+dataclass を使う。テンプレートからは従来どおり属性アクセス（day.date, ev.label）で参照できる。
+"""
+from dataclasses import dataclass, field
+from datetime import date as date_type
+from operator import attrgetter
+from typing import Optional
+
+WEEKDAY_LABELS = ("月", "火", "水", "木", "金", "土", "日")
+
+# 同日内の表示順（小さいほど上）
+KIND_SORT_KEYS = {
+    'admission': 10,
+    'discharge': 20,
+    'treatment': 30,
+    'first-visit': 90,
+}
+
+# 同日内のイベント並び替え用キー（sort_key → label）
+event_order = attrgetter('sort_key', 'label')
+
+
+@dataclass(slots=True)
+class CalendarEvent:
+    kind: str
+    label: str
+    url: str
+    patient_id: Optional[int] = None
+    session_id: Optional[int] = None
+    is_planned: bool = False
+    sort_key: Optional[int] = None
+    # クリニカルパスの評価イベント用
+    timing: Optional[str] = None
+    window_end: Optional[date_type] = None
+
+    def __post_init__(self):
+        if self.sort_key is None:
+            self.sort_key = KIND_SORT_KEYS.get(self.kind, 99)
+
+    @property
+    def type(self):
+        """クリニカルパスのテンプレートは event.type を参照する。"""
+        return self.kind
+
+    @property
+    def date(self):
+        return self.window_end
+
+
+@dataclass(slots=True)
+class DayCell:
+    date: date_type
+    url: str = ''
+    events: list = field(default_factory=list)
+    is_holiday: bool = False
+    holiday_name: Optional[str] = None
+    # 月間カレンダー用
+    is_current_month: bool = True
+    rtms_count: int = 0
+    inpatient_count: int = 0
+    events_hidden_count: int = 0
+
+    @property
+    def weekday(self):
+        return self.date.weekday()
+
+    @property
+    def weekday_label(self):
+        return WEEKDAY_LABELS[self.date.weekday()]
+
+    @property
+    def is_weekend(self):
+        return self.date.weekday() >= 5
+
+    @property
+    def day_url(self):
+        return self.url
+
+    @property
+    def events_visible(self):
+        return self.events
@@ -0,0 +1,128 @@
+"""
+入院・治療の占有数（センサス）エンジン
+
+入院（入院日〜退院日）や治療クール（初回治療日〜最終治療日）を半開区間 [start, end) として
+受け取り、差分配列＋累積和（prefix sum）で日ごとの人数を一度に求める。
+区間の数を N、日数を D とすると O(N + D) で、日付を1日ずつ歩く実装（O(N × 滞在日数)）と違い
+複数年の履歴でも日数に比例する時間で済む。
+
+累積和は NumPy でベクトル化する（NumPy は最初の集計時に import し、URLconf の読み込みでは読まない）。
+
+    census = census_from_intervals(stays, date(2026, 1, 1), date(2026, 12, 31))
+    census.count(date(2026, 3, 2))   # その日の人数
+    census.peak()                    # (最大人数, 最初にその人数になった日)
+    census.rollup('month')           # 月ごとの最大・平均
+"""
+import datetime
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+Interval = Tuple[datetime.date, datetime.date]  # [start, end)
+
+PERIODS = ('day', 'week', 'month', 'year')
+
+
+@dataclass(frozen=True)
+class Census:
+    """start から len(counts) 日分の日ごとの人数。"""
+    start: datetime.date
+    counts: Tuple[int, ...]
+
+    def __len__(self):
+        return len(self.counts)
+
+    @property
+    def end(self) -> datetime.date:
+        return self.start + datetime.timedelta(days=len(self.counts) - 1)
+
+    def dates(self) -> List[datetime.date]:
+        return [self.start + datetime.timedelta(days=i) for i in range(len(self.counts))]
+
+    def count(self, d: datetime.date) -> int:
+        i = (d - self.start).days
+        return self.counts[i] if 0 <= i < len(self.counts) else 0
+
+    def as_dict(self) -> Dict[datetime.date, int]:
+        return dict(zip(self.dates(), self.counts))
+
+    def window(self, start: datetime.date, end: datetime.date) -> 'Census':
+        """start〜end（両端含む）の部分。範囲外の日は 0 になる。"""
+        n = (end - start).days + 1
+        return Census(start, tuple(self.count(start + datetime.timedelta(days=i)) for i in range(max(n, 0))))
+
+    def peak(self) -> Tuple[int, Optional[datetime.date]]:
+        """(最大人数, 最初にその人数になった日)。空なら (0, None)。"""
+        if not self.counts:
+            return 0, None
+        top = max(self.counts)
+        return top, self.start + datetime.timedelta(days=self.counts.index(top))
+
+    def over(self, capacity: int) -> List[Tuple[datetime.date, int]]:
+        """capacity を超えた日と人数。"""
+        return [
+            (self.start + datetime.timedelta(days=i), c)
+            for i, c in enumerate(self.counts) if c > capacity
+        ]
+
+    def rollup(self, period: str = 'week') -> List[Dict]:
+        """週（月曜始まり）・月・年ごとの最大・平均・ピーク日。"""
+        if period not in PERIODS:
+            raise ValueError(f"period must be one of {PERIODS}")
+        buckets: List[Dict] = []
+        key = None
+        for d, c in zip(self.dates(), self.counts):
+            k = _bucket_key(d, period)
+            if k != key:
+                key = k
+                buckets.append({'start': d, 'end': d, 'peak': c, 'peak_date': d, 'total': 0, 'days': 0})
+            b = buckets[-1]
+            b['end'] = d
+            b['total'] += c
+            b['days'] += 1
+            if c > b['peak']:
+                b['peak'], b['peak_date'] = c, d
+        for b in buckets:
+            b['mean'] = round(b.pop('total') / b['days'], 2)
+        return buckets
+
+
+def _bucket_key(d: datetime.date, period: str):
+    if period == 'day':
+        return d
+    if period == 'week':
+        return d - datetime.timedelta(days=d.weekday())
+    if period == 'month':
+        return (d.year, d.month)
+    return d.year
+
+
+def _sweep(n: int, starts: Sequence[int], ends: Sequence[int]) -> Tuple[int, ...]:
+    """[starts[i], ends[i]) を 0..n-1 に切り詰めて差分配列に積み、累積和を返す。"""
+    import numpy as np
+
+    s = np.clip(np.asarray(starts, dtype=np.int64), 0, n)
+    e = np.clip(np.asarray(ends, dtype=np.int64), 0, n)
+    keep = s < e
+    diff = np.bincount(s[keep], minlength=n + 1) - np.bincount(e[keep], minlength=n + 1)
+    return tuple(int(c) for c in np.cumsum(diff[:n]))
+
+
+def census_from_intervals(intervals: Iterable[Interval], start: datetime.date, end: datetime.date) -> Census:
+    """半開区間 [s, e) の集合から start〜end（両端含む）の日ごとの人数を作る。"""
+    n = (end - start).days + 1
+    if n <= 0:
+        return Census(start, ())
+    origin = start.toordinal()
+    starts, ends = [], []
+    for s, e in intervals:
+        if s is None or e is None:
+            continue
+        starts.append(s.toordinal() - origin)
+        ends.append(e.toordinal() - origin)
+    return Census(start, _sweep(n, starts, ends))
+
+
+def census_from_days(days: Iterable[datetime.date], start: datetime.date, end: datetime.date) -> Census:
+    """1日だけの出来事（治療1回など）の件数を日ごとに数える。"""
+    one = datetime.timedelta(days=1)
+    return census_from_intervals(((d, d + one) for d in days), start, end)
@@ -0,0 +1,349 @@
+"""
+コホート全体の HAM-D 成績集計
+
+全患者・全クールの HAM-D17 合計点（治療前・第3/4/6週）を1クエリで読み込み、
+クール（患者 × クール数）を1行とする配列にしてから、改善率・反応・寛解・重症度区分を
+まとめて計算し、クール数・紹介元・プロトコル・期間ごとに集計する。
+
+- 判定規則は assessment_rules と同じ（寛解: HAM-D17 <= 7、反応: 改善率 >= 20%、寛解を優先）。
+- 割合は Wilson の 95% 信頼区間、改善率の平均は正規近似の 95% 信頼区間を付ける。
+- 反応までの期間は評価週（3/4/6 週）を時間軸にした Kaplan-Meier 推定で、
+  反応しないまま評価が途切れたクールは最後の評価週で打ち切り（censored）とする。
+
+行ごとの判定と群ごとの合計（np.bincount）は NumPy でベクトル化する（NumPy は最初の集計時に
+import し、URLconf の読み込みでは読まない）。
+
+    cohort = load_cohort()
+    report = analyze(cohort, by='referral', endpoint='final')
+"""
+import datetime
+import math
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from ..assessment_rules import (
+    HAMD17_SEVERITY_BANDS,
+    REMISSION_HAMD17_THRESHOLD,
+    RESPONSE_RATE_THRESHOLD,
+)
+from ..protocols import DEFAULT_PROTOCOL, get_protocol_by_code
+
+# 評価時期 -> 評価週（Kaplan-Meier の時間軸）
+FOLLOW_UP_WEEKS = (('week3', 3), ('week4', 4), ('week6', 6))
+ENDPOINTS = ('final',) + tuple(t for t, _ in FOLLOW_UP_WEEKS)
+GROUP_BY = ('course', 'referral', 'protocol', 'period')
+PERIODS = ('month', 'quarter', 'year')
+
+STATUS_LABELS = ('未評価', '寛解', '反応', '反応なし')
+SEVERITY_LABELS = tuple(label for _, _, label in HAMD17_SEVERITY_BANDS)
+UNKNOWN_REFERRAL = '（未記入）'
+
+Z_95 = 1.959964
+
+
+@dataclass
+class Cohort:
+    """1クール1行。スコアは未評価なら None。"""
+    patient_id: List[int] = field(default_factory=list)
+    course_number: List[int] = field(default_factory=list)
+    referral: List[str] = field(default_factory=list)
+    protocol: List[str] = field(default_factory=list)
+    baseline_date: List[Optional[datetime.date]] = field(default_factory=list)
+    baseline: List[Optional[int]] = field(default_factory=list)
+    scores: Dict[str, List[Optional[int]]] = field(default_factory=lambda: {t: [] for t, _ in FOLLOW_UP_WEEKS})
+
+    def __len__(self):
+        return len(self.patient_id)
+
+    def endpoint(self, endpoint: str) -> Tuple[List[Optional[int]], List[Optional[int]]]:
+        """(スコア, 評価週)。final は最後に評価された週。"""
+        if endpoint != 'final':
+            week = dict(FOLLOW_UP_WEEKS)[endpoint]
+            values = self.scores[endpoint]
+            return values, [week if v is not None else None for v in values]
+        out_scores, out_weeks = [], []
+        for i in range(len(self)):
+            score = week = None
+            for timing, w in FOLLOW_UP_WEEKS:
+                if self.scores[timing][i] is not None:
+                    score, week = self.scores[timing][i], w
+            out_scores.append(score)
+            out_weeks.append(week)
+        return out_scores, out_weeks
+
+
+def load_cohort(start: Optional[datetime.date] = None, end: Optional[datetime.date] = None) -> Cohort:
+    """治療前評価日が start〜end（省略時は全期間）のクールを読み込む（1クエリ）。"""
+    from ..models import Assessment
+
+    qs = Assessment.objects.filter(type='HAM-D', timing__in=['baseline'] + [t for t, _ in FOLLOW_UP_WEEKS])
+    rows = qs.values_list(
+        'patient_id', 'course_number', 'timing', 'date', 'total_score_17',
+        'patient__referral_source', 'patient__protocol_type',
+    ).order_by('patient_id', 'course_number')
+
+    courses: Dict[Tuple[int, int], Dict] = {}
+    for patient_id, course_number, timing, d, score, referral, protocol in rows:
+        c = courses.setdefault((patient_id, course_number), {
+            'referral': (referral or '').strip() or UNKNOWN_REFERRAL,
+            'protocol': protocol or DEFAULT_PROTOCOL,
+        })
+        c[timing] = (d, score)
+
+    cohort = Cohort()
+    for (patient_id, course_number), c in courses.items():
+        base_date, base_score = c.get('baseline', (None, None))
+        if base_date is None:
+            continue
+        if (start and base_date < start) or (end and base_date > end):
+            continue
+        cohort.patient_id.append(patient_id)
+        cohort.course_number.append(course_number)
+        cohort.referral.append(c['referral'])
+        cohort.protocol.append(c['protocol'])
+        cohort.baseline_date.append(base_date)
+        cohort.baseline.append(base_score)
+        for timing, _ in FOLLOW_UP_WEEKS:
+            cohort.scores[timing].append(c.get(timing, (None, None))[1])
+    return cohort
+
+
+# ----------------------------------------------------------------------
+# 行ごとの判定
+# ----------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class Labels:
+    improvement: Tuple[Optional[float], ...]  # 改善率（割合）。算出できなければ None
+    status: Tuple[str, ...]                   # STATUS_LABELS
+    baseline_band: Tuple[Optional[int], ...]  # SEVERITY_LABELS の添字
+    endpoint_band: Tuple[Optional[int], ...]
+
+
+def compute_labels(baseline: Sequence[Optional[int]], current: Sequence[Optional[int]]) -> Labels:
+    """assessment_rules.compute_improvement_rate / classify_response_status を全行まとめて適用する。"""
+    import numpy as np
+
+    b = np.array([np.nan if v is None else v for v in baseline], dtype=float)
+    c = np.array([np.nan if v is None else v for v in current], dtype=float)
+    evaluated = ~np.isnan(c)
+    ok = evaluated & ~np.isnan(b) & (b != 0)
+    improvement = np.full(len(b), np.nan)
+    improvement[ok] = (b[ok] - c[ok]) / b[ok]
+    with np.errstate(invalid='ignore'):
+        remission = evaluated & (c <= REMISSION_HAMD17_THRESHOLD)
+        response = ok & (improvement >= RESPONSE_RATE_THRESHOLD)
+    status = np.where(~evaluated, 0, np.where(remission, 1, np.where(response, 2, 3)))
+    lows = np.array([low for low, _, _ in HAMD17_SEVERITY_BANDS], dtype=float)
+
+    def bands(x):
+        idx = np.clip(np.searchsorted(lows, x, side='right') - 1, 0, len(lows) - 1)
+        return tuple(None if math.isnan(v) else int(i) for v, i in zip(x.tolist(), idx.tolist()))
+
+    return Labels(
+        improvement=tuple(None if math.isnan(v) else v for v in improvement.tolist()),
+        status=tuple(STATUS_LABELS[s] for s in status.tolist()),
+        baseline_band=bands(b),
+        endpoint_band=bands(c),
+    )
+
+
+# ----------------------------------------------------------------------
+# 群ごとの合計と統計量
+# ----------------------------------------------------------------------
+
+def _group_sums(codes: Sequence[int], n_groups: int, columns: Dict[str, Sequence[float]]) -> Dict[str, List[float]]:
+    """列ごとに codes（群番号）別の合計を返す。"""
+    import numpy as np
+
+    idx = np.asarray(codes, dtype=np.int64)
+    return {
+        name: np.bincount(idx, weights=np.asarray(values, dtype=float), minlength=n_groups).tolist()
+        for name, values in columns.items()
+    }
+
+
+def wilson_interval(k: float, n: float) -> Tuple[Optional[float], Optional[float]]:
+    """二項割合 k/n の Wilson 95% 信頼区間。"""
+    if not n:
+        return None, None
+    p = k / n
+    denom = 1 + Z_95 ** 2 / n
+    centre = (p + Z_95 ** 2 / (2 * n)) / denom
+    half = Z_95 * math.sqrt(p * (1 - p) / n + Z_95 ** 2 / (4 * n * n)) / denom
+    return round(max(0.0, centre - half), 4), round(min(1.0, centre + half), 4)
+
+
+def _mean_ci(total: float, squares: float, n: float) -> Dict:
+    if not n:
+        return {'mean': None, 'ci_low': None, 'ci_high': None}
+    mean = total / n
+    if n < 2:
+        return {'mean': round(mean, 4), 'ci_low': None, 'ci_high': None}
+    var = max(squares - n * mean * mean, 0.0) / (n - 1)
+    half = Z_95 * math.sqrt(var / n)
+    return {'mean': round(mean, 4), 'ci_low': round(mean - half, 4), 'ci_high': round(mean + half, 4)}
+
+
+def _rate(k: float, n: float) -> Dict:
+    low, high = wilson_interval(k, n)
+    return {'n': int(k), 'rate': round(k / n, 4) if n else None, 'ci_low': low, 'ci_high': high}
+
+
+# ----------------------------------------------------------------------
+# Kaplan-Meier（反応までの評価週）
+# ----------------------------------------------------------------------
+
+def _time_to_response(cohort: Cohort) -> Tuple[List[Optional[int]], List[bool]]:
+    """各クールの (最初に反応または寛解した週 / 最後の評価週, 反応したか)。追跡評価が無ければ None。"""
+    times: List[Optional[int]] = [None] * len(cohort)
+    events = [False] * len(cohort)
+    for timing, week in FOLLOW_UP_WEEKS:
+        labels = compute_labels(cohort.baseline, cohort.scores[timing])
+        for i, status in enumerate(labels.status):
+            if events[i] or status == STATUS_LABELS[0]:
+                continue
+            times[i] = week
+            events[i] = status in (STATUS_LABELS[1], STATUS_LABELS[2])
+    return times, events
+
+
+def kaplan_meier(times: Sequence[Optional[int]], events: Sequence[bool]) -> List[Dict]:
+    """時点ごとの at_risk・events・censored・未反応割合 survival と累積反応割合 responded。"""
+    pairs = [(t, e) for t, e in zip(times, events) if t is not None]
+    if not pairs:
+        return []
+    import numpy as np
+
+    t = np.array([p[0] for p in pairs], dtype=np.int64)
+    e = np.array([p[1] for p in pairs], dtype=bool)
+    uniq, inverse = np.unique(t, return_inverse=True)
+    n_at = np.bincount(inverse, minlength=len(uniq))
+    n_event = np.bincount(inverse, weights=e.astype(float), minlength=len(uniq)).astype(int)
+    at_risk = np.cumsum(n_at[::-1])[::-1]
+    steps = zip(uniq.tolist(), at_risk.tolist(), n_event.tolist(), n_at.tolist())
+    curve, survival = [], 1.0
+    for week, at_risk, n_event, n_at in steps:
+        survival *= 1 - n_event / at_risk
+        curve.append({
+            'week': int(week), 'at_risk': int(at_risk), 'events': int(n_event),
+            'censored': int(n_at - n_event), 'survival': round(survival, 4), 'responded': round(1 - survival, 4),
+        })
+    return curve
+
+
+# ----------------------------------------------------------------------
+# レポート
+# ----------------------------------------------------------------------
+
+def _period_key(d: Optional[datetime.date], period: str) -> str:
+    if d is None:
+        return ''
+    if period == 'month':
+        return f"{d.year}-{d.month:02d}"
+    if period == 'quarter':
+        return f"{d.year}-Q{(d.month - 1) // 3 + 1}"
+    return str(d.year)
+
+
+def _group_keys(cohort: Cohort, by: str, period: str) -> List[str]:
+    if by == 'course':
+        return [f"{n}クール目" for n in cohort.course_number]
+    if by == 'referral':
+        return list(cohort.referral)
+    if by == 'protocol':
+        return [
+            (get_protocol_by_code(code).display_name if get_protocol_by_code(code) else code)
+            for code in cohort.protocol
+        ]
+    return [_period_key(d, period) for d in cohort.baseline_date]
+
+
+def analyze(cohort: Cohort, by: str = 'course', endpoint: str = 'final', period: str = 'year') -> Dict:
+    """cohort を by ごとに集計した反応率・寛解率・改善率・重症度分布と Kaplan-Meier 曲線。"""
+    if by not in GROUP_BY:
+        raise ValueError(f"by must be one of {GROUP_BY}")
+    if endpoint not in ENDPOINTS:
+        raise ValueError(f"endpoint must be one of {ENDPOINTS}")
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {PERIODS}")
+
+    current, _ = cohort.endpoint(endpoint)
+    labels = compute_labels(cohort.baseline, current)
+    times, events = _time_to_response(cohort)
+
+    keys = _group_keys(cohort, by, period)
+    names = sorted(set(keys))
+    index = {name: i for i, name in enumerate(names)}
+    codes = [index[k] for k in keys]
+    members: List[List[int]] = [[] for _ in names]
+    for i, g in enumerate(codes):
+        members[g].append(i)
+
+    evaluated = [s != STATUS_LABELS[0] for s in labels.status]
+    has_imp = [imp is not None for imp in labels.improvement]
+    imp = [imp or 0.0 for imp in labels.improvement]
+    columns = {
+        'courses': [1.0] * len(cohort),
+        'evaluated': evaluated,
+        'remission': [s == STATUS_LABELS[1] for s in labels.status],
+        'response_only': [s == STATUS_LABELS[2] for s in labels.status],
+        'response': [h and v >= RESPONSE_RATE_THRESHOLD for h, v in zip(has_imp, imp)],
+        'imp_n': has_imp,
+        'imp_sum': imp,
+        'imp_sq': [v * v for v in imp],
+        'base_n': [b is not None for b in cohort.baseline],
+        'base_sum': [b or 0 for b in cohort.baseline],
+        'end_sum': [c or 0 for c in current],
+    }
+    for i, label in enumerate(SEVERITY_LABELS):
+        columns[f'base_band_{i}'] = [b == i for b in labels.baseline_band]
+        columns[f'end_band_{i}'] = [b == i for b in labels.endpoint_band]
+    sums = _group_sums(codes, len(names), columns)
+    # 全体（最後の添字）は群ごとの合計の和
+    overall = len(names)
+    for values in sums.values():
+        values.append(sum(values))
+
+    def summary(g, name):
+        n_eval = sums['evaluated'][g]
+        return {
+            'group': name,
+            'courses': int(sums['courses'][g]),
+            'evaluated': int(n_eval),
+            'remission': _rate(sums['remission'][g], n_eval),
+            'response': _rate(sums['response'][g], n_eval),
+            'status': {
+                STATUS_LABELS[1]: int(sums['remission'][g]),
+                STATUS_LABELS[2]: int(sums['response_only'][g]),
+                STATUS_LABELS[3]: int(n_eval - sums['remission'][g] - sums['response_only'][g]),
+                STATUS_LABELS[0]: int(sums['courses'][g] - n_eval),
+            },
+            'improvement': _mean_ci(sums['imp_sum'][g], sums['imp_sq'][g], sums['imp_n'][g]),
+            'baseline_mean': round(sums['base_sum'][g] / sums['base_n'][g], 2) if sums['base_n'][g] else None,
+            'endpoint_mean': round(sums['end_sum'][g] / n_eval, 2) if n_eval else None,
+            'severity': {
+                'baseline': {label: int(sums[f'base_band_{i}'][g]) for i, label in enumerate(SEVERITY_LABELS)},
+                'endpoint': {label: int(sums[f'end_band_{i}'][g]) for i, label in enumerate(SEVERITY_LABELS)},
+            },
+        }
+
+    groups = []
+    for g, name in enumerate(names):
+        row = summary(g, name)
+        row['time_to_response'] = kaplan_meier([times[i] for i in members[g]], [events[i] for i in members[g]])
+        groups.append(row)
+    total = summary(overall, '全体')
+    total['time_to_response'] = kaplan_meier(times, events)
+
+    return {
+        'by': by,
+        'endpoint': endpoint,
+        'period': period if by == 'period' else None,
+        'thresholds': {
+            'remission_hamd17': REMISSION_HAMD17_THRESHOLD,
+            'response_rate': RESPONSE_RATE_THRESHOLD,
+        },
+        'overall': total,
+        'groups': groups,
+    }
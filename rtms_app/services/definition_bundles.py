@@ -0,0 +1,110 @@
+"""
+尺度・質問票定義の静的バンドル
+
+HAM-D のアンカー文と患者用質問票の定義を、内容ハッシュ付きのファイル名
+（例: rtms_app/definitions/hamd.3f2a9c1b7d04.json）で静的ファイルとして書き出す。
+ファイル名が内容で決まるので WhiteNoise から immutable で配信でき
+（settings の WHITENOISE_IMMUTABLE_FILE_TEST）、2回目以降の表示ではブラウザの
+キャッシュから読まれる。
+
+書き出しは `manage.py rtms_definition_bundles`（build.sh で collectstatic の前に実行）。
+バンドルが見つからない環境（未ビルドの開発環境など）では bundle_url() が None を返し、
+テンプレートは従来どおり定義を HTML に埋め込む。
+"""
+import hashlib
+import json
+import os
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from django.apps import apps
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+
+BUNDLE_DIR = 'rtms_app/definitions'
+
+_lock = threading.Lock()
+_urls: Dict[str, Optional[str]] = {}
+
+
+def _hamd_payload():
+    from rtms_app.utils.hamd import hamd_items
+
+    items, _left, _right = hamd_items()
+    return {
+        'items': [
+            {'key': key, 'label': label, 'max': max_score, 'anchor': anchor}
+            for key, label, max_score, anchor in items
+        ],
+    }
+
+
+def _instruments_payload():
+    from rtms_app.surveys import INSTRUMENT_ORDER, get_instruments
+
+    return {'order': list(INSTRUMENT_ORDER), 'instruments': get_instruments()}
+
+
+BUNDLES = {
+    'hamd': _hamd_payload,
+    'instruments': _instruments_payload,
+}
+
+
+@lru_cache(maxsize=None)
+def bundle_content(name: str) -> Tuple[str, bytes]:
+    """(静的ファイルのパス, JSON のバイト列) を返す。パスには内容の sha1 先頭12桁が入る。"""
+    payload = BUNDLES[name]()
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    digest = hashlib.sha1(data).hexdigest()[:12]
+    return f"{BUNDLE_DIR}/{name}.{digest}.json", data
+
+
+def _exists(path: str) -> bool:
+    if finders.find(path):
+        return True
+    try:
+        return staticfiles_storage.exists(path)
+    except Exception:
+        return False
+
+
+def bundle_url(name: str) -> Optional[str]:
+    """現在の定義に対応するバンドルの URL。ビルドされていなければ None。"""
+    if name not in _urls:
+        path, _data = bundle_content(name)
+        url = static(path) if _exists(path) else None
+        with _lock:
+            _urls[name] = url
+    return _urls[name]
+
+
+def default_output_dir() -> str:
+    return os.path.join(apps.get_app_config('rtms_app').path, 'static', *BUNDLE_DIR.split('/'))
+
+
+def write_bundles(output_dir: Optional[str] = None) -> List[str]:
+    """全バンドルを output_dir に書き出し、同名の古いハッシュのファイルは消す。書いたパスを返す。"""
+    output_dir = output_dir or default_output_dir()
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    for name in BUNDLES:
+        path, data = bundle_content(name)
+        filename = os.path.basename(path)
+        for existing in os.listdir(output_dir):
+            if existing != filename and existing.startswith(f"{name}.") and existing.endswith('.json'):
+                os.remove(os.path.join(output_dir, existing))
+        target = os.path.join(output_dir, filename)
+        with open(target, 'wb') as f:
+            f.write(data)
+        written.append(target)
+    reset()
+    return written
+
+
+def reset():
+    """bundle_url() の存在確認キャッシュを消す（書き出し直後・テスト用）。"""
+    with _lock:
+        _urls.clear()
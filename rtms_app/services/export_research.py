@@ -11,6 +11,10 @@ from decimal import Decimal
 from django.utils import timezone
 from django.db.models import Q, Count, Max, Min
 from rtms_app.models import Patient, TreatmentSession, AssessmentRecord, SeriousAdverseEvent, AdverseEventReport
+from rtms_app.protocols import get_protocol
+
+# (Assessment.timing, column key infix) of the follow-up HAM-D columns
+HAMD_TIMINGS = (('week3', '3w'), ('week4', '4w'), ('week6', '6w'))
 
 
 class ResearchCSVExporter:
@@ -19,6 +23,10 @@ class ResearchCSVExporter:
     One row = (card_id, course_number) with all patient/treatment/assessment data horizontally.
     """
     
+    # Narrative Patient fields the column getters read; kept when the
+    # exporter's queryset uses Patient.objects.lean()
+    PATIENT_FIELDS = ('psychiatric_history', 'psychiatric_history_other_text')
+
     # Column definitions by category
     CATEGORIES = {
         'patient_basic': {
@@ -59,18 +67,18 @@ class ResearchCSVExporter:
             'columns': [
                 ('hamd_baseline_17', 'HAM-D17（ベースライン）', lambda p, *args: _get_hamd_by_timing(p, 'baseline', 17)),
                 ('hamd_baseline_21', 'HAM-D21（ベースライン）', lambda p, *args: _get_hamd_by_timing(p, 'baseline', 21)),
-                ('hamd_3w_17', 'HAM-D17（第3週）', lambda p, *args: _get_hamd_by_timing(p, '3w', 17)),
-                ('hamd_3w_21', 'HAM-D21（第3週）', lambda p, *args: _get_hamd_by_timing(p, '3w', 21)),
-                ('hamd_3w_improvement', 'HAM-D17改善率（第3週）', lambda p, *args: _format_percent(_get_hamd_improvement(p, '3w', 17))),
-                ('hamd_3w_status', '判定（第3週）', lambda p, *args: _get_hamd_status(p, '3w')),
-                ('hamd_4w_17', 'HAM-D17（第4週）', lambda p, *args: _get_hamd_by_timing(p, '4w', 17)),
-                ('hamd_4w_21', 'HAM-D21（第4週）', lambda p, *args: _get_hamd_by_timing(p, '4w', 21)),
-                ('hamd_4w_improvement', 'HAM-D17改善率（第4週）', lambda p, *args: _format_percent(_get_hamd_improvement(p, '4w', 17))),
-                ('hamd_4w_status', '判定（第4週）', lambda p, *args: _get_hamd_status(p, '4w')),
-                ('hamd_6w_17', 'HAM-D17（第6週）', lambda p, *args: _get_hamd_by_timing(p, '6w', 17)),
-                ('hamd_6w_21', 'HAM-D21（第6週）', lambda p, *args: _get_hamd_by_timing(p, '6w', 21)),
-                ('hamd_6w_improvement', 'HAM-D17改善率（第6週）', lambda p, *args: _format_percent(_get_hamd_improvement(p, '6w', 17))),
-                ('hamd_6w_status', '判定（第6週）', lambda p, *args: _get_hamd_status(p, '6w')),
+                ('hamd_3w_17', 'HAM-D17（第3週）', lambda p, *args: _get_hamd_by_timing(p, 'week3', 17)),
+                ('hamd_3w_21', 'HAM-D21（第3週）', lambda p, *args: _get_hamd_by_timing(p, 'week3', 21)),
+                ('hamd_3w_improvement', 'HAM-D17改善率（第3週）', lambda p, *args: _format_percent(_get_hamd_improvement(p, 'week3', 17))),
+                ('hamd_3w_status', '判定（第3週）', lambda p, *args: _get_hamd_status(p, 'week3')),
+                ('hamd_4w_17', 'HAM-D17（第4週）', lambda p, *args: _get_hamd_by_timing(p, 'week4', 17)),
+                ('hamd_4w_21', 'HAM-D21（第4週）', lambda p, *args: _get_hamd_by_timing(p, 'week4', 21)),
+                ('hamd_4w_improvement', 'HAM-D17改善率（第4週）', lambda p, *args: _format_percent(_get_hamd_improvement(p, 'week4', 17))),
+                ('hamd_4w_status', '判定（第4週）', lambda p, *args: _get_hamd_status(p, 'week4')),
+                ('hamd_6w_17', 'HAM-D17（第6週）', lambda p, *args: _get_hamd_by_timing(p, 'week6', 17)),
+                ('hamd_6w_21', 'HAM-D21（第6週）', lambda p, *args: _get_hamd_by_timing(p, 'week6', 21)),
+                ('hamd_6w_improvement', 'HAM-D17改善率（第6週）', lambda p, *args: _format_percent(_get_hamd_improvement(p, 'week6', 17))),
+                ('hamd_6w_status', '判定（第6週）', lambda p, *args: _get_hamd_status(p, 'week6')),
             ]
         },
         'adverse_events': {
@@ -149,9 +157,8 @@ def _count_treatment_sessions(patient, related_data=None):
 
 
 def _get_planned_sessions(patient):
-    """Get planned total sessions (default 30, customize by protocol later)."""
-    # For now, default to 30. Can be customized by protocol_type later.
-    return 30
+    """Get planned total sessions of the patient's protocol."""
+    return get_protocol(patient).total_sessions
 
 
 def _get_last_treatment_date(patient, related_data=None):
@@ -159,8 +166,8 @@ def _get_last_treatment_date(patient, related_data=None):
     last_session = TreatmentSession.objects.filter(
         patient=patient,
         course_number=patient.course_number
-    ).order_by('-date').first()
-    return last_session.date.date().isoformat() if last_session else ''
+    ).order_by('-session_date', '-date').first()
+    return last_session.session_date.isoformat() if last_session else ''
 
 
 def _get_treatment_duration(patient, related_data=None):
@@ -221,16 +228,16 @@ def _get_hamd_status(patient, timing):
 def _has_adverse_event_report(patient, related_data=None):
     """Check if patient has any adverse event reports."""
     return AdverseEventReport.objects.filter(
-        patient=patient,
-        course_number=patient.course_number
+        session__patient=patient,
+        session__course_number=patient.course_number
     ).exists()
 
 
 def _count_adverse_events(patient, related_data=None):
     """Count adverse event reports."""
     return AdverseEventReport.objects.filter(
-        patient=patient,
-        course_number=patient.course_number
+        session__patient=patient,
+        session__course_number=patient.course_number
     ).count()
 
 
@@ -0,0 +1,52 @@
+"""
+事前レンダリング済みの静的 HTML 断片
+
+HAM-D のアンカー付き行・質問票の選択肢ブロック・副作用チェック票の既定行は
+定義が変わらない限り毎回同じ HTML になる。定義のハッシュ（version）ごとに一度だけ
+レンダリングしてプロセス内に保持する。
+
+RTMS_PRECOMPILED_FRAGMENTS が False（開発時の既定）のときは毎回レンダリングするので、
+テンプレートを編集してもすぐ反映される。
+"""
+import hashlib
+import json
+import threading
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+_lock = threading.Lock()
+_fragments = {}
+
+
+def definition_version(*parts) -> str:
+    """定義データ（dict/list/tuple など JSON 化できるもの）から短いハッシュを作る。"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]
+
+
+def render_fragment(template_name, version, context, variant=()):
+    """template_name を context でレンダリングした safe な HTML を返す。
+
+    (template_name, version, variant) が同じなら2回目以降はキャッシュを返す。
+    variant には表示位置など、context のうち定義以外で出力が変わる値を渡す。
+    """
+    if not getattr(settings, 'RTMS_PRECOMPILED_FRAGMENTS', False):
+        return mark_safe(render_to_string(template_name, context))
+    key = (template_name, version, tuple(variant))
+    html = _fragments.get(key)
+    if html is None:
+        html = mark_safe(render_to_string(template_name, context))
+        with _lock:
+            _fragments[key] = html
+    return html
+
+
+def cached_fragment_count():
+    return len(_fragments)
+
+
+def clear_fragments():
+    with _lock:
+        _fragments.clear()
@@ -0,0 +1,62 @@
+"""
+祝日カレンダー（jpholiday / holidays の遅延 import + 年単位キャッシュ）
+
+どちらのライブラリも import に数十 ms かかるため、最初に祝日を引いたときに読み込む。
+warm(years) を呼ぶとその年の表を先に作っておける（rtms_app.warmup から使用）。
+"""
+import datetime
+import threading
+from typing import Dict, Iterable, Optional
+
+_lock = threading.Lock()
+_jp_names: Dict[int, Dict[datetime.date, str]] = {}
+_country_holidays = None
+_UNAVAILABLE = object()
+
+
+def _year_names(year: int) -> Dict[datetime.date, str]:
+    names = _jp_names.get(year)
+    if names is None:
+        try:
+            import jpholiday
+        except ImportError:
+            names = {}
+        else:
+            names = dict(jpholiday.year_holidays(year))
+        with _lock:
+            _jp_names[year] = names
+    return names
+
+
+def holiday_name(d: datetime.date) -> Optional[str]:
+    """jpholiday による祝日名（祝日でなければ None、jpholiday 未導入でも None）。"""
+    return _year_names(d.year).get(d)
+
+
+def _jp_country_holidays():
+    global _country_holidays
+    if _country_holidays is None:
+        try:
+            import holidays as pyholidays
+            calendar = pyholidays.CountryHoliday('JP')
+        except Exception:
+            calendar = _UNAVAILABLE
+        with _lock:
+            _country_holidays = calendar
+    return None if _country_holidays is _UNAVAILABLE else _country_holidays
+
+
+def is_public_holiday(d: datetime.date) -> Optional[bool]:
+    """holidays パッケージによる判定。パッケージが使えなければ None。"""
+    calendar = _jp_country_holidays()
+    if calendar is None:
+        return None
+    return d in calendar
+
+
+def warm(years: Iterable[int]) -> None:
+    for year in years:
+        _year_names(year)
+        calendar = _jp_country_holidays()
+        if calendar is not None:
+            datetime.date(year, 1, 1) in calendar
@@ -0,0 +1,113 @@
+"""
+Long-format (one row per item) export of clinician ratings and patient surveys.
+
+The per-patient survey CSV and the research CSV carry totals only. This
+streams every answered item across the cohort:
+
+    patient_id, card_id, course_number, source, timing, instrument, item, answer, score, date
+
+- source='clinician': AssessmentRecord.scores (any scale; timing = 評価時期).
+  Legacy HAM-D rows in Assessment are included only when no hamd
+  AssessmentRecord exists for the same (patient, course, timing), so
+  mirrored rows are not exported twice.
+- source='patient': PatientSurveyResponse.answers of submitted sessions
+  (timing = session phase). `answer` is the chosen option id and `score`
+  the item score after reverse-keying (surveys.item_score_table).
+
+Each source is read with values_list(...).iterator(), so only one chunk of
+JSON documents is held in memory at a time regardless of cohort size.
+"""
+from typing import Iterator, Optional
+
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from rtms_app.models import Assessment, AssessmentRecord, PatientSurveyResponse
+from rtms_app.surveys import item_score_table
+
+ITEM_CSV_HEADER = [
+    "patient_id",
+    "card_id",
+    "course_number",
+    "source",
+    "timing",
+    "instrument",
+    "item",
+    "answer",
+    "score",
+    "date",
+]
+
+ITERATOR_CHUNK_SIZE = 2000
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _scale_rows(patient_id, card_id, course, timing, instrument, when, scores):
+    for item, value in (scores or {}).items():
+        yield [f"{patient_id:05d}", card_id, course, "clinician", timing, instrument, item, value,
+               _int_or_none(value), when.isoformat() if when else ""]
+
+
+def clinician_item_rows(patient_id: Optional[int] = None) -> Iterator[list]:
+    records = AssessmentRecord.objects.all()
+    legacy = Assessment.objects.filter(type="HAM-D").exclude(
+        Exists(AssessmentRecord.objects.filter(
+            patient=OuterRef("patient"),
+            course_number=OuterRef("course_number"),
+            timing=OuterRef("timing"),
+            scale__code="hamd",
+        ))
+    )
+    if patient_id is not None:
+        records = records.filter(patient_id=patient_id)
+        legacy = legacy.filter(patient_id=patient_id)
+
+    for pid, card_id, course, timing, code, when, scores in (
+        records.order_by("patient_id", "course_number", "date", "id")
+        .values_list("patient_id", "patient__card_id", "course_number", "timing", "scale__code", "date", "scores")
+        .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    ):
+        yield from _scale_rows(pid, card_id, course, timing, code, when, scores)
+
+    for pid, card_id, course, timing, when, scores in (
+        legacy.order_by("patient_id", "course_number", "date", "id")
+        .values_list("patient_id", "patient__card_id", "course_number", "timing", "date", "scores")
+        .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    ):
+        yield from _scale_rows(pid, card_id, course, timing, "hamd", when, scores)
+
+
+def survey_item_rows(patient_id: Optional[int] = None) -> Iterator[list]:
+    responses = PatientSurveyResponse.objects.filter(session__status="submitted")
+    if patient_id is not None:
+        responses = responses.filter(session__patient_id=patient_id)
+
+    for pid, card_id, course, phase, submitted_at, instrument, answers in (
+        responses.order_by("session__patient_id", "session__course_number", "session__started_at", "id")
+        .values_list(
+            "session__patient_id", "session__patient__card_id", "session__course_number",
+            "session__phase", "session__submitted_at", "instrument", "answers",
+        )
+        .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    ):
+        answers = answers or {}
+        when = timezone.localtime(submitted_at).date().isoformat() if submitted_at else ""
+        table = item_score_table(instrument)
+        # 設問順に並べ、定義にない回答キーは末尾（score は空）
+        keys = [k for k in table if k in answers] + [k for k in answers if k not in table]
+        for key in keys:
+            answer = answers[key]
+            score = table.get(key, {}).get(str(answer))
+            yield [f"{pid:05d}", card_id, course, "patient", phase, instrument, key, answer, score, when]
+
+
+def iter_item_rows(patient_id: Optional[int] = None) -> Iterator[list]:
+    """All item rows: clinician ratings first, then patient surveys."""
+    yield from clinician_item_rows(patient_id)
+    yield from survey_item_rows(patient_id)
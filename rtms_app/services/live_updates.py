@@ -0,0 +1,154 @@
+"""
+ダッシュボード・月間カレンダーのライブ更新（Server-Sent Events）
+
+TreatmentSession / MappingSession / Assessment / Patient が保存・削除されると、
+シグナルから小さな差分（delta）を作り、コミット後にプロセス内の購読者へ配る。
+購読者は views_live.live_events の SSE ストリーム1本につき1つで、表示中の日付範囲と
+画面に出ている患者 ID で絞り込む。
+
+配信はプロセス内だけなので、書き込みを受けたプロセスと SSE をつないでいるプロセスが
+同じときにだけ届く（ASGI サーバーを1プロセスで動かす構成を想定）。
+届かなかった変更は次の再読み込みで反映されるだけで、データの整合性には影響しない。
+
+delta の例:
+    {"kind": "treatment", "patient_id": 3, "dates": ["2026-02-02"], "done": true}
+"""
+import asyncio
+import datetime
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional
+
+from django.db import transaction
+
+# 購読者ごとのキューの上限。溢れたら差分を捨てて resync を送る
+QUEUE_SIZE = 100
+
+
+@dataclass(eq=False)
+class Subscription:
+    """SSE 接続1本分。start..end の日付か patient_ids の患者に関わる差分だけ受け取る。"""
+    loop: asyncio.AbstractEventLoop
+    start: datetime.date
+    end: datetime.date
+    patient_ids: FrozenSet[int] = frozenset()
+    queue: asyncio.Queue = field(default_factory=lambda: asyncio.Queue(QUEUE_SIZE))
+    overflowed: bool = False
+
+    def matches(self, delta: Dict[str, Any]) -> bool:
+        if delta.get('patient_id') in self.patient_ids:
+            return True
+        for value in delta.get('dates', ()):
+            if self.start.isoformat() <= value <= self.end.isoformat():
+                return True
+        return False
+
+    def offer(self, delta: Dict[str, Any]):
+        # イベントループのスレッドで呼ばれる
+        try:
+            self.queue.put_nowait(delta)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class Broker:
+    """購読者の登録と差分の配信。publish はどのスレッドから呼んでもよい。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions: List[Subscription] = []
+
+    def has_subscribers(self) -> bool:
+        return bool(self._subscriptions)
+
+    def subscribe(self, loop, start, end, patient_ids=()) -> Subscription:
+        sub = Subscription(loop=loop, start=start, end=end, patient_ids=frozenset(patient_ids))
+        with self._lock:
+            self._subscriptions.append(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            if sub in self._subscriptions:
+                self._subscriptions.remove(sub)
+
+    def publish(self, delta: Dict[str, Any]) -> int:
+        """delta を該当する購読者へ送り、送った数を返す。"""
+        with self._lock:
+            targets = [sub for sub in self._subscriptions if sub.matches(delta)]
+        sent = 0
+        for sub in targets:
+            try:
+                sub.loop.call_soon_threadsafe(sub.offer, delta)
+            except RuntimeError:
+                # ループが閉じている（切断済み）
+                self.unsubscribe(sub)
+                continue
+            sent += 1
+        return sent
+
+
+broker = Broker()
+
+
+def _iso(*values) -> List[str]:
+    out = []
+    for value in values:
+        if isinstance(value, datetime.datetime):
+            value = value.date()
+        if value:
+            out.append(value.isoformat())
+    return sorted(set(out))
+
+
+def delta_for(instance, deleted: bool = False) -> Optional[Dict[str, Any]]:
+    """モデルインスタンスの変更を表す delta。対象外のモデルなら None。"""
+    from rtms_app.models import Assessment, MappingSession, Patient, TreatmentSession
+
+    if isinstance(instance, TreatmentSession):
+        return {
+            'kind': 'treatment',
+            'patient_id': instance.patient_id,
+            'dates': _iso(instance.session_date),
+            'done': not deleted,
+            'status': instance.status,
+        }
+    if isinstance(instance, MappingSession):
+        return {
+            'kind': 'mapping',
+            'patient_id': instance.patient_id,
+            'dates': _iso(instance.date),
+            'done': not deleted,
+        }
+    if isinstance(instance, Assessment):
+        return {
+            'kind': 'assessment',
+            'patient_id': instance.patient_id,
+            'dates': _iso(instance.date, instance.performed_date),
+            'timing': instance.timing,
+            'done': not deleted,
+        }
+    if isinstance(instance, Patient):
+        return {
+            'kind': 'patient',
+            'patient_id': instance.pk,
+            'dates': _iso(
+                instance.created_at,
+                instance.admission_date,
+                instance.mapping_date,
+                instance.first_treatment_date,
+                instance.discharge_date,
+            ),
+            'admission_done': bool(instance.is_admission_procedure_done),
+            'deleted': deleted,
+        }
+    return None
+
+
+def publish_on_commit(instance, deleted: bool = False):
+    """購読者がいれば、トランザクションのコミット後に instance の delta を配る。"""
+    if not broker.has_subscribers():
+        return
+    delta = delta_for(instance, deleted=deleted)
+    if delta is not None:
+        transaction.on_commit(lambda: broker.publish(delta))
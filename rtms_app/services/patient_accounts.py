@@ -1,12 +1,27 @@
 from __future__ import annotations
-from typing import Tuple
-
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterable, List, Tuple
+
+import django
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import Group, User
 from django.db import transaction
+from django.db.models import F
 
 from rtms_app.models import Patient
 
 PATIENT_GROUP_NAME = "patient"
+CARD_ID_RE = re.compile(r'^\d{5}$')
+
+# Below this many passwords, hash in-process instead of starting a process pool
+PARALLEL_HASH_MIN = 8
+
+
+def is_valid_card_id(card_id) -> bool:
+    return bool(card_id) and bool(CARD_ID_RE.match(card_id))
 
 
 def ensure_patient_group() -> Group:
@@ -21,11 +36,10 @@ def ensure_patient_user(patient: Patient, reset_password: bool = False) -> Tuple
     - user added to PATIENT_GROUP_NAME
     - Patient.user is linked
     """
-    import re
     if not patient.pk:
         raise ValueError("Patient must be saved before creating a user")
-    
-    if not patient.card_id or not re.match(r'^\d{5}$', patient.card_id):
+
+    if not is_valid_card_id(patient.card_id):
         raise ValueError(f"Patient.card_id must be exactly 5 digits, got: {patient.card_id}")
 
     group = ensure_patient_group()
@@ -68,4 +82,136 @@ def reset_patient_password(patient: Patient) -> User:
     return user
 
 
-__all__ = ["ensure_patient_user", "ensure_patient_group", "reset_patient_password", "PATIENT_GROUP_NAME"]
+@dataclass
+class ProvisionResult:
+    created: List[Patient] = field(default_factory=list)
+    linked: List[Patient] = field(default_factory=list)
+    unchanged: List[Patient] = field(default_factory=list)
+    skipped: List[Tuple[Patient, str]] = field(default_factory=list)  # (patient, reason)
+    passwords_set: int = 0
+
+
+def hash_passwords(raw_passwords: List[str], workers: int | None = None) -> List[str]:
+    """make_password for each raw password, spread over a process pool (PBKDF2 is deliberately slow)."""
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(raw_passwords) < PARALLEL_HASH_MIN:
+        return [make_password(p) for p in raw_passwords]
+    chunksize = max(1, len(raw_passwords) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+        return list(pool.map(make_password, raw_passwords, chunksize=chunksize))
+
+
+def provision_patient_users(
+    patients: Iterable[Patient],
+    reset_password: bool = False,
+    workers: int | None = None,
+    batch_size: int = 500,
+) -> ProvisionResult:
+    """Batch version of ensure_patient_user.
+
+    - users and group memberships are created with bulk_create
+    - patients are linked with one bulk_update
+    - passwords are hashed in a process pool (see hash_passwords)
+
+    The number of queries does not grow with the number of patients. Being bulk
+    operations, no post_save fires for User or Patient.
+
+    Patients whose username would clash (card_id repeated in the batch, held by
+    another user, or by a user linked to another patient) are put in
+    result.skipped with the reason, so one bad row does not abort the batch.
+    """
+    result = ProvisionResult()
+    targets = []
+    for patient in patients:
+        if not patient.pk:
+            result.skipped.append((patient, "not saved"))
+        elif not is_valid_card_id(patient.card_id):
+            result.skipped.append((patient, f"invalid card_id '{patient.card_id}'"))
+        else:
+            targets.append(patient)
+    if not targets:
+        return result
+
+    group = ensure_patient_group()
+    linked_users = User.objects.in_bulk([p.user_id for p in targets if p.user_id])
+    # patient_pk: the patient this user is already linked to (None if free)
+    by_username = (
+        User.objects.annotate(patient_pk=F("patient_profile__id"))
+        .in_bulk([p.card_id for p in targets], field_name="username")
+    )
+
+    new_users, new_user_patients, existing_users = [], [], {}
+    claimed = {}  # username -> patient that takes it in this batch
+    for patient in targets:
+        linked = linked_users.get(patient.user_id)
+        holder = by_username.get(patient.card_id)
+        if patient.card_id in claimed:
+            reason = f"card_id '{patient.card_id}' is also used by patient {claimed[patient.card_id].pk}"
+        elif linked is not None and holder is not None and holder.pk != linked.pk:
+            reason = f"username '{patient.card_id}' is already used by user {holder.pk}"
+        elif linked is None and holder is not None and holder.patient_pk not in (None, patient.pk):
+            reason = f"user '{patient.card_id}' is already linked to patient {holder.patient_pk}"
+        else:
+            reason = None
+        if reason:
+            result.skipped.append((patient, reason))
+            continue
+        claimed[patient.card_id] = patient
+        user = linked or holder
+        if user is None:
+            user = User(username=patient.card_id, is_active=True, first_name=patient.name or "")
+            new_users.append(user)
+            new_user_patients.append(patient)
+            continue
+        if user.username != patient.card_id:
+            user.username = patient.card_id
+        if not user.first_name and patient.name:
+            user.first_name = patient.name
+        existing_users[patient.pk] = user
+
+    to_hash = new_users + (list(existing_users.values()) if reset_password else [])
+    for user, hashed in zip(to_hash, hash_passwords([u.username for u in to_hash], workers)):
+        user.password = hashed
+    result.passwords_set = len(to_hash)
+
+    update_fields = ["username", "first_name"] + (["password"] if reset_password else [])
+    with transaction.atomic():
+        User.objects.bulk_create(new_users, batch_size=batch_size)
+        User.objects.bulk_update(list(existing_users.values()), update_fields, batch_size=batch_size)
+
+        Membership = User.groups.through
+        Membership.objects.bulk_create(
+            [Membership(user_id=u.pk, group_id=group.pk) for u in new_users + list(existing_users.values())],
+            ignore_conflicts=True,
+            batch_size=batch_size,
+        )
+
+        for patient, user in zip(new_user_patients, new_users):
+            patient.user = user
+        relink = []
+        for patient in targets:
+            user = existing_users.get(patient.pk)
+            if user is None:
+                continue
+            if patient.user_id != user.pk:
+                patient.user = user
+                relink.append(patient)
+            else:
+                result.unchanged.append(patient)
+        Patient.objects.bulk_update(new_user_patients + relink, ["user"], batch_size=batch_size)
+
+    result.created = new_user_patients
+    result.linked = relink
+    return result
+
+
+__all__ = [
+    "ensure_patient_user",
+    "ensure_patient_group",
+    "reset_patient_password",
+    "provision_patient_users",
+    "hash_passwords",
+    "is_valid_card_id",
+    "ProvisionResult",
+    "PATIENT_GROUP_NAME",
+]
@@ -0,0 +1,414 @@
+"""
+Typed columnar research dataset export (Parquet / NPZ).
+
+The wide research CSV (ResearchCSVExporter) turns every value into text —
+'有'/'無', '12.5%', ISO dates — which pandas/R then have to parse back.
+This module exports the same categories with real column types, plus two
+long tables, as one zip archive:
+
+- courses:    one row per (card_id, course_number); the CSV's columns
+- sessions:   one row per TreatmentSession
+- hamd_items: one row per HAM-D item of each AssessmentRecord
+
+Each table is built from chunked querysets (ROW_GROUP_SIZE rows per chunk,
+a fixed number of bulk queries per chunk) and written chunk by chunk:
+
+- pyarrow installed (optional): `<table>.parquet`, one row group per chunk
+  (date32, dictionary-encoded categoricals, nullable int64)
+- otherwise NumPy:   `<table>.npz` (datetime64[D], int32 category codes,
+  int64/bool/str values with a `<column>__null` mask); category labels
+  and column types are in `schema.json`
+
+`schema.json` (column labels, dtypes, units, categories, row counts) is
+included in both formats.
+"""
+from __future__ import annotations
+
+import datetime
+import io
+import json
+import zipfile
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.db.models import Count, Max
+
+from rtms_app.models import (
+    AdverseEventReport,
+    AssessmentRecord,
+    Patient,
+    SeriousAdverseEvent,
+    TreatmentSession,
+)
+from rtms_app.protocols import get_protocol
+from rtms_app.services.export_research import HAMD_TIMINGS, ResearchCSVExporter
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow は任意
+    pa = pq = None
+
+ROW_GROUP_SIZE = 2000
+DTYPES = ('string', 'category', 'int', 'float', 'bool', 'date')
+
+
+@dataclass(frozen=True)
+class Column:
+    key: str
+    label: str
+    dtype: str
+    unit: str = ''
+
+
+@dataclass
+class Table:
+    name: str
+    label: str
+    columns: List[Column]
+    # yields lists of row tuples (values in column order, None = missing)
+    chunks: Callable[[], Iterator[List[tuple]]]
+
+
+def available_formats() -> List[str]:
+    """Formats write_dataset can produce, preferred first."""
+    return ['parquet', 'npz'] if pq is not None else ['npz']
+
+
+def _chunked(iterable: Iterable, size: int = ROW_GROUP_SIZE) -> Iterator[list]:
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ==========================================================================
+# courses: typed version of the research CSV
+# ==========================================================================
+
+# dtype (and unit) of each ResearchCSVExporter column
+COURSE_DTYPES: Dict[str, Tuple[str, str]] = {
+    'card_id': ('string', ''), 'course_number': ('int', ''), 'name': ('string', ''),
+    'birth_date': ('date', ''), 'age': ('int', 'years'), 'gender': ('category', ''),
+    'diagnosis': ('string', ''), 'weight_kg': ('float', 'kg'), 'is_weight_unknown': ('bool', ''),
+    'status': ('category', ''),
+    'is_all_case_survey': ('bool', ''), 'estimated_onset_year': ('int', ''), 'estimated_onset_month': ('int', ''),
+    'psychiatric_history': ('string', ''), 'psychiatric_history_other_text': ('string', ''),
+    'first_treatment_date': ('date', ''), 'mapping_date': ('date', ''), 'admission_date': ('date', ''),
+    'discharge_date': ('date', ''), 'treatment_sessions_count': ('int', ''), 'planned_sessions': ('int', ''),
+    'last_treatment_date': ('date', ''), 'treatment_duration_days': ('int', 'days'),
+    'ae_report_exists': ('bool', ''), 'ae_count': ('int', ''), 'sae_count': ('int', ''),
+    'hamd_baseline_17': ('int', 'points'), 'hamd_baseline_21': ('int', 'points'),
+}
+for _timing, _short in HAMD_TIMINGS:
+    COURSE_DTYPES[f'hamd_{_short}_17'] = ('int', 'points')
+    COURSE_DTYPES[f'hamd_{_short}_21'] = ('int', 'points')
+    COURSE_DTYPES[f'hamd_{_short}_improvement'] = ('float', '%')
+    COURSE_DTYPES[f'hamd_{_short}_status'] = ('category', '')
+for _sae in ('seizure', 'finger_muscle', 'syncope', 'mania', 'suicide', 'other'):
+    COURSE_DTYPES[f'sae_{_sae}'] = ('bool', '')
+
+
+class _CourseContext:
+    """Related rows of one chunk of patients, loaded with one query per model."""
+
+    def __init__(self, patients: Sequence[Patient]):
+        ids = [p.id for p in patients]
+        self.sessions = {
+            (r['patient_id'], r['course_number']): (r['n'], r['last'])
+            for r in TreatmentSession.objects.filter(patient_id__in=ids)
+            .values('patient_id', 'course_number').annotate(n=Count('id'), last=Max('session_date'))
+        }
+        self.hamd: Dict[tuple, tuple] = {}
+        rows = (
+            AssessmentRecord.objects.filter(patient_id__in=ids, scale__code='hamd')
+            .order_by('id')
+            .values_list('patient_id', 'course_number', 'timing', 'total_score_17', 'total_score_21',
+                         'improvement_rate_17', 'status_label')
+        )
+        for pid, course, timing, s17, s21, imp, label in rows:
+            # same as .first() in the CSV getters
+            self.hamd.setdefault((pid, course, timing), (s17, s21, imp, label or None))
+        # AdverseEventReport reaches patient/course through its session
+        self.ae = {
+            (r['session__patient_id'], r['session__course_number']): r['n']
+            for r in AdverseEventReport.objects.filter(session__patient_id__in=ids)
+            .values('session__patient_id', 'session__course_number').annotate(n=Count('id'))
+        }
+        self.sae: Dict[tuple, List[list]] = {}
+        for pid, course, types in SeriousAdverseEvent.objects.filter(patient_id__in=ids).values_list(
+            'patient_id', 'course_number', 'event_types'
+        ):
+            self.sae.setdefault((pid, course), []).append(types or [])
+
+
+def _age(p):
+    return p.age if p.birth_date else None
+
+
+def _duration(p, ctx):
+    last = ctx.sessions.get((p.id, p.course_number), (0, None))[1]
+    if not p.first_treatment_date or not last:
+        return None
+    days = (last - p.first_treatment_date).days
+    return days if days >= 0 else None
+
+
+def _hamd(field_index):
+    def getter(timing):
+        return lambda p, ctx: ctx.hamd.get((p.id, p.course_number, timing), (None,) * 4)[field_index]
+    return getter
+
+
+def _sae_flag(event_type):
+    return lambda p, ctx: any(event_type in types for types in ctx.sae.get((p.id, p.course_number), []))
+
+
+COURSE_GETTERS: Dict[str, Callable] = {
+    'card_id': lambda p, ctx: p.card_id,
+    'course_number': lambda p, ctx: p.course_number,
+    'name': lambda p, ctx: p.name,
+    'birth_date': lambda p, ctx: p.birth_date,
+    'age': lambda p, ctx: _age(p),
+    'gender': lambda p, ctx: dict(p.GENDER_CHOICES).get(p.gender),
+    'diagnosis': lambda p, ctx: p.diagnosis or None,
+    'weight_kg': lambda p, ctx: float(p.weight_kg) if p.weight_kg is not None else None,
+    'is_weight_unknown': lambda p, ctx: bool(p.is_weight_unknown),
+    'status': lambda p, ctx: dict(p.STATUS_CHOICES).get(p.status),
+    'is_all_case_survey': lambda p, ctx: bool(p.is_all_case_survey),
+    'estimated_onset_year': lambda p, ctx: p.estimated_onset_year,
+    'estimated_onset_month': lambda p, ctx: p.estimated_onset_month,
+    'psychiatric_history': lambda p, ctx: ','.join(p.psychiatric_history) if p.psychiatric_history else None,
+    'psychiatric_history_other_text': lambda p, ctx: p.psychiatric_history_other_text or None,
+    'first_treatment_date': lambda p, ctx: p.first_treatment_date,
+    'mapping_date': lambda p, ctx: p.mapping_date,
+    'admission_date': lambda p, ctx: p.admission_date,
+    'discharge_date': lambda p, ctx: p.discharge_date,
+    'treatment_sessions_count': lambda p, ctx: ctx.sessions.get((p.id, p.course_number), (0, None))[0],
+    'planned_sessions': lambda p, ctx: get_protocol(p).total_sessions,
+    'last_treatment_date': lambda p, ctx: ctx.sessions.get((p.id, p.course_number), (0, None))[1],
+    'treatment_duration_days': _duration,
+    'ae_report_exists': lambda p, ctx: ctx.ae.get((p.id, p.course_number), 0) > 0,
+    'ae_count': lambda p, ctx: ctx.ae.get((p.id, p.course_number), 0),
+    'sae_count': lambda p, ctx: len(ctx.sae.get((p.id, p.course_number), [])),
+    'sae_seizure': _sae_flag('seizure'),
+    'sae_finger_muscle': _sae_flag('finger_muscle'),
+    'sae_syncope': _sae_flag('syncope'),
+    'sae_mania': _sae_flag('mania'),
+    'sae_suicide': _sae_flag('suicide_attempt'),
+    'sae_other': _sae_flag('other'),
+    'hamd_baseline_17': _hamd(0)('baseline'),
+    'hamd_baseline_21': _hamd(1)('baseline'),
+}
+for _timing, _short in HAMD_TIMINGS:
+    COURSE_GETTERS[f'hamd_{_short}_17'] = _hamd(0)(_timing)
+    COURSE_GETTERS[f'hamd_{_short}_21'] = _hamd(1)(_timing)
+    COURSE_GETTERS[f'hamd_{_short}_improvement'] = _hamd(2)(_timing)
+    COURSE_GETTERS[f'hamd_{_short}_status'] = _hamd(3)(_timing)
+
+
+def course_table(selected_categories: Optional[Sequence[str]] = None) -> Table:
+    exporter = ResearchCSVExporter(selected_categories=selected_categories)
+    columns = [Column(key, label, *COURSE_DTYPES[key]) for key, label, _ in exporter.columns]
+    getters = [COURSE_GETTERS[c.key] for c in columns]
+
+    def chunks():
+        patients = (
+            Patient.objects.lean(*ResearchCSVExporter.PATIENT_FIELDS)
+            .order_by('card_id', 'course_number')
+            .iterator(chunk_size=ROW_GROUP_SIZE)
+        )
+        for chunk in _chunked(patients):
+            ctx = _CourseContext(chunk)
+            yield [tuple(g(p, ctx) for g in getters) for p in chunk]
+
+    return Table('courses', '患者・クール', columns, chunks)
+
+
+# ==========================================================================
+# long tables
+# ==========================================================================
+
+SESSION_COLUMNS = [
+    Column('card_id', 'カルテ番号', 'string'),
+    Column('course_number', 'クール数', 'int'),
+    Column('session_date', '実施日', 'date'),
+    Column('slot', 'スロット', 'category'),
+    Column('status', 'ステータス', 'category'),
+    Column('coil_type', 'コイル', 'category'),
+    Column('target_site', '刺激部位', 'category'),
+    Column('mt_percent', 'MT', 'int', '%'),
+    Column('intensity_percent', '刺激強度', 'int', '%MT'),
+    Column('frequency_hz', '周波数', 'float', 'Hz'),
+    Column('train_seconds', 'トレイン時間', 'float', 's'),
+    Column('intertrain_seconds', 'トレイン間隔', 'float', 's'),
+    Column('train_count', 'トレイン数', 'int'),
+    Column('total_pulses', '総パルス数', 'int'),
+    Column('sessions_per_day', '1日の回数', 'int'),
+]
+
+
+def session_table() -> Table:
+    fields = ['patient__card_id'] + [c.key for c in SESSION_COLUMNS[1:]]
+    decimals = {i for i, c in enumerate(SESSION_COLUMNS) if c.dtype == 'float'}
+
+    def chunks():
+        rows = (
+            TreatmentSession.objects.order_by('patient__card_id', 'course_number', 'session_date', 'date', 'id')
+            .values_list(*fields)
+            .iterator(chunk_size=ROW_GROUP_SIZE)
+        )
+        for chunk in _chunked(rows):
+            yield [
+                tuple(
+                    (float(v) if v is not None else None) if i in decimals else (v if v != '' else None)
+                    for i, v in enumerate(row)
+                )
+                for row in chunk
+            ]
+
+    return Table('sessions', '治療セッション', SESSION_COLUMNS, chunks)
+
+
+HAMD_ITEM_COLUMNS = [
+    Column('card_id', 'カルテ番号', 'string'),
+    Column('course_number', 'クール数', 'int'),
+    Column('timing', '時期', 'category'),
+    Column('date', '評価日', 'date'),
+    Column('item', '項目', 'category'),
+    Column('score', '得点', 'int', 'points'),
+]
+
+
+def hamd_item_table() -> Table:
+    def chunks():
+        rows = (
+            AssessmentRecord.objects.filter(scale__code='hamd')
+            .order_by('patient__card_id', 'course_number', 'date', 'id')
+            .values_list('patient__card_id', 'course_number', 'timing', 'date', 'scores')
+            .iterator(chunk_size=ROW_GROUP_SIZE)
+        )
+        for chunk in _chunked(rows):
+            out = []
+            for card_id, course, timing, d, scores in chunk:
+                for item, score in (scores or {}).items():
+                    try:
+                        value = int(score)
+                    except (TypeError, ValueError):
+                        value = None
+                    out.append((card_id, course, timing, d, item, value))
+            yield out
+
+    return Table('hamd_items', 'HAM-D 項目別得点', HAMD_ITEM_COLUMNS, chunks)
+
+
+def research_tables(selected_categories: Optional[Sequence[str]] = None) -> List[Table]:
+    return [course_table(selected_categories), session_table(), hamd_item_table()]
+
+
+# ==========================================================================
+# writers
+# ==========================================================================
+
+def _column_schema(column: Column) -> Dict:
+    out = {'key': column.key, 'label': column.label, 'dtype': column.dtype}
+    if column.unit:
+        out['unit'] = column.unit
+    return out
+
+
+def _write_parquet(table: Table) -> Tuple[bytes, Dict]:
+    arrow_types = {
+        'string': pa.string(), 'category': pa.string(), 'int': pa.int64(),
+        'float': pa.float64(), 'bool': pa.bool_(), 'date': pa.date32(),
+    }
+    schema = pa.schema([
+        pa.field(c.key, pa.dictionary(pa.int32(), pa.string()) if c.dtype == 'category' else arrow_types[c.dtype])
+        for c in table.columns
+    ])
+    sink = pa.BufferOutputStream()
+    rows = 0
+    with pq.ParquetWriter(sink, schema) as writer:
+        for chunk in table.chunks():
+            arrays = []
+            for i, c in enumerate(table.columns):
+                arr = pa.array([row[i] for row in chunk], type=arrow_types[c.dtype])
+                arrays.append(arr.dictionary_encode() if c.dtype == 'category' else arr)
+            # one row group per chunk
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            rows += len(chunk)
+    meta = {'rows': rows, 'columns': [_column_schema(c) for c in table.columns]}
+    return sink.getvalue().to_pybytes(), meta
+
+
+def _npz_chunk(column: Column, values: list, categories: Dict[str, int]):
+    """(values array, null mask) of one column chunk."""
+    null = np.array([v is None for v in values], dtype=bool)
+    if column.dtype == 'date':
+        data = np.array([v if v is not None else 'NaT' for v in values], dtype='datetime64[D]')
+    elif column.dtype == 'category':
+        data = np.array([categories.setdefault(v, len(categories)) if v is not None else -1 for v in values], dtype=np.int32)
+    elif column.dtype == 'int':
+        data = np.array([v if v is not None else 0 for v in values], dtype=np.int64)
+    elif column.dtype == 'float':
+        data = np.array([v if v is not None else np.nan for v in values], dtype=np.float64)
+    elif column.dtype == 'bool':
+        data = np.array([bool(v) for v in values], dtype=bool)
+    else:
+        data = np.array([v if v is not None else '' for v in values], dtype=str)
+    return data, null
+
+
+def _write_npz(table: Table) -> Tuple[bytes, Dict]:
+    parts: Dict[str, List] = {c.key: [] for c in table.columns}
+    masks: Dict[str, List] = {c.key: [] for c in table.columns}
+    categories: Dict[str, Dict[str, int]] = {c.key: {} for c in table.columns if c.dtype == 'category'}
+    rows = 0
+    for chunk in table.chunks():
+        for i, c in enumerate(table.columns):
+            data, null = _npz_chunk(c, [row[i] for row in chunk], categories.get(c.key, {}))
+            parts[c.key].append(data)
+            masks[c.key].append(null)
+        rows += len(chunk)
+
+    empty = {'date': 'datetime64[D]', 'category': np.int32, 'int': np.int64, 'float': np.float64, 'bool': bool, 'string': str}
+    arrays = {}
+    columns = []
+    for c in table.columns:
+        arrays[c.key] = np.concatenate(parts[c.key]) if parts[c.key] else np.array([], dtype=empty[c.dtype])
+        null = np.concatenate(masks[c.key]) if masks[c.key] else np.array([], dtype=bool)
+        # dates/floats carry NaT/NaN; categories use -1
+        if c.dtype in ('int', 'bool', 'string') and null.any():
+            arrays[f'{c.key}__null'] = null
+        col = _column_schema(c)
+        if c.dtype == 'category':
+            col['categories'] = list(categories[c.key])
+        columns.append(col)
+    buf = io.BytesIO()
+    np.savez_compressed(buf, **arrays)
+    return buf.getvalue(), {'rows': rows, 'columns': columns}
+
+
+def write_dataset(out, tables: Sequence[Table], fmt: Optional[str] = None) -> str:
+    """Write tables into the zip file-like `out`. Returns the format used."""
+    formats = available_formats()
+    fmt = fmt if fmt in formats else formats[0]
+    writer = _write_parquet if fmt == 'parquet' else _write_npz
+    schema = {
+        'format': fmt,
+        'generated_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'tables': {},
+    }
+    # members are already compressed
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_STORED) as zf:
+        for table in tables:
+            data, meta = writer(table)
+            zf.writestr(f'{table.name}.{fmt}', data)
+            schema['tables'][table.name] = {'label': table.label, **meta}
+        zf.writestr('schema.json', json.dumps(schema, ensure_ascii=False, indent=2))
+    return fmt
@@ -1,5 +1,8 @@
 import datetime
-from typing import List, Optional, Set
+import math
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
 
 DEFAULT_TOTAL_SESSIONS = 30
 DEFAULT_PER_WEEK = 5
@@ -50,7 +53,9 @@ def session_info_for_date(planned_dates: List[datetime.date],
     return {"session_no": n, "week_no": week}
 
 
-def format_rtms_label(session_no: int, week_no: int) -> str:
+def format_rtms_label(session_no: int, week_no: int, last_session_no: Optional[int] = None) -> str:
+    if last_session_no and last_session_no != session_no:
+        return f"rTMS治療 {session_no}〜{last_session_no}回目（第{week_no}週）"
     return f"rTMS治療 {session_no}回目（第{week_no}週）"
 
 
@@ -126,3 +131,126 @@ def generate_mapping_dates(start_date: datetime.date,
         actual = next_open_day(nominal, holidays)
         mapping.append({"nominal": nominal, "actual": actual, "week_no": k + 1})
     return mapping
+
+
+# ==========================================================
+# Protocol-driven treatment plan (date, slot) sequences
+# ==========================================================
+
+@dataclass(frozen=True)
+class PlannedSession:
+    session_no: int
+    date: datetime.date
+    slot: int  # 1-based sitting on that day
+    week_no: int
+
+
+@dataclass(frozen=True)
+class TreatmentPlan:
+    """Planned sessions of one course. Built by build_treatment_plan()."""
+    protocol: object  # rtms_app.protocols.ProtocolSpec
+    start: datetime.date
+    sessions: Tuple[PlannedSession, ...]
+    by_date: Dict[datetime.date, Tuple[PlannedSession, ...]]
+
+    @property
+    def total(self) -> int:
+        return len(self.sessions)
+
+    @property
+    def dates(self) -> List[datetime.date]:
+        """Distinct treatment dates in order."""
+        return list(self.by_date)
+
+    @property
+    def end_date(self) -> Optional[datetime.date]:
+        return self.sessions[-1].date if self.sessions else None
+
+    @property
+    def multi_slot(self) -> bool:
+        return self.protocol.sessions_per_day > 1
+
+    def sessions_on(self, d: datetime.date) -> Tuple[PlannedSession, ...]:
+        return self.by_date.get(d, ())
+
+    def session_info(self, d: datetime.date) -> Optional[dict]:
+        """Like session_info_for_date(): first session on d and its week, or None."""
+        on_day = self.by_date.get(d)
+        if not on_day:
+            return None
+        return {
+            "session_no": on_day[0].session_no,
+            "last_session_no": on_day[-1].session_no,
+            "week_no": on_day[0].week_no,
+        }
+
+    def slot_value(self, slot: int) -> str:
+        """TreatmentSession.slot for a sitting ('' when one session per day)."""
+        return str(slot) if self.multi_slot else ""
+
+
+def _closed_days(first_year: int, last_year: int, holidays) -> List[datetime.date]:
+    closed = set(holidays or ())
+    for y in range(first_year, last_year + 1):
+        closed.update(datetime.date(y, 1, day) for day in (1, 2, 3))
+        closed.update(datetime.date(y, 12, day) for day in (29, 30, 31))
+    return sorted(closed)
+
+
+def open_days(start_date: datetime.date, count: int,
+              holidays: Optional[Set[datetime.date]] = None) -> List[datetime.date]:
+    """The first `count` open days from start_date (same as generate_treatment_dates).
+
+    The whole sequence comes from one numpy.busday_offset call. NumPy is imported
+    here rather than at module level: views imports this module at URLconf load.
+    """
+    import numpy as np
+
+    if count <= 0:
+        return []
+    # count open days never span more than count * 7 / 5 days plus closures
+    last_year = start_date.year + (count * 7 // 5 + 30) // 365 + 1
+    offsets = np.busday_offset(
+        np.datetime64(start_date, "D"), np.arange(count), roll="forward",
+        weekmask="1111100",
+        holidays=np.array(_closed_days(start_date.year, last_year, holidays), dtype="datetime64[D]"),
+    )
+    return offsets.tolist()
+
+
+@lru_cache(maxsize=4096)
+def _cached_plan(code: str, start_date: datetime.date, holidays: FrozenSet[datetime.date]) -> TreatmentPlan:
+    from ..protocols import INSURANCE_PROTOCOL, get_protocol_by_code
+
+    protocol = get_protocol_by_code(code) or INSURANCE_PROTOCOL
+    per_day = max(protocol.sessions_per_day, 1)
+    days = open_days(start_date, math.ceil(protocol.total_sessions / per_day), holidays)
+    sessions = tuple(
+        PlannedSession(
+            session_no=i + 1,
+            date=days[i // per_day],
+            slot=i % per_day + 1,
+            # same rule as views.get_current_week_number
+            week_no=(days[i // per_day] - start_date).days // 7 + 1,
+        )
+        for i in range(protocol.total_sessions)
+    )
+    by_date: Dict[datetime.date, Tuple[PlannedSession, ...]] = {}
+    for s in sessions:
+        by_date[s.date] = by_date.get(s.date, ()) + (s,)
+    return TreatmentPlan(protocol=protocol, start=start_date, sessions=sessions, by_date=by_date)
+
+
+def build_treatment_plan(start_date: datetime.date, protocol_code: Optional[str] = None,
+                         holidays: Optional[Set[datetime.date]] = None) -> TreatmentPlan:
+    """Plan of a course starting on start_date under the given protocol (cached per process)."""
+    from ..protocols import DEFAULT_PROTOCOL
+
+    return _cached_plan(protocol_code or DEFAULT_PROTOCOL, start_date, frozenset(holidays or ()))
+
+
+def treatment_plan_for(patient, holidays: Optional[Set[datetime.date]] = None) -> Optional[TreatmentPlan]:
+    """Plan of the patient's current course, or None before the first treatment date is set."""
+    if not patient.first_treatment_date:
+        return None
+    return build_treatment_plan(patient.first_treatment_date, getattr(patient, "protocol_type", None), holidays)
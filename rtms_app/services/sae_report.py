@@ -5,7 +5,6 @@ import os
 import io
 from typing import Optional, Dict, Any
 from django.conf import settings
-from docx import Document
 
 
 def build_sae_context(session, sae_record=None) -> Dict[str, Any]:
@@ -93,6 +92,9 @@ def render_sae_docx(template_path: str, context: Dict[str, Any]) -> bytes:
     Returns:
         bytes of generated Word document
     """
+    # python-docx は SAE 報告書の出力時にだけ読み込む
+    from docx import Document
+
     doc = Document(template_path)
 
     # Replace in paragraphs
@@ -4,22 +4,17 @@ from django.db import transaction
 
 from rtms_app.models import TreatmentSession, Patient
 
-try:
-    import holidays as pyholidays
-except Exception:
-    pyholidays = None
+from rtms_app.services.holiday_calendar import is_public_holiday
 
 # Module-level override used by tests to inject holiday dates (set of date objects)
 EXTRA_HOLIDAYS: set[date] = set()
 
 
 def _is_holiday(d: date) -> bool:
-    if pyholidays:
-        try:
-            jp = pyholidays.CountryHoliday('JP')
-            return d in jp
-        except Exception:
-            pass
+    # holidays パッケージは初回に読み込み、祝日表はプロセス内で使い回す
+    result = is_public_holiday(d)
+    if result is not None:
+        return result
     # Fallback to any test-injected holidays
     return d in EXTRA_HOLIDAYS
 
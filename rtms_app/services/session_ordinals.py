@@ -0,0 +1,89 @@
+"""
+治療セッションのクール内通し番号（第N回）
+
+番号は (patient, course_number) ごとに session_date, date, id の順で振る:
+
+    ROW_NUMBER() OVER (PARTITION BY patient_id, course_number ORDER BY session_date, date, id)
+
+以前は呼び出し側ごとにクールの全セッションを読んで Python で数えたり（累積回数）、
+印刷のたびに count() したり（副作用チェック票）、月カレンダーで範囲内を2回走査したり
+していた。ここではどれも窓関数付きの1クエリ（(patient, course_number, session_date) の
+インデックスで引ける）で番号を得る。
+
+- with_ordinals(qs): qs に ordinal を付ける。窓関数は qs の WHERE の後で計算されるので、
+  qs はクール単位（patient・course_number）でだけ絞ること。
+- sessions_between(start, end, qs): 期間内のセッションを、番号はクール全体で数えて返す。
+- course_ordinals(patient, course_number): {session_id: ordinal}。患者インスタンスに
+  クールごとに保持するので、同じリクエスト内で何度呼んでもクエリは1回。
+"""
+from typing import Dict, List, Optional
+
+from django.db.models import Exists, F, OuterRef, QuerySet, Subquery, Window
+from django.db.models.functions import RowNumber
+
+from rtms_app.models import TreatmentSession
+
+ORDINAL_ORDER = ('session_date', 'date', 'id')
+_CACHE_ATTR = '_session_ordinals'
+
+
+def session_ordinal() -> Window:
+    return Window(
+        expression=RowNumber(),
+        partition_by=[F('patient_id'), F('course_number')],
+        order_by=[F(name).asc() for name in ORDINAL_ORDER],
+    )
+
+
+def with_ordinals(qs: Optional[QuerySet] = None) -> QuerySet:
+    """qs（既定は全セッション）の各行に ordinal（クール内の第N回）を付ける。"""
+    qs = TreatmentSession.objects.all() if qs is None else qs
+    return qs.annotate(ordinal=session_ordinal())
+
+
+def sessions_between(start, end, qs: Optional[QuerySet] = None) -> List[TreatmentSession]:
+    """session_date が start..end のセッション（ordinal 付き、患者・クール・実施順）。
+
+    期間に掛かるクールは end までの行を丸ごと窓関数に渡し、番号をクールの初回から数える。
+    start より前の行（そのクールの既往分）は読み捨てる。
+    """
+    qs = TreatmentSession.objects.all() if qs is None else qs
+    in_range = TreatmentSession.objects.filter(
+        patient_id=OuterRef('patient_id'),
+        course_number=OuterRef('course_number'),
+        session_date__range=(start, end),
+    )
+    rows = with_ordinals(
+        qs.filter(Exists(in_range), session_date__lte=end)
+    ).order_by('patient_id', 'course_number', *ORDINAL_ORDER)
+    return [s for s in rows if s.session_date >= start]
+
+
+def course_ordinals(patient, course_number: int) -> Dict[int, int]:
+    """患者のクールの {session_id: ordinal}（患者インスタンスにキャッシュ）。"""
+    cache = patient.__dict__.setdefault(_CACHE_ATTR, {})
+    if course_number not in cache:
+        cache[course_number] = dict(
+            with_ordinals(TreatmentSession.objects.filter(patient=patient, course_number=course_number))
+            .values_list('id', 'ordinal')
+        )
+    return cache[course_number]
+
+
+def invalidate(patient) -> None:
+    """同じ患者インスタンスでセッションを追加・削除した後に番号を読み直させる。"""
+    patient.__dict__.pop(_CACHE_ATTR, None)
+
+
+def ordinal_of(session_id: int, patient=None, course_number: Optional[int] = None) -> Optional[int]:
+    """セッションのクール内番号。patient / course_number 省略時はセッションから引く（いずれも1クエリ）。"""
+    if patient is not None and course_number is not None:
+        return course_ordinals(patient, course_number).get(session_id)
+    own = TreatmentSession.objects.filter(pk=session_id)
+    qs = TreatmentSession.objects.filter(
+        patient_id=Subquery(own.values('patient_id')[:1]),
+        course_number=Subquery(own.values('course_number')[:1]),
+    )
+    if patient is not None:
+        qs = qs.filter(patient=patient)
+    return dict(with_ordinals(qs).values_list('id', 'ordinal')).get(session_id)
@@ -0,0 +1,233 @@
+"""
+副作用の正規化テーブル（SideEffectObservation）の作成と発現率集計
+
+副作用は SideEffectCheck.rows（{item, before, during, after, relatedness, memo} のリスト）と
+旧形式の TreatmentSession.side_effects（{'headache': 2, ...}）に JSON で入っているため、
+「第N週の頭皮痛の発現率」のような横断集計は全セッションを Python で走査するしかなかった。
+ここで重症度 1 以上の所見を (セッション, 項目キー, 時点) の行に展開し、集計は DB で行う。
+
+- sync_session(): 副作用チェック保存時（signals）に1セッション分を作り直す
+- backfill(): 既存データの一括作成（manage.py rtms_side_effect_facts）
+- incidence_report(): 項目 × 治療週の発現率（分母は期間内の実施済みセッション数）
+"""
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+
+from rtms_app.models import SideEffectObservation, TreatmentSession
+from rtms_app.services.side_effect_schema import DEFAULT_PRINT_ROWS, SIDE_EFFECT_ITEMS
+
+PHASES = ('before', 'during', 'after')
+ITEM_KEYS = tuple(item['key'] for item in SIDE_EFFECT_ITEMS)
+ITEM_LABELS = {item['key']: item['label'] for item in SIDE_EFFECT_ITEMS}
+MAX_GRADE = 3
+BACKFILL_BATCH_SIZE = 1000
+
+# 旧形式 TreatmentSession.side_effects のキー -> 項目キー（該当がないものは other）
+LEGACY_KEY_MAP = {
+    'scalp': 'scalp_pain',
+    'scalp_pain': 'scalp_pain',
+    'headache': 'headache_post',
+    'dizzy': 'dizziness_tinnitus',
+    'tinnitus': 'dizziness_tinnitus',
+    'hearing': 'hearing_issue',
+}
+
+
+def _normalize_label(label) -> str:
+    # 全角/半角括弧・空白の揺れ（'頭痛（刺激後）' / '頭痛 (刺激後)'）を吸収する
+    return ''.join(unicodedata.normalize('NFKC', str(label or '')).split())
+
+
+# チェック票の行は項目名（画面・印刷様式の表記）で入っているので、両方の表記から引く
+_KEY_BY_LABEL = {_normalize_label(item['label']): item['key'] for item in SIDE_EFFECT_ITEMS}
+_KEY_BY_LABEL.update({
+    _normalize_label(row['item']): item['key'] for row, item in zip(DEFAULT_PRINT_ROWS, SIDE_EFFECT_ITEMS)
+})
+
+
+def item_key_for(row: dict) -> str:
+    key = row.get('key')
+    if key in ITEM_LABELS:
+        return key
+    return _KEY_BY_LABEL.get(_normalize_label(row.get('item')), 'other')
+
+
+def _grade(value) -> int:
+    try:
+        grade = int(value)
+    except (TypeError, ValueError):
+        return 0
+    return min(max(grade, 0), MAX_GRADE)
+
+
+def _relatedness(value) -> Optional[int]:
+    try:
+        return min(max(int(value), 0), MAX_GRADE)
+    except (TypeError, ValueError):
+        return None
+
+
+def build_observations(session_id, patient_id, course_number, session_date,
+                       side_effects, rows) -> List[SideEffectObservation]:
+    """1セッション分の所見（未保存）。同じ (項目, 時点) が複数あれば重症度の高い方を残す。"""
+    found: Dict[Tuple[str, str], Tuple[int, Optional[int]]] = {}
+
+    def add(key, phase, grade, relatedness=None):
+        if grade <= 0:
+            return
+        current = found.get((key, phase))
+        if current is None or grade > current[0]:
+            found[(key, phase)] = (grade, relatedness)
+
+    for row in rows or []:
+        if not isinstance(row, dict):
+            continue
+        key = item_key_for(row)
+        relatedness = _relatedness(row.get('relatedness'))
+        for phase in PHASES:
+            add(key, phase, _grade(row.get(phase)), relatedness)
+
+    if isinstance(side_effects, dict):
+        for legacy_key, value in side_effects.items():
+            if legacy_key == 'note':
+                continue
+            add(LEGACY_KEY_MAP.get(legacy_key, 'other'), 'unspecified', _grade(value))
+
+    return [
+        SideEffectObservation(
+            session_id=session_id,
+            patient_id=patient_id,
+            course_number=course_number,
+            session_date=session_date,
+            item_key=key,
+            phase=phase,
+            grade=grade,
+            relatedness=relatedness,
+        )
+        for (key, phase), (grade, relatedness) in found.items()
+    ]
+
+
+def sync_session(session: TreatmentSession, rows=None, replace: bool = True) -> int:
+    """session の所見を作り直す。rows 省略時は session.side_effect_check から読む。
+
+    replace=False は既存の所見がないと分かっているとき（DELETE を省く）。
+    治療記録の保存（services.treatment_record）の transaction 内で呼ばれるので savepoint は作らない。
+    """
+    if rows is None:
+        check = getattr(session, 'side_effect_check', None)
+        rows = check.rows if check else []
+    observations = build_observations(
+        session.pk, session.patient_id, session.course_number, session.session_date,
+        session.side_effects, rows,
+    )
+    with transaction.atomic(savepoint=False):
+        if replace:
+            SideEffectObservation.objects.filter(session_id=session.pk).delete()
+        SideEffectObservation.objects.bulk_create(observations)
+    return len(observations)
+
+
+def backfill(batch_size: int = BACKFILL_BATCH_SIZE) -> Iterable[Tuple[int, int]]:
+    """全セッションの所見を batch_size セッションずつ作り直し、(セッション数, 所見数) を返していく。"""
+    sessions = (
+        TreatmentSession.objects.order_by('id')
+        .values_list('id', 'patient_id', 'course_number', 'session_date', 'side_effects', 'side_effect_check__rows')
+        .iterator(chunk_size=batch_size)
+    )
+    batch = []
+
+    def flush():
+        observations = [obs for values in batch for obs in build_observations(*values)]
+        with transaction.atomic():
+            SideEffectObservation.objects.filter(session_id__in=[values[0] for values in batch]).delete()
+            SideEffectObservation.objects.bulk_create(observations, batch_size=batch_size)
+        return len(batch), len(observations)
+
+    for values in sessions:
+        batch.append(values)
+        if len(batch) >= batch_size:
+            yield flush()
+            batch = []
+    if batch:
+        yield flush()
+
+
+def _course_start():
+    # クールの初回実施日（(patient, course_number, session_date) のインデックスで引く）
+    return Subquery(
+        TreatmentSession.objects.filter(patient=OuterRef('patient'), course_number=OuterRef('course_number'))
+        .order_by('session_date').values('session_date')[:1]
+    )
+
+
+def _week(course_start, session_date) -> Optional[int]:
+    if not course_start or not session_date or session_date < course_start:
+        return None
+    return (session_date - course_start).days // 7 + 1
+
+
+def incidence_report(start=None, end=None, phase: Optional[str] = None, min_grade: int = 1) -> dict:
+    """項目ごとの発現セッション数・発現率（全体と治療週別）。
+
+    分母は期間内の実施済み（status='done'）セッション数。2クエリとも
+    (クール初回日, 実施日) の組でまとめて返すので、行数はセッション数ではなく日付の組の数。
+    """
+    sessions = TreatmentSession.objects.filter(status='done')
+    observations = SideEffectObservation.objects.filter(grade__gte=min_grade, session__status='done')
+    if start:
+        sessions = sessions.filter(session_date__gte=start)
+        observations = observations.filter(session_date__gte=start)
+    if end:
+        sessions = sessions.filter(session_date__lte=end)
+        observations = observations.filter(session_date__lte=end)
+    if phase:
+        observations = observations.filter(phase=phase)
+
+    denominators: Dict[Optional[int], int] = {}
+    for row in (
+        sessions.annotate(course_start=_course_start())
+        .values('course_start', 'session_date').annotate(n=Count('id')).order_by()
+    ):
+        week = _week(row['course_start'], row['session_date'])
+        denominators[week] = denominators.get(week, 0) + row['n']
+
+    numerators: Dict[str, Dict[Optional[int], int]] = {key: {} for key in ITEM_KEYS}
+    for row in (
+        observations.annotate(course_start=_course_start())
+        .values('item_key', 'course_start', 'session_date')
+        .annotate(n=Count('session', distinct=True)).order_by()
+    ):
+        week = _week(row['course_start'], row['session_date'])
+        by_week = numerators.setdefault(row['item_key'], {})
+        by_week[week] = by_week.get(week, 0) + row['n']
+
+    total = sum(denominators.values())
+    weeks = sorted(w for w in denominators if w is not None)
+
+    def rate(n, d):
+        return round(n / d, 4) if d else None
+
+    items = []
+    for key, by_week in numerators.items():
+        n = sum(by_week.values())
+        items.append({
+            'key': key,
+            'label': ITEM_LABELS.get(key, key),
+            'sessions': n,
+            'rate': rate(n, total),
+            'by_week': [
+                {'week': w, 'sessions': by_week.get(w, 0), 'rate': rate(by_week.get(w, 0), denominators[w])}
+                for w in weeks
+            ],
+        })
+    return {
+        'total_sessions': total,
+        'weeks': [{'week': w, 'sessions': denominators[w]} for w in weeks],
+        'items': items,
+        'phase': phase,
+        'min_grade': min_grade,
+    }
@@ -11,3 +11,26 @@ SIDE_EFFECT_ITEMS = [
     {"key": "acute_mood_change", "label": "急性の気分変化（躁転など）"},
     {"key": "other", "label": "その他"},
 ]
+
+# 印刷用チェック票の既定行（記録がないときに表示する）。表記は印刷様式に合わせている。
+DEFAULT_PRINT_ROWS = [
+    {"item": item, "before": 0, "during": 0, "after": 0, "relatedness": 0, "memo": ""}
+    for item in (
+        "頭皮痛・刺激痛",
+        "顔面の不快感",
+        "頸部痛・肩こり",
+        "頭痛 (刺激後)",
+        "けいれん (部位・時間)",
+        "失神",
+        "聴覚障害",
+        "めまい・耳鳴り",
+        "注意集中困難",
+        "急性気分変化 (躁転など)",
+        "その他",
+    )
+]
+
+
+def default_side_effect_rows():
+    """DEFAULT_PRINT_ROWS のコピー（呼び出し側で書き換えてもよい）。"""
+    return [dict(row) for row in DEFAULT_PRINT_ROWS]
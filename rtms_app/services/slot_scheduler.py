@@ -0,0 +1,300 @@
+"""
+治療スロットの割り当て（コイル・部屋の台数を考慮）
+
+治療中の全クールについて、各治療日の実施時刻（スロット）・部屋・コイルを貪欲法で決める。
+
+- 1回の所要時間は刺激時間（TreatmentSession.stimulation_minutes）＋準備時間。
+- 同じ日に複数回（sessions_per_day）行う場合は、前の回の終了から min_gap_minutes（施設設定と
+  プロトコルの大きい方）空ける。通し番号（session_no）は回ごとに振る。
+- 各回は「空きが最も早い部屋」と「その種類のコイルで空きが最も早いもの」に、
+  両方が空く時刻で入れる（リストスケジューリング）。1日の計算量は O(回数 × (部屋数 + コイル数))。
+- 診療時間内に入らない予定の回は翌診療日へ順延し、そのクールの以降の予定も1診療日ずつ
+  ずらす（services.schedule.shift_future_sessions と同じ考え方）。実施済みの回は動かさず、
+  時間外でもそのまま入れて overbooked として警告する。
+
+日ごとに「その日の開始時点の各クールの残り予定」を保存しておくので、TreatmentSkip による順延は
+postpone() で順延日以降だけを解き直せる（それより前の日の割り当ては変わらない）。
+"""
+import datetime
+import math
+from dataclasses import dataclass, field, replace
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from .rtms_schedule import is_closed
+
+CourseKey = Tuple[int, int]  # (patient_id, course_number)
+
+
+def _minute(hhmm: str) -> int:
+    h, _, m = hhmm.partition(':')
+    return int(h) * 60 + int(m or 0)
+
+
+def slot_label(minute: int) -> str:
+    """TreatmentSession.slot に入れる 'HH:MM'。"""
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+@dataclass(frozen=True)
+class Resources:
+    rooms: int = 1
+    coils: Tuple[Tuple[str, int], ...] = (('H1', 1),)
+    open_time: str = '09:00'
+    close_time: str = '17:00'
+    setup_minutes: int = 10
+    min_gap_minutes: int = 50
+
+    @classmethod
+    def from_settings(cls):
+        from django.conf import settings
+        return cls(
+            rooms=max(1, settings.RTMS_SCHEDULER_ROOMS),
+            coils=parse_coils(settings.RTMS_SCHEDULER_COILS),
+            open_time=settings.RTMS_SCHEDULER_OPEN,
+            close_time=settings.RTMS_SCHEDULER_CLOSE,
+            setup_minutes=settings.RTMS_SCHEDULER_SETUP_MINUTES,
+            min_gap_minutes=settings.RTMS_SCHEDULER_MIN_GAP_MINUTES,
+        )
+
+    @property
+    def open_minute(self) -> int:
+        return _minute(self.open_time)
+
+    @property
+    def close_minute(self) -> int:
+        return _minute(self.close_time)
+
+    @property
+    def coil_counts(self) -> Dict[str, int]:
+        return dict(self.coils)
+
+
+def parse_coils(value: str) -> Tuple[Tuple[str, int], ...]:
+    """'H1:2,H7:1' -> (('H1', 2), ('H7', 1))"""
+    out = []
+    for part in (value or '').split(','):
+        name, _, count = part.strip().partition(':')
+        if name:
+            out.append((name, int(count or 1)))
+    return tuple(out)
+
+
+@dataclass(frozen=True)
+class CourseDemand:
+    """1クール分の予定。dates[i] がその日の第k回（session_no = first_session_no + i * sessions_per_day + k - 1）の希望日。"""
+    patient_id: int
+    course_number: int
+    dates: Tuple[datetime.date, ...]
+    coil_type: str = 'H1'
+    minutes: float = 20.0
+    sessions_per_day: int = 1
+    min_gap_minutes: int = 0
+    fixed: FrozenSet[datetime.date] = frozenset()
+    first_session_no: int = 1
+
+    @property
+    def key(self) -> CourseKey:
+        return self.patient_id, self.course_number
+
+
+@dataclass(frozen=True)
+class Assignment:
+    patient_id: int
+    course_number: int
+    session_no: int
+    date: datetime.date
+    sitting: int
+    start_minute: int
+    end_minute: int
+    room: int
+    coil_type: str
+    coil: int
+    overbooked: bool = False
+
+    @property
+    def slot(self) -> str:
+        return slot_label(self.start_minute)
+
+
+@dataclass
+class _CourseState:
+    pending: Tuple[datetime.date, ...]
+    next_no: int
+
+
+@dataclass
+class ScheduleResult:
+    start: datetime.date
+    end: datetime.date
+    resources: Resources
+    assignments: List[Assignment] = field(default_factory=list)
+    warnings: List[Dict] = field(default_factory=list)
+    utilization: Dict[datetime.date, Dict] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict:
+        return {
+            'start': self.start,
+            'end': self.end,
+            'rooms': self.resources.rooms,
+            'coils': self.resources.coil_counts,
+            'assignments': [
+                {
+                    'patient_id': a.patient_id, 'course_number': a.course_number, 'session_no': a.session_no,
+                    'date': a.date, 'sitting': a.sitting, 'slot': a.slot, 'end': slot_label(a.end_minute),
+                    'room': a.room + 1, 'coil_type': a.coil_type, 'coil': a.coil + 1, 'overbooked': a.overbooked,
+                }
+                for a in self.assignments
+            ],
+            'warnings': self.warnings,
+            'utilization': [{'date': d, **u} for d, u in sorted(self.utilization.items())],
+        }
+
+
+class SlotScheduler:
+    def __init__(self, demands, resources: Optional[Resources] = None, holidays: Optional[Set[datetime.date]] = None):
+        self.demands: Dict[CourseKey, CourseDemand] = {d.key: d for d in demands}
+        self.resources = resources or Resources()
+        self.holidays = holidays
+        self._result: Optional[ScheduleResult] = None
+        # 日付 -> その日の開始時点の各クールの状態
+        self._checkpoints: Dict[datetime.date, Dict[CourseKey, _CourseState]] = {}
+
+    # ------------------------------------------------------------------
+    def _next_open(self, d: datetime.date) -> datetime.date:
+        while is_closed(d, self.holidays):
+            d += datetime.timedelta(days=1)
+        return d
+
+    def _shift_from(self, dates, day):
+        """day 以降の予定を day の翌診療日から1診療日ずつ詰め直す（件数は変えない）。"""
+        kept = [d for d in dates if d < day]
+        anchor = day
+        for _ in range(len(dates) - len(kept)):
+            anchor = self._next_open(anchor + datetime.timedelta(days=1))
+            kept.append(anchor)
+        return tuple(kept)
+
+    def _initial_states(self, start) -> Dict[CourseKey, _CourseState]:
+        states = {}
+        for key, demand in self.demands.items():
+            skipped = sum(1 for d in demand.dates if d < start)
+            states[key] = _CourseState(pending=tuple(demand.dates[skipped:]), next_no=demand.first_session_no + skipped * demand.sessions_per_day)
+        return states
+
+    # ------------------------------------------------------------------
+    def solve(self, start: datetime.date, end: datetime.date) -> ScheduleResult:
+        self._checkpoints = {}
+        self._result = ScheduleResult(start=start, end=end, resources=self.resources)
+        self._run(start, self._initial_states(start))
+        return self._result
+
+    def postpone(self, patient_id: int, course_number: int, from_date: datetime.date) -> ScheduleResult:
+        """from_date の回を順延（以降を1診療日ずつずらす）し、from_date 以降だけ解き直す。"""
+        key = (patient_id, course_number)
+        demand = self.demands[key]
+        self.demands[key] = replace(demand, dates=self._shift_from(demand.dates, from_date))
+        result = self._result
+        if result is None or from_date > result.end:
+            return result
+        day = max(from_date, result.start)
+        resume = next((d for d in sorted(self._checkpoints) if d >= day), None)
+        if resume is None:
+            return result
+        states = {k: _CourseState(s.pending, s.next_no) for k, s in self._checkpoints[resume].items()}
+        if key in states:
+            states[key].pending = self._shift_from(states[key].pending, from_date)
+        result.assignments = [a for a in result.assignments if a.date < resume]
+        result.warnings = [w for w in result.warnings if w['date'] < resume]
+        result.utilization = {d: u for d, u in result.utilization.items() if d < resume}
+        self._checkpoints = {d: c for d, c in self._checkpoints.items() if d < resume}
+        self._run(resume, states)
+        return result
+
+    # ------------------------------------------------------------------
+    def _run(self, start, states):
+        day = start
+        while day <= self._result.end:
+            if not is_closed(day, self.holidays):
+                self._checkpoints[day] = {k: _CourseState(s.pending, s.next_no) for k, s in states.items()}
+                self._solve_day(day, states)
+            day += datetime.timedelta(days=1)
+
+    def _solve_day(self, day, states):
+        res = self.resources
+        open_m, close_m = res.open_minute, res.close_minute
+        rooms = [open_m] * res.rooms
+        coils = {name: [open_m] * count for name, count in res.coils}
+        booked_rooms = 0
+        booked_coils = {name: 0 for name in coils}
+        result = self._result
+
+        due = [
+            (s.pending[0], key) for key, s in states.items()
+            if s.pending and s.pending[0] <= day
+        ]
+        # 実施済みの回を先に、次に順延で待たされている回、同順位は患者 ID 順
+        due.sort(key=lambda item: (item[0] not in self.demands[item[1]].fixed, item[0], item[1]))
+
+        for requested, key in due:
+            demand = self.demands[key]
+            state = states[key]
+            fixed = requested in demand.fixed
+            duration = int(math.ceil(demand.minutes)) + res.setup_minutes
+            pool = coils.get(demand.coil_type)
+            if not pool:
+                result.warnings.append(self._warning(day, 'no_coil', demand, state.next_no))
+                state.pending = state.pending[1:]
+                state.next_no += demand.sessions_per_day
+                continue
+
+            # 仮に割り当ててみて、全回が診療時間内に入るか確かめる
+            trial_rooms, trial_pool = list(rooms), list(pool)
+            placed = []
+            earliest = open_m
+            gap = max(res.min_gap_minutes, demand.min_gap_minutes)
+            for sitting in range(1, demand.sessions_per_day + 1):
+                r = min(range(len(trial_rooms)), key=trial_rooms.__getitem__)
+                c = min(range(len(trial_pool)), key=trial_pool.__getitem__)
+                begin = max(earliest, trial_rooms[r], trial_pool[c])
+                finish = begin + duration
+                trial_rooms[r] = trial_pool[c] = finish
+                placed.append((sitting, begin, finish, r, c))
+                earliest = finish + gap
+            fits = placed[-1][2] <= close_m
+
+            if not fits and not fixed:
+                state.pending = self._shift_from(state.pending, day)
+                result.warnings.append(self._warning(day, 'postponed', demand, state.next_no, to=state.pending[0]))
+                continue
+
+            rooms[:] = trial_rooms
+            pool[:] = trial_pool
+            for sitting, begin, finish, r, c in placed:
+                result.assignments.append(Assignment(
+                    patient_id=demand.patient_id, course_number=demand.course_number, session_no=state.next_no + sitting - 1,
+                    date=day, sitting=sitting, start_minute=begin, end_minute=finish, room=r,
+                    coil_type=demand.coil_type, coil=c, overbooked=finish > close_m,
+                ))
+                booked_rooms += finish - begin
+                booked_coils[demand.coil_type] += finish - begin
+            if not fits:
+                result.warnings.append(self._warning(day, 'overbooked', demand, state.next_no))
+            state.pending = state.pending[1:]
+            state.next_no += demand.sessions_per_day
+
+        available = close_m - open_m
+        result.utilization[day] = {
+            'rooms': round(booked_rooms / (available * res.rooms), 3) if res.rooms else 0.0,
+            'coils': {
+                name: round(booked_coils[name] / (available * len(pool)), 3) if pool else 0.0
+                for name, pool in coils.items()
+            },
+            'overbooked': any(t > close_m for t in rooms),
+        }
+
+    @staticmethod
+    def _warning(day, kind, demand, session_no, **extra):
+        return {
+            'date': day, 'kind': kind, 'patient_id': demand.patient_id,
+            'course_number': demand.course_number, 'session_no': session_no, **extra,
+        }
@@ -0,0 +1,99 @@
+"""Bulk sync of patient questionnaire answers.
+
+The patient portal keeps answers in IndexedDB on the tablet (offline mode) and
+sends every instrument of a PatientSurveySession in one request. This module
+validates the payload against the instrument definitions, scores it with
+calculate_score and upserts all responses in a single bulk_create.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from rtms_app.models import PatientSurveyResponse, PatientSurveySession
+from rtms_app.surveys import INSTRUMENT_ORDER, INSTRUMENT_SET, calculate_score, get_instrument
+
+
+class SyncError(ValueError):
+    """Payload could not be accepted. `errors` maps instrument code -> messages."""
+
+    def __init__(self, errors: Dict[str, List[str]]):
+        super().__init__("invalid survey sync payload")
+        self.errors = errors
+
+
+def clean_answers(code: str, answers: Any) -> Tuple[Dict[str, str], List[str]]:
+    """Keep only known question keys with a valid option id; return (answers, errors)."""
+    if not isinstance(answers, dict):
+        return {}, ["answers must be an object"]
+    questions = {q["key"]: q for q in get_instrument(code).get("questions", []) if q.get("key")}
+    cleaned: Dict[str, str] = {}
+    errors: List[str] = []
+    for key, value in answers.items():
+        question = questions.get(key)
+        if question is None:
+            errors.append(f"unknown question: {key}")
+            continue
+        option_ids = {str(o.get("id")) for o in question.get("options", [])}
+        if str(value) not in option_ids:
+            errors.append(f"invalid answer for {key}: {value!r}")
+            continue
+        cleaned[key] = str(value)
+    return cleaned, errors
+
+
+def missing_questions(code: str, answers: Dict[str, Any]) -> List[str]:
+    return [q["key"] for q in get_instrument(code).get("questions", []) if q.get("key") and q["key"] not in answers]
+
+
+def sync_session_answers(session: PatientSurveySession, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate, score and upsert the answers for every instrument in payload.
+
+    payload = {instrument_code: {question_key: option_id, ...}, ...}. Each instrument's
+    answers replace what is stored (the client holds the full state). Raises SyncError
+    without writing anything if any instrument is invalid.
+    """
+    if not isinstance(payload, dict):
+        raise SyncError({"": ["answers must be an object keyed by instrument code"]})
+
+    errors: Dict[str, List[str]] = {}
+    rows = []
+    now = timezone.now()
+    for code, answers in payload.items():
+        if code not in INSTRUMENT_SET:
+            errors[code] = ["unknown instrument"]
+            continue
+        cleaned, problems = clean_answers(code, answers)
+        if problems:
+            errors[code] = problems
+            continue
+        total, extras = calculate_score(code, cleaned)
+        rows.append(PatientSurveyResponse(
+            session=session,
+            instrument=code,
+            answers=cleaned,
+            total_score=total,
+            extra_data=extras or {},
+            updated_at=now,
+        ))
+    if errors:
+        raise SyncError(errors)
+
+    with transaction.atomic():
+        PatientSurveyResponse.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["session", "instrument"],
+            update_fields=["answers", "total_score", "extra_data", "updated_at"],
+        )
+
+    stored = dict(session.responses.values_list("instrument", "answers"))
+    missing = {code: missing_questions(code, stored.get(code) or {}) for code in INSTRUMENT_ORDER}
+    missing = {code: keys for code, keys in missing.items() if keys}
+    return {
+        "saved": {r.instrument: {"total": r.total_score, "extras": r.extra_data} for r in rows},
+        "missing": missing,
+        "complete": not missing,
+    }
@@ -0,0 +1,173 @@
+"""
+ベンチマーク用の合成コホート生成。
+
+乱数シードを固定して、同じ引数なら毎回同じレジストリ（患者・治療30回・週次位置決め・
+HAM-D評価・自己記入式・重篤有害事象・監査ログ）を作る。
+大量投入のため bulk_create を使い、Patient の post_save（患者ユーザー自動作成）は発火しない。
+"""
+import datetime
+import random
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.utils import timezone
+
+from rtms_app.models import (
+    Assessment,
+    AssessmentRecord,
+    AuditLog,
+    MappingSession,
+    Patient,
+    PatientSurveyResponse,
+    PatientSurveySession,
+    ScaleDefinition,
+    SeriousAdverseEvent,
+    TreatmentSession,
+)
+from rtms_app.services.rtms_schedule import generate_treatment_dates
+from rtms_app.surveys import INSTRUMENT_ORDER, get_instrument
+
+# 患者の入院日はこの日から SPREAD_DAYS 日の範囲に分散させる
+COHORT_START = datetime.date(2026, 1, 5)
+SPREAD_DAYS = 84
+SESSIONS_PER_COURSE = 30
+MAPPING_WEEKS = 6
+HAMD_TIMINGS = (('baseline', -1), ('week3', 14), ('week4', 19), ('week6', 29))
+# card_id は 5 桁。ベンチ用は 9xxxx 帯を使う
+CARD_ID_BASE = 90000
+
+
+@dataclass
+class CohortStats:
+    patients: int = 0
+    treatment_sessions: int = 0
+    mapping_sessions: int = 0
+    assessments: int = 0
+    assessment_records: int = 0
+    survey_sessions: int = 0
+    survey_responses: int = 0
+    serious_adverse_events: int = 0
+    audit_logs: int = 0
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+def _hamd_scores(rng, severity):
+    # severity (0..1) が低いほど低得点
+    return {f"q{i}": min(4 if i <= 3 else 2, int(rng.random() * 3 * severity + 0.5)) for i in range(1, 22)}
+
+
+def _survey_answers(rng, code):
+    answers = {}
+    for q in get_instrument(code)["questions"]:
+        options = q.get("options") or []
+        if options:
+            answers[q["key"]] = rng.choice(options)["id"]
+    return answers
+
+
+@transaction.atomic
+def seed_cohort(n_patients, courses=1, seed=0, start=COHORT_START):
+    """n_patients 人分の合成データを投入し CohortStats を返す。
+
+    患者 i のクール数は (i % courses) + 1。同じ (n_patients, courses, seed) なら同じデータになる。
+    """
+    if n_patients > 99999 - CARD_ID_BASE:
+        raise ValueError(f"n_patients must be <= {99999 - CARD_ID_BASE}")
+    rng = random.Random(seed)
+    stats = CohortStats()
+    hamd_scale, _ = ScaleDefinition.objects.get_or_create(code='hamd', defaults={'name': 'HAM-D'})
+
+    patients = []
+    for i in range(n_patients):
+        admission = start + datetime.timedelta(days=rng.randrange(SPREAD_DAYS))
+        patients.append(Patient(
+            card_id=f"{CARD_ID_BASE + i:05d}",
+            name=f"ベンチ 患者{i:04d}",
+            birth_date=datetime.date(1950 + rng.randrange(50), rng.randrange(1, 13), rng.randrange(1, 29)),
+            gender=rng.choice('MF'),
+            course_number=(i % courses) + 1,
+            admission_date=admission,
+            mapping_date=admission + datetime.timedelta(days=2),
+            first_treatment_date=admission + datetime.timedelta(days=3),
+            status='inpatient',
+            life_history='生活歴 ' * 200,
+            present_illness='現病歴 ' * 200,
+        ))
+    patients = Patient.objects.bulk_create(patients)
+    stats.patients = len(patients)
+
+    treatments, mappings, assessments, records, surveys, audits = [], [], [], [], [], []
+    for p in patients:
+        course = p.course_number
+        tdates = generate_treatment_dates(p.first_treatment_date, total=SESSIONS_PER_COURSE)
+        done_until = rng.randrange(SESSIONS_PER_COURSE + 1)
+        for n, d in enumerate(tdates, start=1):
+            treatments.append(TreatmentSession(
+                patient=p,
+                course_number=course,
+                session_date=d,
+                date=timezone.make_aware(datetime.datetime.combine(d, datetime.time(9, 0))),
+                status='done' if n <= done_until else 'planned',
+                mt_percent=120,
+                side_effects={'headache': rng.randrange(3), 'scalp_pain': rng.randrange(3)} if n <= done_until else {},
+            ))
+        for w in range(MAPPING_WEEKS):
+            mappings.append(MappingSession(
+                patient=p,
+                course_number=course,
+                date=p.mapping_date + datetime.timedelta(days=7 * w),
+                week_number=w + 1,
+                resting_mt=rng.randrange(45, 75),
+            ))
+        severity = 0.6 + rng.random() * 0.4
+        for k, (timing, offset) in enumerate(HAMD_TIMINGS):
+            scores = _hamd_scores(rng, severity * (1 - 0.2 * k))
+            when = p.first_treatment_date + datetime.timedelta(days=offset)
+            a = Assessment(patient=p, course_number=course, date=when, timing=timing, scores=scores, type='HAM-D')
+            a.calculate_scores()
+            assessments.append(a)
+            r = AssessmentRecord(patient=p, course_number=course, timing=timing, scale=hamd_scale, date=when, scores=scores)
+            r.calculate_scores()
+            records.append(r)
+        for phase in ('pre', 'post'):
+            surveys.append(PatientSurveySession(patient=p, course_number=course, phase=phase, status='submitted'))
+        for k in range(5):
+            audits.append(AuditLog(
+                patient=p, target_model='TreatmentSession', target_pk=str(k),
+                action=rng.choice(['CREATE', 'UPDATE', 'PRINT']), summary='synthetic', meta={},
+            ))
+
+    treatments = TreatmentSession.objects.bulk_create(treatments, batch_size=500)
+    MappingSession.objects.bulk_create(mappings, batch_size=500)
+    Assessment.objects.bulk_create(assessments, batch_size=500)
+    AssessmentRecord.objects.bulk_create(records, batch_size=500)
+    surveys = PatientSurveySession.objects.bulk_create(surveys, batch_size=500)
+    AuditLog.objects.bulk_create(audits, batch_size=500)
+
+    responses = []
+    for s in surveys:
+        for code in INSTRUMENT_ORDER:
+            resp = PatientSurveyResponse(session=s, instrument=code, answers=_survey_answers(rng, code))
+            resp.calculate_totals()
+            responses.append(resp)
+    PatientSurveyResponse.objects.bulk_create(responses, batch_size=500)
+
+    # 10 人に 1 人、5 回目の治療で重篤有害事象
+    saes = [
+        SeriousAdverseEvent(patient_id=t.patient_id, course_number=t.course_number, session=t, event_types=['syncope'])
+        for idx, t in enumerate(treatments)
+        if idx % (SESSIONS_PER_COURSE * 10) == 4
+    ]
+    SeriousAdverseEvent.objects.bulk_create(saes)
+
+    stats.treatment_sessions = len(treatments)
+    stats.mapping_sessions = len(mappings)
+    stats.assessments = len(assessments)
+    stats.assessment_records = len(records)
+    stats.survey_sessions = len(surveys)
+    stats.survey_responses = len(responses)
+    stats.serious_adverse_events = len(saes)
+    stats.audit_logs = len(audits)
+    return stats
@@ -0,0 +1,212 @@
+"""
+治療記録（treatment_add の POST）の書き込みをまとめる unit-of-work
+
+1回の保存で触る行は TreatmentSession・SideEffectCheck・SeriousAdverseEvent の3つ。
+以前は update_or_create の後に meta を最大2回保存し直し、副作用チェックも
+get_or_create + save の2回書いていたので、監査ログも保存回数分だけ積まれていた。
+
+ここでは最終的な状態（セッションの各項目・meta・副作用チェック・SAE）を先にメモリ上で
+組み立て、1つの transaction.atomic の中で各行を1回ずつ書き込む。
+既存行の読み込みもセッション1件の SELECT（副作用チェックを select_related、SAE の有無を
+Exists で付与）で済ませる。
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from rtms_app.models import SeriousAdverseEvent, SideEffectCheck, TreatmentSession
+
+# POST のチェックボックス名 -> SeriousAdverseEvent.event_types の値
+SAE_FIELD_MAP = {
+    'sae_seizure': 'seizure',
+    'sae_finger_muscle': 'finger_muscle',
+    'sae_syncope': 'syncope',
+    'sae_mania': 'mania',
+    'sae_suicide_attempt': 'suicide_attempt',
+    'sae_other': 'other',
+}
+
+
+@dataclass
+class TreatmentRecord:
+    """1回の保存で書き込む内容。fields は TreatmentSession に代入する項目。"""
+    patient: Any
+    course_number: int
+    session_date: Any
+    slot: str
+    fields: Dict[str, Any]
+    meta_updates: Dict[str, Any] = field(default_factory=dict)
+    side_effect_rows: List[Any] = field(default_factory=list)
+    side_effect_memo: str = ''
+    side_effect_signature: str = ''
+    sae_event_types: List[str] = field(default_factory=list)
+    sae_other_text: str = ''
+    skip: bool = False
+
+
+def meta_updates_from_post(post) -> Dict[str, Any]:
+    """Step6 の確認項目と Step7 の治療中項目を meta に入れる値として取り出す。"""
+    updates: Dict[str, Any] = {}
+    cps = (post.get('confirm_pulse_seconds') or '').strip()
+    cmp = (post.get('confirm_mt_percent') or '').strip()
+    cn = (post.get('confirm_notes') or '').strip()
+    tn = (post.get('treat_notes') or '').strip()
+    if cps:
+        try:
+            updates['confirm_pulse_seconds'] = float(cps)
+        except Exception:
+            pass
+    if cmp:
+        try:
+            updates['confirm_mt_percent'] = int(cmp)
+        except Exception:
+            pass
+    if cn:
+        updates['confirm_notes'] = cn
+    # チェックボックスはPOSTに含まれる場合のみTrue、含まれない場合はFalse
+    updates['confirm_discomfort'] = (post.get('confirm_discomfort') == 'on')
+    updates['confirm_movement'] = (post.get('confirm_movement') == 'on')
+    if tn:
+        updates['treat_notes'] = tn
+    updates['treat_discomfort'] = (post.get('treat_discomfort') == 'on')
+    updates['treat_movement'] = (post.get('treat_movement') == 'on')
+    return updates
+
+
+def sae_event_types_from_post(post) -> List[str]:
+    return [event for name, event in SAE_FIELD_MAP.items() if post.get(name) == 'on']
+
+
+def _sae_snapshot(session, patient) -> Dict[str, Any]:
+    """SAE 発生時点の主要条件（保存前のメモリ上の値から作る）。"""
+    try:
+        return {
+            'date': session.session_date.isoformat(),
+            'mt_percent': session.mt_percent,
+            'frequency_hz': str(session.frequency_hz),
+            'train_seconds': str(session.train_seconds),
+            'train_count': session.train_count,
+            'total_pulses': session.total_pulses,
+            'coil_type': session.coil_type,
+            'target_site': session.target_site,
+            'diagnosis': patient.diagnosis,
+            # Medication snapshot (placeholder, adjust for your medication model)
+            'medication_history': patient.medication_history,
+            'age': patient.age,
+            'gender': patient.get_gender_display(),
+        }
+    except Exception:
+        return {}
+
+
+def _load_existing(record: TreatmentRecord) -> Optional[TreatmentSession]:
+    sae_exists = SeriousAdverseEvent.objects.filter(
+        patient=record.patient,
+        course_number=record.course_number,
+        session=OuterRef('pk'),
+    )
+    return (
+        TreatmentSession.objects
+        .select_for_update(of=('self',))
+        .select_related('side_effect_check')
+        .annotate(has_sae=Exists(sae_exists))
+        .filter(
+            patient=record.patient,
+            course_number=record.course_number,
+            session_date=record.session_date,
+            slot=record.slot,
+        )
+        .first()
+    )
+
+
+def save_treatment_record(record: TreatmentRecord) -> TreatmentSession:
+    """record の内容でセッション・副作用チェック・SAE を1回ずつ書き込み、セッションを返す。
+
+    新規: SELECT 1 + INSERT 2（セッション・副作用チェック）+ SAE があれば INSERT 1。
+    更新: SELECT 1 + UPDATE 2 + SAE の upsert 1（チェックが外れて既存 SAE があれば削除）。
+    """
+    with transaction.atomic():
+        session = _load_existing(record)
+        created = session is None
+        if created:
+            session = TreatmentSession(
+                patient=record.patient,
+                course_number=record.course_number,
+                session_date=record.session_date,
+                slot=record.slot,
+            )
+            sec = None
+            has_sae = False
+        else:
+            try:
+                sec = session.side_effect_check
+            except SideEffectCheck.DoesNotExist:
+                sec = None
+            has_sae = session.has_sae
+            # 監査ログのシグナルが session.patient を読むので取得済みの患者を載せておく
+            session.patient = record.patient
+
+        for name, value in record.fields.items():
+            setattr(session, name, value)
+
+        # 副作用チェック: メモ・署名は空で送られてきたら既存の値を残す
+        memo = record.side_effect_memo or (sec.memo if sec else '') or ''
+        signature = record.side_effect_signature or (sec.physician_signature if sec else '') or ''
+
+        meta = dict(session.meta or {})
+        meta.update(record.meta_updates)
+        if memo:
+            # keep legacy keys for backward compatibility but set from unified memo
+            meta['confirm_notes'] = memo
+            meta['treat_notes'] = memo
+        session.meta = meta
+        if record.skip:
+            session.status = 'skipped'
+
+        if created:
+            session.save()
+        else:
+            update_fields = set(record.fields) | {'meta'}
+            if record.skip:
+                update_fields.add('status')
+            session.save(update_fields=sorted(update_fields))
+
+        if sec is None:
+            sec = SideEffectCheck.objects.create(
+                session=session,
+                rows=record.side_effect_rows or [],
+                memo=memo,
+                physician_signature=signature,
+            )
+        else:
+            sec.rows = record.side_effect_rows or []
+            sec.memo = memo
+            sec.physician_signature = signature
+            sec.save(update_fields=['rows', 'memo', 'physician_signature', 'updated_at'])
+        session.side_effect_check = sec
+
+        if record.sae_event_types:
+            SeriousAdverseEvent.objects.bulk_create(
+                [SeriousAdverseEvent(
+                    patient=record.patient,
+                    course_number=record.course_number,
+                    session=session,
+                    event_types=record.sae_event_types,
+                    other_text=record.sae_other_text,
+                    auto_snapshot=_sae_snapshot(session, record.patient),
+                )],
+                update_conflicts=True,
+                unique_fields=['patient', 'course_number', 'session'],
+                update_fields=['event_types', 'other_text', 'auto_snapshot'],
+            )
+        elif has_sae:
+            # No SAE events checked: delete existing record
+            SeriousAdverseEvent.objects.filter(
+                patient=record.patient,
+                course_number=record.course_number,
+                session=session,
+            ).delete()
+    return session
@@ -2,10 +2,13 @@ from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.db import transaction
 from django.contrib.auth import get_user_model
-from .models import AuditLog, TreatmentSession, Assessment, ConsentDocument, Patient
-from .services.patient_accounts import ensure_patient_user
+from .models import AuditLog, TreatmentSession, Assessment, ConsentDocument, Patient, MappingSession, SideEffectCheck
+from .services import live_updates, side_effect_facts
+from .services.patient_accounts import ensure_patient_user, is_valid_card_id
 from .utils.request_context import get_current_request, get_client_ip, get_user_agent
-import re
+import logging
+
+logger = logging.getLogger(__name__)
 
 TARGET_MODELS = [TreatmentSession, Assessment]
 
@@ -68,6 +71,43 @@ def audit_log_delete(sender, instance, **kwargs):
     create_audit_log(instance, 'DELETE', summary)
 
 
+
+# --- Live dashboard deltas (services/live_updates) ---
+LIVE_MODELS = (TreatmentSession, MappingSession, Assessment, Patient)
+
+
+@receiver(post_save, dispatch_uid="rtms_live_update_save")
+def live_update_save(sender, instance, raw=False, **kwargs):
+    if raw or sender not in LIVE_MODELS:
+        return
+    live_updates.publish_on_commit(instance)
+
+
+@receiver(post_delete, dispatch_uid="rtms_live_update_delete")
+def live_update_delete(sender, instance, **kwargs):
+    if sender not in LIVE_MODELS:
+        return
+    live_updates.publish_on_commit(instance, deleted=True)
+
+# --- Side-effect fact table (services/side_effect_facts) ---
+@receiver(post_save, sender=SideEffectCheck, dispatch_uid="rtms_side_effect_facts_save")
+def side_effect_facts_save(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    session = instance.session
+    # 新規チェックの前に所見があり得るのは旧形式 side_effects を持つセッションだけ
+    replace = not created or bool(session.side_effects)
+    side_effect_facts.sync_session(session, instance.rows, replace=replace)
+
+
+@receiver(post_delete, sender=SideEffectCheck, dispatch_uid="rtms_side_effect_facts_delete")
+def side_effect_facts_delete(sender, instance, **kwargs):
+    # セッションごと削除された場合は所見も CASCADE で消えている
+    session = TreatmentSession.objects.filter(pk=instance.session_id).first()
+    if session is not None:
+        side_effect_facts.sync_session(session, [])
+
+
 # --- AuditLog for User model actions ---
 User = get_user_model()
 
@@ -99,26 +139,18 @@ def audit_log_user_save(sender, instance, created, **kwargs):
     transaction.on_commit(_create_user_log)
 
 
-@receiver(post_save, sender=Patient)
-def auto_create_patient_user(sender, instance, created, **kwargs):
-    """Automatically create patient portal user when Patient is created."""
-    if not instance.pk or not instance.card_id:
-        return
-    
-    # Only create user if card_id is valid 5-digit format
-    if not re.match(r'^\d{5}$', instance.card_id):
-        return
-    
-    # Skip if user already exists
-    if instance.user_id:
+@receiver(post_save, sender=Patient, dispatch_uid="rtms_provision_patient_user")
+def provision_patient_user(sender, instance: Patient, raw=False, **kwargs):
+    """Provision a patient portal user the first time a Patient with a valid card_id is saved.
+
+    Already-linked patients (and invalid card_ids) return before touching the database.
+    """
+    if raw or instance.user_id or not instance.pk or not is_valid_card_id(instance.card_id):
         return
-    
     try:
         ensure_patient_user(instance)
     except Exception as e:
         # Log error but don't break patient creation
-        import logging
-        logger = logging.getLogger(__name__)
         logger.error(f"Failed to auto-create user for patient {instance.pk}: {e}")
 
 
@@ -145,14 +177,3 @@ def audit_log_user_delete(sender, instance, **kwargs):
         )
 
     transaction.on_commit(_create_user_delete_log)
-
-
-@receiver(post_save, sender=Patient)
-def create_patient_user_on_save(sender, instance: Patient, created, **kwargs):
-    """Automatically provision a patient portal user when a Patient is saved."""
-    try:
-        if created or not instance.user_id:
-            ensure_patient_user(instance)
-    except Exception:
-        # Avoid breaking patient save due to user provisioning errors
-        pass
\ No newline at end of file
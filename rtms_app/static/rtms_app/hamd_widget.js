@@ -154,10 +154,28 @@
     calcHAMD17();
   }
 
-  function boot() {
-    console.log('[hamd_widget] boot() called');
-    initButtonGroups();
-    
+  // アンカー文が定義バンドル（immutable キャッシュ）から来る場合は、Popover 生成前に埋める
+  function hydrateAnchors() {
+    const url = window.HAMD_BUNDLE_URL;
+    const targets = document.querySelectorAll('[data-anchor-key]:not([data-bs-content])');
+    if (!url || targets.length === 0) return Promise.resolve();
+    return fetch(url, { credentials: 'same-origin' })
+      .then((r) => {
+        if (!r.ok) throw new Error(`HTTP ${r.status}`);
+        return r.json();
+      })
+      .then((bundle) => {
+        const anchors = {};
+        (bundle.items || []).forEach((item) => { anchors[item.key] = item.anchor; });
+        targets.forEach((el) => {
+          const text = anchors[el.getAttribute('data-anchor-key')];
+          if (text !== undefined) el.setAttribute('data-bs-content', text);
+        });
+      })
+      .catch((e) => console.error('[hamd_widget] Failed to load definition bundle:', e));
+  }
+
+  function startPopovers() {
     // Wait for Bootstrap to be fully loaded before initializing popovers
     if (typeof bootstrap !== 'undefined' && bootstrap.Popover) {
       console.log('[hamd_widget] Bootstrap detected, initializing popovers');
@@ -187,7 +205,13 @@
         }
       }, 100);
     }
-    
+  }
+
+  function boot() {
+    console.log('[hamd_widget] boot() called');
+    initButtonGroups();
+    hydrateAnchors().then(startPopovers);
+
     restoreValues();
     setTimeout(calcHAMD17, 50);
     setTimeout(calcHAMD17, 200);
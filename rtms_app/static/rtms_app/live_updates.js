@@ -0,0 +1,98 @@
+// ダッシュボード・月間カレンダーのライブ更新 (SSE)
+// [data-live-url] の要素が EventSource の接続先を持つ。受け取った差分が表示中の日付
+// （[data-live-date]）の位置決めならその場で書き換え、それ以外は同じ URL を取り直して
+// [data-live-region] の部分だけ差し替える（ページ全体の再読み込みはしない）。
+(() => {
+  if (!('EventSource' in window) || !('fetch' in window)) return;
+
+  const REFRESH_DELAY_MS = 400;
+  const STATUS = {
+    true: { label: '実施済', color: 'success' },
+    false: { label: '実施未', color: 'danger' },
+  };
+  let source = null;
+  let sourceUrl = null;
+  let refreshTimer = null;
+
+  function liveRoot() {
+    return document.querySelector('[data-live-url]');
+  }
+
+  // 位置決めは「その日に記録があるか」だけなのでバッジを書き換えれば足りる。
+  // 治療は回数・週の表示も変わり、別の日付の差分は表示中の日のバッジと関係ないので取り直す
+  function applyInPlace(root, delta) {
+    if (root.dataset.liveRegion !== 'tasks' || delta.kind !== 'mapping') return false;
+    if (!root.dataset.liveDate || !(delta.dates || []).includes(root.dataset.liveDate)) return false;
+    const items = root.querySelectorAll(
+      `[data-live-kind="${delta.kind}"][data-patient-id="${delta.patient_id}"]`,
+    );
+    if (items.length === 0) return false;
+    const status = STATUS[Boolean(delta.done)];
+    items.forEach((item) => {
+      const badge = item.querySelector('.status-badge');
+      if (!badge) return;
+      badge.textContent = status.label;
+      badge.className = `status-badge status-${status.color}`;
+    });
+    return true;
+  }
+
+  async function refreshRegions() {
+    refreshTimer = null;
+    try {
+      const r = await fetch(window.location.href, {
+        credentials: 'same-origin',
+        headers: { 'X-Requested-With': 'XMLHttpRequest' },
+      });
+      if (!r.ok || r.redirected) return;
+      const doc = new DOMParser().parseFromString(await r.text(), 'text/html');
+      doc.querySelectorAll('[data-live-region]').forEach((fresh) => {
+        const current = document.querySelector(`[data-live-region="${fresh.dataset.liveRegion}"]`);
+        if (current) current.replaceWith(document.importNode(fresh, true));
+      });
+      // 表示中の患者が変わると購読条件も変わる
+      const root = liveRoot();
+      if (root && root.dataset.liveUrl !== sourceUrl) connect(root.dataset.liveUrl);
+    } catch (e) {
+      console.warn('live refresh failed', e);
+    }
+  }
+
+  function scheduleRefresh() {
+    if (refreshTimer) return;
+    refreshTimer = setTimeout(refreshRegions, REFRESH_DELAY_MS);
+  }
+
+  function onDelta(event) {
+    let delta;
+    try {
+      delta = JSON.parse(event.data);
+    } catch (e) {
+      return;
+    }
+    const root = liveRoot();
+    if (!root || !applyInPlace(root, delta)) scheduleRefresh();
+  }
+
+  function connect(url) {
+    if (source) source.close();
+    sourceUrl = url;
+    if (!url) return;
+    source = new EventSource(url);
+    let opened = false;
+    source.onopen = () => {
+      // 再接続時は切断中の変更を取りこぼしているので取り直す
+      if (opened) scheduleRefresh();
+      opened = true;
+    };
+    source.onmessage = onDelta;
+    // サーバー側で取りこぼしたときは全体を取り直す
+    source.addEventListener('resync', scheduleRefresh);
+  }
+
+  document.addEventListener('DOMContentLoaded', () => {
+    const root = liveRoot();
+    if (root) connect(root.dataset.liveUrl);
+  });
+  window.addEventListener('pagehide', () => { if (source) source.close(); });
+})();
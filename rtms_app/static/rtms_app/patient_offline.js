@@ -0,0 +1,131 @@
+// 患者ポータルのオフライン入力
+// 回答を IndexedDB に保存し、未送信分をまとめて sync エンドポイントへ送る。
+const SurveyOffline = (() => {
+  const DB_NAME = 'rtms-patient-surveys';
+  const STORE = 'answers';
+  let dbPromise = null;
+
+  function supported() {
+    return 'indexedDB' in window && 'fetch' in window;
+  }
+
+  function openDb() {
+    if (!dbPromise) {
+      dbPromise = new Promise((resolve, reject) => {
+        const req = indexedDB.open(DB_NAME, 1);
+        req.onupgradeneeded = () => {
+          const store = req.result.createObjectStore(STORE, { keyPath: 'id' });
+          store.createIndex('session', 'sessionId');
+        };
+        req.onsuccess = () => resolve(req.result);
+        req.onerror = () => reject(req.error);
+      });
+    }
+    return dbPromise;
+  }
+
+  function run(mode, fn) {
+    return openDb().then((db) => new Promise((resolve, reject) => {
+      const tx = db.transaction(STORE, mode);
+      const result = fn(tx.objectStore(STORE));
+      tx.oncomplete = () => resolve(result && 'result' in result ? result.result : result);
+      tx.onerror = () => reject(tx.error);
+    }));
+  }
+
+  // { id, sessionId, instrument, answers, updatedAt, dirty }
+  function get(sessionId, instrument) {
+    return run('readonly', (store) => store.get(`${sessionId}:${instrument}`));
+  }
+
+  function put(sessionId, instrument, answers) {
+    return run('readwrite', (store) => store.put({
+      id: `${sessionId}:${instrument}`,
+      sessionId,
+      instrument,
+      answers,
+      updatedAt: Date.now(),
+      dirty: true,
+    }));
+  }
+
+  function pending(sessionId) {
+    return run('readonly', (store) => store.index('session').getAll(sessionId))
+      .then((rows) => (rows || []).filter((row) => row.dirty));
+  }
+
+  // 送信中に書き換えられた行は dirty のまま残す
+  function markSynced(rows) {
+    return run('readwrite', (store) => {
+      rows.forEach((sent) => {
+        const req = store.get(sent.id);
+        req.onsuccess = () => {
+          const row = req.result;
+          if (row && row.updatedAt === sent.updatedAt) {
+            row.dirty = false;
+            store.put(row);
+          }
+        };
+      });
+    });
+  }
+
+  function csrfToken() {
+    const input = document.querySelector('input[name="csrfmiddlewaretoken"]');
+    return input ? input.value : '';
+  }
+
+  // 未送信の回答を1リクエストで送る。送るものがなければ null を返す
+  async function flush(sessionId, syncUrl) {
+    const rows = await pending(sessionId);
+    if (rows.length === 0) return null;
+    const answers = {};
+    rows.forEach((row) => { answers[row.instrument] = row.answers; });
+    const r = await fetch(syncUrl, {
+      method: 'POST',
+      credentials: 'same-origin',
+      headers: {
+        'Content-Type': 'application/json',
+        'X-Requested-With': 'XMLHttpRequest',
+        'X-CSRFToken': csrfToken(),
+      },
+      body: JSON.stringify({ answers }),
+    });
+    const body = await r.json().catch(() => ({}));
+    if (r.status === 409) {
+      // 提出済み: 端末側の未送信分は破棄する
+      await markSynced(rows);
+      return body;
+    }
+    if (!r.ok) {
+      const err = new Error(`sync failed: HTTP ${r.status}`);
+      err.body = body;
+      throw err;
+    }
+    await markSynced(rows);
+    return body;
+  }
+
+  function registerWorker(url, scope) {
+    if (!('serviceWorker' in navigator) || !url) return Promise.resolve(null);
+    return navigator.serviceWorker.register(url, { scope })
+      .catch((e) => { console.warn('service worker registration failed', e); return null; });
+  }
+
+  function precache(urls) {
+    if (!('serviceWorker' in navigator)) return;
+    navigator.serviceWorker.ready.then((reg) => {
+      if (reg.active) reg.active.postMessage({ type: 'precache', urls });
+    });
+  }
+
+  return {
+    supported,
+    get,
+    put,
+    pending,
+    flush,
+    registerWorker,
+    precache,
+  };
+})();
@@ -3,6 +3,7 @@ const SurveyPage = (() => {
   let instrument = {};
   let answers = {};
   let saveTimer = null;
+  let offline = false;
 
   function readJson(id) {
     const el = document.getElementById(id);
@@ -10,6 +11,72 @@ const SurveyPage = (() => {
     try { return JSON.parse(el.textContent || '{}'); } catch (e) { return {}; }
   }
 
+  // _instrument_questions.html と同じ構造の設問カードを組み立てる
+  function renderQuestions(container, def) {
+    (def.questions || []).forEach((q, idx) => {
+      const card = document.createElement('div');
+      card.className = 'question-card shadow-sm';
+      card.id = `q-${q.key}`;
+      card.dataset.questionKey = q.key;
+      card.dataset.includeTotal = q.include_in_total === undefined ? 'True' : (q.include_in_total ? 'True' : 'False');
+
+      const body = document.createElement('div');
+      body.className = 'd-flex flex-column gap-2';
+      const head = document.createElement('div');
+      head.className = 'd-flex align-items-center gap-2';
+      const badge = document.createElement('div');
+      badge.className = 'q-badge';
+      badge.textContent = `Q${idx + 1}`;
+      const text = document.createElement('div');
+      text.className = 'fw-bold question-text';
+      text.dataset.defaultLabel = q.text;
+      text.textContent = q.text;
+      head.append(badge, text);
+
+      const options = document.createElement('div');
+      options.className = 'options-row';
+      (q.options || []).forEach((opt) => {
+        const inputId = `q${q.key}-${opt.id}`;
+        const input = document.createElement('input');
+        input.className = 'btn-check';
+        input.type = 'radio';
+        input.name = q.key;
+        input.id = inputId;
+        input.value = opt.id;
+        const label = document.createElement('label');
+        label.className = 'btn btn-option';
+        label.htmlFor = inputId;
+        label.dataset.score = opt.score;
+        label.textContent = opt.label;
+        options.append(input, label);
+      });
+
+      body.append(head, options);
+      card.append(body);
+      container.append(card);
+    });
+  }
+
+  // 定義バンドル（immutable キャッシュ）から設問を読む。読めなければ埋め込み版を再取得する
+  async function loadInstrument() {
+    if (!cfg.bundleUrl) return readJson('instrumentDef') || {};
+    try {
+      const r = await fetch(cfg.bundleUrl, { credentials: 'same-origin' });
+      if (!r.ok) throw new Error(`HTTP ${r.status}`);
+      const bundle = await r.json();
+      const def = (bundle.instruments || {})[cfg.instrumentCode];
+      if (!def) throw new Error(`instrument ${cfg.instrumentCode} missing from bundle`);
+      renderQuestions(document.getElementById('questionList'), def);
+      return def;
+    } catch (e) {
+      console.warn('definition bundle failed, reloading inline', e);
+      const url = new URL(window.location.href);
+      url.searchParams.set('inline', '1');
+      window.location.replace(url.toString());
+      return null;
+    }
+  }
+
   function restoreSelections() {
     document.querySelectorAll('.btn-check').forEach((input) => {
       const val = answers[input.name];
@@ -83,19 +150,43 @@ const SurveyPage = (() => {
     return missing;
   }
 
+  function showStatus(text) {
+    const el = document.getElementById('syncStatus');
+    if (el) el.textContent = text;
+  }
+
+  // オフラインモードでは端末内に保存するだけ（送信は flushAnswers でまとめて行う）
+  function storeLocal() {
+    return SurveyOffline.put(cfg.sessionId, cfg.instrumentCode, { ...answers })
+      .catch((e) => console.warn('local save failed', e));
+  }
+
+  function flushAnswers() {
+    return SurveyOffline.flush(cfg.sessionId, cfg.syncUrl).then((result) => {
+      if (result) showStatus('送信しました');
+      return result;
+    });
+  }
+
   function debouncedSave() {
+    if (offline) {
+      storeLocal();
+      return;
+    }
     if (saveTimer) clearTimeout(saveTimer);
     saveTimer = setTimeout(() => saveDraft(), 400);
   }
 
   async function saveDraft(nav = 'stay') {
     collectAnswers();
+    const csrf = document.querySelector('input[name="csrfmiddlewaretoken"]');
     try {
       await fetch(window.location.href, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
           'X-Requested-With': 'XMLHttpRequest',
+          'X-CSRFToken': csrf ? csrf.value : '',
         },
         body: JSON.stringify({ answers, nav }),
       });
@@ -112,18 +203,57 @@ const SurveyPage = (() => {
       alert('未回答の設問があります。');
       return;
     }
+    if (offline) {
+      storeLocal().then(() => {
+        if (cfg.nextUrl) {
+          window.location.href = cfg.nextUrl;
+        } else {
+          finish();
+        }
+      });
+      return;
+    }
     const nav = document.getElementById('navInput');
     if (nav) nav.value = 'next';
     document.getElementById('surveyForm').submit();
   }
 
+  // 最後の検査: 未送信の回答を1回で送ってから確認画面へ。オフラインなら接続の回復を待つ
+  function finish() {
+    showStatus('送信しています…');
+    flushAnswers()
+      .then(() => { window.location.href = cfg.reviewUrl; })
+      .catch((e) => {
+        console.warn('sync failed', e);
+        if (e.body && e.body.errors) {
+          showStatus('回答を保存できませんでした。スタッフに声をかけてください。');
+          return;
+        }
+        showStatus('オフラインのため送信待ちです。接続が戻ると自動で送信します。');
+        window.addEventListener('online', finish, { once: true });
+      });
+  }
+
   function goPrev() {
+    if (offline && cfg.prevUrl) {
+      collectAnswers();
+      storeLocal().then(() => { window.location.href = cfg.prevUrl; });
+      return;
+    }
     const nav = document.getElementById('navInput');
     if (nav) nav.value = 'prev';
     document.getElementById('surveyForm').submit();
   }
 
   function saveOnly() {
+    if (offline) {
+      collectAnswers();
+      storeLocal()
+        .then(flushAnswers)
+        .then((result) => { if (!result) showStatus('保存しました'); })
+        .catch(() => showStatus('端末に保存しました（接続が戻ると送信します）'));
+      return;
+    }
     saveDraft('stay');
   }
 
@@ -138,10 +268,19 @@ const SurveyPage = (() => {
     });
   }
 
-  function init(config) {
+  async function init(config) {
     cfg = config || {};
-    instrument = readJson('instrumentDef') || {};
+    instrument = await loadInstrument();
+    if (!instrument) return;
     answers = readJson('answerData') || {};
+    offline = Boolean(cfg.syncUrl) && typeof SurveyOffline !== 'undefined' && SurveyOffline.supported();
+    if (offline) {
+      const local = await SurveyOffline.get(cfg.sessionId, cfg.instrumentCode).catch(() => null);
+      if (local) answers = { ...answers, ...local.answers };
+      SurveyOffline.registerWorker(cfg.serviceWorkerUrl, cfg.serviceWorkerScope)
+        .then(() => SurveyOffline.precache(cfg.instrumentUrls || []));
+      window.addEventListener('online', () => flushAnswers().catch(() => null));
+    }
     restoreSelections();
     updateDynamicLabels();
     computeTotal();
@@ -1,10 +1,11 @@
 from .definitions import (
-    INSTRUMENTS,
     INSTRUMENT_ORDER,
     INSTRUMENT_SET,
     calculate_score,
     get_instrument,
+    get_instruments,
     instrument_label,
+    item_score_table,
     next_instrument,
     prev_instrument,
 )
@@ -15,7 +16,15 @@ __all__ = [
     "INSTRUMENT_SET",
     "calculate_score",
     "get_instrument",
+    "get_instruments",
     "instrument_label",
+    "item_score_table",
     "next_instrument",
     "prev_instrument",
 ]
+
+
+def __getattr__(name):
+    if name == "INSTRUMENTS":
+        return get_instruments()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
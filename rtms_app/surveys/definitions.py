@@ -1,4 +1,5 @@
 from __future__ import annotations
+from functools import lru_cache
 from typing import Dict, List, Tuple, Any
 
 # Instrument ordering for patient workflow
@@ -472,73 +473,84 @@ DAI10_QUESTIONS = [
     "薬を続けていれば、病気の予防になる",
 ]
 
-INSTRUMENTS: Dict[str, Dict[str, Any]] = {
-    "bdi2": {
-        "code": "bdi2",
-        "name": "日本版 BDI-II",
-        "instructions": "【回答の方法】\n「この質問票には21の項目があります。それぞれの項目に含まれる文章をひとつひとつ注意深く読み、それぞれの項目で、今日を含むこの2週間のあなたの気持ちに最も近い文章をひとつ選び、選んだ文章の番号を○で囲んでください。\nもし、ひとつの項目で同じように当てはまる文章がいくつかある場合は、番号の大きい方を○で囲んでください。No.16 (睡眠習慣の変化)やNo.18 (食欲の変化)も含め、それぞれの項目で必ずひとつだけ選んでください。」",
-        "questions": BDI2_QUESTIONS,
-    },
-    "sds": {
-        "code": "sds",
-        "name": "SDS (Zung Self-Rating Depression Scale)",
-        "instructions": "【回答の方法】\n「おもての質問を読んで現在あなたの状態にもっともよくあてはまると思われる欄に印をつけてください。」",
-        "questions": SDS_QUESTIONS,
-    },
-    "sassj": {
-        "code": "sassj",
-        "name": "SASS-J (社会適応自己評価尺度)",
-        "instructions": "【回答の方法】\n「以下の質問に対して自分にあてはまるものを選び、その( )の中に○をつけてください。」",
-        "questions": SASSJ_QUESTIONS,
-    },
-    "phq9": {
-        "code": "phq9",
-        "name": "PHQ-9 日本語版",
-        "instructions": "「この2週間、次のような問題にどのくらい頻繁(ひんぱん)に悩まされていますか？」\n「右の欄の最もよくあてはまる選択肢の中から一つ選び、その数字に○をつけてください。」",
-        "questions": PHQ9_QUESTIONS,
-    },
-    "stai_x1": {
-        "code": "stai_x1",
-        "name": "日本版 STAI 状態不安 (X-1)",
-        "instructions": "やり方①\n「下に文章が並んでいますから、読んで、この質問紙を記入している今現在のあなたの気持ちをよく表すように、それぞれの文の右の欄に○をつけてください。」\n「(選択肢: 全くちがう / いくらか / まあそうだ / その通りだ)」",
-        "questions": [
-            {"key": f"q{i+1}", "text": txt, "options": STAI_X1_OPTIONS}
-            for i, txt in enumerate(STAI_X1_QUESTIONS)
-        ],
-    },
-    "stai_x2": {
-        "code": "stai_x2",
-        "name": "日本版 STAI 特性不安 (X-2)",
-        "instructions": "やり方②\n「下に文章が並んでいますから、読んで、今度はあなたのふだんの気持ちをよく表すように、それぞれの文の右の欄に○をつけてください。」\n「(選択肢: ほとんどない / ときたま / しばしば / しょっちゅう)」",
-        "questions": [
-            {"key": f"q{i+21}", "text": txt, "options": STAI_X2_OPTIONS}
-            for i, txt in enumerate(STAI_X2_QUESTIONS)
-        ],
-    },
-    "dai10": {
-        "code": "dai10",
-        "name": "薬に対するアンケート (DAI-10)",
-        "instructions": "「現在、ご自身が飲んでいる薬に対する印象を聞くアンケートです。各項目で、あてはまる方に○をつけて下さい」",
-        "questions": [
-            {
-                "key": f"q{i+1}",
-                "text": txt,
-                "options": DAI10_OPTIONS,
-                "reverse": (i + 1) in DAI10_REVERSE_ITEMS,
-                "max_score": 1,
-            }
-            for i, txt in enumerate(DAI10_QUESTIONS)
-        ],
-    },
-}
+@lru_cache(maxsize=None)
+def get_instruments() -> Dict[str, Dict[str, Any]]:
+    """Instrument table, assembled on first use (INSTRUMENTS resolves to this)."""
+    return {
+        "bdi2": {
+            "code": "bdi2",
+            "name": "日本版 BDI-II",
+            "instructions": "【回答の方法】\n「この質問票には21の項目があります。それぞれの項目に含まれる文章をひとつひとつ注意深く読み、それぞれの項目で、今日を含むこの2週間のあなたの気持ちに最も近い文章をひとつ選び、選んだ文章の番号を○で囲んでください。\nもし、ひとつの項目で同じように当てはまる文章がいくつかある場合は、番号の大きい方を○で囲んでください。No.16 (睡眠習慣の変化)やNo.18 (食欲の変化)も含め、それぞれの項目で必ずひとつだけ選んでください。」",
+            "questions": BDI2_QUESTIONS,
+        },
+        "sds": {
+            "code": "sds",
+            "name": "SDS (Zung Self-Rating Depression Scale)",
+            "instructions": "【回答の方法】\n「おもての質問を読んで現在あなたの状態にもっともよくあてはまると思われる欄に印をつけてください。」",
+            "questions": SDS_QUESTIONS,
+        },
+        "sassj": {
+            "code": "sassj",
+            "name": "SASS-J (社会適応自己評価尺度)",
+            "instructions": "【回答の方法】\n「以下の質問に対して自分にあてはまるものを選び、その( )の中に○をつけてください。」",
+            "questions": SASSJ_QUESTIONS,
+        },
+        "phq9": {
+            "code": "phq9",
+            "name": "PHQ-9 日本語版",
+            "instructions": "「この2週間、次のような問題にどのくらい頻繁(ひんぱん)に悩まされていますか？」\n「右の欄の最もよくあてはまる選択肢の中から一つ選び、その数字に○をつけてください。」",
+            "questions": PHQ9_QUESTIONS,
+        },
+        "stai_x1": {
+            "code": "stai_x1",
+            "name": "日本版 STAI 状態不安 (X-1)",
+            "instructions": "やり方①\n「下に文章が並んでいますから、読んで、この質問紙を記入している今現在のあなたの気持ちをよく表すように、それぞれの文の右の欄に○をつけてください。」\n「(選択肢: 全くちがう / いくらか / まあそうだ / その通りだ)」",
+            "questions": [
+                {"key": f"q{i+1}", "text": txt, "options": STAI_X1_OPTIONS}
+                for i, txt in enumerate(STAI_X1_QUESTIONS)
+            ],
+        },
+        "stai_x2": {
+            "code": "stai_x2",
+            "name": "日本版 STAI 特性不安 (X-2)",
+            "instructions": "やり方②\n「下に文章が並んでいますから、読んで、今度はあなたのふだんの気持ちをよく表すように、それぞれの文の右の欄に○をつけてください。」\n「(選択肢: ほとんどない / ときたま / しばしば / しょっちゅう)」",
+            "questions": [
+                {"key": f"q{i+21}", "text": txt, "options": STAI_X2_OPTIONS}
+                for i, txt in enumerate(STAI_X2_QUESTIONS)
+            ],
+        },
+        "dai10": {
+            "code": "dai10",
+            "name": "薬に対するアンケート (DAI-10)",
+            "instructions": "「現在、ご自身が飲んでいる薬に対する印象を聞くアンケートです。各項目で、あてはまる方に○をつけて下さい」",
+            "questions": [
+                {
+                    "key": f"q{i+1}",
+                    "text": txt,
+                    "options": DAI10_OPTIONS,
+                    "reverse": (i + 1) in DAI10_REVERSE_ITEMS,
+                    "max_score": 1,
+                }
+                for i, txt in enumerate(DAI10_QUESTIONS)
+            ],
+        },
+    }
+
+
+
+def __getattr__(name: str):
+    # INSTRUMENTS is built lazily so importing the URLconf does not pay for it
+    if name == "INSTRUMENTS":
+        return get_instruments()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def get_instrument(code: str) -> Dict[str, Any]:
-    return INSTRUMENTS[code]
+    return get_instruments()[code]
 
 
 def instrument_label(code: str) -> str:
-    return INSTRUMENTS.get(code, {}).get("name", code)
+    return get_instruments().get(code, {}).get("name", code)
 
 
 def next_instrument(code: str) -> str | None:
@@ -572,8 +584,19 @@ def _score_for_question(question: Dict[str, Any], answer_id: Any) -> int:
     return 0
 
 
+@lru_cache(maxsize=None)
+def item_score_table(code: str) -> Dict[str, Dict[str, int]]:
+    """{question key: {option id: score}} in question order (reverse items already applied)."""
+    meta = get_instruments().get(code) or {}
+    return {
+        q["key"]: {str(opt.get("id")): _score_for_question(q, opt.get("id")) for opt in q.get("options", [])}
+        for q in meta.get("questions", [])
+        if q.get("key") is not None
+    }
+
+
 def calculate_score(code: str, answers: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
-    meta = INSTRUMENTS.get(code)
+    meta = get_instruments().get(code)
     if not meta:
         return 0, {}
     total = 0
@@ -597,7 +620,9 @@ __all__ = [
     "INSTRUMENTS",
     "INSTRUMENT_ORDER",
     "get_instrument",
+    "get_instruments",
     "instrument_label",
+    "item_score_table",
     "next_instrument",
     "prev_instrument",
     "calculate_score",
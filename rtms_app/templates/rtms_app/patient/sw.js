@@ -0,0 +1,76 @@
+// 患者ポータル用 Service Worker（views_patient.service_worker から配信）
+// - 静的ファイルと質問票の定義バンドル: cache-first（定義バンドルはファイル名に内容ハッシュ）
+// - 検査ページ: network-first、オフライン時はキャッシュを返す
+// 回答は IndexedDB（patient_offline.js）に保存し、まとめて sync エンドポイントへ送る。
+const CACHE_VERSION = {{ cache_version_json|safe }};
+const STATIC_CACHE = `rtms-patient-static-${CACHE_VERSION}`;
+const PAGE_CACHE = 'rtms-patient-pages';
+const ASSETS = {{ assets_json|safe }};
+const SURVEY_PAGE = /\/patient\/surveys\/\d+\/[a-z0-9_]+\/$/;
+
+self.addEventListener('install', (event) => {
+  event.waitUntil(
+    caches.open(STATIC_CACHE)
+      .then((cache) => cache.addAll(ASSETS))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener('activate', (event) => {
+  event.waitUntil(
+    caches.keys()
+      .then((keys) => Promise.all(
+        keys
+          .filter((key) => key.startsWith('rtms-patient-static-') && key !== STATIC_CACHE)
+          .map((key) => caches.delete(key))
+      ))
+      .then(() => self.clients.claim())
+  );
+});
+
+// 検査ページから { type: 'precache', urls: [...] } を受け取り、未取得のページを先に取っておく
+self.addEventListener('message', (event) => {
+  const data = event.data || {};
+  if (data.type !== 'precache' || !Array.isArray(data.urls)) return;
+  event.waitUntil(
+    caches.open(PAGE_CACHE).then((cache) => Promise.all(
+      data.urls.map((url) => cache.match(url).then((hit) => hit || cache.add(url).catch(() => null)))
+    ))
+  );
+});
+
+function networkFirst(request) {
+  return fetch(request)
+    .then((response) => {
+      if (response.ok && !response.redirected) {
+        const copy = response.clone();
+        caches.open(PAGE_CACHE).then((cache) => cache.put(request, copy));
+      }
+      return response;
+    })
+    .catch(() => caches.open(PAGE_CACHE)
+      .then((cache) => cache.match(request, { ignoreSearch: true }))
+      .then((hit) => hit || Response.error()));
+}
+
+function cacheFirst(request) {
+  return caches.match(request).then((hit) => hit || fetch(request).then((response) => {
+    if (response.ok) {
+      const copy = response.clone();
+      caches.open(STATIC_CACHE).then((cache) => cache.put(request, copy));
+    }
+    return response;
+  }));
+}
+
+self.addEventListener('fetch', (event) => {
+  const request = event.request;
+  if (request.method !== 'GET') return;
+  const url = new URL(request.url);
+  if (url.origin !== self.location.origin) return;
+  if (ASSETS.includes(url.pathname)) {
+    event.respondWith(cacheFirst(request));
+  } else if (request.mode === 'navigate' && SURVEY_PAGE.test(url.pathname)) {
+    event.respondWith(networkFirst(request));
+  }
+});
@@ -0,0 +1,78 @@
+from functools import lru_cache
+
+from django import template
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from rtms_app.services.definition_bundles import bundle_url
+from rtms_app.services.fragments import definition_version, render_fragment
+from rtms_app.services.side_effect_schema import DEFAULT_PRINT_ROWS
+from rtms_app.surveys import get_instruments
+from rtms_app.utils.hamd import hamd_items
+
+register = template.Library()
+
+# 定義（アンカー文・項目名・既定行）が変わると変わる。事前レンダリング済み断片のキー
+_HAMD_DEFINITION_VERSION = definition_version(hamd_items()[0])
+_SIDE_EFFECT_ROWS_VERSION = definition_version(DEFAULT_PRINT_ROWS)
+
+
+@lru_cache(maxsize=None)
+def _registered_instrument_version(code):
+    return definition_version(get_instruments()[code])
+
+
+def _instrument_version(instrument_def):
+    # 登録済みの定義はプロセス内で変わらないので検査ごとに1回だけハッシュする
+    code = instrument_def.get("code", "")
+    if get_instruments().get(code) is instrument_def:
+        return _registered_instrument_version(code)
+    return definition_version(instrument_def)
+
+
+@register.simple_tag
+def hamd_rows(side, placement="auto", trigger="hover focus"):
+    """HAM-D の左列(Q1-11)/右列(Q12-21)の行。定義と表示位置が同じなら使い回す。
+
+    定義バンドルがあればアンカー文は埋め込まず、hamd_widget.js がバンドルから補う。
+    """
+    _all, left, right = hamd_items()
+    items, offset = (left, 0) if side == "left" else (right, len(left))
+    hydrate = bundle_url("hamd") is not None
+    context = {"items": items, "offset": offset, "placement": placement, "trigger": trigger, "hydrate": hydrate}
+    return render_fragment(
+        "rtms_app/assessment/_hamd_rows.html",
+        _HAMD_DEFINITION_VERSION,
+        context,
+        variant=(side, placement, trigger, hydrate),
+    )
+
+
+@register.simple_tag
+def definition_bundle_url(name):
+    """定義バンドルの URL（未ビルドなら空文字）。"""
+    return bundle_url(name) or ""
+
+
+@register.simple_tag
+def instrument_questions(instrument_def):
+    """患者ポータルの質問票の設問・選択肢ブロック。"""
+    code = instrument_def.get("code", "")
+    return render_fragment(
+        "rtms_app/patient/_instrument_questions.html",
+        _instrument_version(instrument_def),
+        {"instrument_def": instrument_def},
+        variant=(code,),
+    )
+
+
+@register.simple_tag
+def side_effect_rows(rows):
+    """副作用チェック票の行。既定行（記録なし）のときだけキャッシュを使う。"""
+    if rows == DEFAULT_PRINT_ROWS:
+        return render_fragment(
+            "rtms_app/print/_side_effect_rows.html",
+            _SIDE_EFFECT_ROWS_VERSION,
+            {"side_effect_rows": rows},
+        )
+    return mark_safe(render_to_string("rtms_app/print/_side_effect_rows.html", {"side_effect_rows": rows}))
@@ -1,4 +1,9 @@
-from django.test import TestCase, Client
+from importlib.util import find_spec
+from unittest import skipUnless
+
+from django.core.servers.basehttp import WSGIServer
+from django.test import TestCase, Client, LiveServerTestCase, override_settings
+from django.test.testcases import LiveServerThread, QuietWSGIRequestHandler
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 
@@ -9,7 +14,7 @@ from datetime import date
 from rtms_app import services
 from rtms_app.services import schedule as schedule_service
 from rtms_app.surveys import INSTRUMENT_ORDER, get_instrument
-from rtms_app.services.patient_accounts import ensure_patient_group
+from rtms_app.services.patient_accounts import PATIENT_GROUP_NAME, ensure_patient_group
 
 
 class TestAssessmentRules(TestCase):
@@ -168,6 +173,92 @@ class TestSkipSessions(TestCase):
         delta = new_last - original_last
         self.assertEqual(self.patient.discharge_date, date(2026,1,31) + delta)
 
+class TestTreatmentRecordUnitOfWork(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='uow', password='pw')
+        self.client = Client()
+        self.client.login(username='uow', password='pw')
+        self.patient = Patient.objects.create(card_id='UOW1', name='UoW Test', birth_date=datetime.date(1985, 5, 1))
+        self.url = reverse('rtms_app:treatment_add', args=[self.patient.id])
+        self.post = {
+            'treatment_date': '2026-02-02',
+            'treatment_time': '09:00',
+            'mt_percent': '120',
+            'frequency_hz': '18.0',
+            'train_seconds': '2.0',
+            'intertrain_seconds': '20.0',
+            'train_count': '55',
+            'total_pulses': '1980',
+            'confirm_pulse_seconds': '2.5',
+            'confirm_discomfort': 'on',
+            'side_effect_rows_json': '[{"item": "headache", "before": 0, "during": 1, "after": 0}]',
+            'side_effect_memo': '軽い頭痛',
+            'side_effect_signature': 'Dr.A',
+        }
+
+    def _post(self, data):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        # 監査ログの INSERT は on_commit で走るので書き込み数には含まれない
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as ctx:
+            resp = self.client.post(self.url, data, follow=False)
+        self.assertIn(resp.status_code, (302, 303))
+        return [q['sql'].split()[0].upper() for q in ctx.captured_queries
+                  if q['sql'].lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE'))]
+
+    def test_each_row_written_once(self):
+        from rtms_app.models import AuditLog, SideEffectCheck, TreatmentSession
+
+        # session INSERT + side-effect INSERT + 副作用所見（SideEffectObservation）INSERT
+        self.assertEqual(self._post(self.post), ['INSERT', 'INSERT', 'INSERT'])
+        s = TreatmentSession.objects.get(patient=self.patient, session_date=date(2026, 2, 2))
+        self.assertEqual(s.meta['confirm_pulse_seconds'], 2.5)
+        self.assertTrue(s.meta['confirm_discomfort'])
+        self.assertEqual(s.meta['confirm_notes'], '軽い頭痛')
+        self.assertEqual(s.meta['treat_notes'], '軽い頭痛')
+        sec = SideEffectCheck.objects.get(session=s)
+        self.assertEqual(sec.physician_signature, 'Dr.A')
+        self.assertEqual(len(sec.rows), 1)
+        self.assertEqual(AuditLog.objects.filter(target_model='TreatmentSession', target_pk=str(s.pk)).count(), 1)
+
+        # 再保存: SAE を付けると UPDATE 2 + 所見の作り直し（DELETE + INSERT）+ SAE upsert 1。
+        # 空のメモ・署名は既存値を残す
+        data = dict(self.post, side_effect_memo='', side_effect_signature='', sae_syncope='on')
+        self.assertEqual(self._post(data), ['UPDATE', 'UPDATE', 'DELETE', 'INSERT', 'INSERT'])
+        sec.refresh_from_db()
+        self.assertEqual((sec.memo, sec.physician_signature), ('軽い頭痛', 'Dr.A'))
+        sae = s.sae_records.get()
+        self.assertEqual(sae.event_types, ['syncope'])
+        self.assertEqual(sae.auto_snapshot['date'], '2026-02-02')
+        self.assertEqual(AuditLog.objects.filter(target_model='TreatmentSession', target_pk=str(s.pk)).count(), 2)
+
+        # チェックを外すと既存 SAE を削除
+        self.assertEqual(self._post(self.post), ['UPDATE', 'UPDATE', 'DELETE', 'INSERT', 'DELETE'])
+        self.assertFalse(s.sae_records.exists())
+
+    def test_service_statement_count(self):
+        from rtms_app.services.treatment_record import TreatmentRecord, save_treatment_record
+
+        def record(**kwargs):
+            return TreatmentRecord(
+                patient=self.patient, course_number=1, session_date=date(2026, 2, 3), slot='',
+                fields={'mt_percent': 110, 'performer': self.user}, **kwargs,
+            )
+
+        # SELECT + INSERT x2 (+ SAVEPOINT/RELEASE)
+        with self.assertNumQueries(5):
+            s = save_treatment_record(record(side_effect_memo='memo'))
+        # SELECT + UPDATE x2 + 所見の DELETE + SAE upsert (+ SAVEPOINT/RELEASE)
+        with self.assertNumQueries(7):
+            s2 = save_treatment_record(record(sae_event_types=['other'], skip=True))
+        self.assertEqual(s.pk, s2.pk)
+        s.refresh_from_db()
+        self.assertEqual(s.status, 'skipped')
+        self.assertEqual(s.meta['confirm_notes'], 'memo')
+
+
 class TestPatientSurveyFlow(TestCase):
     def setUp(self):
         self.client = Client()
@@ -273,6 +364,185 @@ class TestPatientSurveyFlow(TestCase):
         self.assertEqual(s3.session_date, d3)
 
 
+class TestPatientSurveySync(TestCase):
+    def setUp(self):
+        from rtms_app.models import PatientSurveySession
+        from rtms_app.services.patient_accounts import ensure_patient_user
+        ensure_patient_group()
+        self.patient = Patient.objects.create(card_id="23456", name="Sync Patient", birth_date=date(1990, 1, 1))
+        self.user, _ = ensure_patient_user(self.patient, reset_password=True)
+        self.client.force_login(self.user)
+        self.session = PatientSurveySession.objects.create(
+            patient=self.patient, phase="pre", status="in_progress", course_number=1,
+        )
+        self.url = reverse("patient_portal:sync", args=[self.session.id])
+
+    def _answers(self, code, pick=0):
+        return {q["key"]: q["options"][pick]["id"] for q in get_instrument(code)["questions"]}
+
+    def _post(self, answers):
+        import json
+        return self.client.post(self.url, json.dumps({"answers": answers}), content_type="application/json")
+
+    def test_one_request_saves_and_scores_every_instrument(self):
+        from rtms_app.models import PatientSurveyResponse
+        from rtms_app.surveys import calculate_score
+
+        partial = {"bdi2": self._answers("bdi2")}
+        resp = self._post(partial)
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(resp.json()["complete"])
+        self.assertNotIn("bdi2", resp.json()["missing"])
+
+        payload = {code: self._answers(code, pick=1) for code in INSTRUMENT_ORDER}
+        with self.assertNumQueries(10):
+            resp = self._post(payload)
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertTrue(data["complete"])
+        self.assertEqual(data["review_url"], reverse("patient_portal:review", args=[self.session.id]))
+
+        rows = {r.instrument: r for r in PatientSurveyResponse.objects.filter(session=self.session)}
+        self.assertEqual(set(rows), set(INSTRUMENT_ORDER))
+        for code in INSTRUMENT_ORDER:
+            total, extras = calculate_score(code, payload[code])
+            self.assertEqual(rows[code].answers, payload[code])
+            self.assertEqual(rows[code].total_score, total)
+            self.assertEqual(data["saved"][code]["total"], total)
+            self.assertEqual(rows[code].extra_data, extras)
+
+        resp = self.client.post(reverse("patient_portal:submit", args=[self.session.id]))
+        self.assertRedirects(resp, reverse("patient_portal:review", args=[self.session.id]))
+        self.assertEqual(self._post(payload).status_code, 409)
+
+    def test_invalid_payload_writes_nothing(self):
+        from rtms_app.models import PatientSurveyResponse
+
+        bad = self._answers("phq9")
+        bad["q1"] = "not-an-option"
+        resp = self._post({"bdi2": self._answers("bdi2"), "phq9": bad, "nope": {}})
+        self.assertEqual(resp.status_code, 400)
+        errors = resp.json()["errors"]
+        self.assertEqual(set(errors), {"phq9", "nope"})
+        self.assertFalse(PatientSurveyResponse.objects.filter(session=self.session).exists())
+
+        for body in ("[1, 2]", '"answers"', "null", "not json"):
+            resp = self.client.post(self.url, body, content_type="application/json")
+            self.assertEqual((resp.status_code, resp.json()), (400, {"error": "invalid JSON"}), body)
+
+        other = Patient.objects.create(card_id="34567", name="Other", birth_date=date(1990, 1, 1))
+        from rtms_app.models import PatientSurveySession
+        foreign = PatientSurveySession.objects.create(patient=other, phase="pre", status="in_progress")
+        resp = self.client.post(reverse("patient_portal:sync", args=[foreign.id]), "{}", content_type="application/json")
+        self.assertEqual(resp.status_code, 404)
+
+    def test_service_worker_and_offline_page_config(self):
+        resp = self.client.get(reverse("patient_portal:service_worker"))
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp["Content-Type"].startswith("application/javascript"))
+        self.assertEqual(resp["Service-Worker-Allowed"], "/patient/")
+        self.assertContains(resp, "rtms_app/patient_surveys.js")
+
+        resp = self.client.get(reverse("patient_portal:instrument", args=[self.session.id, "bdi2"]))
+        self.assertContains(resp, f'syncUrl: "{self.url}"')
+        self.assertContains(resp, 'prevUrl: ""')
+        self.assertContains(resp, reverse("patient_portal:instrument", args=[self.session.id, "dai10"]))
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class TestPatientProvisioning(TestCase):
+    def test_bulk_provisioning_query_count_does_not_grow(self):
+        from django.contrib.auth.models import Group
+        from rtms_app.services.patient_accounts import provision_patient_users
+
+        User = get_user_model()
+        existing = User.objects.create_user(username="40001", password="old")
+        # bulk_create skips post_save, so nothing is provisioned yet
+        Patient.objects.bulk_create(
+            [Patient(card_id=f"4{i:04d}", name=f"患者{i}", birth_date=date(1980, 1, 1)) for i in range(1, 7)]
+            + [Patient(card_id="P-1", name="無効", birth_date=date(1980, 1, 1))]
+        )
+        patients = list(Patient.objects.order_by("card_id"))
+        self.assertFalse(any(p.user_id for p in patients))
+
+        # group get_or_create(2) + 2 lookups + savepoint/insert/update/membership/link/release
+        with self.assertNumQueries(11):
+            result = provision_patient_users(patients, workers=1)
+        self.assertEqual(len(result.created), 5)
+        self.assertEqual([p.card_id for p in result.linked], ["40001"])
+        self.assertEqual([(p.card_id, reason) for p, reason in result.skipped], [("P-1", "invalid card_id 'P-1'")])
+        self.assertEqual(result.passwords_set, 5)
+
+        group = Group.objects.get(name=PATIENT_GROUP_NAME)
+        for patient in Patient.objects.filter(card_id__startswith="4").select_related("user"):
+            self.assertEqual(patient.user.username, patient.card_id)
+            self.assertTrue(patient.user.groups.filter(pk=group.pk).exists())
+        self.assertTrue(User.objects.get(username="40002").check_password("40002"))
+        existing.refresh_from_db()
+        self.assertTrue(existing.check_password("old"))
+        self.assertEqual(existing.first_name, "患者1")
+
+        again = provision_patient_users(Patient.objects.all(), reset_password=True, workers=2)
+        self.assertEqual(len(again.unchanged), 6)
+        self.assertEqual(again.passwords_set, 6)
+        existing.refresh_from_db()
+        self.assertTrue(existing.check_password("40001"))
+
+    def test_username_conflicts_are_skipped_not_fatal(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from rtms_app.services.patient_accounts import provision_patient_users
+
+        User = get_user_model()
+        Patient.objects.bulk_create([
+            Patient(card_id=card_id, name=name, birth_date=date(1980, 1, 1))
+            for card_id, name in (("50001", "改番"), ("50002", "重複A"), ("50003", "重複B"), ("50004", "新規"), ("50005", "既存"))
+        ])
+        renamed, dup_a, dup_b, fresh, taken = Patient.objects.filter(card_id__startswith="5000").order_by("card_id")
+        # 50001 の患者は旧番号のユーザーに紐づいたまま、50001 は別のユーザーが使っている
+        other = User.objects.create_user(username="50001")
+        Patient.objects.filter(pk=renamed.pk).update(user=User.objects.create_user(username="49999"))
+        # 50005 のユーザーは既に別の患者に紐づいている
+        owner = Patient.objects.create(card_id="50099", name="持ち主", birth_date=date(1980, 1, 1))
+        Patient.objects.filter(pk=owner.pk).update(user=User.objects.create_user(username="50005"))
+
+        patients = list(Patient.objects.filter(pk__in=[p.pk for p in (renamed, dup_a, dup_b, fresh, taken)]).order_by("card_id"))
+        patients[2].card_id = "50002"  # 保存前の入力ミスで同じ番号が重なった
+        result = provision_patient_users(patients, workers=1)
+        self.assertEqual([p.pk for p in result.created], [dup_a.pk, fresh.pk])
+        self.assertEqual(dict((p.pk, reason) for p, reason in result.skipped), {
+            renamed.pk: f"username '50001' is already used by user {other.pk}",
+            dup_b.pk: f"card_id '50002' is also used by patient {dup_a.pk}",
+            taken.pk: f"user '50005' is already linked to patient {owner.pk}",
+        })
+        self.assertEqual(Patient.objects.get(pk=renamed.pk).user.username, "49999")
+        self.assertIsNone(Patient.objects.get(pk=dup_b.pk).user_id)
+
+        out = StringIO()
+        call_command("create_patient_users", patient_ids=[taken.pk], stdout=out)
+        self.assertIn(f"already linked to patient {owner.pk} - skipped", out.getvalue())
+
+    def test_parallel_hashing_matches_serial(self):
+        from django.contrib.auth.hashers import check_password
+        from rtms_app.services.patient_accounts import PARALLEL_HASH_MIN, hash_passwords
+
+        raw = [f"{i:05d}" for i in range(PARALLEL_HASH_MIN)]
+        hashed = hash_passwords(raw, workers=2)
+        self.assertEqual(len(set(hashed)), len(raw))
+        for r, h in zip(raw, hashed):
+            self.assertTrue(check_password(r, h))
+
+    def test_save_signal_provisions_once_and_is_free_when_linked(self):
+        patient = Patient.objects.create(card_id="45678", name="保存", birth_date=date(1980, 1, 1))
+        self.assertEqual(patient.user.username, "45678")
+        self.assertEqual(get_user_model().objects.filter(username="45678").count(), 1)
+        patient.name = "保存2"
+        with self.assertNumQueries(1):
+            patient.save(update_fields=["name"])
+        invalid = Patient.objects.create(card_id="X", name="無効", birth_date=date(1980, 1, 1))
+        self.assertIsNone(invalid.user_id)
+
+
 class TestScheduleTasks(TestCase):
     def test_compute_task_definitions_and_dashboard(self):
         from rtms_app.services.schedule_tasks import compute_task_definitions, compute_dashboard_tasks
@@ -295,3 +565,1502 @@ class TestScheduleTasks(TestCase):
         todo = compute_dashboard_tasks(p, today=planned, holidays=set())
         todo_keys = {t['key'] for t in todo}
         self.assertIn('mapping', todo_keys)
+
+
+class TestQueryPlans(TestCase):
+    """EXPLAIN the hot lookups and fail if any regresses to a full table scan.
+
+    SQLite reports full scans as ``SCAN <table>`` (index lookups are ``SEARCH``);
+    PostgreSQL reports ``Seq Scan on <table>``. On PostgreSQL sequential scans are
+    disabled for the check so tiny test tables do not hide a missing index.
+    """
+
+    def setUp(self):
+        from rtms_app.models import TreatmentSession, MappingSession, Assessment, AuditLog
+        self.patient = Patient.objects.create(card_id='PLAN1', name='Plan Test', birth_date=date(1980, 1, 1))
+        TreatmentSession.objects.create(patient=self.patient, session_date=date(2026, 1, 5))
+        MappingSession.objects.create(patient=self.patient, date=date(2026, 1, 5), resting_mt=60)
+        Assessment.objects.create(patient=self.patient, timing='baseline', date=date(2026, 1, 2))
+        AuditLog.objects.create(patient=self.patient, target_model='Patient', target_pk='1', action='UPDATE', summary='x')
+
+    def _plan(self, qs):
+        from django.db import connection
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return qs.explain()
+
+    def assertNoFullScan(self, qs):
+        from django.db import connection
+        table = qs.model._meta.db_table
+        plan = self._plan(qs)
+        for line in plan.splitlines():
+            text = line.strip()
+            if connection.vendor == 'sqlite':
+                bad = f'SCAN {table}' in text and 'USING' not in text
+            elif connection.vendor == 'postgresql':
+                bad = f'Seq Scan on {table}' in text
+            else:
+                bad = False
+            self.assertFalse(bad, f'full scan on {table}:\n{plan}')
+
+    def test_treatment_by_patient_and_session_date(self):
+        from rtms_app.models import TreatmentSession
+        qs = TreatmentSession.objects.filter(patient=self.patient, session_date=date(2026, 1, 5))
+        self.assertNoFullScan(qs)
+
+    def test_treatment_weekly_range(self):
+        from rtms_app.models import TreatmentSession
+        qs = TreatmentSession.objects.filter(patient=self.patient, session_date__range=[date(2026, 1, 5), date(2026, 1, 11)])
+        self.assertNoFullScan(qs)
+
+    def test_assessment_latest_by_timing(self):
+        from rtms_app.models import Assessment
+        qs = Assessment.objects.filter(patient=self.patient, timing='week3').order_by('-date')[:1]
+        self.assertNoFullScan(qs)
+
+    def test_mapping_by_course_and_week(self):
+        from rtms_app.models import MappingSession
+        qs = MappingSession.objects.filter(patient=self.patient, course_number=1, week_number=1).order_by('-date')[:1]
+        self.assertNoFullScan(qs)
+
+    def test_mapping_by_patient_and_date(self):
+        from rtms_app.models import MappingSession
+        qs = MappingSession.objects.filter(patient=self.patient, date=date(2026, 1, 5))
+        self.assertNoFullScan(qs)
+
+    def test_audit_log_by_patient(self):
+        from rtms_app.models import AuditLog
+        qs = AuditLog.objects.filter(patient=self.patient).order_by('-created_at')
+        self.assertNoFullScan(qs)
+
+    def test_full_scan_is_detected(self):
+        from rtms_app.models import TreatmentSession
+        from django.db import connection
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest('plan format not recognised')
+        qs = TreatmentSession.objects.filter(treatment_notes='x')
+        with self.assertRaises(AssertionError):
+            self.assertNoFullScan(qs)
+
+
+class TestPatientLeanProjection(TestCase):
+    def setUp(self):
+        self.narrative = 'あ' * 20000
+        for i in range(3):
+            Patient.objects.create(
+                card_id=f"2000{i}", name=f"Lean {i}", birth_date=date(1980, 1, 1),
+                admission_date=date(2026, 1, 5), first_treatment_date=date(2026, 1, 8),
+                life_history=self.narrative, present_illness=self.narrative,
+                summary_text=self.narrative, questionnaire_data={'memo': self.narrative},
+            )
+        User = get_user_model()
+        self.user = User.objects.create_user(username="lean", password="pass", is_staff=True)
+        self.client = Client()
+        self.client.login(username="lean", password="pass")
+
+    def test_lean_defers_narrative_fields(self):
+        from rtms_app.models import PatientQuerySet
+        p = Patient.objects.lean().first()
+        deferred = p.get_deferred_fields()
+        self.assertEqual(deferred, set(PatientQuerySet.NARRATIVE_FIELDS))
+        self.assertNotIn('name', deferred)
+        self.assertNotIn('first_treatment_date', deferred)
+
+    def test_lean_keep_loads_requested_fields(self):
+        p = Patient.objects.lean('psychiatric_history').first()
+        self.assertNotIn('psychiatric_history', p.get_deferred_fields())
+        self.assertIn('summary_text', p.get_deferred_fields())
+
+    def test_lean_rows_are_much_smaller(self):
+        import pickle
+        full = sum(len(pickle.dumps(p)) for p in Patient.objects.all())
+        lean = sum(len(pickle.dumps(p)) for p in Patient.objects.lean())
+        # 3 rows x ~80KB of narrative text vs. a few hundred bytes each
+        self.assertGreater(full, 100000)
+        self.assertLess(lean * 20, full)
+
+    def test_list_views_do_not_reload_deferred_fields(self):
+        # Touching a deferred field would cost one extra query per row, so the
+        # query count must not grow with the number of patients.
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        def count(url):
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            return len([q for q in ctx.captured_queries if 'life_history' in q['sql']])
+
+        self.assertEqual(count(reverse('rtms_app:patient_list')), 0)
+        self.assertEqual(count(reverse('rtms_app:dashboard') + '?date=2026-01-08'), 0)
+
+
+class TestURLTemplates(TestCase):
+    ROUTES = [
+        ('rtms_app:dashboard', []),
+        ('rtms_app:patient_home', [12]),
+        ('rtms_app:treatment_add', [3]),
+        ('rtms_app:mapping_add', [45]),
+        ('rtms_app:admission_procedure', [7]),
+        ('rtms_app:patient_first_visit', [8]),
+        ('rtms_app:assessment_week4', [9]),
+        ('rtms_app:assessment_add', [10, 'week3']),
+    ]
+
+    def test_matches_reverse(self):
+        from rtms_app.utils.url_templates import URLTemplateRegistry
+        registry = URLTemplateRegistry()
+        for name, args in self.ROUTES:
+            for _ in range(2):  # compile, then cached template
+                self.assertEqual(registry.reverse(name, args), reverse(name, args=args), name)
+
+    def test_matches_reverse_under_script_prefix(self):
+        from django.urls import set_script_prefix, get_script_prefix
+        from rtms_app.utils.url_templates import URLTemplateRegistry
+        registry = URLTemplateRegistry()
+        registry.reverse('rtms_app:patient_home', [1])  # compiled without prefix
+        old = get_script_prefix()
+        set_script_prefix('/rtms/')
+        try:
+            self.assertEqual(registry.reverse('rtms_app:patient_home', [5]), reverse('rtms_app:patient_home', args=[5]))
+            self.assertTrue(registry.reverse('rtms_app:patient_home', [5]).startswith('/rtms/'))
+        finally:
+            set_script_prefix(old)
+
+    def test_non_int_args_fall_back_to_reverse(self):
+        from django.urls import NoReverseMatch
+        from rtms_app.utils.url_templates import URLTemplateRegistry
+        registry = URLTemplateRegistry()
+        self.assertEqual(registry.reverse('rtms_app:patient_home', ['5']), reverse('rtms_app:patient_home', args=['5']))
+        with self.assertRaises(NoReverseMatch):
+            registry.reverse('rtms_app:patient_home', [-1])
+        with self.assertRaises(NoReverseMatch):
+            registry.reverse('rtms_app:no_such_route', [1])
+
+    def test_build_url_appends_query(self):
+        from rtms_app.views import build_url
+        self.assertEqual(
+            build_url('treatment_add', [3], {'date': '2026-01-05'}),
+            reverse('rtms_app:treatment_add', args=[3]) + '?date=2026-01-05',
+        )
+
+
+class TestCalendarCells(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="cal", password="pass", is_staff=True)
+        self.client = Client()
+        self.client.login(username="cal", password="pass")
+        self.patient = Patient.objects.create(
+            card_id="30001", name="Cal Test", birth_date=date(1980, 1, 1),
+            admission_date=date(2026, 1, 5), first_treatment_date=date(2026, 1, 8),
+        )
+
+    def test_cells_are_slotted(self):
+        from rtms_app.services.calender import CalendarEvent, DayCell
+        ev = CalendarEvent('admission', '入院', '/x/')
+        day = DayCell(date=date(2026, 1, 10), events=[ev])
+        self.assertFalse(hasattr(ev, '__dict__'))
+        self.assertFalse(hasattr(day, '__dict__'))
+        self.assertEqual(ev.sort_key, 10)
+        self.assertEqual(ev.type, 'admission')
+        self.assertEqual(day.weekday, 5)
+        self.assertEqual(day.weekday_label, '土')
+        self.assertTrue(day.is_weekend)
+
+    def test_event_allocates_less_than_dict(self):
+        import tracemalloc
+        from rtms_app.services.calender import CalendarEvent
+
+        def measure(factory):
+            tracemalloc.start()
+            items = [factory(i) for i in range(2000)]
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del items
+            return size
+
+        as_obj = measure(lambda i: CalendarEvent('treatment', 'label', '/u/', patient_id=i, is_planned=True, sort_key=31))
+        as_dict = measure(lambda i: {'kind': 'treatment', 'label': 'label', 'url': '/u/', 'patient_id': i, 'is_planned': True, 'sort_key': 31})
+        self.assertLess(as_obj, as_dict)
+
+    def test_month_calendar_orders_events(self):
+        from rtms_app.views import _build_month_calendar
+        data = _build_month_calendar(2026, 1)
+        cells = {d.date: d for week in data['weeks'] for d in week}
+        admission_day = cells[date(2026, 1, 5)]
+        keys = [(e.sort_key, e.label) for e in admission_day.events_visible]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(admission_day.events_visible[0].kind, 'admission')
+        treat_day = cells[date(2026, 1, 8)]
+        self.assertTrue(any(e.kind == 'treatment' and e.is_planned for e in treat_day.events_visible))
+
+    def test_views_render(self):
+        resp = self.client.get(reverse('rtms_app:calendar_month') + '?year=2026&month=1')
+        self.assertEqual(resp.status_code, 200)
+        self.assertContains(resp, '入院 Cal Test')
+        resp = self.client.get(reverse('rtms_app:patient_clinical_path', args=[self.patient.id]))
+        self.assertEqual(resp.status_code, 200)
+        self.assertContains(resp, '入院')
+
+
+class TestBenchCommand(TestCase):
+    def test_seed_cohort_is_deterministic(self):
+        from rtms_app.models import TreatmentSession, Assessment
+        from rtms_app.services.synthetic_cohort import seed_cohort
+
+        def snapshot():
+            return (
+                list(Patient.objects.filter(card_id__gte='90000').order_by('card_id').values_list('card_id', 'admission_date', 'course_number')),
+                list(Assessment.objects.order_by('patient__card_id', 'timing').values_list('timing', 'total_score_17')),
+                TreatmentSession.objects.filter(status='done').count(),
+            )
+
+        stats = seed_cohort(4, courses=2, seed=7)
+        self.assertEqual(stats.patients, 4)
+        self.assertEqual(stats.treatment_sessions, 4 * 30)
+        first = snapshot()
+        Patient.objects.filter(card_id__gte='90000').delete()
+        seed_cohort(4, courses=2, seed=7)
+        self.assertEqual(snapshot(), first)
+
+    def test_bench_writes_and_compares_json(self):
+        import json
+        import os
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.json')
+            call_command('rtms_bench', '--in-place', '--patients', '3', '--repeat', '1', '--output', path, stdout=StringIO())
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            scenarios = data['scales']['3']['scenarios']
+            self.assertEqual(
+                set(scenarios),
+                {'dashboard', 'calendar_month', 'clinical_path', 'hamd_form', 'research_export', 'survey_export', 'slot_schedule', 'skip'},
+            )
+            for name, r in scenarios.items():
+                self.assertIn(r['status'], (200, 302), name)
+                self.assertGreater(r['queries'], 0, name)
+            self.assertGreater(scenarios['hamd_form']['render_ms'], 0)
+
+            out = StringIO()
+            call_command('rtms_bench', '--in-place', '--patients', '3', '--repeat', '1', '--compare', path, '--threshold', '1000', stdout=out)
+            self.assertIn('Comparison with baseline', out.getvalue())
+        # Seeded rows are rolled back after each scale point
+        self.assertFalse(Patient.objects.filter(card_id__gte='90000').exists())
+
+
+class TestProfiler(TestCase):
+    def setUp(self):
+        import tempfile
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        override = override_settings(RTMS_PROFILE_DIR=self._tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username="prof_admin", password="pass")
+        self.staff = User.objects.create_user(username="prof_staff", password="pass", is_staff=True)
+
+    def test_only_superuser_with_flag_is_profiled(self):
+        import os
+        url = reverse('rtms_app:dashboard')
+        self.client.force_login(self.staff)
+        resp = self.client.get(url, {'_profile': '1'})
+        self.assertNotIn('X-Profile-Name', resp)
+
+        self.client.force_login(self.admin)
+        resp = self.client.get(url)
+        self.assertNotIn('X-Profile-Name', resp)
+        resp = self.client.get(url, {'date': '2026-01-05'}, headers={'X-Profile': '1'})
+        name = resp['X-Profile-Name']
+        self.assertTrue(name.endswith('_' + resp['X-Request-ID']))
+        self.assertTrue(os.path.isfile(os.path.join(self._tmp.name, f"{name}.prof")))
+
+        from rtms_app.utils.profiling import list_profiles
+        [entry] = list_profiles()
+        self.assertEqual(entry['name'], name)
+        self.assertEqual(entry['path'], url + '?date=2026-01-05')
+        self.assertGreater(entry['sql_count'], 0)
+
+    def test_admin_list_and_download(self):
+        self.client.force_login(self.admin)
+        name = self.client.get(reverse('rtms_app:dashboard'), {'_profile': '1'})['X-Profile-Name']
+        resp = self.client.get(reverse('rtms_admin:profiles'))
+        self.assertContains(resp, name)
+        resp = self.client.get(reverse('rtms_admin:profile-download', args=[name, 'json']))
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b'"sql_count"', b''.join(resp.streaming_content))
+        resp = self.client.get(reverse('rtms_admin:profile-download', args=[name, 'txt']))
+        self.assertEqual(resp.status_code, 404)
+
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse('rtms_admin:profiles')).status_code, 403)
+
+    def test_profile_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from rtms_app.utils.profiling import list_profiles
+
+        patient = Patient.objects.create(card_id="P-PROF", name="プロファイル", birth_date=date(1980, 1, 1))
+        out = StringIO()
+        call_command('rtms_profile', 'rtms_app:patient_clinical_path', '--patient', str(patient.id), stdout=out)
+        self.assertIn('-> 200', out.getvalue())
+        [entry] = list_profiles()
+        self.assertEqual(entry['user'], 'rtms_profile')
+        self.assertFalse(get_user_model().objects.filter(username__startswith='rtms_profile_').exists())
+
+
+class TestSlowQueryLog(TestCase):
+    def setUp(self):
+        from rtms_app.utils.slow_queries import store
+        self.store = store
+        store.clear()
+        self.addCleanup(store.clear)
+        User = get_user_model()
+        self.staff = User.objects.create_user(username="sq_staff", password="pass", is_staff=True)
+        self.other = User.objects.create_user(username="sq_user", password="pass")
+
+    def test_shape_normalizes_literals_and_in_lists(self):
+        from rtms_app.utils.slow_queries import statement_shape
+        self.assertEqual(
+            statement_shape("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x''y' AND n > 10"),
+            statement_shape("SELECT *  FROM t WHERE id IN (%s) AND name = 'z' AND n > 3"),
+        )
+
+    @override_settings(RTMS_SLOW_QUERY_MS=0)
+    def test_records_shape_once_with_plan_and_caller(self):
+        with self.assertLogs('rtms_app.slow_query', 'WARNING'):
+            p1 = Patient.objects.create(card_id="SQ1", name="A", birth_date=date(1980, 1, 1))
+            p2 = Patient.objects.create(card_id="SQ2", name="B", birth_date=date(1980, 1, 1))
+        self.store.clear()
+        with self.assertLogs('rtms_app.slow_query', 'WARNING') as logs:
+            list(Patient.objects.filter(card_id=p1.card_id))
+            list(Patient.objects.filter(card_id=p2.card_id))
+        self.assertIn("'SQ1'", logs.output[0])
+        [entry] = [e for e in self.store.snapshot() if 'rtms_app_patient' in e['shape'] and 'card_id' in e['shape']]
+        self.assertEqual(entry['count'], 2)
+        self.assertIn('rtms_app/tests.py', entry['caller'])
+        self.assertTrue(entry['plan'])
+        self.assertNotIn('EXPLAIN failed', entry['plan'][0])
+
+    @override_settings(RTMS_SLOW_QUERY_MS=0, RTMS_SLOW_QUERY_TOP_N=3)
+    def test_store_keeps_top_n(self):
+        for i in range(6):
+            self.store.add(f"SELECT {i}", f"SELECT {i}", (), float(i), '', '', '')
+        self.assertEqual([e['max_ms'] for e in self.store.snapshot()], [5.0, 4.0, 3.0])
+
+    @override_settings(RTMS_SLOW_QUERY_MS=0)
+    def test_staff_json_endpoint(self):
+        url = reverse('rtms_app:slow_queries')
+        with self.assertLogs('rtms_app.slow_query', 'WARNING'):
+            self.client.force_login(self.other)
+            self.assertEqual(self.client.get(url).status_code, 403)
+
+            self.client.force_login(self.staff)
+            self.client.get(reverse('rtms_app:dashboard'), {'date': '2026-01-05'})
+            data = self.client.get(url).json()
+            self.assertEqual(self.client.post(url).json()['status'], 'cleared')
+        self.assertIn('rtms_app:dashboard', {e['view'] for e in data['shapes']})
+
+
+class TestColdStart(TestCase):
+    def test_urlconf_import_skips_heavy_dependencies(self):
+        import os
+        import subprocess
+        import sys
+        from django.conf import settings
+
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE="config.settings")
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c",
+             "import django; django.setup(); import config.urls"],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=120,
+        )
+        self.assertEqual(proc.returncode, 0, proc.stderr[-2000:])
+        cumulative = {}
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cum, name = line.split("|")
+            if cum.strip().isdigit():
+                cumulative[name.strip()] = int(cum)
+        self.assertIn("rtms_app.views", cumulative)
+        for heavy in ("jpholiday", "holidays", "docx", "weasyprint", "numpy"):
+            self.assertNotIn(heavy, cumulative, f"{heavy} imported at startup")
+
+    def test_holiday_calendar_and_warm_up(self):
+        from rtms_app.services.holiday_calendar import holiday_name, is_public_holiday
+        from rtms_app.surveys import INSTRUMENTS, get_instruments
+        from rtms_app.warmup import warm_up
+
+        self.assertEqual(holiday_name(date(2026, 1, 1)), "元日")
+        self.assertIsNone(holiday_name(date(2026, 1, 6)))
+        self.assertIn(is_public_holiday(date(2026, 1, 1)), (True, None))
+        self.assertIs(INSTRUMENTS, get_instruments())
+        timings = warm_up(years=[2026])
+        self.assertGreater(timings["templates"], 0)
+
+
+class TestTemplateFragments(TestCase):
+    def setUp(self):
+        from rtms_app.services.fragments import clear_fragments
+        clear_fragments()
+        self.addCleanup(clear_fragments)
+        self.user = get_user_model().objects.create_user(username="frag_staff", password="pass", is_staff=True)
+        self.patient = Patient.objects.create(card_id="P-FRAG", name="断片", birth_date=date(1980, 1, 1))
+
+    def _hamd_page(self):
+        import re
+        self.client.force_login(self.user)
+        resp = self.client.get(reverse('rtms_app:assessment_scale', args=[self.patient.id, 'baseline', 'hamd']))
+        self.assertEqual(resp.status_code, 200)
+        return re.sub(r'name="csrfmiddlewaretoken" value="[^"]*"', '', resp.content.decode())
+
+    def test_hamd_rows_are_cached_and_identical(self):
+        from rtms_app.services.fragments import cached_fragment_count
+
+        plain = self._hamd_page()
+        self.assertEqual(cached_fragment_count(), 0)
+        with override_settings(RTMS_PRECOMPILED_FRAGMENTS=True):
+            first = self._hamd_page()
+            self.assertEqual(cached_fragment_count(), 2)
+            second = self._hamd_page()
+            self.assertEqual(cached_fragment_count(), 2)
+        self.assertEqual(plain, first)
+        self.assertEqual(first, second)
+        self.assertIn('Q21', plain)
+        self.assertIn('data-hamd-key="q12"', plain)
+        self.assertIn('data-bs-placement="left"', plain)
+
+    @override_settings(RTMS_PRECOMPILED_FRAGMENTS=True)
+    def test_instrument_questions_and_side_effect_rows(self):
+        from rtms_app.services.side_effect_schema import DEFAULT_PRINT_ROWS, default_side_effect_rows
+        from rtms_app.templatetags.rtms_fragments import instrument_questions, side_effect_rows
+        from rtms_app.warmup import warm_fragments
+
+        from unittest import mock
+        from rtms_app.services import fragments
+        from rtms_app.templatetags import rtms_fragments
+
+        rtms_fragments._registered_instrument_version.cache_clear()
+        with mock.patch.object(rtms_fragments, 'definition_version', wraps=fragments.definition_version) as version:
+            html = instrument_questions(get_instrument('phq9'))
+            self.assertIs(instrument_questions(get_instrument('phq9')), html)
+        # 定義のハッシュは検査ごとに1回だけ
+        self.assertEqual(version.call_count, 1)
+        self.assertEqual(html.count('class="question-card'), len(get_instrument('phq9')['questions']))
+
+        rows = default_side_effect_rows()
+        self.assertEqual(rows, DEFAULT_PRINT_ROWS)
+        self.assertIs(side_effect_rows(rows), side_effect_rows(default_side_effect_rows()))
+        rows[0]['before'] = 2
+        rows[0]['memo'] = '<b>'
+        edited = side_effect_rows(rows)
+        self.assertIn('&lt;b&gt;', edited)
+        self.assertIsNot(edited, side_effect_rows(rows))
+
+        self.assertGreaterEqual(warm_fragments(), 4 + len(INSTRUMENT_ORDER) + 1)
+
+
+class TestDefinitionBundles(TestCase):
+    def setUp(self):
+        import tempfile
+        from rtms_app.services import definition_bundles
+        from rtms_app.services.fragments import clear_fragments
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        override = override_settings(STATICFILES_DIRS=[self._tmp.name])
+        override.enable()
+        self.addCleanup(override.disable)
+        for reset in (definition_bundles.reset, clear_fragments):
+            reset()
+            self.addCleanup(reset)
+        self.user = get_user_model().objects.create_user(username="bundle_staff", password="pass", is_staff=True)
+        self.patient = Patient.objects.create(card_id="54321", name="バンドル", birth_date=date(1980, 1, 1))
+
+    def _build(self):
+        import os
+        from io import StringIO
+        from django.core.management import call_command
+        call_command('rtms_definition_bundles', '--output-dir',
+                     os.path.join(self._tmp.name, 'rtms_app', 'definitions'), stdout=StringIO())
+
+    def _hamd_page(self):
+        self.client.force_login(self.user)
+        resp = self.client.get(reverse('rtms_app:assessment_scale', args=[self.patient.id, 'baseline', 'hamd']))
+        self.assertEqual(resp.status_code, 200)
+        return resp.content.decode()
+
+    def test_bundles_are_content_hashed_and_immutable(self):
+        import json
+        import os
+        import re
+        from django.conf import settings
+        from rtms_app.services.definition_bundles import bundle_content, bundle_url
+
+        self.assertIsNone(bundle_url('hamd'))
+        self._build()
+        url = bundle_url('hamd')
+        self.assertRegex(url, r'/rtms_app/definitions/hamd\.[0-9a-f]{12}\.json$')
+        self.assertTrue(re.search(settings.WHITENOISE_IMMUTABLE_FILE_TEST, url))
+        self.assertTrue(re.search(settings.WHITENOISE_IMMUTABLE_FILE_TEST, bundle_url('instruments')))
+
+        path, data = bundle_content('instruments')
+        with open(os.path.join(self._tmp.name, path), 'rb') as f:
+            self.assertEqual(f.read(), data)
+        bundle = json.loads(data)
+        self.assertEqual(bundle['order'], list(INSTRUMENT_ORDER))
+        self.assertEqual(bundle['instruments']['phq9'], get_instrument('phq9'))
+
+        # Rebuilding drops nothing but stale files of the same bundle
+        stale = os.path.join(self._tmp.name, 'rtms_app', 'definitions', 'hamd.000000000000.json')
+        open(stale, 'w').close()
+        self._build()
+        self.assertFalse(os.path.exists(stale))
+        self.assertEqual(len(os.listdir(os.path.dirname(stale))), 2)
+
+    def test_forms_hydrate_from_bundle(self):
+        from rtms_app.models import PatientSurveySession
+        from rtms_app.services.patient_accounts import ensure_patient_user
+        from rtms_app.utils.hamd import HAMD_ANCHORS
+
+        inline = self._hamd_page()
+        self.assertIn('data-bs-content=', inline)
+
+        self._build()
+        hydrated = self._hamd_page()
+        self.assertNotIn('data-bs-content=', hydrated)
+        self.assertIn('data-anchor-key="q21"', hydrated)
+        self.assertNotIn(HAMD_ANCHORS['q1'].split('\n')[1], hydrated)
+        self.assertLess(len(hydrated.encode()), len(inline.encode()))
+
+        ensure_patient_group()
+        patient_user, _ = ensure_patient_user(self.patient, reset_password=True)
+        session = PatientSurveySession.objects.create(patient=self.patient, phase="pre", status="in_progress", course_number=1)
+        self.client.force_login(patient_user)
+        url = reverse("patient_portal:instrument", args=[session.id, "bdi2"])
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotContains(resp, 'class="question-card')
+        self.assertNotContains(resp, 'id="instrumentDef"')
+        self.assertContains(resp, 'bundleUrl: "/static/rtms_app/definitions/instruments.')
+        resp = self.client.get(url, {'inline': '1'})
+        self.assertContains(resp, 'class="question-card', count=len(get_instrument('bdi2')['questions']))
+        self.assertContains(resp, 'id="instrumentDef"')
+
+
+class TestLiveUpdates(TestCase):
+    def setUp(self):
+        import asyncio
+        from rtms_app.services.live_updates import broker
+
+        User = get_user_model()
+        self.user = User.objects.create_user(username='live', password='pw')
+        self.patient = Patient.objects.create(card_id='LIVE1', name='Live Test', birth_date=datetime.date(1970, 3, 3))
+        self.loop = asyncio.new_event_loop()
+        self.broker = broker
+        self.addCleanup(self.loop.close)
+
+    def _subscribe(self, start, end, patients=()):
+        sub = self.broker.subscribe(self.loop, start, end, patients)
+        self.addCleanup(self.broker.unsubscribe, sub)
+        return sub
+
+    def _drain(self, sub):
+        import asyncio
+
+        self.loop.run_until_complete(asyncio.sleep(0))
+        out = []
+        while not sub.queue.empty():
+            out.append(sub.queue.get_nowait())
+        return out
+
+    def test_deltas_are_filtered_by_date_and_patient(self):
+        from rtms_app.models import MappingSession, TreatmentSession
+
+        day = date(2026, 3, 2)
+        same_day = self._subscribe(day, day)
+        other_day = self._subscribe(date(2026, 3, 3), date(2026, 3, 3))
+        by_patient = self._subscribe(date(2025, 1, 1), date(2025, 1, 1), [self.patient.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            s = TreatmentSession.objects.create(patient=self.patient, session_date=day)
+        expected = {'kind': 'treatment', 'patient_id': self.patient.id, 'dates': ['2026-03-02'], 'done': True, 'status': 'planned'}
+        self.assertEqual(self._drain(same_day), [expected])
+        self.assertEqual(self._drain(other_day), [])
+        self.assertEqual(self._drain(by_patient), [expected])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            s.delete()
+            MappingSession.objects.create(patient=self.patient, date=day, resting_mt=60)
+        kinds = [(d['kind'], d['done']) for d in self._drain(same_day)]
+        self.assertEqual(kinds, [('treatment', False), ('mapping', True)])
+
+    def test_no_delta_without_subscribers_or_on_rollback(self):
+        from django.db import transaction
+        from rtms_app.models import TreatmentSession
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            TreatmentSession.objects.create(patient=self.patient, session_date=date(2026, 3, 4))
+        self.assertFalse([c for c in callbacks if 'publish_on_commit' in c.__qualname__])
+
+        sub = self._subscribe(date(2026, 3, 5), date(2026, 3, 5))
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    TreatmentSession.objects.create(patient=self.patient, session_date=date(2026, 3, 5))
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(self._drain(sub), [])
+
+    def test_wsgi_request_gets_no_content(self):
+        url = reverse('rtms_app:live_events') + '?start=2026-03-02'
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 204)
+
+    async def test_asgi_stream_sends_deltas(self):
+        import asyncio
+        import json
+
+        await self.async_client.aforce_login(self.user)
+        url = reverse('rtms_app:live_events')
+        self.assertEqual((await self.async_client.get(url + '?start=bad')).status_code, 400)
+
+        resp = await self.async_client.get(url + '?start=2026-03-02&end=2026-03-08')
+        self.assertEqual(resp['Content-Type'], 'text/event-stream')
+        stream = aiter(resp.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+        self.broker.publish({'kind': 'mapping', 'patient_id': 1, 'dates': ['2026-03-09'], 'done': True})
+        self.broker.publish({'kind': 'mapping', 'patient_id': 1, 'dates': ['2026-03-03'], 'done': True})
+        chunk = await asyncio.wait_for(anext(stream), timeout=2)
+        self.assertTrue(chunk.startswith(b'data: '))
+        self.assertEqual(json.loads(chunk[6:])['dates'], ['2026-03-03'])
+        # クライアント切断時のようにサーバーが待機中のタスクを取り消すと購読が外れる
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertFalse(self.broker.has_subscribers())
+
+    def test_dashboard_and_calendar_link_stream(self):
+        self.patient.first_treatment_date = date(2026, 3, 2)
+        self.patient.save()
+        self.client.force_login(self.user)
+        resp = self.client.get(reverse('rtms_app:dashboard') + '?date=2026-03-02')
+        self.assertContains(resp, f'data-live-url="/app/dashboard/live/?start=2026-03-02&amp;patients={self.patient.id}"')
+        self.assertContains(resp, f'data-live-kind="treatment" data-patient-id="{self.patient.id}"')
+        # ライブ更新のその場書き換えは表示中の日付の差分に限る
+        self.assertContains(resp, 'data-live-date="2026-03-02"')
+        resp = self.client.get(reverse('rtms_app:calendar_month') + '?year=2026&month=3')
+        self.assertContains(resp, 'data-live-url="/app/dashboard/live/?start=2026-02-23&amp;end=2026-04-05')
+
+
+class TestTaskBoard(TestCase):
+    def setUp(self):
+        from rtms_app.services.synthetic_cohort import seed_cohort
+
+        User = get_user_model()
+        self.user = User.objects.create_user(username='board', password='pw')
+        seed_cohort(6, courses=1, seed=3)
+        self.client.force_login(self.user)
+
+    def _dashboard_groups(self, day):
+        resp = self.client.get(reverse('rtms_app:dashboard'), {'date': day})
+        return {
+            g['live_kind']: sorted((item['obj'].id, item['status'], item['todo']) for item in g['list'])
+            for g in resp.context['dashboard_tasks']
+        }
+
+    def _start(self):
+        first = Patient.objects.order_by('first_treatment_date').values_list('first_treatment_date', flat=True).first()
+        return first + datetime.timedelta(days=14)
+
+    def test_board_matches_dashboard_for_each_day(self):
+        start = self._start()
+        resp = self.client.get(reverse('rtms_app:task_board'), {'start': start.isoformat(), 'days': 7})
+        self.assertEqual(resp.status_code, 200)
+        board = resp.json()
+        self.assertEqual(len(board['days']), 7)
+        total = 0
+        for day in board['days']:
+            got = {g['kind']: sorted((i['patient_id'], i['status'], i['todo']) for i in g['items']) for g in day['groups']}
+            self.assertEqual(got, self._dashboard_groups(day['date']), day['date'])
+            total += sum(len(g['items']) for g in day['groups'])
+        self.assertGreater(total, 0)
+        for pid in {i['patient_id'] for day in board['days'] for g in day['groups'] for i in g['items']}:
+            self.assertIn(str(pid), board['patients'])
+
+    def test_query_count_does_not_grow_with_days(self):
+        from rtms_app.views_task_board import build_task_board
+
+        start = self._start()
+        with self.assertNumQueries(4):
+            build_task_board(start, days=3)
+        with self.assertNumQueries(4):
+            build_task_board(start, days=31)
+
+    def test_invalid_days_is_rejected(self):
+        resp = self.client.get(reverse('rtms_app:task_board'), {'days': 0})
+        self.assertEqual(resp.status_code, 400)
+
+
+class TestCensus(TestCase):
+    def test_sweep_matches_day_by_day_walk(self):
+        import random
+        from rtms_app.services.census import census_from_intervals
+
+        rng = random.Random(5)
+        start, end = date(2025, 12, 1), date(2026, 3, 31)
+        intervals = []
+        for _ in range(200):
+            s = date(2025, 10, 1) + datetime.timedelta(days=rng.randrange(240))
+            intervals.append((s, s + datetime.timedelta(days=rng.randrange(0, 60))))
+        census = census_from_intervals(intervals, start, end)
+        for d in census.dates():
+            self.assertEqual(census.count(d), sum(1 for s, e in intervals if s <= d < e), d)
+        peak, peak_date = census.peak()
+        self.assertEqual(peak, max(census.counts))
+        self.assertEqual(census.count(peak_date), peak)
+        self.assertEqual(census.count(date(2030, 1, 1)), 0)
+
+    def test_rollup_and_over_capacity(self):
+        from rtms_app.services.census import census_from_days
+
+        census = census_from_days([date(2026, 3, 2), date(2026, 3, 2), date(2026, 3, 10)], date(2026, 3, 1), date(2026, 3, 31))
+        weeks = census.rollup('week')
+        self.assertEqual([w['start'] for w in weeks[:2]], [date(2026, 3, 1), date(2026, 3, 2)])
+        self.assertEqual((weeks[1]['peak'], weeks[1]['peak_date']), (2, date(2026, 3, 2)))
+        self.assertEqual(census.rollup('month')[0]['mean'], round(3 / 31, 2))
+        self.assertEqual(census.over(1), [(date(2026, 3, 2), 2)])
+
+    @override_settings(RTMS_BED_CAPACITY=1)
+    def test_month_calendar_and_capacity_report(self):
+        from rtms_app.services.synthetic_cohort import seed_cohort
+        from rtms_app.views import stay_interval
+
+        User = get_user_model()
+        self.client.force_login(User.objects.create_user(username='census', password='pw'))
+        seed_cohort(5, courses=1, seed=2)
+        first = Patient.objects.order_by('admission_date').first().admission_date
+        resp = self.client.get(reverse('rtms_app:calendar_month'), {'year': first.year, 'month': first.month})
+        stays = [stay_interval(p) for p in Patient.objects.all()]
+        for week in resp.context['weeks']:
+            for day in week:
+                expected = sum(1 for stay in stays if stay and stay[0] <= day.date < stay[1])
+                self.assertEqual(day.inpatient_count, expected, day.date)
+        self.assertEqual(resp.context['peak_inpatients'], max(d.inpatient_count for w in resp.context['weeks'] for d in w))
+
+        resp = self.client.get(reverse('rtms_app:capacity_report'), {
+            'start': first.isoformat(), 'end': (first + datetime.timedelta(days=400)).isoformat(), 'period': 'month',
+        })
+        self.assertEqual(resp.status_code, 200)
+        report = resp.json()
+        self.assertGreaterEqual(report['inpatients']['peak'], 1)
+        self.assertTrue(all(o['count'] > 1 for o in report['inpatients']['over_capacity']))
+        self.assertGreater(report['rtms_sessions']['peak'], 0)
+        self.assertEqual(len(report['on_course']['rollup']), 14)
+        resp = self.client.get(reverse('rtms_app:capacity_report'), {'period': 'decade'})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_capacity_report_query_count_is_constant(self):
+        from rtms_app.services.synthetic_cohort import seed_cohort
+        from rtms_app.views_capacity import build_capacity_report
+
+        seed_cohort(8, courses=1, seed=3)
+        first = Patient.objects.order_by('admission_date').first().admission_date
+        with self.assertNumQueries(2):
+            build_capacity_report(first, first + datetime.timedelta(days=400), 'month')
+
+
+class TestSlotScheduler(TestCase):
+    def _demands(self, n, first=date(2026, 3, 2), **kw):
+        from rtms_app.services.rtms_schedule import generate_treatment_dates
+        from rtms_app.services.slot_scheduler import CourseDemand
+
+        return [
+            CourseDemand(patient_id=i + 1, course_number=1, dates=tuple(generate_treatment_dates(first, 10)), **kw)
+            for i in range(n)
+        ]
+
+    def test_sittings_do_not_overlap_on_rooms_or_coils(self):
+        from collections import defaultdict
+        from dataclasses import replace
+        from rtms_app.services.slot_scheduler import Resources, SlotScheduler
+
+        resources = Resources(rooms=2, coils=(('H1', 1), ('H7', 1)), open_time='09:00', close_time='12:00')
+        h7 = replace(self._demands(1, minutes=20)[0], patient_id=11, coil_type='H7', sessions_per_day=2)
+        demands = self._demands(3, minutes=20) + [h7]
+        result = SlotScheduler(demands, resources).solve(date(2026, 3, 2), date(2026, 3, 6))
+        self.assertEqual(result.warnings, [])
+        by_resource = defaultdict(list)
+        for a in result.assignments:
+            by_resource[(a.date, 'room', a.room)].append((a.start_minute, a.end_minute))
+            by_resource[(a.date, a.coil_type, a.coil)].append((a.start_minute, a.end_minute))
+        for spans in by_resource.values():
+            spans.sort()
+            for (_, end1), (start2, _) in zip(spans, spans[1:]):
+                self.assertLessEqual(end1, start2)
+        monday = [a for a in result.assignments if a.date == date(2026, 3, 2)]
+        self.assertEqual([a.slot for a in monday if a.coil_type == 'H1'], ['09:00', '09:30', '10:00'])
+        twice = [a for a in monday if a.coil_type == 'H7']
+        self.assertEqual([a.sitting for a in twice], [1, 2])
+        self.assertGreaterEqual(twice[1].start_minute - twice[0].end_minute, resources.min_gap_minutes)
+        self.assertEqual(result.utilization[date(2026, 3, 2)]['coils']['H1'], round(90 / 180, 3))
+
+    def test_overflow_postpones_planned_and_flags_fixed(self):
+        from dataclasses import replace
+        from rtms_app.services.slot_scheduler import Resources, SlotScheduler
+
+        resources = Resources(rooms=1, coils=(('H1', 1),), open_time='09:00', close_time='10:00')
+        demands = self._demands(3, minutes=20)
+        fixed = replace(demands[2], fixed=frozenset({date(2026, 3, 2)}))
+        result = SlotScheduler(demands[:2] + [fixed], resources).solve(date(2026, 3, 2), date(2026, 3, 2))
+        kinds = {(w['patient_id'], w['kind']) for w in result.warnings}
+        self.assertEqual(kinds, {(2, 'postponed')})
+        postponed = next(w for w in result.warnings if w['kind'] == 'postponed')
+        self.assertEqual(postponed['to'], date(2026, 3, 3))
+        self.assertEqual([a.patient_id for a in result.assignments], [3, 1])
+
+    def test_incremental_postpone_matches_full_solve(self):
+        from rtms_app.services.slot_scheduler import Resources, SlotScheduler
+
+        resources = Resources(rooms=2, coils=(('H1', 2),))
+        start, end = date(2026, 3, 1), date(2026, 3, 31)
+        scheduler = SlotScheduler(self._demands(4, minutes=20), resources)
+        before = scheduler.solve(start, end)
+        kept = [a for a in before.assignments if a.date < date(2026, 3, 9)]
+        incremental = scheduler.postpone(2, 1, date(2026, 3, 9))
+        full = SlotScheduler(list(scheduler.demands.values()), resources).solve(start, end)
+        self.assertEqual(incremental.assignments, full.assignments)
+        self.assertEqual([a for a in incremental.assignments if a.date < date(2026, 3, 9)], kept)
+        moved = [a.date for a in incremental.assignments if a.patient_id == 2]
+        self.assertNotIn(date(2026, 3, 9), moved)
+        self.assertEqual(len(moved), 10)
+
+    def test_twice_daily_course_numbers_each_sitting(self):
+        from rtms_app.services.slot_scheduler import Resources, SlotScheduler
+
+        resources = Resources(rooms=1, coils=(('H1', 1),), min_gap_minutes=10)
+        demand = self._demands(1, minutes=20, sessions_per_day=2, min_gap_minutes=50)[0]
+        result = SlotScheduler([demand], resources).solve(date(2026, 3, 1), date(2026, 3, 31))
+        self.assertEqual([a.session_no for a in result.assignments], list(range(1, 21)))
+        self.assertEqual([a.sitting for a in result.assignments[:4]], [1, 2, 1, 2])
+        first, second = result.assignments[:2]
+        self.assertEqual(second.start_minute - first.end_minute, 50)
+
+        later = SlotScheduler([demand], resources).solve(date(2026, 3, 4), date(2026, 3, 31))
+        self.assertEqual(later.assignments[0].session_no, 5)
+
+    def test_demands_follow_protocol_and_accelerated_course_reaches_thirty(self):
+        from rtms_app.services.slot_scheduler import Resources, SlotScheduler
+        from rtms_app.views_capacity import load_course_demands
+
+        start = date(2026, 3, 2)
+        Patient.objects.create(
+            card_id='70002', name='Accel', birth_date=date(1980, 1, 1),
+            first_treatment_date=start, protocol_type='ACCELERATED',
+        )
+        end = start + datetime.timedelta(days=40)
+        demand, = load_course_demands(start, end)
+        self.assertEqual((demand.sessions_per_day, demand.min_gap_minutes), (2, 50))
+        result = SlotScheduler([demand], Resources(min_gap_minutes=0)).solve(start, end)
+        self.assertEqual(result.warnings, [])
+        self.assertEqual(max(a.session_no for a in result.assignments), 30)
+
+    def test_month_endpoint(self):
+        from rtms_app.services.synthetic_cohort import seed_cohort
+
+        User = get_user_model()
+        self.client.force_login(User.objects.create_user(username='slots', password='pw'))
+        seed_cohort(4, courses=1, seed=4)
+        first = Patient.objects.order_by('first_treatment_date').first().first_treatment_date
+        resp = self.client.get(reverse('rtms_app:slot_schedule'), {'year': first.year, 'month': first.month})
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertGreater(len(data['assignments']), 0)
+        self.assertTrue(all('09:00' <= a['slot'] for a in data['assignments']))
+        self.assertEqual(len({(a['date'], a['room'], a['slot']) for a in data['assignments']}), len(data['assignments']))
+
+
+class TestTreatmentPlan(TestCase):
+    def test_standard_plan_matches_canonical_schedule(self):
+        from rtms_app.services.rtms_schedule import build_treatment_plan, generate_treatment_dates
+        from rtms_app.views import JP_HOLIDAYS, get_current_week_number
+
+        start = date(2025, 12, 15)  # 年末年始・祝日をまたぐ
+        plan = build_treatment_plan(start, 'INSURANCE', JP_HOLIDAYS)
+        expected = generate_treatment_dates(start, total=30, holidays=JP_HOLIDAYS)
+        self.assertEqual(plan.dates, expected)
+        self.assertEqual(plan.total, 30)
+        self.assertEqual(plan.end_date, expected[-1])
+        self.assertEqual([s.slot for s in plan.sessions], [1] * 30)
+        for i, d in enumerate(expected):
+            info = plan.session_info(d)
+            self.assertEqual((info['session_no'], info['week_no']), (i + 1, get_current_week_number(start, d)))
+        self.assertIsNone(plan.session_info(date(2025, 12, 29)))
+        self.assertIs(plan, build_treatment_plan(start, 'INSURANCE', JP_HOLIDAYS))
+
+    def test_accelerated_plan_has_two_slots_per_day(self):
+        from rtms_app.protocols import ACCELERATED_PROTOCOL
+        from rtms_app.services.rtms_schedule import build_treatment_plan, open_days
+
+        start = date(2026, 3, 2)
+        plan = build_treatment_plan(start, 'ACCELERATED')
+        self.assertEqual(plan.total, ACCELERATED_PROTOCOL.total_sessions)
+        self.assertEqual(plan.dates, open_days(start, 15))
+        self.assertEqual([(s.session_no, s.slot) for s in plan.sessions_on(start)], [(1, 1), (2, 2)])
+        self.assertEqual([plan.slot_value(s.slot) for s in plan.sessions_on(start)], ['1', '2'])
+        self.assertEqual(plan.session_info(plan.end_date)['last_session_no'], 30)
+
+    def test_protocol_taper_limits(self):
+        from rtms_app.protocols import ACCELERATED_PROTOCOL, INSURANCE_PROTOCOL
+
+        self.assertEqual([INSURANCE_PROTOCOL.weekly_limit(w) for w in (3, 4, 5, 6)], [None, 3, 2, 1])
+        self.assertIsNone(ACCELERATED_PROTOCOL.weekly_limit(4))
+
+    def test_views_follow_patient_protocol(self):
+        User = get_user_model()
+        self.client.force_login(User.objects.create_user(username='plan', password='pw'))
+        start = date(2026, 3, 2)
+        patient = Patient.objects.create(
+            card_id='70001', name='Accel', birth_date=date(1980, 1, 1),
+            first_treatment_date=start, protocol_type='ACCELERATED',
+        )
+        url = reverse('rtms_app:treatment_add', args=[patient.id])
+        resp = self.client.get(url, {'date': start.isoformat(), 'slot': 2})
+        self.assertEqual(resp.context['session_num'], 2)
+        self.assertEqual(resp.context['slot_num'], 2)
+        self.assertEqual(resp.context['plan_end_date'], date(2026, 3, 23))  # 3/20 は祝日
+
+        resp = self.client.get(reverse('rtms_app:dashboard'), {'date': start.isoformat()})
+        todos = [i['todo'] for g in resp.context['dashboard_tasks'] if g['live_kind'] == 'treatment' for i in g['list']]
+        self.assertEqual(todos, ['rTMS治療 1〜2回目（第1週）'])
+
+
+class TestCohortAnalytics(TestCase):
+    def test_labels_match_per_patient_rules(self):
+        from rtms_app.assessment_rules import classify_hamd17_severity, classify_response_status, compute_improvement_rate
+        from rtms_app.services.cohort_analytics import SEVERITY_LABELS, compute_labels
+
+        pairs = [(b, c) for b in (None, 0, 10, 24, 30) for c in (None, 0, 7, 8, 12, 19, 30)]
+        labels = compute_labels([b for b, _ in pairs], [c for _, c in pairs])
+        for i, (b, c) in enumerate(pairs):
+            imp = compute_improvement_rate(b, c)
+            self.assertEqual(labels.improvement[i], imp, (b, c))
+            self.assertEqual(labels.status[i], classify_response_status(c, imp), (b, c))
+            band = labels.endpoint_band[i]
+            self.assertEqual(SEVERITY_LABELS[band] if band is not None else None, classify_hamd17_severity(c))
+
+    def test_grouped_rates_and_time_to_response(self):
+        from rtms_app.services.cohort_analytics import Cohort, analyze, wilson_interval
+
+        cohort = Cohort(
+            patient_id=[1, 2, 3, 4], course_number=[1, 1, 2, 1],
+            referral=['A', 'A', 'B', 'B'], protocol=['INSURANCE'] * 4,
+            baseline_date=[date(2025, 1, 10), date(2025, 2, 1), date(2026, 1, 5), date(2026, 3, 1)],
+            baseline=[20, 20, 25, 20],
+            scores={'week3': [18, 10, 22, None], 'week4': [None, None, 6, None], 'week6': [15, 12, None, None]},
+        )
+        report = analyze(cohort, by='referral')
+        overall = report['overall']
+        self.assertEqual((overall['courses'], overall['evaluated']), (4, 3))
+        # 最終評価: 1=15 (25%: 反応), 2=12 (40%: 反応), 3=6 (寛解), 4=未評価
+        self.assertEqual(overall['status'], {'寛解': 1, '反応': 2, '反応なし': 0, '未評価': 1})
+        self.assertEqual(overall['remission']['rate'], round(1 / 3, 4))
+        self.assertEqual((overall['remission']['ci_low'], overall['remission']['ci_high']), wilson_interval(1, 3))
+        self.assertEqual([g['group'] for g in report['groups']], ['A', 'B'])
+        self.assertEqual(report['groups'][0]['response']['n'], 2)
+        # 反応: 2 は第3週、3 は第4週（寛解）、1 は第6週
+        km = overall['time_to_response']
+        self.assertEqual([(k['week'], k['at_risk'], k['events']) for k in km], [(3, 3, 1), (4, 2, 1), (6, 1, 1)])
+        self.assertEqual(km[-1]['responded'], 1.0)
+        self.assertEqual([g['group'] for g in analyze(cohort, by='period', period='year')['groups']], ['2025', '2026'])
+
+    def test_endpoints_are_superuser_only(self):
+        from rtms_app.services.synthetic_cohort import seed_cohort
+
+        seed_cohort(5, courses=1, seed=7)
+        User = get_user_model()
+        self.client.force_login(User.objects.create_user(username='staff', password='pw'))
+        self.assertEqual(self.client.get(reverse('rtms_app:cohort_analytics_api')).status_code, 403)
+
+        self.client.force_login(User.objects.create_superuser(username='root', password='pw'))
+        resp = self.client.get(reverse('rtms_app:cohort_analytics_api'), {'by': 'protocol'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['overall']['courses'], 5)
+        self.assertEqual(self.client.get(reverse('rtms_app:cohort_analytics_api'), {'by': 'x'}).status_code, 400)
+        with self.assertNumQueries(4):  # セッション・ユーザー・患者グループ判定・評価（1クエリ）
+            self.client.get(reverse('rtms_app:cohort_analytics_api'))
+        resp = self.client.get(reverse('rtms_app:cohort_analytics'), {'by': 'course'})
+        self.assertContains(resp, '1クール目')
+
+
+class TestResearchDataset(TestCase):
+    def setUp(self):
+        from rtms_app.services.synthetic_cohort import seed_cohort
+
+        seed_cohort(3, courses=1, seed=3)
+
+    def test_course_rows_are_typed(self):
+        from rtms_app.services.research_dataset import course_table
+
+        table = course_table()
+        keys = [c.key for c in table.columns]
+        rows = [row for chunk in table.chunks() for row in chunk]
+        self.assertEqual(len(rows), 3)
+        row = dict(zip(keys, rows[0]))
+        self.assertIsInstance(row['first_treatment_date'], date)
+        self.assertIsInstance(row['treatment_sessions_count'], int)
+        self.assertIsInstance(row['hamd_baseline_17'], int)
+        self.assertIsInstance(row['hamd_3w_17'], int)
+        self.assertIs(row['ae_report_exists'], False)
+
+    def test_csv_follow_up_hamd_columns_are_filled(self):
+        from rtms_app.services.export_research import ResearchCSVExporter
+
+        exporter = ResearchCSVExporter(selected_categories=['hamd'])
+        patient = Patient.objects.order_by('card_id').first()
+        csv_text = exporter.generate_csv([(patient, None)])
+        header, row = csv_text.lstrip('\ufeff').splitlines()[:2]
+        values = dict(zip(header.split(','), row.split(',')))
+        self.assertNotEqual(values['HAM-D17（第3週）'], '')
+
+    def _export(self, fmt, **extra):
+        import io
+        import json
+        import zipfile
+
+        User = get_user_model()
+        self.client.force_login(User.objects.get_or_create(username='root', is_superuser=True, is_staff=True)[0])
+        resp = self.client.post(reverse('rtms_app:export_research_dataset'), {'format': fmt, **extra})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/zip')
+        zf = zipfile.ZipFile(io.BytesIO(resp.content))
+        schema = json.loads(zf.read('schema.json'))
+        self.assertEqual(schema['format'], fmt)
+        self.assertEqual(
+            sorted(zf.namelist()),
+            sorted(['schema.json'] + [f'{t}.{fmt}' for t in ('courses', 'sessions', 'hamd_items')]),
+        )
+        self.assertEqual(schema['tables']['courses']['rows'], 3)
+        self.assertEqual(schema['tables']['hamd_items']['rows'], 3 * 4 * 21)
+        return zf, schema
+
+    def test_npz_export(self):
+        import io
+        import numpy as np
+        from rtms_app.models import TreatmentSession
+
+        zf, schema = self._export('npz')
+        courses = np.load(io.BytesIO(zf.read('courses.npz')))
+        patients = list(Patient.objects.order_by('card_id', 'course_number'))
+        self.assertEqual(courses['card_id'].tolist(), [p.card_id for p in patients])
+        self.assertEqual(courses['hamd_baseline_17'].dtype, np.int64)
+        self.assertEqual(courses['first_treatment_date'].dtype, np.dtype('datetime64[D]'))
+        self.assertEqual(courses['first_treatment_date'][0], np.datetime64(patients[0].first_treatment_date))
+        self.assertEqual(courses['ae_report_exists'].dtype, bool)
+        self.assertEqual(courses['hamd_3w_improvement'].dtype, np.float64)
+        # category: int32 codes, labels in schema.json
+        gender = next(c for c in schema['tables']['courses']['columns'] if c['key'] == 'gender')
+        codes = courses['gender']
+        self.assertEqual(codes.dtype, np.int32)
+        self.assertEqual(
+            [gender['categories'][c] if c >= 0 else None for c in codes.tolist()],
+            [dict(Patient.GENDER_CHOICES).get(p.gender) for p in patients],
+        )
+
+        sessions = np.load(io.BytesIO(zf.read('sessions.npz')))
+        self.assertEqual(len(sessions['session_date']), TreatmentSession.objects.count())
+        self.assertEqual(sessions['frequency_hz'].dtype, np.float64)
+        # slot は空 -> null（コード -1）
+        self.assertTrue((sessions['slot'] == -1).all())
+        items = np.load(io.BytesIO(zf.read('hamd_items.npz')))
+        self.assertEqual(items['score'].dtype, np.int64)
+        self.assertNotIn('score__null', items.files)
+
+    @skipUnless(find_spec('pyarrow'), 'pyarrow is not installed')
+    def test_parquet_export(self):
+        import io
+        import pyarrow.parquet as pq
+
+        zf, _ = self._export('parquet')
+        courses = pq.read_table(io.BytesIO(zf.read('courses.parquet')))
+        self.assertEqual(courses.num_rows, 3)
+        self.assertEqual(str(courses.schema.field('first_treatment_date').type), 'date32[day]')
+        self.assertEqual(str(courses.schema.field('hamd_baseline_17').type), 'int64')
+
+    def test_dataset_button_names_default_format(self):
+        from rtms_app.services.research_dataset import available_formats
+
+        User = get_user_model()
+        self.client.force_login(User.objects.create_superuser(username='root', password='pw'))
+        resp = self.client.get(reverse('rtms_app:export_research_csv'))
+        self.assertContains(resp, reverse('rtms_app:export_research_dataset'))
+        self.assertContains(resp, f'型付きデータセット（{available_formats()[0].upper()}）')
+        self.assertEqual(available_formats()[-1], 'npz')
+
+
+class TestSideEffectFacts(TestCase):
+    def setUp(self):
+        from rtms_app.models import TreatmentSession
+
+        self.patient = Patient.objects.create(card_id='SE001', name='副作用 テスト', birth_date=date(1980, 1, 1))
+        start = date(2026, 4, 6)
+        self.sessions = [
+            TreatmentSession.objects.create(
+                patient=self.patient, session_date=start + datetime.timedelta(days=d), status='done',
+            )
+            for d in (0, 1, 7, 8)
+        ]
+
+    def _rows(self, **grades):
+        from rtms_app.services.side_effect_schema import default_side_effect_rows
+
+        rows = default_side_effect_rows()
+        for row in rows:
+            row.update(grades.get(row['item'], {}))
+        return rows
+
+    def test_check_save_keeps_observations_in_sync(self):
+        from rtms_app.models import SideEffectCheck, SideEffectObservation
+
+        session = self.sessions[0]
+        check = SideEffectCheck.objects.create(session=session, rows=self._rows(**{
+            '頭皮痛・刺激痛': {'during': 2, 'after': 1, 'relatedness': 3},
+            '頭痛 (刺激後)': {'after': 1},
+        }))
+        obs = {(o.item_key, o.phase): (o.grade, o.relatedness) for o in session.side_effect_observations.all()}
+        self.assertEqual(obs, {
+            ('scalp_pain', 'during'): (2, 3), ('scalp_pain', 'after'): (1, 3), ('headache_post', 'after'): (1, 0),
+        })
+
+        check.rows = self._rows(**{'頭皮痛・刺激痛': {'before': 1}})
+        check.save()
+        self.assertEqual(list(session.side_effect_observations.values_list('item_key', 'phase')), [('scalp_pain', 'before')])
+        check.delete()
+        self.assertFalse(SideEffectObservation.objects.exists())
+
+    def test_backfill_command_and_incidence_report(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from rtms_app.models import SideEffectCheck, SideEffectObservation, TreatmentSession
+        from rtms_app.services.side_effect_facts import incidence_report
+
+        # 旧形式と bulk_create（シグナルなし）の行は backfill で入る
+        TreatmentSession.objects.filter(pk=self.sessions[1].pk).update(side_effects={'scalp': 1, 'note': 'x'})
+        SideEffectCheck.objects.bulk_create([
+            SideEffectCheck(session=self.sessions[2], rows=self._rows(**{'頭皮痛・刺激痛': {'during': 1}})),
+        ])
+        self.assertFalse(SideEffectObservation.objects.exists())
+        out = StringIO()
+        call_command('rtms_side_effect_facts', batch_size=3, stdout=out)
+        self.assertIn('Done: 4 sessions, 2 observations', out.getvalue())
+        call_command('rtms_side_effect_facts', stdout=StringIO())
+        self.assertEqual(SideEffectObservation.objects.count(), 2)
+
+        report = incidence_report()
+        self.assertEqual(report['total_sessions'], 4)
+        self.assertEqual(report['weeks'], [{'week': 1, 'sessions': 2}, {'week': 2, 'sessions': 2}])
+        scalp = next(i for i in report['items'] if i['key'] == 'scalp_pain')
+        self.assertEqual((scalp['sessions'], scalp['rate']), (2, 0.5))
+        self.assertEqual([w['sessions'] for w in scalp['by_week']], [1, 1])
+        self.assertEqual(incidence_report(phase='during')['items'][0]['sessions'], 1)
+
+        User = get_user_model()
+        self.client.force_login(User.objects.create_superuser(username='root', password='pw'))
+        resp = self.client.get(reverse('rtms_app:side_effect_incidence_api'), {'min_grade': '2'})
+        self.assertEqual(resp.json()['items'][0]['sessions'], 0)
+        self.assertEqual(self.client.get(reverse('rtms_app:side_effect_incidence_api'), {'phase': 'x'}).status_code, 400)
+        self.assertContains(self.client.get(reverse('rtms_app:side_effect_incidence')), '第2週')
+
+
+class TestSessionOrdinals(TestCase):
+    def setUp(self):
+        from django.utils import timezone
+        from rtms_app.models import TreatmentSession
+
+        self.patient = Patient.objects.create(card_id='ORD01', name='通し番号 テスト', birth_date=date(1975, 6, 1))
+        self.other = Patient.objects.create(card_id='ORD02', name='別患者', birth_date=date(1975, 6, 1))
+
+        def make(patient, d, course=1, hour=9, slot=''):
+            return TreatmentSession.objects.create(
+                patient=patient, course_number=course, session_date=d, slot=slot,
+                date=timezone.make_aware(datetime.datetime.combine(d, datetime.time(hour))),
+            )
+
+        # 同日2回（時刻順）・月をまたぐクール・別クール・別患者
+        self.s = [
+            make(self.patient, date(2026, 4, 28), hour=14, slot='2'),
+            make(self.patient, date(2026, 4, 28), hour=9, slot='1'),
+            make(self.patient, date(2026, 4, 30)),
+            make(self.patient, date(2026, 5, 1)),
+        ]
+        self.course2 = make(self.patient, date(2026, 5, 1), course=2)
+        make(self.other, date(2026, 4, 1))
+
+    def test_row_number_per_course(self):
+        from rtms_app.services.session_ordinals import course_ordinals, sessions_between
+        from rtms_app.views import get_cumulative_treatment_number
+
+        self.assertEqual(
+            course_ordinals(self.patient, 1),
+            {self.s[1].id: 1, self.s[0].id: 2, self.s[2].id: 3, self.s[3].id: 4},
+        )
+        with self.assertNumQueries(0):  # 患者インスタンスにキャッシュ済み
+            self.assertEqual(get_cumulative_treatment_number(self.patient, 1, self.s[3].id), 4)
+        self.assertEqual(get_cumulative_treatment_number(self.patient, None, self.course2.id), 1)
+        self.assertIsNone(get_cumulative_treatment_number(self.other, None, self.s[0].id))
+
+        # 期間の前にあるクールの既往分も数える
+        with self.assertNumQueries(1):
+            in_may = sessions_between(date(2026, 5, 1), date(2026, 5, 31))
+        self.assertEqual([(s.id, s.ordinal) for s in in_may], [(self.s[3].id, 4), (self.course2.id, 1)])
+
+    def test_consumers_use_course_ordinals(self):
+        from rtms_app.views import _build_month_calendar
+
+        cal = _build_month_calendar(2026, 5)
+        titles = {e.label for week in cal['weeks'] for day in week for e in day.events if e.session_id == self.s[3].id}
+        self.assertEqual(titles, {'治療4回 通し番号 テスト'})
+
+        User = get_user_model()
+        self.client.force_login(User.objects.create_user(username='ord', password='pw'))
+        resp = self.client.get(reverse('rtms_app:print:print_side_effect_check', args=[self.patient.id, self.course2.id]))
+        self.assertEqual(resp.context['session_number'], 1)
+        resp = self.client.get(reverse('rtms_app:print:print_side_effect_check', args=[self.patient.id, self.s[0].id]))
+        self.assertEqual(resp.context['session_number'], 2)
+
+
+class AsyncViewCallMixin:
+    """非同期ビューを同期テストから呼び、ストリーミング応答を集める。"""
+
+    def _call(self, view, user, path='/', *args):
+        from asgiref.sync import async_to_sync
+        from django.test import AsyncRequestFactory
+
+        request = AsyncRequestFactory().get(path)
+
+        async def auser():
+            return user
+        request.auser = auser
+        request.user = user
+        return async_to_sync(view)(request, *args)
+
+    def _body(self, response):
+        from asgiref.sync import async_to_sync
+
+        async def collect():
+            return b''.join([chunk async for chunk in response])
+        return async_to_sync(collect)()
+
+
+class TestItemExport(AsyncViewCallMixin, TestCase):
+    def setUp(self):
+        from rtms_app.services.synthetic_cohort import seed_cohort
+
+        seed_cohort(2, courses=1, seed=5)
+
+    def test_rows_cover_records_legacy_and_surveys(self):
+        from rtms_app.models import Assessment, PatientSurveyResponse
+        from rtms_app.services.item_export import clinician_item_rows, survey_item_rows
+
+        patient = Patient.objects.order_by('id').first()
+        # AssessmentRecord のない旧 HAM-D 行だけが追加で出る
+        Assessment.objects.create(patient=patient, timing='other', type='HAM-D', scores={'q1': 2, 'q2': 1})
+        clinician = list(clinician_item_rows())
+        self.assertEqual(len(clinician), 2 * 4 * 21 + 2)
+        self.assertEqual({r[5] for r in clinician}, {'hamd'})
+
+        rows = list(survey_item_rows())
+        totals = {}
+        for r in rows:
+            if r[5] == 'phq9' and r[6] == 'q10':
+                continue
+            key = (r[0], r[4], r[5])
+            totals[key] = totals.get(key, 0) + (r[8] or 0)
+        responses = PatientSurveyResponse.objects.select_related('session').filter(session__status='submitted')
+        self.assertTrue(responses.exists())
+        for resp in responses:
+            key = (f"{resp.session.patient_id:05d}", resp.session.phase, resp.instrument)
+            self.assertEqual(totals.get(key, 0), resp.total_score, key)
+
+    def test_csv_streams_for_superuser_and_matches_async(self):
+        from rtms_app import views_async
+
+        User = get_user_model()
+        staff = User.objects.create_user(username='staff', password='pw', is_staff=True)
+        root = User.objects.create_superuser(username='root', password='pw')
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(reverse('rtms_app:export_item_scores_csv')).status_code, 403)
+
+        self.client.force_login(root)
+        resp = self.client.get(reverse('rtms_app:export_item_scores_csv'))
+        self.assertTrue(resp.streaming)
+        body = b''.join(resp.streaming_content)
+        self.assertEqual(body.count(b'\xef\xbb\xbf'), 1)
+        lines = body.decode('utf-8-sig').splitlines()
+        self.assertEqual(lines[0], 'patient_id,card_id,course_number,source,timing,instrument,item,answer,score,date')
+        self.assertEqual(sum(1 for line in lines if ',clinician,' in line), 2 * 4 * 21)
+
+        async_resp = self._call(views_async.export_item_scores_csv, root)
+        self.assertEqual(self._body(async_resp), body)
+
+        pid = Patient.objects.order_by('id').first().id
+        one = self.client.get(reverse('rtms_app:export_item_scores_csv'), {'patient': pid})
+        one_lines = b''.join(one.streaming_content).decode('utf-8-sig').splitlines()[1:]
+        self.assertTrue(one_lines)
+        self.assertTrue(all(line.startswith(f"{pid:05d},") for line in one_lines))
+
+
+class TestAsyncViews(AsyncViewCallMixin, TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.staff = User.objects.create_user(username='async_staff', password='pw', is_staff=True)
+        self.nurse = User.objects.create_user(username='async_nurse', password='pw')
+        self.root = User.objects.create_superuser(username='async_root', password='pw')
+        self.patient = Patient.objects.create(card_id='ASYNC1', name='Async Test', birth_date=datetime.date(1970, 4, 4))
+
+    def test_treatment_csv_matches_sync_export_across_batches(self):
+        from unittest import mock
+        from rtms_app import views, views_async
+        from rtms_app.models import TreatmentSession
+
+        day = date(2026, 4, 6)
+        for i in range(5):
+            TreatmentSession.objects.create(patient=self.patient, session_date=day + datetime.timedelta(days=i))
+        self.client.force_login(self.root)
+        expected = self.client.get('/app/export/treatments.csv').content
+
+        with mock.patch('rtms_app.utils.async_io.CSV_BATCH_SIZE', 2):
+            response = self._call(views_async.export_treatment_csv, self.root)
+            body = self._body(response)
+        self.assertTrue(response.streaming)
+        self.assertTrue(body.startswith(b'\xef\xbb\xbf'))
+        self.assertEqual(body, expected)
+        self.assertEqual(len(body.decode('utf-8-sig').splitlines()), 1 + 5)
+        self.assertEqual(views.TREATMENT_CSV_HEADER[0], body.decode('utf-8-sig').split(',', 1)[0])
+
+    def test_download_db_streams_file_for_superuser_only(self):
+        import os
+        import tempfile
+        from unittest import mock
+        from django.core.exceptions import PermissionDenied
+        from rtms_app import views_async
+
+        payload = os.urandom(600 * 1024)
+        with tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False) as f:
+            f.write(payload)
+        self.addCleanup(os.unlink, f.name)
+
+        with mock.patch.object(views_async, '_sqlite_path', return_value=f.name):
+            response = self._call(views_async.download_db, self.root)
+            self.assertEqual(response['Content-Length'], str(len(payload)))
+            self.assertEqual(self._body(response), payload)
+            for view in (views_async.download_db, views_async.admin_backup, views_async.export_treatment_csv):
+                with self.assertRaises(PermissionDenied):
+                    self._call(view, self.staff)
+
+    def test_backup_and_treatment_export_are_superuser_only(self):
+        from django.contrib.auth.models import AnonymousUser
+        from rtms_app import views_async
+
+        urls = [reverse('rtms_app:admin_backup'), reverse('rtms_app:download_db'), reverse('rtms_app:export_treatment_csv')]
+        for user in (self.nurse, self.staff):
+            self.client.force_login(user)
+            for url in urls:
+                self.assertEqual(self.client.get(url).status_code, 403, (user.username, url))
+        self.client.logout()
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 302, url)
+        self.assertEqual(self._call(views_async.download_db, AnonymousUser()).status_code, 302)
+
+        self.client.force_login(self.root)
+        self.assertEqual(self.client.get(reverse('rtms_app:admin_backup')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('rtms_app:export_treatment_csv')).status_code, 200)
+
+    @override_settings(RTMS_ASYNC_VIEWS=True)
+    def test_pdf_is_rendered_before_the_response(self):
+        from unittest import mock
+        from rtms_app import print_views
+
+        class FakeHTML:
+            def __init__(self, string, base_url):
+                self.string = string
+
+            def write_pdf(self, stylesheets):
+                return b'%PDF-fake'
+
+        view = print_views.async_pdf_view(print_views.patient_print_admission_pdf)
+        with mock.patch.object(print_views, '_weasyprint_html', return_value=FakeHTML):
+            response = self._call(view, self.staff, '/x/', self.patient.id)
+            self.assertFalse(response.streaming)
+            self.assertEqual((response['Content-Type'], response.content), ('application/pdf', b'%PDF-fake'))
+            self.assertTrue(response.has_header('Content-Disposition'))
+            # 生成に失敗したら PDF のふりをした応答ではなくエラーになる
+            with mock.patch.object(FakeHTML, 'write_pdf', side_effect=RuntimeError('render failed')):
+                with self.assertRaises(RuntimeError):
+                    self._call(view, self.staff, '/x/', self.patient.id)
+
+    def test_login_required_and_survey_export(self):
+        from django.contrib.auth.models import AnonymousUser
+        from rtms_app import views_async
+
+        response = self._call(views_async.export_patient_surveys_csv, AnonymousUser(), '/x/', self.patient.id)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('login', response['Location'])
+
+        from rtms_app.models import PatientSurveySession
+        PatientSurveySession.objects.create(patient=self.patient, phase="pre", status="in_progress")
+        PatientSurveySession.objects.create(patient=self.patient, phase="post", status="in_progress")
+        response = self._call(views_async.export_patient_surveys_csv, self.staff, '/x/', self.patient.id)
+        self.assertEqual(response.status_code, 200)
+        self.client.force_login(self.staff)
+        expected = self.client.get(reverse('rtms_app:patient_survey_export', args=[self.patient.id])).content
+        self.assertEqual(self._body(response), expected)
+        self.assertEqual(expected.count(b'\xef\xbb\xbf'), 1)
+
+
+class _SerialLiveServerThread(LiveServerThread):
+    # テスト DB はスレッド間で1接続を共有するため、リクエストは直列に処理する
+    def _create_server(self, connections_override=None):
+        return WSGIServer((self.host, self.port), QuietWSGIRequestHandler, allow_reuse_address=False)
+
+
+class TestLoadTestHarness(LiveServerTestCase):
+    server_thread_class = _SerialLiveServerThread
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_workload_replays_against_live_server(self):
+        import asyncio
+        from urllib.parse import urlparse
+        from rtms_app.loadtest.workload import prepare_workload, run_workload
+
+        manifest = prepare_workload(n_patients=3, n_staff=2, n_portal=1, seed=1)
+        url = urlparse(self.live_server_url)
+        report = asyncio.run(run_workload(
+            url.hostname, url.port, manifest,
+            {'nurse': 1, 'physician': 1, 'patient': 1},
+            duration=1.0, think=0, seed=1,
+        ))
+        by_url = report['by_url']
+        for name in ('login', 'portal_login', 'dashboard', 'treatment_add GET', 'treatment_add POST',
+                     'assessment POST', 'print_path_pdf', 'survey_autosave'):
+            self.assertIn(name, by_url)
+            self.assertEqual(by_url[name]['errors'], 0, name)
+        self.assertGreater(report['throughput_rps'], 0)
+        self.assertLessEqual(by_url['dashboard']['p50_ms'], by_url['dashboard']['p99_ms'])
+
+    def test_percentiles_use_nearest_rank(self):
+        from rtms_app.loadtest.workload import Recorder
+        values = [i / 1000 for i in range(1, 101)]
+        self.assertEqual(Recorder._pct(values, 50), 0.05)
+        self.assertEqual(Recorder._pct(values, 95), 0.095)
+        self.assertEqual(Recorder._pct(values, 99), 0.099)
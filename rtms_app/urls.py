@@ -3,29 +3,59 @@ from django.shortcuts import redirect
 from . import views
 from django.views.generic.base import RedirectView
 from . import views_health
+from . import views_live
 from . import views_survey_export
+from . import views_capacity
+from . import views_task_board
+from . import views_analytics
 
 from django.conf import settings
 from django.conf.urls.static import static
 
 app_name = "rtms_app"
 
+
+def _io_view(view):
+    """RTMS_ASYNC_VIEWS（ASGI 配信）のときは views_async の同名の非同期版を使う。"""
+    if settings.RTMS_ASYNC_VIEWS:
+        from . import views_async
+        return getattr(views_async, view.__name__)
+    return view
+
+
 urlpatterns = [
     # =========================
     # Health & System
     # =========================
-    path("healthz/", views_health.healthz, name="healthz"),
+    path("healthz/", _io_view(views_health.healthz), name="healthz"),
     path("version/", views_health.version, name="version"),
+    path("ops/slow-queries/", views_health.slow_queries, name="slow_queries"),
     
     # =========================
     # Dashboard / List
     # =========================
     path("dashboard/", views.dashboard_view, name="dashboard"),
+    path("dashboard/live/", views_live.live_events, name="live_events"),
+    path("dashboard/board/", views_task_board.task_board, name="task_board"),
     path("patients/", views.patient_list_view, name="patient_list"),
     path("patients/add/", views.patient_add_view, name="patient_add"),
     path("logout/", views.custom_logout, name="custom_logout"),
     
-    path("app/consent/latest/", views.latest_consent, name="latest_consent"),
+    path("app/consent/latest/", _io_view(views.latest_consent), name="latest_consent"),
+
+    # =========================
+    # Backup / Export（ASGI では非同期ストリーミング）
+    # =========================
+    path("admin/backup/", _io_view(views.admin_backup), name="admin_backup"),
+    path("admin/backup/db/", _io_view(views.download_db), name="download_db"),
+    path("export/treatments.csv", _io_view(views.export_treatment_csv), name="export_treatment_csv"),
+    path("export/research/", views.export_research_csv, name="export_research_csv"),
+    path("export/research/dataset/", views.export_research_dataset, name="export_research_dataset"),
+    path("export/items.csv", _io_view(views_survey_export.export_item_scores_csv), name="export_item_scores_csv"),
+    path("analytics/cohort/", views_analytics.cohort_analytics, name="cohort_analytics"),
+    path("analytics/cohort/data/", views_analytics.cohort_analytics_api, name="cohort_analytics_api"),
+    path("analytics/side-effects/", views_analytics.side_effect_incidence, name="side_effect_incidence"),
+    path("analytics/side-effects/data/", views_analytics.side_effect_incidence_api, name="side_effect_incidence_api"),
 
     # =========================
     # Patient main pages
@@ -53,7 +83,7 @@ urlpatterns = [
     ),
     path(
         "patient/<int:patient_id>/surveys/export.csv",
-        views_survey_export.export_patient_surveys_csv,
+        _io_view(views_survey_export.export_patient_surveys_csv),
         name="patient_survey_export",
     ),
 
@@ -137,6 +167,8 @@ urlpatterns = [
         views.calendar_month_print_view,
         name="calendar_month_print",
     ),
+    path("calendar/capacity/", views_capacity.capacity_report, name="capacity_report"),
+    path("calendar/slots/", views_capacity.slot_schedule, name="slot_schedule"),
 
     # =========================
     # Print（分離）
@@ -0,0 +1,141 @@
+"""
+ASGI 用の非同期 I/O ヘルパー（views_async から使う）
+
+- ファイル配信: FileResponse は ASGI ではファイル全体を読み込んでから送るため、
+  チャンクごとにスレッドで読む async イテレータで StreamingHttpResponse を返す。
+  送信待ちの間はスレッドもワーカーも占有しない。
+- ORM: 同期ビューは ASGI では1本の共有スレッド（thread_sensitive）で順番に実行される。
+  非同期ビューからの ORM 読み込みは、必要なクエリを1つの同期関数にまとめて
+  orm_batch() で1回だけそのスレッドへ渡す（クエリごとに行き来しない）。
+- CSV: keyset ページングでバッチごとに読み、行を書いたそばから送る。
+  QuerySet.iterator() の行ジェネレータは aiter_rows() でバッチにして共有スレッドから読む
+  （iter_csv() は同じ出力を作る同期ビュー用の版）。
+"""
+import csv
+import io
+import os
+from functools import wraps
+from itertools import islice
+from typing import AsyncIterator, Callable, Iterable, Iterator, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import PermissionDenied
+from django.http import StreamingHttpResponse
+
+FILE_CHUNK_SIZE = 256 * 1024
+CSV_BATCH_SIZE = 500
+UTF8_BOM = b'\xef\xbb\xbf'
+
+
+def orm_batch(fn: Callable) -> Callable:
+    """fn（ORM 読み込みをまとめた同期関数）を共有スレッドで1回で実行する awaitable にする。"""
+    return sync_to_async(fn, thread_sensitive=True)
+
+
+def async_login_required(view):
+    """login_required の非同期ビュー版（Django 5.0 の login_required は非同期ビュー非対応）。"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def async_superuser_required(view):
+    """views.superuser_required の非同期ビュー版。未ログインはログインへ、スーパーユーザー以外は 403。"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        if not user.is_superuser:
+            raise PermissionDenied("スーパーユーザーのみこの機能にアクセスできます。")
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def aiter_file(path: str, chunk_size: int = FILE_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """path をチャンクごとに読む。読み込みは共有スレッドを使わない別スレッドで行う。"""
+    read_in_thread = sync_to_async(lambda f: f.read(chunk_size), thread_sensitive=False)
+    f = await sync_to_async(open, thread_sensitive=False)(path, 'rb')
+    try:
+        while True:
+            chunk = await read_in_thread(f)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        f.close()
+
+
+def file_streaming_response(path: str, content_type: str = 'application/octet-stream',
+                            filename: Optional[str] = None) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(aiter_file(path), content_type=content_type)
+    response['Content-Length'] = str(os.path.getsize(path))
+    if filename:
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _csv_line(row) -> bytes:
+    buf = io.StringIO()
+    csv.writer(buf).writerow(row)
+    return buf.getvalue().encode('utf-8')
+
+
+async def aiter_csv(header: Iterable, batches: AsyncIterator[List[list]], bom: bool = True) -> AsyncIterator[bytes]:
+    """header と行バッチの async イテレータから CSV のバイト列を1バッチずつ作る。"""
+    yield (UTF8_BOM if bom else b'') + _csv_line(header)
+    async for rows in batches:
+        yield b''.join(_csv_line(row) for row in rows)
+
+
+def iter_csv(header: Iterable, rows: Iterable[list], batch_size: int = CSV_BATCH_SIZE, bom: bool = True) -> Iterator[bytes]:
+    """aiter_csv の同期版（StreamingHttpResponse 用）。rows は batch_size 行ずつまとめて書く。"""
+    yield (UTF8_BOM if bom else b'') + _csv_line(header)
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield b''.join(_csv_line(row) for row in batch)
+
+
+async def aiter_rows(make_rows: Callable[[], Iterable[list]], batch_size: Optional[int] = None) -> AsyncIterator[List[list]]:
+    """make_rows()（QuerySet.iterator() を使う行ジェネレータ）を batch_size 行ずつ共有スレッドで読む。
+
+    ジェネレータの生成・再開はすべて共有スレッド上で行うので、DB カーソルは同じ接続のまま。
+    """
+    batch_size = batch_size or CSV_BATCH_SIZE
+    rows = await orm_batch(lambda: iter(make_rows()))()
+    next_batch = orm_batch(lambda: list(islice(rows, batch_size)))
+    while True:
+        batch = await next_batch()
+        if not batch:
+            return
+        yield batch
+
+
+async def abatches(fetch: Callable, batch_size: Optional[int] = None) -> AsyncIterator[List[list]]:
+    """fetch(cursor, limit) -> (rows, next_cursor) を next_cursor が None になるまで繰り返す。
+
+    keyset ページング用（最初の cursor は None）。1バッチ = 共有スレッドへの1回の受け渡し。
+    """
+    fetch_async = orm_batch(fetch)
+    batch_size = batch_size or CSV_BATCH_SIZE
+    cursor = None
+    while True:
+        rows, cursor = await fetch_async(cursor, batch_size)
+        if rows:
+            yield rows
+        if cursor is None:
+            return
+
+
+def csv_streaming_response(header, batches, filename: str) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(aiter_csv(header, batches), content_type='text/csv; charset=utf-8-sig')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,99 @@
+"""
+オンデマンドのリクエストプロファイラ
+
+cProfile でビューを包み、同時に発行された SQL を記録して
+PROFILE_DIR 配下に <日時>_<request_id>.prof / .json として保存する。
+.prof は `python -m pstats` や snakeviz で開ける。
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+# 保存するSQLの件数上限（巨大なN+1で JSON が肥大化しないように）
+MAX_SQL_ENTRIES = 500
+_NAME_RE = re.compile(r'^[0-9A-Za-z_-]+$')
+
+
+def get_profile_dir():
+    return str(getattr(settings, 'RTMS_PROFILE_DIR', os.path.join(settings.BASE_DIR, 'profiles')))
+
+
+def run_profiled(fn, request_id, meta=None, sort='cumulative', limit=40):
+    """fn() を cProfile + SQL キャプチャ付きで実行し、(fn の戻り値, プロファイル名) を返す。"""
+    profiler = cProfile.Profile()
+    with CaptureQueriesContext(connection) as ctx:
+        t0 = time.perf_counter()
+        profiler.enable()
+        try:
+            result = fn()
+        finally:
+            profiler.disable()
+            elapsed_ms = (time.perf_counter() - t0) * 1000
+
+    name = f"{timezone.localtime().strftime('%Y%m%d-%H%M%S')}_{request_id}"
+    profile_dir = get_profile_dir()
+    os.makedirs(profile_dir, exist_ok=True)
+    profiler.dump_stats(os.path.join(profile_dir, f"{name}.prof"))
+
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats(sort).print_stats(limit)
+    queries = ctx.captured_queries
+    payload = {
+        **(meta or {}),
+        'request_id': request_id,
+        'created_at': timezone.now().isoformat(),
+        'elapsed_ms': round(elapsed_ms, 2),
+        'sql_count': len(queries),
+        'sql_time_ms': round(sum(float(q.get('time') or 0) for q in queries) * 1000, 2),
+        'sql': queries[:MAX_SQL_ENTRIES],
+        'top': out.getvalue(),
+    }
+    with open(os.path.join(profile_dir, f"{name}.json"), 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=1)
+    return result, name
+
+
+def list_profiles():
+    """保存済みプロファイルのメタデータ一覧（新しい順）。"""
+    profile_dir = get_profile_dir()
+    if not os.path.isdir(profile_dir):
+        return []
+    items = []
+    for filename in sorted(os.listdir(profile_dir), reverse=True):
+        if not filename.endswith('.json'):
+            continue
+        name = filename[:-5]
+        try:
+            with open(os.path.join(profile_dir, filename), encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        items.append({
+            'name': name,
+            'request_id': data.get('request_id', ''),
+            'created_at': data.get('created_at', ''),
+            'method': data.get('method', ''),
+            'path': data.get('path', ''),
+            'user': data.get('user', ''),
+            'elapsed_ms': data.get('elapsed_ms'),
+            'sql_count': data.get('sql_count'),
+            'sql_time_ms': data.get('sql_time_ms'),
+        })
+    return items
+
+
+def profile_file_path(name, ext):
+    """名前と拡張子（prof/json）から保存先パスを返す。不正な名前や存在しない場合は None。"""
+    if ext not in ('prof', 'json') or not _NAME_RE.match(name or ''):
+        return None
+    path = os.path.join(get_profile_dir(), f"{name}.{ext}")
+    return path if os.path.isfile(path) else None
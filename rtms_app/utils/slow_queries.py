@@ -0,0 +1,199 @@
+"""
+スロークエリログ（DB execute wrapper）
+
+RTMS_SLOW_QUERY_MS を超えた SQL について SQL・パラメータ・所要時間・呼び出し元
+（ビュー名とアプリ内の行）をログに出し、文の「形」（リテラルとプレースホルダを
+正規化したもの）ごとに一度だけ EXPLAIN（SQLite は EXPLAIN QUERY PLAN）を取得する。
+最も遅い形の上位 RTMS_SLOW_QUERY_TOP_N 件をプロセス内に保持し、
+スタッフ用 JSON エンドポイント（views_health.slow_queries）で確認できる。
+
+ストアはプロセス単位（gunicorn のワーカーごと）で、再起動で消える。
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .request_context import get_current_request
+
+logger = logging.getLogger('rtms_app.slow_query')
+
+DEFAULT_THRESHOLD_MS = 200.0
+DEFAULT_TOP_N = 50
+MAX_PARAMS_REPR = 500
+
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_SKIP_FILES = (os.path.abspath(__file__), os.path.join(_APP_DIR, 'middleware.py'))
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*\?\s*,?)+\)', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+
+def statement_shape(sql):
+    """リテラル・プレースホルダ・IN リストの長さを潰した正規化 SQL を返す。"""
+    shape = _STRING_RE.sub('?', sql)
+    shape = shape.replace('%s', '?')
+    shape = _NUMBER_RE.sub('?', shape)
+    shape = _IN_LIST_RE.sub('IN (...)', shape)
+    return _SPACE_RE.sub(' ', shape).strip()
+
+
+def _shape_id(shape):
+    return hashlib.sha1(shape.encode('utf-8')).hexdigest()[:12]
+
+
+def _caller():
+    """アプリ内で最も内側のフレーム（このモジュールとミドルウェアを除く）を 'path:line in func' で返す。"""
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(_APP_DIR) and filename not in _SKIP_FILES:
+            return f"{os.path.relpath(filename, os.path.dirname(_APP_DIR))}:{frame.lineno} in {frame.name}"
+    return ''
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None) if request is not None else None
+    if match is None:
+        return ''
+    return match.view_name or match._func_path
+
+
+class SlowQueryStore:
+    """文の形ごとの集計。max_ms が小さいものから追い出して top_n 件を保持する。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def add(self, shape, sql, params, duration_ms, caller, view, request_id):
+        """記録して、その形が新規（EXPLAIN 未取得）なら True を返す。"""
+        shape_id = _shape_id(shape)
+        now = timezone.now().isoformat()
+        with self._lock:
+            entry = self._entries.get(shape_id)
+            is_new = entry is None
+            if is_new:
+                entry = self._entries[shape_id] = {
+                    'shape_id': shape_id,
+                    'shape': shape,
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'plan': None,
+                }
+            entry['count'] += 1
+            entry['total_ms'] = round(entry['total_ms'] + duration_ms, 3)
+            entry['last_ms'] = round(duration_ms, 3)
+            entry['last_seen'] = now
+            if duration_ms >= entry['max_ms']:
+                entry.update({
+                    'max_ms': round(duration_ms, 3),
+                    'sql': sql,
+                    'params': repr(params)[:MAX_PARAMS_REPR],
+                    'caller': caller,
+                    'view': view,
+                    'request_id': request_id,
+                })
+            top_n = int(getattr(settings, 'RTMS_SLOW_QUERY_TOP_N', DEFAULT_TOP_N))
+            while len(self._entries) > max(top_n, 1):
+                slowest_out = min(self._entries.values(), key=lambda e: e['max_ms'])
+                del self._entries[slowest_out['shape_id']]
+            return is_new and shape_id in self._entries
+
+    def set_plan(self, shape, plan):
+        with self._lock:
+            entry = self._entries.get(_shape_id(shape))
+            if entry is not None:
+                entry['plan'] = plan
+
+    def snapshot(self):
+        """max_ms の降順のコピー。"""
+        with self._lock:
+            entries = [dict(e) for e in self._entries.values()]
+        for e in entries:
+            e['avg_ms'] = round(e['total_ms'] / e['count'], 3) if e['count'] else 0.0
+        return sorted(entries, key=lambda e: e['max_ms'], reverse=True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+store = SlowQueryStore()
+_local = threading.local()
+
+
+def explain(connection, sql, params):
+    """EXPLAIN（SQLite は EXPLAIN QUERY PLAN）の結果を文字列のリストで返す。"""
+    prefix = 'EXPLAIN QUERY PLAN' if connection.vendor == 'sqlite' else 'EXPLAIN'
+    with connection.cursor() as cursor:
+        cursor.execute(f"{prefix} {sql}", params)
+        return [' | '.join(str(col) for col in row) for row in cursor.fetchall()]
+
+
+def _is_explainable(sql):
+    head = sql.lstrip()[:6].upper()
+    return head.startswith('SELECT') or head.startswith('WITH')
+
+
+class SlowQueryWrapper:
+    """connection.execute_wrappers に入れる wrapper（接続ごとに1つ）。"""
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_local, 'active', False):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration_ms = (time.perf_counter() - start) * 1000
+        threshold = getattr(settings, 'RTMS_SLOW_QUERY_MS', DEFAULT_THRESHOLD_MS)
+        if threshold is not None and 0 <= float(threshold) <= duration_ms:
+            self._record(sql, params, many, duration_ms)
+        return result
+
+    def _record(self, sql, params, many, duration_ms):
+        _local.active = True
+        try:
+            request = get_current_request()
+            caller = _caller()
+            view = _view_name(request)
+            request_id = getattr(request, 'request_id', '')
+            logger.warning(
+                f"[{request_id}] slow query {duration_ms:.1f}ms view={view} at {caller}: "
+                f"{sql} params={repr(params)[:MAX_PARAMS_REPR]}"
+            )
+            shape = statement_shape(sql)
+            is_new = store.add(shape, sql, params, duration_ms, caller, view, request_id)
+            if is_new and not many and _is_explainable(sql):
+                connection = connections[self.alias]
+                try:
+                    if connection.in_atomic_block and connection.vendor != 'sqlite':
+                        # EXPLAIN の失敗で呼び出し側のトランザクションを壊さない
+                        with transaction.atomic(using=self.alias):
+                            plan = explain(connection, sql, params)
+                    else:
+                        plan = explain(connection, sql, params)
+                except Exception as e:
+                    plan = [f"EXPLAIN failed: {e}"]
+                store.set_plan(shape, plan)
+        finally:
+            _local.active = False
+
+
+def install(sender=None, connection=None, **kwargs):
+    """connection_created シグナルのハンドラ。各接続に wrapper を一度だけ追加する。"""
+    if connection is None:
+        return
+    if not any(isinstance(w, SlowQueryWrapper) for w in connection.execute_wrappers):
+        connection.execute_wrappers.append(SlowQueryWrapper(connection.alias))
@@ -0,0 +1,84 @@
+"""
+URL テンプレートレジストリ
+
+カレンダー生成のように同じルートを数千回 reverse() する処理向けに、
+ルート名ごとに一度だけ reverse() してパス文字列のテンプレートを作り、
+以降は文字列置換だけで URL を組み立てる。
+
+- 位置引数がすべて 0 以上の int のときだけテンプレートを使う（int の to_url は str() と同じで
+  クォートも不要なため、reverse() と同一の結果になる）。それ以外は reverse() に委譲。
+- スクリプトプレフィックスはテンプレートに含めず、毎回 get_script_prefix() を付与する。
+- ROOT_URLCONF の変更（テストの override_settings など）でキャッシュを破棄する。
+"""
+import threading
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.urls import NoReverseMatch, get_script_prefix, reverse
+
+# reverse() に渡す目印の引数。実際の URL に現れない大きな値を使う。
+_SENTINEL_BASE = 987650000
+
+
+class URLTemplateRegistry:
+    def __init__(self):
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._templates = {}
+
+    def _compile(self, name, nargs):
+        sentinels = [str(_SENTINEL_BASE + i) for i in range(nargs)]
+        try:
+            url = reverse(name, args=[int(s) for s in sentinels])
+        except NoReverseMatch:
+            # 目印の値がパターンに合わない（桁数制限付きの正規表現など）→ 常に reverse() を使う
+            return None
+        prefix = get_script_prefix()
+        if not url.startswith(prefix):
+            return None
+        path = url[len(prefix):]
+        if any(path.count(s) != 1 for s in sentinels):
+            return None
+        parts = []
+        for s in sentinels:
+            head, path = path.split(s, 1)
+            parts.append(head)
+        parts.append(path)
+        return tuple(parts)
+
+    def _template(self, name, nargs):
+        key = (name, nargs)
+        try:
+            return self._templates[key]
+        except KeyError:
+            pass
+        template = self._compile(name, nargs)
+        with self._lock:
+            self._templates[key] = template
+        return template
+
+    def reverse(self, name, args=None):
+        """reverse(name, args=args) と同じ結果を返す（int 引数はテンプレートで高速化）。"""
+        args = tuple(args or ())
+        if not all(type(a) is int and a >= 0 for a in args):
+            return reverse(name, args=args)
+        template = self._template(name, len(args))
+        if template is None:
+            return reverse(name, args=args)
+        out = [get_script_prefix(), template[0]]
+        for arg, part in zip(args, template[1:]):
+            out.append(str(arg))
+            out.append(part)
+        return "".join(out)
+
+
+url_templates = URLTemplateRegistry()
+
+
+@receiver(setting_changed)
+def _clear_on_urlconf_change(*, setting, **kwargs):
+    if setting == "ROOT_URLCONF":
+        url_templates.clear()
@@ -23,11 +23,6 @@ import io
 from urllib.parse import urlencode
 import logging
 
-try:
-    import jpholiday
-except ImportError:
-    jpholiday = None
-
 from .models import (
     Patient,
     TreatmentSession,
@@ -45,14 +40,22 @@ from .forms import (
     PatientRegistrationForm, PatientBasicEditForm, AdmissionProcedureForm
 )
 from .utils.request_context import get_current_request, get_client_ip, get_user_agent, can_view_audit
+from .utils.url_templates import url_templates
 from .services.rtms_schedule import (
-    generate_treatment_dates,
     generate_mapping_dates,
-    session_info_for_date,
     format_rtms_label,
+    treatment_plan_for,
 )
 from .services.schedule import shift_future_sessions
-from .utils.hamd import classify_hamd_response, classify_hamd17_severity
+from .protocols import PROTOCOL_CHOICES, get_protocol, get_protocol_by_code
+from .services.treatment_record import (
+    TreatmentRecord, meta_updates_from_post, sae_event_types_from_post, save_treatment_record,
+)
+from .services.calender import CalendarEvent, DayCell, event_order
+from .services.census import census_from_days, census_from_intervals
+from .services.session_ordinals import ordinal_of as session_ordinal_of, sessions_between
+from .services.holiday_calendar import holiday_name as jp_holiday_name
+from .utils.hamd import classify_hamd_response, classify_hamd17_severity, hamd_items as _hamd_items
 
 
 def superuser_required(view_func):
@@ -121,18 +124,20 @@ def log_audit_action(patient, action, target_model, target_pk, summary='', meta=
 
 def build_url(name, args=None, query=None):
     """
-    reverse() でURLを作り、必要なら query dict を安全に付与する。
+    URLを作り、必要なら query dict を安全に付与する。
 
     名前空間が付いていない場合は rtms_app: を補完する。
+    カレンダーでは1画面で数千回呼ばれるため、reverse() ではなく
+    url_templates（ルートごとに一度だけ reverse したテンプレート）を使う。
     """
     resolved_name = name if ":" in name else f"rtms_app:{name}"
-    base = reverse(resolved_name, args=args)
+    base = url_templates.reverse(resolved_name, args=args)
     return f"{base}?{urlencode(query, doseq=True)}" if query else base
     
 # ==========================================
 # 祝日定義 (2024-2030) + 年末年始 (12/29-1/3)
 # ==========================================
-JP_HOLIDAYS = {
+JP_HOLIDAYS = frozenset({
     date(2024, 1, 1), date(2024, 1, 8), date(2024, 2, 11), date(2024, 2, 12),
     date(2024, 2, 23), date(2024, 3, 20), date(2024, 4, 29), date(2024, 5, 3),
     date(2024, 5, 4), date(2024, 5, 5), date(2024, 5, 6), date(2024, 7, 15),
@@ -149,7 +154,7 @@ JP_HOLIDAYS = {
     date(2026, 5, 5), date(2026, 5, 6), date(2026, 7, 20), date(2026, 8, 11),
     date(2026, 9, 21), date(2026, 9, 22), date(2026, 9, 23), date(2026, 10, 12),
     date(2026, 11, 3), date(2026, 11, 23),
-}
+})
 
 def is_holiday(d):
     """日付が祝日リストまたは年末年始に含まれるか"""
@@ -246,6 +251,26 @@ def get_completion_date(start_date):
     if not start_date: return None
     return get_date_of_session(start_date, 30)
 
+def treatment_plan(patient):
+    """患者のプロトコル（Patient.protocol_type）による今クールの治療計画。初回治療日が未設定なら None"""
+    return treatment_plan_for(patient, JP_HOLIDAYS)
+
+def get_planned_end_date(patient):
+    """治療計画の最終治療日（終了予定日）"""
+    plan = treatment_plan(patient)
+    return plan.end_date if plan else None
+
+def get_planned_session_no(patient, target_date, slot=''):
+    """target_date（と TreatmentSession.slot）に予定されている回番号。予定外なら None"""
+    plan = treatment_plan(patient)
+    if not plan:
+        return None
+    on_day = plan.sessions_on(target_date)
+    for ps in on_day:
+        if plan.slot_value(ps.slot) == slot:
+            return ps.session_no
+    return on_day[0].session_no if on_day else None
+
 def get_current_week_number(start_date, target_date):
     if not start_date or target_date < start_date: return 0
     days_diff = (target_date - start_date).days
@@ -254,7 +279,7 @@ def get_current_week_number(start_date, target_date):
 def get_session_count(patient, target_date=None):
     query = TreatmentSession.objects.filter(patient=patient)
     if target_date:
-        query = query.filter(date__date__lte=target_date)
+        query = query.filter(session_date__lte=target_date)
     return query.count()
 
 def get_weekly_session_count(patient, target_date):
@@ -264,7 +289,7 @@ def get_weekly_session_count(patient, target_date):
     week_start_offset = (days_diff // 7) * 7
     week_start_date = start_date + timedelta(days=week_start_offset)
     week_end_date = week_start_date + timedelta(days=6)
-    return TreatmentSession.objects.filter(patient=patient, date__date__range=[week_start_date, week_end_date]).count()
+    return TreatmentSession.objects.filter(patient=patient, session_date__range=[week_start_date, week_end_date]).count()
 
 
 def compute_initials_from_name(name: str) -> str:
@@ -345,20 +370,8 @@ def get_cumulative_treatment_number(patient: Patient | None, course_number: int
     """Get cumulative (ordinal) treatment session number within the course."""
     if not patient or not session_id:
         return None
-    try:
-        session = TreatmentSession.objects.get(pk=session_id)
-    except TreatmentSession.DoesNotExist:
-        return None
-    
-    qs = TreatmentSession.objects.filter(patient=patient, course_number=course_number or session.course_number)
-    qs = qs.order_by('session_date', 'date', 'id')
-    
-    cumulative_no = 1
-    for ts in qs:
-        if ts.id == session.id:
-            return cumulative_no
-        cumulative_no += 1
-    return None
+    # ROW_NUMBER() over the course (services.session_ordinals), one query per patient/course
+    return session_ordinal_of(session_id, patient, course_number)
 
 
 def convert_to_romaji_initials(name_ja: str) -> str:
@@ -484,11 +497,8 @@ def generate_calendar_weeks(patient):
     # 基準となる終了日
     treatment_start = patient.first_treatment_date
     # Canonical 30回目は開院日に基づく予定
-    treatment_end_est = None
-    if treatment_start:
-        tdates_for_end = generate_treatment_dates(treatment_start, total=30, holidays=JP_HOLIDAYS)
-        if tdates_for_end:
-            treatment_end_est = tdates_for_end[-1]
+    plan = treatment_plan(patient)
+    treatment_end_est = plan.end_date if plan else None
     
     base_end = patient.discharge_date
     if not base_end:
@@ -508,75 +518,52 @@ def generate_calendar_weeks(patient):
     current = start_date
     
     mapping_dates = list(MappingSession.objects.filter(patient=patient).values_list('date', flat=True))
-    treatments_done = {t.date.date(): t for t in TreatmentSession.objects.filter(patient=patient)}
+    treatments_done = {t.session_date: t for t in TreatmentSession.objects.filter(patient=patient)}
     assessment_events = []  # 評価イベントを別途収集
 
-    # Canonical planned treatment and mapping dates (no drift, closures honored)
-    treat_dates = []
+    # Canonical planned mapping dates (no drift, closures honored); treatment dates come from plan
     scheduled_mapping_dates = set()
     if treatment_start:
-        treat_dates = generate_treatment_dates(treatment_start, total=30, holidays=JP_HOLIDAYS)
         # Use mapping base as patient.mapping_date if set, else first_treatment_date
         mapping_base = patient.mapping_date or treatment_start
         if mapping_base:
             mapping_list = generate_mapping_dates(mapping_base, weeks=8, holidays=JP_HOLIDAYS)
             scheduled_mapping_dates = {m['actual'] for m in mapping_list}
-        # Set estimated end to the 30th treatment date
-        if treat_dates:
-            treatment_end_est = treat_dates[-1]
 
     while current <= end_date:
-        is_hol = is_holiday(current)
-        day_info = {
-            'date': current,
-            'weekday': ["月", "火", "水", "木", "金", "土", "日"][current.weekday()],
-            'weekday_num': current.weekday(),
-            'events': [],
-            'is_weekend': current.weekday() >= 5,
-            'is_holiday': is_hol,
-            'url': build_url('dashboard', query={'date': current.strftime('%Y-%m-%d')})
-        }
+        day_info = DayCell(
+            date=current,
+            is_holiday=is_holiday(current),
+            url=build_url('dashboard', query={'date': current.strftime('%Y-%m-%d')}),
+        )
+        events = day_info.events
         
         # 1. 入院
         if current == patient.admission_date:
-            day_info['events'].append({'type': 'admission', 'label': '入院', 'url': build_url('admission_procedure', [patient.id])})
+            events.append(CalendarEvent('admission', '入院', build_url('admission_procedure', [patient.id])))
             
         # 2. 位置決め（実績があれば実績、なければ毎週の予定を表示）
-        if current == patient.mapping_date or current in mapping_dates:
-            day_info['events'].append({
-                'type': 'mapping',
-                'label': '位置決め',
-                'url': build_url("mapping_add", args=[patient.id], query={"date": current.strftime("%Y-%m-%d")})
-            })
-        elif current in scheduled_mapping_dates:
-            day_info['events'].append({
-                'type': 'mapping',
-                'label': '位置決め',
-                'url': build_url("mapping_add", args=[patient.id], query={"date": current.strftime("%Y-%m-%d")})
-            })
+        if current == patient.mapping_date or current in mapping_dates or current in scheduled_mapping_dates:
+            events.append(CalendarEvent(
+                'mapping', '位置決め',
+                build_url("mapping_add", args=[patient.id], query={"date": current.strftime("%Y-%m-%d")}),
+            ))
             
-        # 3. 治療予定・実績（canonical treat_dates を基準に表示）
-        if treatment_start and current in treat_dates:
-            idx = treat_dates.index(current)
-            session_no = idx + 1
-            # Week number rolls over on the same weekday anchored to first treatment date
-            week_no = get_current_week_number(treatment_start, current)
+        # 3. 治療予定・実績（プロトコルの治療計画を基準に表示）
+        info = plan.session_info(current) if plan else None
+        if info:
             status_label = " (済)" if current in treatments_done else ""
-            label = format_rtms_label(session_no, week_no)
-            day_info['events'].append({
-                'type': 'treatment',
-                'label': label + status_label,
-                'url': build_url('treatment_add', [patient.id], {'date': current})
-            })
+            label = format_rtms_label(info['session_no'], info['week_no'], info['last_session_no'])
+            events.append(CalendarEvent('treatment', label + status_label, build_url('treatment_add', [patient.id], {'date': current})))
         
         # 5. 退院
         if current == patient.discharge_date:
-            day_info['events'].append({'type': 'discharge', 'label': '退院準備', 'url': build_url('patient_home', [patient.id])})
+            events.append(CalendarEvent('discharge', '退院準備', build_url('patient_home', [patient.id])))
 
         elif not patient.discharge_date and treatment_start:
-            # Show discharge prep on the 30th treatment date (not next day)
+            # Show discharge prep on the last planned treatment date (not next day)
             if treatment_end_est and current == treatment_end_est:
-                day_info['events'].append({'type': 'discharge', 'label': '退院準備', 'url': build_url('patient_home', [patient.id])})
+                events.append(CalendarEvent('discharge', '退院準備', build_url('patient_home', [patient.id])))
 
         current_week.append(day_info)
         
@@ -595,7 +582,7 @@ def generate_calendar_weeks(patient):
             # 該当日の day_info を探す
             for week in calendar_weeks:
                 for day in week:
-                    if day['date'] == we:
+                    if day.date == we:
                         existing = Assessment.objects.filter(patient=patient, timing=timing).exists()
                         # 括弧書き（HAM-D）と日付 (mm/dd) を除去したシンプル表記
                         label = {
@@ -613,76 +600,28 @@ def generate_calendar_weeks(patient):
                         else:
                             url = build_url('assessment_add', [patient.id, timing], query={'from': 'clinical_path', 'date': we.strftime('%Y-%m-%d')})
                             
-                        event = {
-                            'type': 'assessment',
-                            'label': label,
-                            'url': url,
-                            'date': we,
-                            'timing': timing,
-                            'window_end': we
-                        }
-                        day['events'].append(event)
+                        event = CalendarEvent('assessment', label, url, timing=timing, window_end=we)
+                        day.events.append(event)
                         assessment_events.append(event)
                         break
     
     return calendar_weeks, assessment_events
 
-HAMD_ANCHORS = {
-    "q1": "0. なし\n1. 質問をされた時のみ示される（一時的、軽度のうつ状態）\n2. 自ら言葉で訴える（持続的、軽度から中等度のうつ状態）\n3. 言葉を使わなくとも伝わる（例えば、表情・姿勢・声・涙もろさ）（持続的、中等度から重度のうつ状態）\n4. 言語的にも、非言語的にも、事実上こうした気分の状態のみが、自然に表現される（持続的、極めて重度のうつ状態、希望のなさや涙もろさが顕著）",
-    "q2": "0. なし\n1. 自己非難、他人をがっかりさせたという思い（生産性の低下に対する自責感のみ）\n2. 過去の過ちや罪深い行為に対する、罪責観念や思考の反復（罪責、後悔、あるいは恥の感情）\n3. 現在の病気は自分への罰であると考える、罪責妄想（重度で広範な罪責感）\n4. 非難や弾劾するような声が聞こえ、そして（あるいは）脅されるような幻視を体験する",
-    "q3": "0. なし\n1. 生きる価値がないと感じる\n2. 死ねたらという願望、または自己の死の可能性を考える\n3. 自殺念慮、自殺をほのめかす行動をとる\n4. 自殺を企図する",
-    "q4": "0. 入眠困難はない\n1. 時々寝つけない、と訴える（すなわち、30分以上、週に2-3日）\n2. 夜ごと寝つけない、と訴える（すなわち、30分以上、週に4日以上）",
-    "q5": "0. 熟眠困難はない\n1. 夜間、睡眠が不安定で、妨げられると訴える（または、時々、すなわち週に2-3日、夜中に30分以上覚醒している）\n2. 夜中に目が覚めてしまう―トイレ以外で、寝床から出てしまういかなる場合も含む（しばしば、すなわち週に4日以上、夜中に30分以上覚醒している）",
-    "q6": "0. 早朝睡眠に困難はない\n1. 早朝に目が覚めるが、再び寝つける（時々、すなわち、週に2～3日、早朝に30分以上目が覚める）\n2. 一度起き出すと、再び寝つくことはできない（しばしば、すなわち、週に4日以上、早朝に30分以上目が覚める）",
-    "q7": "0. 困難なくできる\n1. 活動、仕事、あるいは趣味に関連して、それができない、疲れる、弱気であるといった思いがある（興味や喜びは軽度減退しているが、機能障害は明らかではない）\n2. 活動・趣味・仕事に対する興味の喪失―患者が直接訴える、あるいは、気乗りのなさ、優柔不断、気迷いから間接的に判断される（仕事や活動をするのに無理せざるを得ないと感じる興味や喜び、機能は明らかに減退している）\n3. 活動に費やす実時間の減少、あるいは生産性の低下（興味や喜び、機能の深刻な減退）\n4. 現在の病気のために、働くことをやめた（病気のために仕事あるいは主要な役割を果たすことができない、そして興味も完全に喪失している）",
-    "q8": "0. 発話・思考は正常である\n1. 面接時に軽度の遅滞が認められる（または、軽度の精神運動抑制）\n2. 面接時に明らかな遅滞が認められる（すなわち、中等度、面接はいくらか困難；話は途切れがちで、思考速度は遅い）\n3. 面接は困難である（重度の精神運動抑制、話はかなり長く途切れてしまい、面接は非常に困難）\n4. 完全な昏迷（極めて重度の精神運動抑制：昏迷：面接はほとんど不可能）",
-    "q9": "0. なし（正常範囲内の動作）\n1. そわそわする\n2. 手や髪などをいじくる\n3. 動き回る、じっと座っていられない\n4. 手を握りしめる、爪を噛む、髪を引っ張る、唇を噛む（面接は不可能）",
-    "q10": "0. 問題なし\n1. 主観的な緊張とイライラ感（軽度、一時的）\n2. 些細な事柄について悩む（中等度、多少の苦痛をもたらす、あるいは実在する問題に過度に悩んでいる）\n3. 心配な態度が顔つきや話し方から明らかである（重度：不安のために機能障害が生じている）\n4. 疑問の余地なく恐怖が表出されている（何もできない程の症状）",
-    "q11": "0. なし\n1. 軽度（症状は時々出現するのみ、機能の障害はない。わずかな苦痛）\n2. 中等度（症状はより持続する、普段の活動に多少の支障をきたす、中等度の苦痛）\n3. 重度（顕著な機能の障害）\n4. 何もできなくなる",
-    "q12": "0. なし\n1. 食欲はないが、促されなくても食べている（普段より食欲はいくらか低下）\n2. 促されないと食事摂取が困難（あるいは、無理して食べなければならないかどうかに関わらず、食欲は顕著に低下している）",
-    "q13": "0. なし\n1. 手足や背中、あるいは頭の重苦しさ。背部痛、頭痛、筋肉痛。元気のなさや易疲労性（普段より気力はいくらか低下：軽度で一時的な、気力の喪失や筋肉の痛み／重苦しさ）\n2. 何らかの明白な症状（持続的で顕著な、気力の喪失や筋肉の痛み／重苦しさ）",
-    "q14": "0. なし\n1. 軽度（普段よりいくらか関心が低下）\n2. 重度（普段よりかなり関心が低下）",
-    "q15": "0. なし（不適切な心配はない、あるいは完全に安心できる）\n1. 体のことが気がかりである（自分の健康に関する多少の不適切な心配、または大丈夫だと言われているにも関わらず、わずかに心配している）\n2. 健康にこだわっている（しばしば自身の健康に対し過剰に心配する、あるいは医学的に大丈夫だと明言されているにも関わらず、特別な病気があると思い込んでいる）\n3. 訴えや助けを求めること等が頻繁にみられる（医師が確認できていない身体的問題があると確信している：身体的な健康についての誇張された、現実的でない心配）\n4. 心気妄想（例えば、体の一部が衰え、腐ってしまうと感じる、など、外来患者ではまれである）",
-    "q16": "現病歴による評価の場合：\n0. 体重減少なし、あるいは今回の病気による減少ではない\n1. 今回のうつ病により、おそらく体重が減少している\n2. （患者によると）うつ病により、明らかに体重が減少している",
-    "q17": "0. うつ状態であり病気であることを認める、または現在うつ状態でない\n1. 病気であることを認めるが、原因を粗食、働き過ぎ、ウィルス、休息の必要性などのせいにする（病気を否定するが、病気である可能性は認める、例えば「私はどこも悪いところはないと思います、でも他の人には悪く見えるようです」）\n2. 病気であることを全く認めない（病気であることを完全に否定する、例えば「私はうつ病ではありません、私は元気です」）",
-    # Q18: only B (degree of diurnal variation) is relevant for scoring/UI — A (timing) removed from display
-    "q18": "B. 日内変動がある場合、変動の程度をマークする。\n0. なし\n1. 軽度\n2. 重度",
-    "q19": "0. なし\n1. 軽度\n2. 中等度\n3. 重度\n4. 何もできなくなる",
-    "q20": "0. なし\n1. 疑念をもっている\n2. 関係念慮\n3. 被害関係妄想",
-    "q21": "0. なし\n1. 軽度\n2. 重度",
-}
-
-
-def _hamd_items():
-    items = [
-        ('q1', '1. 抑うつ気分', 4, HAMD_ANCHORS['q1']),
-        ('q2', '2. 罪責感', 4, HAMD_ANCHORS['q2']),
-        ('q3', '3. 自殺', 4, HAMD_ANCHORS['q3']),
-        ('q4', '4. 入眠障害', 2, HAMD_ANCHORS['q4']),
-        ('q5', '5. 熟眠障害', 2, HAMD_ANCHORS['q5']),
-        ('q6', '6. 早朝睡眠障害', 2, HAMD_ANCHORS['q6']),
-        ('q7', '7. 仕事と活動', 4, HAMD_ANCHORS['q7']),
-        ('q8', '8. 精神運動抑制', 4, HAMD_ANCHORS['q8']),
-        ('q9', '9. 精神運動激越', 4, HAMD_ANCHORS['q9']),
-        ('q10', '10. 不安, 精神症状', 4, HAMD_ANCHORS['q10']),
-        ('q11', '11. 不安, 身体症状', 4, HAMD_ANCHORS['q11']),
-        ('q12', '12. 身体症状, 消化器系', 2, HAMD_ANCHORS['q12']),
-        ('q13', '13. 身体症状, 一般的', 2, HAMD_ANCHORS['q13']),
-        ('q14', '14. 生殖器症状', 2, HAMD_ANCHORS['q14']),
-        ('q15', '15. 心気症', 4, HAMD_ANCHORS['q15']),
-        ('q16', '16. 体重減少', 2, HAMD_ANCHORS['q16']),
-        ('q17', '17. 病識', 2, HAMD_ANCHORS['q17']),
-        ('q18', '18. 日内変動', 2, HAMD_ANCHORS['q18']),
-        ('q19', '19. 現実感喪失・離人症', 4, HAMD_ANCHORS['q19']),
-        ('q20', '20. 妄想症状', 3, HAMD_ANCHORS['q20']),
-        ('q21', '21. 強迫症状', 2, HAMD_ANCHORS['q21']),
-    ]
-    return items, items[:11], items[11:]
 
 # ==========================================
 # ビュー関数
 # ==========================================
 
+# ダッシュボードのタスク群（live_kind, 表示情報）。週間タスクボード（views_task_board）と共通
+DASHBOARD_GROUPS = (
+    ('first_visit', {'title': "① 初診", 'color_class': "bg-g-first-visit", 'icon': "fa-user-plus"}),
+    ('admission', {'title': "② 入院", 'color_class': "bg-g-admission", 'icon': "fa-procedures"}),
+    ('mapping', {'title': "③ 位置決め", 'color_class': "bg-g-mapping", 'icon': "fa-crosshairs"}),
+    ('treatment', {'title': "④ 治療実施", 'color_class': "bg-g-treatment", 'icon': "fa-bolt"}),
+    ('assessment', {'title': "⑤ 尺度評価", 'color_class': "bg-g-assessment", 'icon': "fa-clipboard-check"}),
+    ('discharge', {'title': "⑥ 退院準備", 'color_class': "bg-g-discharge", 'icon': "fa-file-export"}),
+)
+
 @login_required
 def dashboard_view(request):
     jst_now = timezone.localtime(timezone.now())
@@ -694,17 +633,17 @@ def dashboard_view(request):
     target_date_display = f"{target_date.year}年{target_date.month}月{target_date.day}日 ({weekdays[target_date.weekday()]})"
     prev_day = target_date - timedelta(days=1); next_day = target_date + timedelta(days=1)
 
-    task_first_visit = [{'obj': p, 'status': "診察済", 'todo': "初診"} for p in Patient.objects.filter(created_at__date=target_date)]
+    task_first_visit = [{'obj': p, 'status': "診察済", 'todo': "初診"} for p in Patient.objects.lean().filter(created_at__date=target_date)]
     task_admission = []; task_mapping = []; task_treatment = []; task_assessment = []; task_discharge = []
 
-    for p in Patient.objects.filter(admission_date=target_date):
+    for p in Patient.objects.lean().filter(admission_date=target_date):
         status = "手続済" if p.is_admission_procedure_done else "要手続"; color = "success" if p.is_admission_procedure_done else "warning"
         task_admission.append({'obj': p, 'status': status, 'color': color, 'todo': "入院手続き"})
-    for p in Patient.objects.filter(mapping_date=target_date):
+    for p in Patient.objects.lean().filter(mapping_date=target_date):
         is_done = MappingSession.objects.filter(patient=p, date=target_date).exists()
         task_mapping.append({'obj': p, 'status': "実施済" if is_done else "実施未", 'color': "success" if is_done else "danger", 'todo': "MT測定"})
 
-    pre_candidates = Patient.objects.filter(admission_date__lte=target_date).filter(Q(first_treatment_date__isnull=True) | Q(first_treatment_date__gte=target_date))
+    pre_candidates = Patient.objects.lean().filter(admission_date__lte=target_date).filter(Q(first_treatment_date__isnull=True) | Q(first_treatment_date__gte=target_date))
     for p in pre_candidates:
         ws, we = get_assessment_window(p, 'baseline')
         if ws <= target_date <= we:
@@ -712,25 +651,18 @@ def dashboard_view(request):
             if not done: task_assessment.append({'obj': p, 'status': "実施未", 'color': "danger", 'timing_code': 'baseline', 'todo': f"治療前評価 ({we.strftime('%m/%d')})"})
             elif Assessment.objects.filter(patient=p, timing='baseline', date=target_date).exists(): task_assessment.append({'obj': p, 'status': "実施済", 'color': "success", 'timing_code': 'baseline', 'todo': "治療前評価 (完了)"})
 
-    active_candidates = Patient.objects.filter(first_treatment_date__lte=target_date).order_by('card_id')
+    active_candidates = Patient.objects.lean().filter(first_treatment_date__lte=target_date).order_by('card_id')
     for p in active_candidates:
-        # Use canonical treat_dates for session/week labels
-        info = None
-        if p.first_treatment_date:
-            tdates = generate_treatment_dates(p.first_treatment_date, total=30, holidays=JP_HOLIDAYS)
-            if target_date in tdates:
-                idx = tdates.index(target_date)
-                info = {
-                    'session_no': idx + 1,
-                    # Week number rolls over on the same weekday anchored to first treatment date
-                    'week_no': get_current_week_number(p.first_treatment_date, target_date)
-                }
+        # Use the protocol plan for session/week labels (week rolls over on the first treatment weekday)
+        plan = treatment_plan(p)
+        info = plan.session_info(target_date) if plan else None
 
         if info:
             n = info['session_no']
             week = info['week_no']
-            today_session = TreatmentSession.objects.filter(patient=p, date__date=target_date).first(); is_done = today_session is not None
-            todo_label = format_rtms_label(n, week)
+            planned_today = info['last_session_no'] - n + 1
+            is_done = TreatmentSession.objects.filter(patient=p, session_date=target_date).count() >= planned_today
+            todo_label = format_rtms_label(n, week, info['last_session_no'])
             task_treatment.append({'obj': p, 'note': '', 'status': "実施済" if is_done else "実施未", 'color': "success" if is_done else "danger", 'session_num': n, 'todo': todo_label})
         
         # Use get_assessment_window() for week3/week4/week6 to match clinical path windows
@@ -746,23 +678,24 @@ def dashboard_view(request):
         # Discharge readiness is handled below via confirmed/estimated dates; avoid DB-count based labels
 
     # 退院準備: 退院日が確定している患者
-    discharge_patients = Patient.objects.filter(discharge_date=target_date)
+    discharge_patients = Patient.objects.lean().filter(discharge_date=target_date)
     for p in discharge_patients:
         task_discharge.append({'obj': p, 'status': "退院準備", 'color': "info", 'todo': "サマリー・紹介状作成"})
 
     # 退院準備: 退院日未設定だが30回目治療日の患者（同日に表示）
     for p in active_candidates:
         if p.discharge_date: continue  # 既に上記で追加済み
-        if p.first_treatment_date:
-            tdates = generate_treatment_dates(p.first_treatment_date, total=30, holidays=JP_HOLIDAYS)
-            treatment_end_est = tdates[-1] if tdates else None
-        else:
-            treatment_end_est = None
+        plan = treatment_plan(p)
+        treatment_end_est = plan.end_date if plan else None
         if treatment_end_est and target_date == treatment_end_est:
             task_discharge.append({'obj': p, 'status': "退院準備（予定）", 'color': "info", 'todo': "サマリー・紹介状作成"})
 
-    dashboard_tasks = [{'list': task_first_visit, 'title': "① 初診", 'color_class': "bg-g-first-visit", 'icon': "fa-user-plus"}, {'list': task_admission, 'title': "② 入院", 'color_class': "bg-g-admission", 'icon': "fa-procedures"}, {'list': task_mapping, 'title': "③ 位置決め", 'color_class': "bg-g-mapping", 'icon': "fa-crosshairs"}, {'list': task_treatment, 'title': "④ 治療実施", 'color_class': "bg-g-treatment", 'icon': "fa-bolt"}, {'list': task_assessment, 'title': "⑤ 尺度評価", 'color_class': "bg-g-assessment", 'icon': "fa-clipboard-check"}, {'list': task_discharge, 'title': "⑥ 退院準備", 'color_class': "bg-g-discharge", 'icon': "fa-file-export"}]
-    return render(request, 'rtms_app/dashboard.html', {'today': target_date, 'target_date_display': target_date_display, 'prev_day': prev_day, 'next_day': next_day, 'today_raw': jst_now.date(), 'dashboard_tasks': dashboard_tasks})
+    lists = {'first_visit': task_first_visit, 'admission': task_admission, 'mapping': task_mapping, 'treatment': task_treatment, 'assessment': task_assessment, 'discharge': task_discharge}
+    dashboard_tasks = [{'list': lists[kind], 'live_kind': kind, **meta} for kind, meta in DASHBOARD_GROUPS]
+    # ライブ更新（SSE）: この日付と表示中の患者に関わる差分だけ受け取る
+    live_patient_ids = sorted({item['obj'].id for group in dashboard_tasks for item in group['list']})
+    live_url = build_url('live_events', query={'start': target_date.isoformat(), 'patients': ','.join(map(str, live_patient_ids))})
+    return render(request, 'rtms_app/dashboard.html', {'today': target_date, 'target_date_display': target_date_display, 'prev_day': prev_day, 'next_day': next_day, 'today_raw': jst_now.date(), 'dashboard_tasks': dashboard_tasks, 'live_url': live_url})
 
 @login_required
 def patient_list_view(request):
@@ -807,7 +740,7 @@ def patient_list_view(request):
     ordering = build_ordering(sort_param, direction)
 
     # ===== QuerySet（ここがポイント） =====
-    qs = Patient.objects.select_related('attending_physician').all()
+    qs = Patient.objects.lean().select_related('attending_physician')
 
     if q:
         qs = qs.filter(name__icontains=q)
@@ -946,9 +879,9 @@ def mapping_add(request, patient_id):
         'can_view_audit': can_view_audit(request.user),
         # Unified plan bar variables
         'treatment_plan_start': patient.first_treatment_date,
-        'treatment_plan_end': get_completion_date(patient.first_treatment_date),
-        'today_session_no': get_session_number(patient.first_treatment_date, initial_date),
-        'total_sessions': 30,
+        'treatment_plan_end': get_planned_end_date(patient),
+        'today_session_no': get_planned_session_no(patient, initial_date),
+        'total_sessions': get_protocol(patient).total_sessions,
         'week_no': week_no_default,
     })
 
@@ -958,34 +891,10 @@ def patient_first_visit(request, patient_id):
     dashboard_date = request.GET.get('dashboard_date')
 
     # Referral source/doctor are entered at patient registration; first-visit UI doesn't edit them.
-    end_date_est = get_completion_date(patient.first_treatment_date)
+    end_date_est = get_planned_end_date(patient)
 
     # ---- HAM-D modal (baseline) ----
-    hamd_items = [
-        ('q1', '1. 抑うつ気分', 4, HAMD_ANCHORS['q1']),
-        ('q2', '2. 罪責感', 4, HAMD_ANCHORS['q2']),
-        ('q3', '3. 自殺', 4, HAMD_ANCHORS['q3']),
-        ('q4', '4. 入眠障害', 2, HAMD_ANCHORS['q4']),
-        ('q5', '5. 熟眠障害', 2, HAMD_ANCHORS['q5']),
-        ('q6', '6. 早朝睡眠障害', 2, HAMD_ANCHORS['q6']),
-        ('q7', '7. 仕事と活動', 4, HAMD_ANCHORS['q7']),
-        ('q8', '8. 精神運動抑制', 4, HAMD_ANCHORS['q8']),
-        ('q9', '9. 精神運動激越', 4, HAMD_ANCHORS['q9']),
-        ('q10', '10. 不安, 精神症状', 4, HAMD_ANCHORS['q10']),
-        ('q11', '11. 不安, 身体症状', 4, HAMD_ANCHORS['q11']),
-        ('q12', '12. 身体症状, 消化器系', 2, HAMD_ANCHORS['q12']),
-        ('q13', '13. 身体症状, 一般的', 2, HAMD_ANCHORS['q13']),
-        ('q14', '14. 生殖器症状', 2, HAMD_ANCHORS['q14']),
-        ('q15', '15. 心気症', 4, HAMD_ANCHORS['q15']),
-        ('q16', '16. 体重減少', 2, HAMD_ANCHORS['q16']),
-        ('q17', '17. 病識', 2, HAMD_ANCHORS['q17']),
-        ('q18', '18. 日内変動', 2, HAMD_ANCHORS['q18']),
-        ('q19', '19. 現実感喪失・離人症', 4, HAMD_ANCHORS['q19']),
-        ('q20', '20. 妄想症状', 3, HAMD_ANCHORS['q20']),
-        ('q21', '21. 強迫症状', 2, HAMD_ANCHORS['q21']),
-    ]
-    hamd_items_left = hamd_items[:11]
-    hamd_items_right = hamd_items[11:]
+    hamd_items, hamd_items_left, hamd_items_right = _hamd_items()
 
     baseline_assessment = Assessment.objects.filter(patient=patient, timing='baseline').first()
 
@@ -1076,9 +985,10 @@ def patient_first_visit(request, patient_id):
             q_data['q_details'] = (request.POST.get('q_details') or '').strip()
             p.questionnaire_data = q_data
 
-            # Save protocol_type (form or POST override)
-            protocol_type = request.POST.get('protocol_type') or 'INSURANCE'
-            p.protocol_type = protocol_type
+            # Save protocol_type (POST override; unknown codes keep the current protocol)
+            protocol_type = request.POST.get('protocol_type')
+            if get_protocol_by_code(protocol_type or ''):
+                p.protocol_type = protocol_type
 
             p.save()
 
@@ -1111,6 +1021,7 @@ def patient_first_visit(request, patient_id):
         'patient': patient,
         'form': form,
         'end_date_est': end_date_est,
+        'protocol_choices': PROTOCOL_CHOICES,
         'dashboard_date': dashboard_date,
         'baseline_assessment': baseline_assessment,
         'questionnaire_done': questionnaire_done,
@@ -1457,25 +1368,35 @@ def treatment_add(request, patient_id):
         """
     )
 
-    if patient.first_treatment_date:
-        tdates = generate_treatment_dates(patient.first_treatment_date, total=30, holidays=JP_HOLIDAYS)
-        if initial_date in tdates:
-            idx = tdates.index(initial_date)
-            week_num = get_current_week_number(patient.first_treatment_date, initial_date)
-            session_num = idx + 1
-        plan_start_date = patient.first_treatment_date
-        plan_end_date = get_completion_date(patient.first_treatment_date)
-        total_planned_sessions = len(tdates) if tdates else 30
+    # 1日複数回のプロトコルでは ?slot=2 で2回目を記録する（TreatmentSession.slot）
+    protocol = get_protocol(patient)
+    try:
+        slot_num = min(max(int(request.GET.get('slot') or 1), 1), protocol.sessions_per_day)
+    except ValueError:
+        slot_num = 1
+    plan = treatment_plan(patient)
+    if plan:
+        planned = [ps for ps in plan.sessions_on(initial_date) if ps.slot == slot_num]
+        if planned:
+            week_num = planned[0].week_no
+            session_num = planned[0].session_no
+        plan_start_date = plan.start
+        plan_end_date = plan.end_date
+        total_planned_sessions = plan.total
+        slot = plan.slot_value(slot_num)
     else:
         plan_start_date = None
         plan_end_date = None
-        total_planned_sessions = 30
+        total_planned_sessions = protocol.total_sessions
+        slot = ''
 
     if plan_start_date and plan_end_date and session_num and week_num:
         plan_date_range_text = (
             f"治療予定：{plan_start_date.strftime('%Y/%m/%d')}〜{plan_end_date.strftime('%Y/%m/%d')}"
         )
         course_session_text = f"{course_number}クール第{session_num}回（第{week_num}週）"
+        if protocol.sessions_per_day > 1:
+            course_session_text += f"・本日{slot_num}回目"
         # Backward-compatible combined form (used by older template fragments)
         plan_summary_text = f"{plan_date_range_text}｜{course_session_text}"
     
@@ -1487,7 +1408,7 @@ def treatment_add(request, patient_id):
         # Try to get mapping for current week_number
         current_week_mapping = MappingSession.objects.filter(patient=patient, course_number=course_number, week_number=week_num).order_by('-date').first()
     
-    end_date_est = get_completion_date(patient.first_treatment_date)
+    end_date_est = plan_end_date
     alert_msg = ""; instruction_msg = ""; is_remission = False
     last_assessment = Assessment.objects.filter(patient=patient, timing='week3').order_by('-date').first(); baseline_assessment = Assessment.objects.filter(patient=patient, timing='baseline').order_by('-date').first(); judgment_info = None
     if last_assessment:
@@ -1500,18 +1421,15 @@ def treatment_add(request, patient_id):
                 if imp_rate >= 0.2: judgment_info = f"有効 (改善率 {int(imp_rate*100)}%)"; instruction_msg = "【指示】有効性あり。治療を継続してください。"
                 else: judgment_info = f"無効/反応不良 (改善率 {int(imp_rate*100)}%)"; instruction_msg = "【指示】治療未反応。続行または中止を検討してください。"
             else: judgment_info = f"判定不能 (Baseデータなし)"
-        if is_remission and week_num >= 4:
+        # 漸減の週ごとの上限はプロトコル定義（protocols.ProtocolSpec.taper）に従う
+        taper_weeks = [w for w, _ in protocol.taper] if protocol.allow_early_taper else []
+        if is_remission and taper_weeks and week_num >= taper_weeks[0]:
             weekly_count = get_weekly_session_count(patient, initial_date); current_weekly = weekly_count + 1
-            if week_num == 4:
-                if current_weekly > 3: alert_msg = f"【制限超過】第4週(週3回まで)です。今回で週{current_weekly}回目になります。"
-                else: alert_msg = f"【漸減】第4週です。週3回まで (現在: 週{current_weekly}回目)"
-            elif week_num == 5:
-                if current_weekly > 2: alert_msg = f"【制限超過】第5週(週2回まで)です。今回で週{current_weekly}回目になります。"
-                else: alert_msg = f"【漸減】第5週です。週2回まで (現在: 週{current_weekly}回目)"
-            elif week_num == 6:
-                if current_weekly > 1: alert_msg = f"【制限超過】第6週(週1回まで)です。今回で週{current_weekly}回目になります。"
-                else: alert_msg = f"【漸減】第6週です。週1回まで (現在: 週{current_weekly}回目)"
-            elif week_num >= 7: alert_msg = "【警告】第7週以降のため、原則として治療は算定できません。"
+            limit = protocol.weekly_limit(week_num)
+            if limit is not None:
+                if current_weekly > limit: alert_msg = f"【制限超過】第{week_num}週(週{limit}回まで)です。今回で週{current_weekly}回目になります。"
+                else: alert_msg = f"【漸減】第{week_num}週です。週{limit}回まで (現在: 週{current_weekly}回目)"
+            elif week_num > taper_weeks[-1]: alert_msg = f"【警告】第{taper_weeks[-1] + 1}週以降のため、原則として治療は算定できません。"
     if request.method == 'POST':
         form = TreatmentForm(request.POST)
         if form.is_valid():
@@ -1520,7 +1438,6 @@ def treatment_add(request, patient_id):
             dt = datetime.datetime.combine(d, t); aware_dt = timezone.make_aware(dt)
             course_number = patient.course_number or 1
             session_date = d
-            slot = ''
             # Check safety conditions for warning
             safety_sleep = cleaned.get('safety_sleep', True)
             safety_alcohol = cleaned.get('safety_alcohol', True)
@@ -1548,137 +1465,31 @@ def treatment_add(request, patient_id):
                 'session_date': session_date,
                 'slot': slot,
             }
-            s, created = TreatmentSession.objects.update_or_create(
-                patient=patient,
-                course_number=course_number,
-                session_date=session_date,
-                slot=slot,
-                defaults=defaults
-            )
-
-            # Save Step6 confirm fields/flags and Step7 treat fields into meta
-            try:
-                meta = s.meta or {}
-                cps = (request.POST.get('confirm_pulse_seconds') or '').strip()
-                cmp = (request.POST.get('confirm_mt_percent') or '').strip()
-                cn = (request.POST.get('confirm_notes') or '').strip()
-                cd = request.POST.get('confirm_discomfort')
-                cm = request.POST.get('confirm_movement')
-                tn = (request.POST.get('treat_notes') or '').strip()
-                td = request.POST.get('treat_discomfort')
-                tm = request.POST.get('treat_movement')
-                
-                if cps:
-                    try:
-                        meta['confirm_pulse_seconds'] = float(cps)
-                    except Exception:
-                        pass
-                if cmp:
-                    try:
-                        meta['confirm_mt_percent'] = int(cmp)
-                    except Exception:
-                        pass
-                if cn:
-                    meta['confirm_notes'] = cn
-                
-                # チェックボックスはPOSTに含まれる場合のみTrue、含まれない場合はFalse
-                meta['confirm_discomfort'] = (cd == 'on')
-                meta['confirm_movement'] = (cm == 'on')
-                if tn:
-                    meta['treat_notes'] = tn
-                meta['treat_discomfort'] = (td == 'on')
-                meta['treat_movement'] = (tm == 'on')
-                
-                if meta != (s.meta or {}):
-                    s.meta = meta
-                    s.save(update_fields=['meta'])
-            except Exception:
-                pass
-
-            # Upsert SideEffectCheck linked to this session
+            # Side-effect rows from Step7
             rows_json = request.POST.get('side_effect_rows_json')
-            signature = request.POST.get('side_effect_signature', '')
-            memo = request.POST.get('side_effect_memo', '')
             try:
                 rows = json.loads(rows_json) if rows_json else []
             except Exception:
                 rows = []
 
-            sec, created = SideEffectCheck.objects.get_or_create(session=s)
-            sec.rows = rows or []
-            # Save provided memo and signature
-            sec.memo = memo or sec.memo or ""
-            sec.physician_signature = signature or sec.physician_signature or ""
-            sec.save()
-
-            # Consolidate side-effect memo into session meta so UI-unified memo appears
-            try:
-                smemo = sec.memo or ""
-                if smemo:
-                    meta = s.meta or {}
-                    # keep legacy keys for backward compatibility but set from unified memo
-                    meta['confirm_notes'] = smemo
-                    meta['treat_notes'] = smemo
-                    s.meta = meta
-                    s.save(update_fields=['meta'])
-            except Exception:
-                pass
-
-            # Upsert SeriousAdverseEvent if any SAE checkbox is checked
-            from .models import SeriousAdverseEvent
-            sae_fields = ['sae_seizure', 'sae_finger_muscle', 'sae_syncope', 'sae_mania', 'sae_suicide_attempt', 'sae_other']
-            sae_event_types = []
-            sae_map = {
-                'sae_seizure': 'seizure',
-                'sae_finger_muscle': 'finger_muscle',
-                'sae_syncope': 'syncope',
-                'sae_mania': 'mania',
-                'sae_suicide_attempt': 'suicide_attempt',
-                'sae_other': 'other',
-            }
-            for f in sae_fields:
-                if request.POST.get(f) == 'on':
-                    sae_event_types.append(sae_map[f])
-            
-            sae_other_text = (request.POST.get('sae_other_text') or '').strip()
-
-            if sae_event_types:
-                # Build snapshot: key info at time of SAE
-                try:
-                    snapshot = {
-                        'date': session_date.isoformat(),
-                        'mt_percent': s.mt_percent,
-                        'frequency_hz': str(s.frequency_hz),
-                        'train_seconds': str(s.train_seconds),
-                        'train_count': s.train_count,
-                        'total_pulses': s.total_pulses,
-                        'coil_type': s.coil_type,
-                        'target_site': s.target_site,
-                        'diagnosis': patient.diagnosis,
-                        # Medication snapshot (placeholder, adjust for your medication model)
-                        'medication_history': patient.medication_history,
-                        'age': patient.age,
-                        'gender': patient.get_gender_display(),
-                    }
-                except Exception:
-                    snapshot = {}
-
-                SeriousAdverseEvent.objects.update_or_create(
-                    patient=patient,
-                    course_number=course_number,
-                    session=s,
-                    defaults={
-                        'event_types': sae_event_types,
-                        'other_text': sae_other_text,
-                        'auto_snapshot': snapshot,
-                    }
-                )
-            else:
-                # No SAE events checked: delete existing record if any
-                SeriousAdverseEvent.objects.filter(patient=patient, course_number=course_number, session=s).delete()
+            action = request.POST.get('action')
+            # セッション・meta・副作用チェック・SAE をメモリ上で組み立て、1トランザクションで1行ずつ保存
+            s = save_treatment_record(TreatmentRecord(
+                patient=patient,
+                course_number=course_number,
+                session_date=session_date,
+                slot=slot,
+                fields=defaults,
+                meta_updates=meta_updates_from_post(request.POST),
+                side_effect_rows=rows,
+                side_effect_memo=request.POST.get('side_effect_memo', ''),
+                side_effect_signature=request.POST.get('side_effect_signature', ''),
+                sae_event_types=sae_event_types_from_post(request.POST),
+                sae_other_text=(request.POST.get('sae_other_text') or '').strip(),
+                skip=(action == 'skip'),
+            ))
             
             # Check if print action is requested
-            action = request.POST.get('action')
             if action == 'print':
                 # Redirect to print page (PRG) with explicit back_url
                 back_params = {'date': d.isoformat()}
@@ -1707,11 +1518,7 @@ def treatment_add(request, patient_id):
             # Skip action: mark this session as skipped and shift future planned sessions
             if action == 'skip':
                 from rtms_app.models import TreatmentSkip
-                try:
-                    s.status = 'skipped'
-                    s.save(update_fields=['status'])
-                except Exception:
-                    pass
+                # status='skipped' は save_treatment_record で保存済み
                 try:
                     shift_future_sessions(patient, session_date)
                 except Exception:
@@ -1771,7 +1578,8 @@ def treatment_add(request, patient_id):
     existing_session = TreatmentSession.objects.filter(
         patient=patient,
         course_number=course_number,
-        session_date=initial_date
+        session_date=initial_date,
+        slot=slot,
     ).order_by('-date').first()
     
     if existing_session:
@@ -1843,7 +1651,7 @@ def treatment_add(request, patient_id):
             m = alert_session.meta or {}
             d = alert_session.session_date
             # compute session number within plan
-            sess_no = get_session_number(patient.first_treatment_date, d) if patient.first_treatment_date else None
+            sess_no = get_planned_session_no(patient, d, alert_session.slot)
             d_str = f"{d.month}月{d.day}日"
             sec = m.get('confirm_pulse_seconds')
             pct = m.get('confirm_mt_percent')
@@ -2021,6 +1829,8 @@ def treatment_add(request, patient_id):
         'initial_date': initial_date,
         'session_num': session_num,
         'week_num': week_num,
+        'slot_num': slot_num,
+        'slot_choices': range(1, protocol.sessions_per_day + 1) if protocol.sessions_per_day > 1 else [],
         'end_date_est': end_date_est,
         'start_date': patient.first_treatment_date,
         'dashboard_date': dashboard_date,
@@ -2181,15 +1991,32 @@ def assessment_week4(request, patient_id):
 
 
 def _planned_discharge_date(patient):
-    """Return planned discharge date (30th treatment + 1 day) if actual discharge is missing."""
+    """Return planned discharge date (last planned treatment + 1 day) if actual discharge is missing."""
     if patient.discharge_date:
         return patient.discharge_date
-    if not patient.first_treatment_date:
+    plan = treatment_plan(patient)
+    if not plan or not plan.end_date:
         return None
-    planned_dates = generate_treatment_dates(patient.first_treatment_date, total=30, holidays=JP_HOLIDAYS)
-    if not planned_dates:
+    return plan.end_date + timedelta(days=1)
+
+
+def stay_interval(patient):
+    """入院期間 [入院日, 退院日（未定なら予定日）) 。どちらかが無ければ None。"""
+    planned_discharge = _planned_discharge_date(patient)
+    if patient.admission_date and planned_discharge:
+        return patient.admission_date, planned_discharge
+    return None
+
+
+def course_interval(patient):
+    """治療クール [初回治療日, 最終治療日の翌日) 。退院日が先ならそこで打ち切る。"""
+    plan = treatment_plan(patient)
+    if not plan or not plan.end_date:
         return None
-    return planned_dates[-1] + timedelta(days=1)
+    end = plan.end_date + timedelta(days=1)
+    if patient.discharge_date:
+        end = min(end, patient.discharge_date)
+    return patient.first_treatment_date, end
 
 
 def _build_month_calendar(year: int, month: int, is_print: bool = False):
@@ -2204,119 +2031,83 @@ def _build_month_calendar(year: int, month: int, is_print: bool = False):
     grid_start = first_day - timedelta(days=first_day.weekday())
     grid_end = last_day + timedelta(days=(6 - last_day.weekday()))
 
-    # All sessions in range (for counts + per-day events)
-    sessions_qs = (
-        TreatmentSession.objects
-        .filter(session_date__range=[grid_start, grid_end])
-        .select_related('patient', 'performer')
-        .order_by('patient_id', 'course_number', 'session_date', 'date', 'id')
-    )
+    # All sessions in range (for counts + per-day events), numbered from the start of
+    # each course (not of the grid) so they line up with the plan's session numbers
+    sessions_in_grid = sessions_between(grid_start, grid_end, TreatmentSession.objects.select_related('patient'))
 
-    # Assign session numbers per patient+course in chronological order
-    session_numbers = {}
-    last_key = None
-    counter = 0
-    for s in sessions_qs:
-        key = (s.patient_id, s.course_number)
-        if key != last_key:
-            counter = 0
-            last_key = key
-        counter += 1
-        session_numbers[s.id] = counter
-
-    rtms_counts = defaultdict(int)
     day_treatment_events = defaultdict(list)
     actual_session_numbers = defaultdict(set)  # (pid, course) -> set of session numbers
-    for s in sessions_qs:
-        rtms_counts[s.session_date] += 1
-        session_no = session_numbers.get(s.id, 0)
+    for s in sessions_in_grid:
+        session_no = s.ordinal
         actual_session_numbers[(s.patient_id, s.course_number)].add(session_no)
-        day_treatment_events[s.session_date].append({
-            'label': f"治療{session_no}回 {s.patient.name}",
-            'kind': 'treatment',
-            'patient_id': s.patient_id,
-            'session_id': s.id,
-            'url': build_url('treatment_add', [s.patient_id], {'date': s.session_date.isoformat()}),
-            'is_planned': False,
-            'sort_key': 30 + session_no,  # treatment order later
-        })
+        day_treatment_events[s.session_date].append(CalendarEvent(
+            'treatment', f"治療{session_no}回 {s.patient.name}",
+            build_url('treatment_add', [s.patient_id], {'date': s.session_date.isoformat()}),
+            patient_id=s.patient_id,
+            session_id=s.id,
+            sort_key=30 + session_no,  # treatment order later
+        ))
 
     # Patients possibly overlapping this grid
-    patients = Patient.objects.filter(
+    patients = Patient.objects.lean().filter(
         Q(admission_date__isnull=False) | Q(first_treatment_date__isnull=False)
     )
 
-    inpatient_counts = defaultdict(int)
+    stays = []
     events_by_date = defaultdict(list)
 
     for p in patients:
         # 初診（登録日）
         first_visit = p.created_at.date() if hasattr(p, "created_at") and p.created_at else None
         if first_visit and grid_start <= first_visit <= grid_end:
-            events_by_date[first_visit].append({
-                'label': f"初診 {p.name}",
-                'kind': 'first-visit',
-                'patient_id': p.id,
-                'url': build_url('patient_first_visit', [p.id])
-            })
+            events_by_date[first_visit].append(CalendarEvent(
+                'first-visit', f"初診 {p.name}", build_url('patient_first_visit', [p.id]), patient_id=p.id,
+            ))
 
         planned_discharge = _planned_discharge_date(p)
-        # Inpatient window
+        # Inpatient window（日ごとの人数は下でまとめて census から求める）
         if p.admission_date and planned_discharge:
-            start = max(p.admission_date, grid_start)
-            end_excl = min(planned_discharge, grid_end + timedelta(days=1))
-            cur = start
-            while cur < end_excl:
-                inpatient_counts[cur] += 1
-                cur += timedelta(days=1)
+            stays.append((p.admission_date, planned_discharge))
 
         # Events
         if p.admission_date and grid_start <= p.admission_date <= grid_end:
-            events_by_date[p.admission_date].append({
-                'label': f"入院 {p.name}",
-                'kind': 'admission',
-                'patient_id': p.id,
-                'url': build_url('admission_procedure', [p.id])
-            })
-
-        # Planned treatments up to 30 (skip those already done)
-        if p.first_treatment_date:
-            planned_dates = generate_treatment_dates(p.first_treatment_date, total=30, holidays=JP_HOLIDAYS)
+            events_by_date[p.admission_date].append(CalendarEvent(
+                'admission', f"入院 {p.name}", build_url('admission_procedure', [p.id]), patient_id=p.id,
+            ))
+
+        # Planned treatments of the protocol plan (skip those already done)
+        plan = treatment_plan(p)
+        if plan:
+            planned = plan.sessions
             # Filter out treatments on or after discharge_date
             if p.discharge_date:
-                planned_dates = [d for d in planned_dates if d < p.discharge_date]
+                planned = [ps for ps in planned if ps.date < p.discharge_date]
             actual_nos = actual_session_numbers.get((p.id, p.course_number), set())
-            for idx, d in enumerate(planned_dates, start=1):
+            for ps in planned:
+                idx, d = ps.session_no, ps.date
                 if idx in actual_nos:
                     continue
                 if grid_start <= d <= grid_end:
-                    events_by_date[d].append({
-                        'label': f"治療{idx}回 (予定) {p.name}",
-                        'kind': 'treatment',
-                        'patient_id': p.id,
-                        'url': build_url('treatment_add', [p.id], {'date': d.isoformat()}),
-                        'is_planned': True,
-                        'sort_key': 30 + idx,
-                    })
+                    query = {'date': d.isoformat(), 'slot': ps.slot} if plan.multi_slot else {'date': d.isoformat()}
+                    events_by_date[d].append(CalendarEvent(
+                        'treatment', f"治療{idx}回 (予定) {p.name}",
+                        build_url('treatment_add', [p.id], query),
+                        patient_id=p.id,
+                        is_planned=True,
+                        sort_key=30 + idx,
+                    ))
 
         if p.discharge_date and grid_start <= p.discharge_date <= grid_end:
-            events_by_date[p.discharge_date].append({
-                'label': f"退院 {p.name}",
-                'kind': 'discharge',
-                'patient_id': p.id,
-                'url': build_url('patient_home', [p.id]),
-                'is_planned': False,
-                'sort_key': 20,
-            })
+            events_by_date[p.discharge_date].append(CalendarEvent(
+                'discharge', f"退院 {p.name}", build_url('patient_home', [p.id]), patient_id=p.id,
+            ))
         elif planned_discharge and grid_start <= planned_discharge <= grid_end:
-            events_by_date[planned_discharge].append({
-                'label': f"退院予定 {p.name}",
-                'kind': 'discharge',
-                'patient_id': p.id,
-                'url': build_url('patient_home', [p.id]),
-                'is_planned': True,
-                'sort_key': 20,
-            })
+            events_by_date[planned_discharge].append(CalendarEvent(
+                'discharge', f"退院予定 {p.name}", build_url('patient_home', [p.id]), patient_id=p.id, is_planned=True,
+            ))
+
+    rtms_census = census_from_days((s.session_date for s in sessions_in_grid), grid_start, grid_end)
+    inpatient_census = census_from_intervals(stays, grid_start, grid_end)
 
     # Build day cells
     days = []
@@ -2324,59 +2115,37 @@ def _build_month_calendar(year: int, month: int, is_print: bool = False):
     while cur <= grid_end:
         day_events = events_by_date.get(cur, [])
         day_events.extend(day_treatment_events.get(cur, []))
-
-        # Normalize to 4 kinds only
-        normalized = []
-        for ev in day_events:
-            kind = ev.get('kind')
-            is_planned = ev.get('is_planned', False)
-            sort_key = ev.get('sort_key')
-            if sort_key is None:
-                if kind == 'admission':
-                    sort_key = 10
-                elif kind == 'discharge':
-                    sort_key = 20
-                elif kind == 'treatment':
-                    sort_key = 30
-                elif kind == 'first-visit':
-                    sort_key = 90
-                else:
-                    sort_key = 99
-            normalized.append({**ev, 'kind': kind, 'is_planned': is_planned, 'sort_key': sort_key})
-
-        normalized.sort(key=lambda x: (x.get('sort_key', 99), x.get('label', '')))
+        # sort_key は CalendarEvent 生成時に種別から決まっている
+        day_events.sort(key=event_order)
 
         # Limit visible events
-        visible = normalized[:MAX_EVENTS_PER_DAY]
-        hidden_count = max(len(normalized) - MAX_EVENTS_PER_DAY, 0)
+        hidden_count = max(len(day_events) - MAX_EVENTS_PER_DAY, 0)
+        if hidden_count:
+            del day_events[MAX_EVENTS_PER_DAY:]
 
         # Check if holiday
-        holiday_name = None
-        is_holiday = False
-        if jpholiday:
-            holiday_name = jpholiday.is_holiday_name(cur)
-            is_holiday = holiday_name is not None
-
-        days.append({
-            'date': cur,
-            'is_current_month': cur.month == month,
-            'weekday': cur.weekday(),
-            'rtms_count': rtms_counts.get(cur, 0),
-            'inpatient_count': inpatient_counts.get(cur, 0),
-            'events_visible': visible,
-            'events_hidden_count': hidden_count,
-            'day_url': build_url('dashboard', query={'date': cur.isoformat()}),
-            'is_holiday': is_holiday,
-            'holiday_name': holiday_name,
-        })
+        holiday_name = jp_holiday_name(cur)
+        is_holiday = holiday_name is not None
+
+        days.append(DayCell(
+            date=cur,
+            url=build_url('dashboard', query={'date': cur.isoformat()}),
+            events=day_events,
+            is_holiday=is_holiday,
+            holiday_name=holiday_name,
+            is_current_month=cur.month == month,
+            rtms_count=rtms_census.count(cur),
+            inpatient_count=inpatient_census.count(cur),
+            events_hidden_count=hidden_count,
+        ))
         cur += timedelta(days=1)
 
     weeks = []
     for i in range(0, len(days), 7):
         weeks.append(days[i:i+7])
 
-    peak_rtms = max(rtms_counts.values()) if rtms_counts else 0
-    peak_inpatients = max(inpatient_counts.values()) if inpatient_counts else 0
+    peak_rtms, _ = rtms_census.peak()
+    peak_inpatients, _ = inpatient_census.peak()
 
     prev_month_date = first_day - timedelta(days=1)
     next_month_date = last_day + timedelta(days=1)
@@ -2411,6 +2180,13 @@ def calendar_month_view(request):
         month = today.month
 
     data = _build_month_calendar(year, month, is_print=False)
+    # ライブ更新（SSE）: 表示中のグリッド範囲と、イベントが出ている患者の差分を受け取る
+    live_patient_ids = sorted({ev.patient_id for week in data['weeks'] for day in week for ev in day.events if ev.patient_id})
+    data['live_url'] = build_url('live_events', query={
+        'start': data['grid_start'].isoformat(),
+        'end': data['grid_end'].isoformat(),
+        'patients': ','.join(map(str, live_patient_ids)),
+    })
     return render(request, "rtms_app/calendar_month.html", data)
 
 
@@ -2943,9 +2719,9 @@ def patient_summary_view(request, patient_id):
         'can_view_audit': can_view_audit(request.user),
         # Unified plan bar variables
         'treatment_plan_start': patient.first_treatment_date,
-        'treatment_plan_end': get_completion_date(patient.first_treatment_date),
+        'treatment_plan_end': get_planned_end_date(patient),
         'today_session_no': sessions.count() if sessions.exists() else 0,
-        'total_sessions': 30,
+        'total_sessions': get_protocol(patient).total_sessions,
         'week_no': plan_week_no,
     })
     
@@ -2970,12 +2746,22 @@ def patient_add_view(request):
     else: form = PatientRegistrationForm()
     return render(request, 'rtms_app/patient_add.html', {'form': form, 'referral_options': referral_options})
 
-@login_required
+TREATMENT_CSV_HEADER = ['ID', '氏名', '実施日時', 'MT値', '刺激強度(%MT)', 'パルス数', '実施者', '副作用']
+
+
+def treatment_csv_row(t):
+    se_str = json.dumps(t.side_effects, ensure_ascii=False) if t.side_effects else ""
+    return [t.patient.card_id, t.patient.name, t.date.strftime('%Y-%m-%d %H:%M'), t.motor_threshold, t.intensity, t.total_pulses, t.performer.username if t.performer else "", se_str]
+
+
+@superuser_required
 def export_treatment_csv(request):
-    response = HttpResponse(content_type='text/csv; charset=utf-8-sig'); response['Content-Disposition'] = 'attachment; filename="treatment_data.csv"'; writer = csv.writer(response); writer.writerow(['ID', '氏名', '実施日時', 'MT値', '刺激強度(%MT)', 'パルス数', '実施者', '副作用'])
-    treatments = TreatmentSession.objects.all().select_related('patient', 'performer').order_by('date')
+    # 1回でエンコードする（行ごとに書くと utf-8-sig の BOM が各行に付く）
+    buf = io.StringIO(); writer = csv.writer(buf); writer.writerow(TREATMENT_CSV_HEADER)
+    treatments = TreatmentSession.objects.all().select_related('patient', 'performer').order_by('date', 'id')
     rows = treatments.count()
-    for t in treatments: se_str = json.dumps(t.side_effects, ensure_ascii=False) if t.side_effects else ""; writer.writerow([t.patient.card_id, t.patient.name, t.date.strftime('%Y-%m-%d %H:%M'), t.motor_threshold, t.intensity, t.total_pulses, t.performer.username if t.performer else "", se_str])
+    for t in treatments: writer.writerow(treatment_csv_row(t))
+    response = HttpResponse(buf.getvalue(), content_type='text/csv; charset=utf-8-sig'); response['Content-Disposition'] = 'attachment; filename="treatment_data.csv"'
     meta = {
         'export_type': 'csv',
         'filters': {},
@@ -2984,12 +2770,11 @@ def export_treatment_csv(request):
     log_audit_action(None, 'EXPORT', 'TreatmentSession', '', '治療データCSVエクスポート', meta)
     return response
 
-@login_required
+@superuser_required
 def download_db(request):
-    if not request.user.is_staff: return HttpResponse("Forbidden", 403)
     db_path = settings.DATABASES['default']['NAME']
     if os.path.exists(db_path): return FileResponse(open(db_path, 'rb'), as_attachment=True, filename='db.sqlite3')
-    return HttpResponse("Not found", 404)
+    return HttpResponse("Not found", status=404)
 
 def custom_logout(request):
     logout(request)
@@ -3097,7 +2882,7 @@ def patient_print_bundle(request, patient_id):
 
     assessments = Assessment.objects.filter(patient=patient).order_by("date")
 
-    end_date_est = get_completion_date(patient.first_treatment_date)
+    end_date_est = get_planned_end_date(patient)
     today = timezone.now().date()
     back_url = return_to or reverse("rtms_app:patient_first_visit", args=[patient.id])
 
@@ -3268,13 +3053,16 @@ def audit_logs_view(request, patient_id):
         'dashboard_date': dashboard_date,
     })
 
-@login_required
-def latest_consent(request):
+def latest_consent_url():
     doc = ConsentDocument.objects.order_by("-uploaded_at").first()
     if doc and doc.file:
-        return redirect(doc.file.url)
+        return doc.file.url
     # アップロードが無い / 初期化で消えた → 静的ファイルへフォールバック
-    return redirect(static("rtms_app/docs/consent_default.pdf"))
+    return static("rtms_app/docs/consent_default.pdf")
+
+@login_required
+def latest_consent(request):
+    return redirect(latest_consent_url())
 
 @login_required
 @require_http_methods(["POST"])
@@ -3357,10 +3145,13 @@ def export_research_csv(request):
     
     if request.method == 'GET':
         # Show category selection form
+        from .services.research_dataset import available_formats
+
         categories = exporter.get_category_choices()
         context = {
             'categories': categories,
             'title': '研究用CSVエクスポート',
+            'dataset_formats': available_formats(),
         }
         return render(request, 'rtms_app/export_research_csv.html', context)
     
@@ -3374,7 +3165,7 @@ def export_research_csv(request):
         exporter = ResearchCSVExporter(selected_categories=selected_categories)
         
         # Fetch all patients (consider pagination for large datasets)
-        patients = Patient.objects.all().order_by('card_id', 'course_number')
+        patients = Patient.objects.lean(*ResearchCSVExporter.PATIENT_FIELDS).order_by('card_id', 'course_number')
         
         # Prepare data: list of (patient, related_data) tuples
         patients_data = [(p, None) for p in patients]
@@ -3395,17 +3186,44 @@ def export_research_csv(request):
         return response
 
 
-@login_required
+@superuser_required
+@require_http_methods(['POST'])
+def export_research_dataset(request):
+    """
+    Export the research data as a typed columnar dataset (zip of Parquet or
+    NPZ tables + schema.json). Same category selection as export_research_csv.
+
+    Restricted to superusers only.
+    """
+    from .services.export_research import ResearchCSVExporter
+    from .services.research_dataset import research_tables, write_dataset
+
+    selected_categories = [
+        c for c in request.POST.getlist('categories') if c in ResearchCSVExporter.CATEGORIES
+    ] or list(ResearchCSVExporter.CATEGORIES.keys())
+
+    buf = io.BytesIO()
+    fmt = write_dataset(buf, research_tables(selected_categories), request.POST.get('format'))
+
+    log_audit_action(
+        None, 'EXPORT', 'ResearchDataset', '',
+        f'研究用データセット({fmt}): {len(selected_categories)}カテゴリ選択',
+        {'selected_categories': selected_categories, 'format': fmt}
+    )
+
+    response = HttpResponse(buf.getvalue(), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="research_dataset_{timezone.now().strftime("%Y%m%d_%H%M%S")}.zip"'
+    return response
+
+
+@superuser_required
 @require_http_methods(['GET', 'POST'])
 def admin_backup(request):
     """
-    Admin backup management screen.
+    Admin backup management screen (superusers only).
     GET: Show backup/export options
     POST: Handle dumpdata JSON export
     """
-    if not request.user.is_staff:
-        return redirect('login')
-    
     if request.method == 'GET':
         context = {
             'title': 'バックアップ管理',
@@ -0,0 +1,121 @@
+"""
+コホート集計ページと JSON API（研究用CSVエクスポートと同じくスーパーユーザーのみ）
+
+- コホート成績（HAM-D）: services.cohort_analytics で全クールの反応率・寛解率・改善率・
+  重症度分布と反応までの評価週（Kaplan-Meier）を、クール数・紹介元・プロトコル・期間ごとに集計する。
+
+    GET ?by=course|referral|protocol|period&endpoint=final|week3|week4|week6
+        &period=month|quarter|year&start=YYYY-MM-DD&end=YYYY-MM-DD
+
+- 副作用発現率: services.side_effect_facts で項目 × 治療週の発現率を集計する。
+
+    GET ?phase=before|during|after|unspecified&min_grade=1..3&start=YYYY-MM-DD&end=YYYY-MM-DD
+"""
+from django.http import JsonResponse
+from django.shortcuts import render
+from django.utils.dateparse import parse_date
+
+from .models import SideEffectObservation
+from .services.cohort_analytics import ENDPOINTS, GROUP_BY, PERIODS, analyze, load_cohort
+from .services.side_effect_facts import MAX_GRADE, incidence_report
+from .views import superuser_required
+
+GROUP_BY_LABELS = {'course': 'クール数', 'referral': '紹介元', 'protocol': 'プロトコル', 'period': '期間'}
+ENDPOINT_LABELS = {'final': '最終評価', 'week3': '第3週', 'week4': '第4週', 'week6': '第6週'}
+PERIOD_LABELS = {'month': '月', 'quarter': '四半期', 'year': '年'}
+
+
+def _date_params(request, params):
+    """start / end を params に入れ、不正ならエラー文字列を返す。"""
+    for key in ('start', 'end'):
+        raw = request.GET.get(key) or ''
+        try:
+            params[key] = parse_date(raw) if raw else None
+        except ValueError:
+            params[key] = None
+        if raw and params[key] is None:
+            return f"invalid {key}"
+    return None
+
+
+def _params(request):
+    """クエリを検証して (params, error) を返す。"""
+    params = {
+        'by': request.GET.get('by') or 'course',
+        'endpoint': request.GET.get('endpoint') or 'final',
+        'period': request.GET.get('period') or 'year',
+    }
+    for key, allowed in (('by', GROUP_BY), ('endpoint', ENDPOINTS), ('period', PERIODS)):
+        if params[key] not in allowed:
+            return params, f"{key} must be one of {', '.join(allowed)}"
+    return params, _date_params(request, params)
+
+
+def _report(params):
+    cohort = load_cohort(params['start'], params['end'])
+    report = analyze(cohort, by=params['by'], endpoint=params['endpoint'], period=params['period'])
+    report['start'] = params['start']
+    report['end'] = params['end']
+    return report
+
+
+@superuser_required
+def cohort_analytics_api(request):
+    params, error = _params(request)
+    if error:
+        return JsonResponse({'error': error}, status=400)
+    return JsonResponse(_report(params), json_dumps_params={'ensure_ascii': False})
+
+
+@superuser_required
+def cohort_analytics(request):
+    params, error = _params(request)
+    report = None if error else _report(params)
+    return render(request, 'rtms_app/cohort_analytics.html', {
+        'params': params,
+        'error': error,
+        'report': report,
+        'group_by_choices': GROUP_BY_LABELS.items(),
+        'endpoint_choices': ENDPOINT_LABELS.items(),
+        'period_choices': PERIOD_LABELS.items(),
+    })
+
+
+PHASE_LABELS = dict(SideEffectObservation.PHASE_CHOICES)
+
+
+def _side_effect_params(request):
+    params = {'phase': request.GET.get('phase') or '', 'min_grade': request.GET.get('min_grade') or '1'}
+    if params['phase'] and params['phase'] not in PHASE_LABELS:
+        return params, f"phase must be one of {', '.join(PHASE_LABELS)}"
+    if params['min_grade'] not in [str(g) for g in range(1, MAX_GRADE + 1)]:
+        return params, f"min_grade must be 1..{MAX_GRADE}"
+    params['min_grade'] = int(params['min_grade'])
+    return params, _date_params(request, params)
+
+
+def _side_effect_report(params):
+    report = incidence_report(params['start'], params['end'], params['phase'] or None, params['min_grade'])
+    report['start'] = params['start']
+    report['end'] = params['end']
+    return report
+
+
+@superuser_required
+def side_effect_incidence_api(request):
+    params, error = _side_effect_params(request)
+    if error:
+        return JsonResponse({'error': error}, status=400)
+    return JsonResponse(_side_effect_report(params), json_dumps_params={'ensure_ascii': False})
+
+
+@superuser_required
+def side_effect_incidence(request):
+    params, error = _side_effect_params(request)
+    return render(request, 'rtms_app/side_effect_incidence.html', {
+        'params': params,
+        'error': error,
+        'report': None if error else _side_effect_report(params),
+        'phase_choices': PHASE_LABELS.items(),
+        'grade_choices': range(1, MAX_GRADE + 1),
+    })
@@ -0,0 +1,133 @@
+"""
+ASGI 配信用の非同期ビュー（I/O 待ちの長いエンドポイント）
+
+RTMS_ASYNC_VIEWS が有効なとき（config/asgi.py で起動した場合）に urls.py が同名の
+同期ビューの代わりにこちらを使う。
+
+- ファイル（SQLite のダウンロード）は utils.async_io のチャンク読み込みで流し、
+  遅いクライアントへの送信待ちでスレッドを占有しない。
+- CSV は keyset ページングでバッチごとに読み、書いたそばから送る。
+- ORM 読み込みは1ビュー（または1バッチ）あたり orm_batch() 1回にまとめる。
+- 同期ビューと同じ権限チェック・監査ログ・出力形式を保つ（行の組み立ては同期ビューと共有）。
+"""
+import os
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
+from django.utils import timezone
+
+from . import views, views_health, views_survey_export
+from .models import Patient, PatientSurveySession, TreatmentSession
+from .services.item_export import ITEM_CSV_HEADER, iter_item_rows
+from .utils.async_io import (
+    abatches,
+    aiter_rows,
+    async_login_required,
+    async_superuser_required,
+    csv_streaming_response,
+    file_streaming_response,
+    orm_batch,
+)
+
+
+async def healthz(request):
+    status, ok = await orm_batch(views_health.health_status)()
+    return JsonResponse(status, status=200 if ok else 500)
+
+
+@async_login_required
+async def latest_consent(request):
+    return HttpResponseRedirect(await orm_batch(views.latest_consent_url)())
+
+
+def _sqlite_path():
+    db_path = settings.DATABASES['default']['NAME']
+    return str(db_path) if db_path and os.path.exists(db_path) else None
+
+
+@async_superuser_required
+async def download_db(request):
+    db_path = _sqlite_path()
+    if not db_path:
+        return HttpResponse("Not found", status=404)
+    return file_streaming_response(db_path, filename='db.sqlite3')
+
+
+@async_superuser_required
+async def admin_backup(request):
+    """SQLite ダウンロードだけ非同期で流し、画面表示と dumpdata は同期ビューに任せる。"""
+    if request.method == 'POST' and request.POST.get('action') == 'download_db':
+        db_path = _sqlite_path()
+        if db_path:
+            await orm_batch(views.log_audit_action)(
+                None, 'EXPORT', 'DatabaseFile', '',
+                'SQLiteデータベースファイルをダウンロード'
+            )
+            return file_streaming_response(
+                db_path,
+                filename=f"db_{timezone.now().strftime('%Y%m%d_%H%M%S')}.sqlite3",
+            )
+    return await orm_batch(views.admin_backup)(request)
+
+
+def _treatment_rows(cursor, limit):
+    qs = TreatmentSession.objects.select_related('patient', 'performer').order_by('date', 'id')
+    if cursor:
+        last_date, last_id = cursor
+        qs = qs.filter(Q(date__gt=last_date) | Q(date=last_date, id__gt=last_id))
+    batch = list(qs[:limit])
+    rows = [views.treatment_csv_row(t) for t in batch]
+    next_cursor = (batch[-1].date, batch[-1].id) if len(batch) == limit else None
+    return rows, next_cursor
+
+
+def _log_treatment_export():
+    rows = TreatmentSession.objects.count()
+    views.log_audit_action(None, 'EXPORT', 'TreatmentSession', '', '治療データCSVエクスポート', {
+        'export_type': 'csv',
+        'filters': {},
+        'rows': rows,
+    })
+
+
+@async_superuser_required
+async def export_treatment_csv(request):
+    await orm_batch(_log_treatment_export)()
+    return csv_streaming_response(views.TREATMENT_CSV_HEADER, abatches(_treatment_rows), 'treatment_data.csv')
+
+
+def _survey_rows(patient_id):
+    patient = Patient.objects.lean().filter(pk=patient_id).first()
+    if patient is None:
+        return None
+    sessions = PatientSurveySession.objects.filter(patient=patient).prefetch_related("responses").order_by("started_at")
+    return [views_survey_export.survey_csv_row(patient, s) for s in sessions]
+
+
+@async_login_required
+async def export_patient_surveys_csv(request, patient_id):
+    user = await request.auser()
+    if not user.is_staff:
+        return HttpResponse("Forbidden", status=403)
+    rows = await orm_batch(_survey_rows)(patient_id)
+    if rows is None:
+        raise Http404
+
+    async def one_batch():
+        yield rows
+
+    return csv_streaming_response(
+        views_survey_export.SURVEY_CSV_HEADER, one_batch(), f"patient_{patient_id:05d}_surveys.csv",
+    )
+
+
+@async_superuser_required
+async def export_item_scores_csv(request):
+    patient_id = views_survey_export.item_export_patient_id(request)
+    await orm_batch(views_survey_export.log_item_export)(patient_id)
+    return csv_streaming_response(
+        ITEM_CSV_HEADER,
+        aiter_rows(lambda: iter_item_rows(patient_id)),
+        views_survey_export.item_export_filename(patient_id),
+    )
@@ -0,0 +1,153 @@
+"""
+キャパシティ・レポートと治療スロット割り当て（JSON）
+
+任意の期間（週・月・年・複数年）について、日ごとの
+- 入院中の患者数（入院日〜退院日／退院予定日）
+- 治療クール中の患者数（初回治療日〜最終治療日）
+- 実施された rTMS の回数
+を services.census の区間スイープで求め、ピークと期間ごとの集計、
+設定した定員（RTMS_BED_CAPACITY / RTMS_DAILY_SESSION_CAPACITY）を超えた日を返す。
+
+slot_schedule は治療中の全クールを services.slot_scheduler で部屋・コイルに割り当て、
+日ごとの稼働率と順延・時間外の警告を返す。
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Patient, TreatmentSession
+from .services.census import PERIODS, census_from_days, census_from_intervals
+from .services.slot_scheduler import CourseDemand, Resources, SlotScheduler
+from .views import JP_HOLIDAYS, course_interval, stay_interval, treatment_plan
+
+# 10年分まで
+MAX_RANGE_DAYS = 3660
+# 退院日未定の患者は初回治療日から概ねこの日数以内に退院予定日・最終治療日を迎える
+OPEN_STAY_LOOKBACK_DAYS = 120
+
+
+def _series(census, capacity, period):
+    peak, peak_date = census.peak()
+    return {
+        'peak': peak,
+        'peak_date': peak_date,
+        'capacity': capacity or None,
+        'over_capacity': [{'date': d, 'count': c} for d, c in census.over(capacity)] if capacity else [],
+        'rollup': census.rollup(period),
+    }
+
+
+def build_capacity_report(start, end, period='week'):
+    patients = Patient.objects.filter(
+        Q(admission_date__lte=end, discharge_date__gt=start)
+        | Q(first_treatment_date__lte=end, discharge_date__isnull=True,
+            first_treatment_date__gte=start - timedelta(days=OPEN_STAY_LOOKBACK_DAYS))
+        | Q(first_treatment_date__lte=end, discharge_date__gt=start)
+    ).only('admission_date', 'discharge_date', 'first_treatment_date', 'protocol_type')
+    stays, courses = [], []
+    for p in patients:
+        stays.append(stay_interval(p))
+        courses.append(course_interval(p))
+    session_days = TreatmentSession.objects.filter(session_date__range=(start, end)).values_list('session_date', flat=True)
+
+    inpatients = census_from_intervals((i for i in stays if i), start, end)
+    on_course = census_from_intervals((i for i in courses if i), start, end)
+    sessions = census_from_days(session_days, start, end)
+    return {
+        'start': start,
+        'end': end,
+        'period': period,
+        'inpatients': _series(inpatients, settings.RTMS_BED_CAPACITY, period),
+        'on_course': _series(on_course, 0, period),
+        'rtms_sessions': _series(sessions, settings.RTMS_DAILY_SESSION_CAPACITY, period),
+    }
+
+
+@login_required
+def capacity_report(request):
+    """GET ?start=YYYY-MM-DD&end=YYYY-MM-DD&period=day|week|month|year（既定: 今月・週ごと）"""
+    today = timezone.localdate()
+    try:
+        start = parse_date(request.GET.get('start') or '') or today.replace(day=1)
+        end = parse_date(request.GET.get('end') or '') or (
+            date(start.year + start.month // 12, start.month % 12 + 1, 1) - timedelta(days=1)
+        )
+    except ValueError:
+        return JsonResponse({'error': 'invalid date'}, status=400)
+    period = request.GET.get('period') or 'week'
+    if period not in PERIODS:
+        return JsonResponse({'error': f'period must be one of {", ".join(PERIODS)}'}, status=400)
+    if end < start or (end - start).days + 1 > MAX_RANGE_DAYS:
+        return JsonResponse({'error': f'range must be 1..{MAX_RANGE_DAYS} days'}, status=400)
+    return JsonResponse(build_capacity_report(start, end, period), json_dumps_params={'ensure_ascii': False})
+
+
+def load_course_demands(start, end):
+    """start〜end に治療日があるクールの予定（CourseDemand）を DB から作る。
+
+    実施記録（スキップ以外）がある日はその日、残りは患者のプロトコルの治療計画（初回治療日から）で補う。
+    所要時間・コイルはそのクールの最新の記録（無ければモデルの既定値）、1日の回数と回の間隔はプロトコルに従う。
+    """
+    patients = list(Patient.objects.filter(
+        first_treatment_date__lte=end,
+        first_treatment_date__gte=start - timedelta(days=OPEN_STAY_LOOKBACK_DAYS),
+    ).exclude(discharge_date__lt=start).only('course_number', 'first_treatment_date', 'discharge_date', 'protocol_type'))
+    by_key = {(p.id, p.course_number): p for p in patients}
+    rows = defaultdict(list)
+    sessions = (
+        TreatmentSession.objects
+        .filter(patient_id__in=[p.id for p in patients])
+        .exclude(status='skipped')
+        .only('patient_id', 'course_number', 'session_date', 'status', 'coil_type',
+              'train_seconds', 'intertrain_seconds', 'train_count')
+        .order_by('session_date', 'id')
+    )
+    for s in sessions:
+        if (s.patient_id, s.course_number) in by_key:
+            rows[(s.patient_id, s.course_number)].append(s)
+
+    defaults = TreatmentSession()
+    demands = []
+    for key, p in by_key.items():
+        recorded = rows.get(key, [])
+        dates = sorted({s.session_date for s in recorded})
+        # 治療日ごとに sessions_per_day 回（プロトコルの治療計画）
+        plan = treatment_plan(p)
+        planned = plan.dates
+        after = dates[-1] if dates else None
+        dates += [d for d in planned if after is None or d > after][:max(len(planned) - len(dates), 0)]
+        if p.discharge_date:
+            dates = [d for d in dates if d < p.discharge_date]
+        if not dates or dates[-1] < start:
+            continue
+        latest = recorded[-1] if recorded else defaults
+        demands.append(CourseDemand(
+            patient_id=p.id,
+            course_number=p.course_number,
+            dates=tuple(dates),
+            coil_type=latest.coil_type or defaults.coil_type,
+            minutes=latest.stimulation_minutes or defaults.stimulation_minutes,
+            sessions_per_day=plan.protocol.sessions_per_day,
+            min_gap_minutes=plan.protocol.min_gap_minutes,
+            fixed=frozenset(s.session_date for s in recorded if s.status == 'done'),
+        ))
+    return demands
+
+
+@login_required
+def slot_schedule(request):
+    """GET ?year=YYYY&month=M（既定: 今月）で1か月分のスロット割り当てを返す。"""
+    today = timezone.localdate()
+    try:
+        start = date(int(request.GET.get('year', today.year)), int(request.GET.get('month', today.month)), 1)
+    except ValueError:
+        return JsonResponse({'error': 'invalid month'}, status=400)
+    end = date(start.year + start.month // 12, start.month % 12 + 1, 1) - timedelta(days=1)
+    scheduler = SlotScheduler(load_course_demands(start, end), Resources.from_settings(), holidays=JP_HOLIDAYS)
+    return JsonResponse(scheduler.solve(start, end).as_dict(), json_dumps_params={'ensure_ascii': False})
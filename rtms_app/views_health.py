@@ -2,6 +2,7 @@
 ヘルスチェック・システム情報
 """
 from django.http import JsonResponse, HttpResponse
+from django.views.decorators.http import require_http_methods
 from django.db import connection
 from django.conf import settings
 import os
@@ -9,9 +10,9 @@ import sys
 from datetime import datetime
 
 
-def healthz(request):
+def health_status():
     """
-    ヘルスチェックエンドポイント
+    ヘルスチェックの結果 (dict, ok) を返す
     DB接続確認 + 基本情報
     """
     health_status = {
@@ -29,7 +30,7 @@ def healthz(request):
     except Exception as e:
         health_status['status'] = 'unhealthy'
         health_status['checks']['database'] = f'error: {str(e)}'
-        return JsonResponse(health_status, status=500)
+        return health_status, False
     
     # Python version
     health_status['python_version'] = sys.version.split()[0]
@@ -38,7 +39,16 @@ def healthz(request):
     health_status['debug'] = settings.DEBUG
     health_status['environment'] = os.environ.get('DJANGO_ENV', 'unknown')
     
-    return JsonResponse(health_status)
+    return health_status, True
+
+
+def healthz(request):
+    """
+    ヘルスチェックエンドポイント
+    DB接続確認 + 基本情報
+    """
+    status, ok = health_status()
+    return JsonResponse(status, status=200 if ok else 500)
 
 
 def version(request):
@@ -66,3 +76,34 @@ def version(request):
         version_info['build_date'] = build_date
     
     return JsonResponse(version_info)
+
+
+@require_http_methods(["GET", "POST"])
+def slow_queries(request):
+    """
+    スロークエリ（文の形ごとの上位 N 件）を JSON で返す（staff のみ）
+    POST でストアをクリア
+    """
+    if not request.user.is_authenticated or not request.user.is_staff:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+
+    from .utils.slow_queries import store
+
+    if request.method == 'POST':
+        store.clear()
+        return JsonResponse({'status': 'cleared'})
+
+    shapes = store.snapshot()
+    try:
+        limit = int(request.GET.get('limit', 0))
+    except ValueError:
+        limit = 0
+    if limit > 0:
+        shapes = shapes[:limit]
+    return JsonResponse({
+        'threshold_ms': getattr(settings, 'RTMS_SLOW_QUERY_MS', None),
+        'top_n': getattr(settings, 'RTMS_SLOW_QUERY_TOP_N', None),
+        'pid': os.getpid(),
+        'timestamp': datetime.now().isoformat(),
+        'shapes': shapes,
+    }, json_dumps_params={'ensure_ascii': False})
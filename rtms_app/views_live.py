@@ -0,0 +1,88 @@
+"""
+ライブ更新（SSE）エンドポイント
+
+ダッシュボード・月間カレンダーが EventSource でつなぎ、services.live_updates の
+差分を受け取ってセルをその場で書き換える。
+
+ストリームを開き続けるので ASGI（config/asgi.py）で動かしたときだけ有効。
+WSGI ではワーカーを1本占有してしまうため 204 を返す（EventSource は 204 を受けると
+再接続しないので、画面は従来どおり手動の再読み込みで使える）。
+"""
+import asyncio
+import json
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date
+
+from .services.live_updates import broker
+
+# プロキシのアイドル切断を避けるためのコメント行の間隔（秒）
+HEARTBEAT_SECONDS = 20
+# 切断後に EventSource が再接続するまでの待ち時間（ミリ秒）
+RETRY_MS = 5000
+
+
+def _patient_ids(raw):
+    ids = set()
+    for part in (raw or '').split(','):
+        part = part.strip()
+        if part.isdigit():
+            ids.add(int(part))
+    return ids
+
+
+def _event(payload, event=None):
+    lines = []
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(payload, ensure_ascii=False)}")
+    return ("\n".join(lines) + "\n\n").encode('utf-8')
+
+
+async def _stream(start, end, patient_ids):
+    loop = asyncio.get_running_loop()
+    sub = broker.subscribe(loop, start, end, patient_ids)
+    try:
+        yield f"retry: {RETRY_MS}\n\n".encode('ascii')
+        while True:
+            try:
+                delta = await asyncio.wait_for(sub.queue.get(), timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            if sub.overflowed:
+                # 取りこぼしがあるのでクライアントに表示全体を取り直してもらう
+                sub.overflowed = False
+                yield _event({}, event='resync')
+                continue
+            yield _event(delta)
+    finally:
+        broker.unsubscribe(sub)
+
+
+async def live_events(request):
+    """GET ?start=YYYY-MM-DD&end=YYYY-MM-DD&patients=1,2,3 で差分を text/event-stream で流す。"""
+    if request.method != 'GET':
+        return HttpResponse(status=405)
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=403)
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    try:
+        start = parse_date(request.GET.get('start') or '')
+        end = parse_date(request.GET.get('end') or '') or start
+    except ValueError:
+        return HttpResponse(status=400)
+    if not start or end < start:
+        return HttpResponse(status=400)
+
+    response = StreamingHttpResponse(
+        _stream(start, end, _patient_ids(request.GET.get('patients'))),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
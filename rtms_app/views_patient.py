@@ -7,12 +7,15 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponseForbidden, JsonResponse, HttpRequest, HttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.templatetags.static import static
 from django.urls import reverse
 from django.utils import timezone
 from django.conf import settings
 
 from rtms_app.models import Patient, PatientSurveySession, PatientSurveyResponse, TreatmentSession
+from rtms_app.services.definition_bundles import bundle_url
 from rtms_app.services.patient_accounts import PATIENT_GROUP_NAME
+from rtms_app.services.survey_sync import SyncError, sync_session_answers
 from rtms_app.surveys import (
     INSTRUMENT_ORDER,
     INSTRUMENT_SET,
@@ -299,10 +302,67 @@ def instrument_view(request: HttpRequest, session_id: int, instrument: str):
         "current_total": response.total_score,
         "next_code": next_code,
         "prev_code": prev_code,
+        "instrument_urls": [
+            reverse("patient_portal:instrument", args=[session.id, code]) for code in INSTRUMENT_ORDER
+        ],
     }
     return render(request, "rtms_app/patient/instrument.html", context)
 
 
+@login_required(login_url=PATIENT_LOGIN_URL)
+def sync(request: HttpRequest, session_id: int):
+    """オフライン入力された全検査の回答を1リクエストで保存する（JSON）。
+
+    body: {"answers": {"bdi2": {"q1": "0", ...}, "sds": {...}, ...}}
+    各検査の回答は送られた内容で置き換える。1つでも不正なら何も保存せず 400。
+    """
+    patient = _ensure_patient_or_forbid(request)
+    if not patient:
+        return JsonResponse({"error": "患者専用ページです"}, status=403)
+    if request.method != "POST":
+        return JsonResponse({"error": "POST only"}, status=405)
+    session = get_object_or_404(PatientSurveySession, id=session_id, patient=patient)
+    review_url = reverse("patient_portal:review", args=[session.id])
+    if session.status == "submitted":
+        return JsonResponse({"error": "提出済みです", "review_url": review_url}, status=409)
+
+    try:
+        data = json.loads(request.body.decode("utf-8")) if request.body else {}
+    except (UnicodeDecodeError, ValueError):
+        return JsonResponse({"error": "invalid JSON"}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({"error": "invalid JSON"}, status=400)
+    try:
+        result = sync_session_answers(session, data.get("answers") or {})
+    except SyncError as e:
+        logger.warning("survey sync rejected", extra={"session_id": session.id, "errors": e.errors})
+        return JsonResponse({"errors": e.errors}, status=400)
+
+    result["review_url"] = review_url
+    return JsonResponse(result)
+
+
+def service_worker(request: HttpRequest):
+    """患者ポータル用 Service Worker（スコープを /patient/ にするためここから配信する）。"""
+    assets = [
+        static("rtms_app/patient.css"),
+        static("rtms_app/patient_offline.js"),
+        static("rtms_app/patient_surveys.js"),
+    ]
+    definitions_url = bundle_url("instruments")
+    if definitions_url:
+        assets.append(definitions_url)
+    response = render(
+        request,
+        "rtms_app/patient/sw.js",
+        {"assets_json": json.dumps(assets), "cache_version_json": json.dumps(definitions_url or "inline")},
+        content_type="application/javascript; charset=utf-8",
+    )
+    response["Service-Worker-Allowed"] = reverse("patient_portal:portal")
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
 @login_required(login_url=PATIENT_LOGIN_URL)
 def review(request: HttpRequest, session_id: int):
     patient = _ensure_patient_or_forbid(request)
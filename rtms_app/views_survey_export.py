@@ -1,13 +1,65 @@
 """
-Staff-only CSV export views for patient surveys.
+CSV export views for patient surveys.
 Separated to avoid circular import issues.
+
+- export_patient_surveys_csv: staff-only, one patient, totals per session
+- export_item_scores_csv: superuser-only, cohort-wide long format (one row per item)
 """
 import csv
+import io
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 
 from .models import Patient, PatientSurveySession
+from .services.item_export import ITEM_CSV_HEADER, iter_item_rows
+from .utils.async_io import iter_csv
+from .views import log_audit_action, superuser_required
+
+
+SURVEY_CSV_HEADER = [
+    "patient_id",
+    "phase",
+    "started_at",
+    "submitted_at",
+    "status",
+    "bdi2_total",
+    "sds_total",
+    "sassj_total",
+    "phq9_total",
+    "phq9_q10",
+    "stai_x1_total",
+    "stai_x2_total",
+    "dai10_total",
+]
+
+
+def survey_csv_row(patient, session):
+    """One CSV row for a survey session (responses must be prefetched)."""
+    resp_map = {r.instrument: r for r in session.responses.all()}
+
+    def total_for(code: str):
+        r = resp_map.get(code)
+        return r.total_score if r else ''
+
+    phq9_q10 = resp_map.get("phq9").phq9_difficulty if resp_map.get("phq9") else ''
+
+    return [
+        f"{patient.id:05d}",
+        session.phase,
+        session.started_at,
+        session.submitted_at,
+        session.status,
+        total_for("bdi2"),
+        total_for("sds"),
+        total_for("sassj"),
+        total_for("phq9"),
+        phq9_q10,
+        total_for("stai_x1"),
+        total_for("stai_x2"),
+        total_for("dai10"),
+    ]
 
 
 @login_required
@@ -19,49 +71,45 @@ def export_patient_surveys_csv(request, patient_id):
     patient = get_object_or_404(Patient, pk=patient_id)
     sessions = PatientSurveySession.objects.filter(patient=patient).prefetch_related("responses").order_by("started_at")
 
-    response = HttpResponse(content_type='text/csv; charset=utf-8-sig')
+    # 1回でエンコードする（行ごとに書くと utf-8-sig の BOM が各行に付く）
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(SURVEY_CSV_HEADER)
+    for session in sessions:
+        writer.writerow(survey_csv_row(patient, session))
+
+    response = HttpResponse(buf.getvalue(), content_type='text/csv; charset=utf-8-sig')
     response['Content-Disposition'] = f'attachment; filename="patient_{patient_id:05d}_surveys.csv"'
-    writer = csv.writer(response)
-    header = [
-        "patient_id",
-        "phase",
-        "started_at",
-        "submitted_at",
-        "status",
-        "bdi2_total",
-        "sds_total",
-        "sassj_total",
-        "phq9_total",
-        "phq9_q10",
-        "stai_x1_total",
-        "stai_x2_total",
-        "dai10_total",
-    ]
-    writer.writerow(header)
+    return response
+
+
+def item_export_patient_id(request):
+    """?patient=<id> で1人に絞る（不正値は None = 全患者）。"""
+    raw = request.GET.get("patient") or ""
+    return int(raw) if raw.isdigit() else None
+
+
+def item_export_filename(patient_id):
+    suffix = f"patient_{patient_id:05d}" if patient_id is not None else timezone.now().strftime("%Y%m%d_%H%M%S")
+    return f"item_scores_{suffix}.csv"
+
+
+def log_item_export(patient_id):
+    log_audit_action(
+        None, "EXPORT", "ItemScores", "",
+        "項目別スコアCSV（縦持ち）エクスポート",
+        {"patient_id": patient_id},
+    )
 
-    for session in sessions:
-        resp_map = {r.instrument: r for r in session.responses.all()}
-
-        def total_for(code: str):
-            r = resp_map.get(code)
-            return r.total_score if r else ''
-
-        phq9_q10 = resp_map.get("phq9").phq9_difficulty if resp_map.get("phq9") else ''
-
-        writer.writerow([
-            f"{patient.id:05d}",
-            session.phase,
-            session.started_at,
-            session.submitted_at,
-            session.status,
-            total_for("bdi2"),
-            total_for("sds"),
-            total_for("sassj"),
-            total_for("phq9"),
-            phq9_q10,
-            total_for("stai_x1"),
-            total_for("stai_x2"),
-            total_for("dai10"),
-        ])
 
+@superuser_required
+def export_item_scores_csv(request):
+    """Stream item-level HAM-D / scale / survey scores in long format."""
+    patient_id = item_export_patient_id(request)
+    log_item_export(patient_id)
+    response = StreamingHttpResponse(
+        iter_csv(ITEM_CSV_HEADER, iter_item_rows(patient_id)),
+        content_type="text/csv; charset=utf-8-sig",
+    )
+    response["Content-Disposition"] = f'attachment; filename="{item_export_filename(patient_id)}"'
     return response
@@ -0,0 +1,209 @@
+"""
+週間タスクボード（JSON）
+
+ダッシュボードと同じ規則（初診・入院・位置決め・治療・尺度評価・退院準備）を
+start から N 日分まとめて評価して返す。日付を切り替えるたびにサーバーへ問い合わせず、
+クライアント側で days[i] を表示し分けられる。
+
+ダッシュボード（views.dashboard_view）は1日ごとに患者単位のクエリを発行するが、
+こちらは範囲内に関わる患者・治療記録・位置決め記録・評価を最初に1回ずつ読み込み、
+患者ごとの治療計画（プロトコル）と評価ウィンドウ（get_assessment_window）も1回だけ計算してから
+全日付を1パスで走査する（クエリ数は日数・患者数に依存しない）。
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.contrib.auth.decorators import login_required
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Assessment, MappingSession, Patient, TreatmentSession
+from .views import (
+    DASHBOARD_GROUPS,
+    build_url,
+    format_rtms_label,
+    get_assessment_window,
+    treatment_plan,
+)
+
+DEFAULT_DAYS = 7
+MAX_DAYS = 31
+# 初回治療日がこれより前の患者は範囲内にタスクを持たない
+# （最終治療日・第6週評価とも初回治療日から概ね 6〜7 週以内）
+ACTIVE_LOOKBACK_DAYS = 120
+
+WEEKDAYS = ["月", "火", "水", "木", "金", "土", "日"]
+WEEK_TIMINGS = (('week3', '第3週目評価'), ('week4', '第4週目評価'), ('week6', '第6週目評価'))
+
+
+def _day_label(d):
+    return f"{d.year}年{d.month}月{d.day}日 ({WEEKDAYS[d.weekday()]})"
+
+
+def _load(start, end):
+    """範囲内にタスクを持ちうる患者と、その記録をまとめて読み込む。"""
+    patients = list(
+        Patient.objects.lean()
+        .filter(
+            Q(created_at__date__range=(start, end))
+            | Q(admission_date__range=(start, end))
+            | Q(mapping_date__range=(start, end))
+            | Q(discharge_date__range=(start, end))
+            | Q(admission_date__lte=end, first_treatment_date__isnull=True)
+            | Q(admission_date__lte=end, first_treatment_date__gte=start)
+            | Q(first_treatment_date__range=(start - timedelta(days=ACTIVE_LOOKBACK_DAYS), end))
+        )
+        .order_by('card_id', 'id')
+    )
+    ids = [p.id for p in patients]
+    # (patient_id, date) -> その日の記録数（1日複数回のプロトコルでは全回そろって実施済）
+    treated = Counter(
+        TreatmentSession.objects.filter(patient_id__in=ids, session_date__range=(start, end))
+        .values_list('patient_id', 'session_date')
+    )
+    mapped = set(
+        MappingSession.objects.filter(patient_id__in=ids, date__range=(start, end))
+        .values_list('patient_id', 'date')
+    )
+    assessed = defaultdict(list)  # (patient_id, timing) -> [date, ...]
+    rows = Assessment.objects.filter(
+        patient_id__in=ids, timing__in=['baseline'] + [t for t, _ in WEEK_TIMINGS]
+    ).values_list('patient_id', 'timing', 'date')
+    for patient_id, timing, d in rows:
+        assessed[(patient_id, timing)].append(d)
+    return patients, treated, mapped, assessed
+
+
+def _plan(p):
+    """患者ごとに1回だけ計算する予定（治療日列・評価ウィンドウ・退院準備予定日）。"""
+    plan = treatment_plan(p)
+    return {
+        'treatment': plan,
+        'windows': {t: get_assessment_window(p, t) for t in ['baseline'] + [t for t, _ in WEEK_TIMINGS]},
+        'treatment_end_est': plan.end_date if plan else None,
+    }
+
+
+def _item(p, kind, status, color, todo, url, **extra):
+    return {'patient_id': p.id, 'kind': kind, 'status': status, 'color': color, 'todo': todo, 'url': url, **extra}
+
+
+def build_task_board(start, days=DEFAULT_DAYS):
+    """start から days 日分のタスクを dashboard_view と同じ規則で作る。"""
+    end = start + timedelta(days=days - 1)
+    patients, treated, mapped, assessed = _load(start, end)
+    plans = {p.id: _plan(p) for p in patients}
+
+    out_days = []
+    for offset in range(days):
+        d = start + timedelta(days=offset)
+        iso = d.isoformat()
+        q = {'date': iso, 'dashboard_date': iso}
+        groups = {kind: [] for kind, _ in DASHBOARD_GROUPS}
+        baseline, weekly = [], []
+        confirmed_discharge, estimated_discharge = [], []
+
+        for p in patients:
+            plan = plans[p.id]
+            ft = p.first_treatment_date
+
+            if p.created_at and timezone.localtime(p.created_at).date() == d:
+                groups['first_visit'].append(_item(
+                    p, 'first_visit', "診察済", "", "初診",
+                    build_url('patient_first_visit', [p.id], {'dashboard_date': iso}),
+                ))
+            if p.admission_date == d:
+                done = p.is_admission_procedure_done
+                groups['admission'].append(_item(
+                    p, 'admission', "手続済" if done else "要手続", "success" if done else "warning", "入院手続き",
+                    build_url('admission_procedure', [p.id], {'dashboard_date': iso}),
+                ))
+            if p.mapping_date == d:
+                done = (p.id, d) in mapped
+                groups['mapping'].append(_item(
+                    p, 'mapping', "実施済" if done else "実施未", "success" if done else "danger", "MT測定",
+                    build_url('mapping_add', [p.id], q),
+                ))
+
+            # 治療前評価: 入院後〜初回治療日の window 内
+            if p.admission_date and p.admission_date <= d and (not ft or ft >= d):
+                ws, we = plan['windows']['baseline']
+                if ws <= d <= we:
+                    dates = assessed.get((p.id, 'baseline'), [])
+                    url = build_url('assessment_add', [p.id, 'baseline'], q)
+                    if not dates:
+                        baseline.append(_item(
+                            p, 'assessment', "実施未", "danger", f"治療前評価 ({we.strftime('%m/%d')})", url, timing_code='baseline',
+                        ))
+                    elif d in dates:
+                        baseline.append(_item(p, 'assessment', "実施済", "success", "治療前評価 (完了)", url, timing_code='baseline'))
+
+            if ft and ft <= d:
+                info = plan['treatment'].session_info(d)
+                if info:
+                    n = info['session_no']
+                    done = treated[(p.id, d)] >= info['last_session_no'] - n + 1
+                    groups['treatment'].append(_item(
+                        p, 'treatment', "実施済" if done else "実施未", "success" if done else "danger",
+                        format_rtms_label(n, info['week_no'], info['last_session_no']),
+                        build_url('treatment_add', [p.id], q), session_num=n,
+                    ))
+                for timing, label in WEEK_TIMINGS:
+                    ws, we = plan['windows'][timing]
+                    if d != we:
+                        continue
+                    done = any(ws <= a <= we for a in assessed.get((p.id, timing), []))
+                    if timing == 'week4':
+                        url = build_url('assessment_week4', [p.id], q)
+                    else:
+                        url = build_url('assessment_add', [p.id, timing], q)
+                    if done:
+                        weekly.append(_item(p, 'assessment', "実施済", "success", f"{label} (完了)", url, timing_code=timing))
+                    else:
+                        weekly.append(_item(
+                            p, 'assessment', "実施未", "danger", f"{label} ({we.strftime('%m/%d')})", url, timing_code=timing,
+                        ))
+
+            home = build_url('patient_home', [p.id], {'dashboard_date': iso})
+            if p.discharge_date == d:
+                confirmed_discharge.append(_item(p, 'discharge', "退院準備", "info", "サマリー・紹介状作成", home))
+            elif not p.discharge_date and ft and ft <= d and plan['treatment_end_est'] == d:
+                estimated_discharge.append(_item(p, 'discharge', "退院準備（予定）", "info", "サマリー・紹介状作成", home))
+
+        groups['assessment'] = baseline + weekly
+        groups['discharge'] = confirmed_discharge + estimated_discharge
+        out_days.append({
+            'date': iso,
+            'label': _day_label(d),
+            'groups': [{'kind': kind, **meta, 'items': groups[kind]} for kind, meta in DASHBOARD_GROUPS],
+        })
+
+    referenced = {item['patient_id'] for day in out_days for g in day['groups'] for item in g['items']}
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'days': out_days,
+        'patients': {
+            str(p.id): {'card_id': p.card_id, 'name': p.name, 'course_number': p.course_number}
+            for p in patients if p.id in referenced
+        },
+    }
+
+
+@login_required
+def task_board(request):
+    """GET ?start=YYYY-MM-DD&days=7 で N 日分のタスクボードを JSON で返す。"""
+    try:
+        start = parse_date(request.GET.get('start') or '')
+    except ValueError:
+        start = None
+    start = start or timezone.localdate()
+    try:
+        days = int(request.GET.get('days') or DEFAULT_DAYS)
+    except ValueError:
+        return JsonResponse({'error': 'invalid days'}, status=400)
+    if not 1 <= days <= MAX_DAYS:
+        return JsonResponse({'error': f'days must be 1..{MAX_DAYS}'}, status=400)
+    return JsonResponse(build_task_board(start, days), json_dumps_params={'ensure_ascii': False})
@@ -0,0 +1,103 @@
+"""
+起動時ウォームアップ
+
+祝日表・質問票定義・テンプレート（と事前レンダリング断片）を先に作っておき、最初のリクエストで払うコストを減らす。
+RTMS_WARMUP=1 のとき config/wsgi.py から呼ばれる。gunicorn を --preload で起動すると
+マスターで一度だけ実行され、fork 後の各ワーカーはその結果を共有する。
+
+DB 接続は開かないこと（fork 前に開いたソケットをワーカー間で共有してしまうため）。
+"""
+import logging
+import os
+import time
+
+from django.apps import apps
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def _project_template_names(engine):
+    """プロジェクトの templates/ と rtms_app/templates/ 配下のテンプレート名。"""
+    dirs = [str(d) for d in engine.dirs]
+    dirs.append(os.path.join(apps.get_app_config('rtms_app').path, 'templates'))
+    names = set()
+    for base in dirs:
+        for root, _dirs, files in os.walk(base):
+            for filename in files:
+                if filename.endswith(('.html', '.txt')):
+                    names.add(os.path.relpath(os.path.join(root, filename), base).replace(os.sep, '/'))
+    return sorted(names)
+
+
+def warm_templates():
+    """テンプレートをコンパイルしてローダーのキャッシュに載せる。読み込めた数を返す。"""
+    engine = engines['django'].engine
+    loaded = 0
+    for name in _project_template_names(engine):
+        try:
+            engine.get_template(name)
+        except (TemplateDoesNotExist, TemplateSyntaxError) as e:
+            logger.warning(f"warm-up: template {name} skipped: {e}")
+            continue
+        loaded += 1
+    return loaded
+
+
+# assessment/_form.html と assessment/scales/hamd.html が使う HAM-D 行の表示位置
+_HAMD_ROW_VARIANTS = (
+    ("left", "auto", "hover focus"),
+    ("right", "auto", "hover focus"),
+    ("left", "right", "click"),
+    ("right", "left", "click"),
+)
+
+
+def warm_fragments():
+    """RTMS_PRECOMPILED_FRAGMENTS が有効なら静的断片をレンダリングしておく。作った数を返す。"""
+    from django.conf import settings
+
+    from .services.fragments import cached_fragment_count
+    from .services.side_effect_schema import DEFAULT_PRINT_ROWS
+    from .surveys import get_instruments
+    from .templatetags.rtms_fragments import hamd_rows, instrument_questions, side_effect_rows
+
+    if not getattr(settings, 'RTMS_PRECOMPILED_FRAGMENTS', False):
+        return 0
+    for side, placement, trigger in _HAMD_ROW_VARIANTS:
+        hamd_rows(side, placement, trigger)
+    for instrument_def in get_instruments().values():
+        instrument_questions(instrument_def)
+    side_effect_rows(DEFAULT_PRINT_ROWS)
+    return cached_fragment_count()
+
+
+def warm_up(years=None):
+    """祝日表・質問票・テンプレートを構築し、項目ごとの所要時間(ms)を返す。"""
+    from .services.holiday_calendar import warm as warm_holidays
+    from .surveys import get_instruments
+
+    if years is None:
+        this_year = timezone.localdate().year
+        years = (this_year - 1, this_year, this_year + 1)
+
+    timings = {}
+    t0 = time.perf_counter()
+    warm_holidays(years)
+    timings['holidays_ms'] = round((time.perf_counter() - t0) * 1000, 1)
+
+    t0 = time.perf_counter()
+    get_instruments()
+    timings['instruments_ms'] = round((time.perf_counter() - t0) * 1000, 1)
+
+    t0 = time.perf_counter()
+    timings['templates'] = warm_templates()
+    timings['templates_ms'] = round((time.perf_counter() - t0) * 1000, 1)
+
+    t0 = time.perf_counter()
+    timings['fragments'] = warm_fragments()
+    timings['fragments_ms'] = round((time.perf_counter() - t0) * 1000, 1)
+
+    logger.info(f"warm-up done: {timings}")
+    return timings